@@ -0,0 +1,125 @@
+"""
+Benchmark gộp datagram - Bật/tắt batching khi gửi dồn dập
+(thông lượng, độ trễ, số gói UDP cho broadcast và tin riêng)
+
+Chạy: python -m benchmarks.bench_batching
+"""
+import argparse
+import statistics
+import threading
+import time
+from core import NetworkManager
+from core.message import Message, MessageType
+from utils.logger import Logger
+
+
+def _introduce(a: NetworkManager, b: NetworkManager):
+    """Cho 2 node biết tính năng của nhau (thay cho discovery)"""
+    for src, dst in ((a, b), (b, a)):
+        dst._learn_capabilities(Message(
+            MessageType.DISCOVERY, src.user_id, src.user_name, src.port, src.advertise("discover")
+        ))
+
+
+def _run(batching: bool, mode: str, count: int, port: int) -> dict:
+    logger = Logger("bench_batching")
+    sender = NetworkManager(port, "Sender", logger, batching=batching)
+    receiver = NetworkManager(port + 1, "Receiver", logger, batching=batching)
+
+    latencies = []
+    last = [0.0]
+    done = threading.Event()
+    lock = threading.Lock()
+
+    def on_message(message):
+        if message.msg_type not in (MessageType.TEXT, MessageType.PRIVATE_MESSAGE):
+            return
+        sent_at = float(message.content.split("|", 1)[0])
+        now = time.perf_counter()
+        with lock:
+            latencies.append(now - sent_at)
+            last[0] = now
+            if len(latencies) >= count:
+                done.set()
+
+    receiver.on_message_received = on_message
+    sender.start()
+    receiver.start()
+    _introduce(sender, receiver)
+    counter = sender.send_socket = _CountingSocket(sender.send_socket)
+    time.sleep(0.2)
+
+    start = time.perf_counter()
+    results = []
+    for i in range(count):
+        content = f"{time.perf_counter():.9f}|tin nhắn {i}"
+        if mode in ("broadcast", "sparse"):
+            # Hàng đợi đầy -> chờ (backpressure) thay vì bỏ tin
+            message = Message(MessageType.TEXT, sender.user_id, sender.user_name,
+                              sender.port, content)
+            while not sender.send_message(message):
+                time.sleep(0.0005)
+            if mode == "sparse":
+                # Tin thưa: batching không được làm tăng độ trễ
+                time.sleep(0.005)
+        else:
+            results.append(sender.send_private_message(content, receiver.user_id, receiver.port))
+    done.wait(10)
+    elapsed = last[0] - start
+    for result in results:
+        result.wait(5)
+    packets = counter.packets
+
+    sender.stop()
+    receiver.stop()
+
+    with lock:
+        received = len(latencies)
+        ordered = sorted(latencies)
+    return {
+        'received': received,
+        'rate': received / elapsed if elapsed > 0 else 0.0,
+        'p50': statistics.median(ordered) * 1000 if ordered else 0.0,
+        'p99': ordered[int(len(ordered) * 0.99) - 1] * 1000 if ordered else 0.0,
+        'packets': packets,
+    }
+
+
+class _CountingSocket:
+    """Bọc send_socket để đếm số gói UDP thực sự gửi"""
+
+    def __init__(self, sock):
+        self._sock = sock
+        self.packets = 0
+
+    def sendto(self, data, addr):
+        self.packets += 1
+        return self._sock.sendto(data, addr)
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batching benchmark')
+    parser.add_argument('--count', type=int, default=5000)
+    parser.add_argument('--port', type=int, default=5200)
+    args = parser.parse_args()
+
+    print(f"{'mode':<10} {'batching':<9} {'received':>9} {'msg/s':>9} {'p50 ms':>8} "
+          f"{'p99 ms':>8} {'packets':>8} {'msg/pkt':>8}")
+    # Mỗi lượt dùng port mới: socket cũ có thể còn nhận (SO_REUSEPORT) đến khi thread nhận thoát
+    port = args.port
+    for mode in ("broadcast", "private", "sparse"):
+        count = args.count if mode != "sparse" else min(args.count, 300)
+        for batching in (False, True):
+            r = _run(batching, mode, count, port)
+            port += 2
+            per_packet = count / r['packets'] if r['packets'] else 0.0
+            print(f"{mode:<10} {'on' if batching else 'off':<9} {r['received']:>9} "
+                  f"{r['rate']:>9.0f} {r['p50']:>8.2f} {r['p99']:>8.2f} "
+                  f"{r['packets']:>8} {per_packet:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
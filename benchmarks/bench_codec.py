@@ -0,0 +1,84 @@
+"""
+Benchmark codec - So sánh JSON, nhị phân và nhị phân + zlib
+(tốc độ encode/decode, số byte, số datagram sau phân mảnh, CPU nén theo loại tin)
+
+Chạy: python -m benchmarks.bench_codec
+"""
+import json
+import time
+from core.message import Message, MessageType
+from core.codec import (CODEC_BINARY, CODEC_BINARY_ZLIB, CODEC_JSON, CompressionStats,
+                        decode_message, encode_message)
+from core.fragment import fragment
+
+_PASTE = (
+    "Biên bản họp nhóm: cập nhật tiến độ module mạng, phân công kiểm thử trên "
+    "máy Windows và Linux, thống nhất định dạng tin nhắn nhị phân. "
+)
+
+
+def _group_create(count: int) -> Message:
+    members = [f"User{i}_{5000 + i}" for i in range(count)]
+    group_info = json.dumps({
+        'group_id': 'a1b2c3d4', 'name': 'Team', 'creator_id': members[0],
+        'member_ids': members,
+        'member_ports': {m: 5000 + i for i, m in enumerate(members)},
+        'member_names': {m: f"User{i}" for i, m in enumerate(members)}
+    })
+    return Message(MessageType.GROUP_CREATE, "Alice_5000", "Alice", 5000,
+                   group_info, group_id="a1b2c3d4", group_members=members)
+
+
+def _sample_messages():
+    return {
+        "text ngắn": Message(MessageType.TEXT, "Alice_5000", "Alice", 5000, "Xin chào 👋"),
+        "group msg 1KB": Message(MessageType.GROUP_MESSAGE, "Alice_5000", "Alice", 5000,
+                                 "x" * 1024, group_id="a1b2c3d4"),
+        "private": Message(MessageType.PRIVATE_MESSAGE, "Alice_5000", "Alice", 5000,
+                           "hẹn gặp lúc 3h", target_id="Bob_5001"),
+        "paste 8KB": Message(MessageType.PRIVATE_MESSAGE, "Alice_5000", "Alice", 5000,
+                             (_PASTE * 60)[:8192], target_id="Bob_5001"),
+        "group create 50": _group_create(50),
+        "group create 500": _group_create(500),
+    }
+
+
+def _rate(func, arg, duration: float = 0.5) -> float:
+    count = 0
+    start = time.perf_counter()
+    end = start + duration
+    while time.perf_counter() < end:
+        for _ in range(200):
+            func(arg)
+        count += 200
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    # header/s: chỉ đọc header (đủ để lọc tin của mình / trùng / không dành cho mình)
+    # decode/s: header + content
+    print(f"{'message':<18}{'codec':<11}{'bytes':>8}{'dgrams':>7}{'encode/s':>12}"
+          f"{'header/s':>12}{'decode/s':>12}")
+    for name, msg in _sample_messages().items():
+        for codec in (CODEC_JSON, CODEC_BINARY, CODEC_BINARY_ZLIB):
+            data = encode_message(msg, codec)
+            assert decode_message(data) == msg
+            enc = _rate(lambda m: encode_message(m, codec), msg)
+            hdr = _rate(decode_message, data)
+            dec = _rate(lambda d: decode_message(d).content, data)
+            print(f"{name:<18}{codec:<11}{len(data):>8}{len(fragment(data)):>7}"
+                  f"{enc:>12,.0f}{hdr:>12,.0f}{dec:>12,.0f}")
+
+    # Thống kê nén như NetworkManager ghi lại (ngưỡng mặc định)
+    stats = CompressionStats()
+    for msg in _sample_messages().values():
+        for _ in range(100):
+            decode_message(encode_message(msg, CODEC_BINARY_ZLIB, stats=stats), stats).content
+    print(f"\n{'type':<18}{'msgs':>6}{'zipped':>7}{'ratio':>7}{'comp µs':>9}{'decomp µs':>10}")
+    for msg_type, s in stats.snapshot().items():
+        print(f"{msg_type:<18}{s['messages']:>6}{s['compressed']:>7}{s['ratio']:>7.2f}"
+              f"{s['compress_us']:>9.1f}{s['decompress_us']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark chống flood - 1 node spam DISCOVERY + TEXT trong khi 1 peer hợp lệ gửi tin riêng
+(tin hợp lệ đến được / độ trễ p50/p99, tin flood lọt vào ứng dụng, số thread tối đa)
+khi không flood, khi flood không giới hạn và khi bật token bucket + cách ly
+
+Chạy: python -m benchmarks.bench_flood
+"""
+import argparse
+import multiprocessing
+import socket
+import statistics
+import threading
+import time
+from core import DeviceDiscovery, NetworkManager
+from core.codec import CODEC_BINARY, encode_message
+from core.message import Message, MessageType
+from core.ratelimit import DEFAULT_RATE_LIMITS
+from utils.logger import Logger
+from benchmarks.bench_batching import _introduce
+
+
+def _flooder(port: int, duration: float, ready):
+    """Tiến trình spam: DISCOVERY (JSON) và TEXT (nhị phân) nhanh nhất có thể"""
+    sender = ("Flooder_9999", "Flooder", 9999)
+    # msg_id khác nhau để không bị lọc trùng
+    packets = []
+    for _ in range(10000):
+        packets.append(encode_message(Message(MessageType.DISCOVERY, *sender, "discover")))
+        packets.append(encode_message(Message(MessageType.TEXT, *sender, "spam " * 20),
+                                      CODEC_BINARY))
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    addr = ("127.0.0.1", port)
+    ready.wait()
+    deadline = time.monotonic() + duration
+    sent = 0
+    while time.monotonic() < deadline:
+        for _ in range(100):
+            try:
+                sock.sendto(packets[sent % len(packets)], addr)
+            except OSError:
+                pass
+            sent += 1
+    sock.close()
+
+
+def _run(flood: bool, limited: bool, args, port: int) -> dict:
+    logger = Logger("bench_flood")
+    rate_limits = dict(DEFAULT_RATE_LIMITS) if limited else None
+    victim = NetworkManager(port, "Victim", logger, rate_limits=rate_limits)
+    peer = NetworkManager(port + 1, "Peer", logger)
+    discovery = DeviceDiscovery(victim, logger)
+
+    latencies = []
+    flood_delivered = [0]
+
+    def on_message(message):
+        if message.msg_type == MessageType.DISCOVERY:
+            discovery.handle_discovery_message(message)
+        if message.sender_id.startswith("Flooder"):
+            flood_delivered[0] += 1
+        elif message.msg_type == MessageType.PRIVATE_MESSAGE:
+            latencies.append(time.perf_counter() - float(message.content))
+
+    victim.on_message_received = on_message
+    victim.start()
+    peer.start()
+    _introduce(victim, peer)
+    time.sleep(0.2)
+
+    context = multiprocessing.get_context("spawn")
+    ready = context.Event()
+    flooder = context.Process(target=_flooder, args=(port, args.duration, ready))
+    if flood:
+        flooder.start()
+        time.sleep(1.0)
+
+    peak_threads = [threading.active_count()]
+    stop = threading.Event()
+
+    def sample_threads():
+        while not stop.is_set():
+            peak_threads[0] = max(peak_threads[0], threading.active_count())
+            time.sleep(0.01)
+
+    threading.Thread(target=sample_threads, daemon=True).start()
+    ready.set()
+    sent = 0
+    interval = 1.0 / args.rate
+    deadline = time.monotonic() + args.duration
+    while time.monotonic() < deadline:
+        peer.send_private_message(f"{time.perf_counter():.9f}", victim.user_id, victim.port)
+        sent += 1
+        time.sleep(interval)
+    if flood:
+        flooder.join()
+    time.sleep(1.0)  # Chờ truyền lại / hàng đợi rút hết
+    stop.set()
+
+    dropped = sum(s['dropped'] for s in victim.incoming_queue.stats().values())
+    rate_limited = victim.filtered['rate_limited']
+    victim.stop()
+    peer.stop()
+    ordered = sorted(latencies)
+    return {
+        'sent': sent,
+        'delivered': len(ordered),
+        'p50': statistics.median(ordered) * 1000 if ordered else 0.0,
+        'p99': ordered[int(len(ordered) * 0.99) - 1] * 1000 if ordered else 0.0,
+        'flood_delivered': flood_delivered[0],
+        'rate_limited': rate_limited,
+        'queue_dropped': dropped,
+        'peak_threads': peak_threads[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest flood protection benchmark')
+    parser.add_argument('--duration', type=float, default=5.0, help='Giây flood')
+    parser.add_argument('--rate', type=float, default=50.0, help='Tin riêng hợp lệ mỗi giây')
+    parser.add_argument('--port', type=int, default=6500)
+    args = parser.parse_args()
+
+    print(f"{'flood':<6} {'limits':<7} {'legit sent':>10} {'delivered':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'flood->app':>10} {'limited':>8} {'q dropped':>9} {'threads':>7}")
+    port = args.port
+    for flood, limited in ((False, False), (True, False), (True, True)):
+        r = _run(flood, limited, args, port)
+        port += 2
+        print(f"{'yes' if flood else 'no':<6} {'on' if limited else 'off':<7} {r['sent']:>10} {r['delivered']:>9} "
+              f"{r['p50']:>8.2f} {r['p99']:>8.2f} {r['flood_delivered']:>10} "
+              f"{r['rate_limited']:>8} {r['queue_dropped']:>9} {r['peak_threads']:>7}")
+
+
+if __name__ == "__main__":
+    main()
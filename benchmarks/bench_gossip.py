@@ -0,0 +1,119 @@
+"""
+Mô phỏng lan truyền tin nhóm - gửi trực tiếp (hình sao), gossip ngẫu nhiên (epidemic)
+và cây (core.group) theo kích thước nhóm
+(độ phủ, độ trễ p50/p99/max, số gói, tải của người gửi)
+
+Mô phỏng sự kiện rời rạc, không dùng socket: mỗi node gửi tuần tự (send_cost mỗi gói),
+mỗi gói đi mất delay ± jitter. Gói mất (xác suất loss) được truyền lại sau rto như lớp
+reliability. Chế độ cây dùng đúng tree_targets/tree_ttl của core.group.
+Chạy: python -m benchmarks.bench_gossip
+"""
+import argparse
+import heapq
+import random
+import statistics
+import uuid
+from core.group import TREE_FANOUT, tree_targets, tree_ttl
+
+MODES = ("direct", "epidemic", "tree")
+
+
+def _epidemic_targets(ports: list, exclude: set, fanout: int, rng: random.Random) -> list:
+    """Gossip đẩy ngẫu nhiên: mỗi node nhận lần đầu gửi cho `fanout` node bất kỳ"""
+    candidates = [port for port in ports if port not in exclude]
+    return candidates if len(candidates) <= fanout else rng.sample(candidates, fanout)
+
+
+def _targets(mode: str, ports: list, node: int, src: int, msg_id: str, fanout: int,
+             rng: random.Random) -> list:
+    if mode == "tree":
+        return tree_targets(ports, 0, msg_id, fanout, None if node == 0 else node)
+    if mode == "epidemic":
+        return _epidemic_targets(ports, {node, 0, src}, fanout, rng)
+    return ports[1:] if node == 0 else []
+
+
+def _simulate(members: int, mode: str, fanout: int, ttl: int, args, rng: random.Random) -> dict:
+    """Node 0 gửi 1 tin; trả về thời điểm nhận đầu tiên của từng node và số gói"""
+    ports = list(range(members))
+    msg_id = str(uuid.UUID(int=rng.getrandbits(128)))[:8]
+    busy_until = [0.0] * members  # Node gửi tuần tự: gói sau chờ gói trước
+    sent = [0] * members
+    received = {0: 0.0}
+    hops = {0: 0}
+    events = []  # heap (thời điểm đến, n, đích, nguồn, ttl)
+    counter = 0
+
+    def send(src: int, targets: list, now: float, remaining: int):
+        nonlocal counter
+        start = max(now, busy_until[src])
+        for index, dst in enumerate(targets, 1):
+            sent[src] += 1
+            arrival = start + index * args.send_cost + args.delay + rng.uniform(0, args.jitter)
+            while rng.random() < args.loss:
+                sent[src] += 1
+                arrival += args.rto
+            counter += 1
+            heapq.heappush(events, (arrival, counter, dst, src, remaining))
+        busy_until[src] = start + len(targets) * args.send_cost
+
+    send(0, _targets(mode, ports, 0, 0, msg_id, fanout, rng), 0.0, ttl)
+
+    while events:
+        now, _, dst, src, remaining = heapq.heappop(events)
+        if dst in received:
+            continue  # Trùng msg_id -> không chuyển tiếp lại
+        received[dst] = now
+        hops[dst] = hops[src] + 1
+        if remaining:
+            send(dst, _targets(mode, ports, dst, src, msg_id, fanout, rng), now, remaining - 1)
+
+    latencies = sorted(t for node, t in received.items() if node != 0)
+    return {
+        'coverage': len(latencies) / (members - 1),
+        'latencies': latencies,
+        'packets': sum(sent),
+        'sender_packets': sent[0],
+        'hops': max(hops.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Group dissemination simulation')
+    parser.add_argument('--members', type=int, nargs='+', default=[16, 64, 128, 256, 512, 1024])
+    parser.add_argument('--fanout', type=int, default=TREE_FANOUT)
+    parser.add_argument('--ttl', type=int, default=None, help='Mặc định: tree_ttl(N, fanout)')
+    parser.add_argument('--trials', type=int, default=50)
+    parser.add_argument('--send-cost', type=float, default=0.00002, help='Giây CPU mỗi gói gửi')
+    parser.add_argument('--delay', type=float, default=0.0005, help='Giây trễ đường truyền')
+    parser.add_argument('--jitter', type=float, default=0.0005)
+    parser.add_argument('--loss', type=float, default=0.0)
+    parser.add_argument('--rto', type=float, default=0.05, help='Giây chờ trước khi truyền lại')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"fanout={args.fanout} loss={args.loss:.1%} send_cost={args.send_cost * 1e6:.0f}µs "
+          f"delay={args.delay * 1000:.1f}ms, {args.trials} lần/ô\n")
+    print(f"{'members':>7} {'mode':<8} {'ttl':>4} {'coverage':>9} {'min cov':>8} {'p50 ms':>7} "
+          f"{'p99 ms':>7} {'max ms':>7} {'hops':>5} {'pkts/msg':>9} {'sender':>7}")
+    for members in args.members:
+        ttl = args.ttl if args.ttl is not None else tree_ttl(members, args.fanout)
+        for mode in MODES:
+            runs = [_simulate(members, mode, args.fanout, ttl, args, rng)
+                    for _ in range(args.trials)]
+            latencies = sorted(t for r in runs for t in r['latencies'])
+            coverage = [r['coverage'] for r in runs]
+            print(f"{members:>7} {mode:<8} "
+                  f"{ttl if mode != 'direct' else '-':>4} {statistics.mean(coverage):>9.2%} "
+                  f"{min(coverage):>8.1%} "
+                  f"{statistics.median(latencies) * 1000:>7.2f} "
+                  f"{latencies[int(len(latencies) * 0.99) - 1] * 1000:>7.2f} "
+                  f"{latencies[-1] * 1000:>7.2f} "
+                  f"{max(r['hops'] for r in runs):>5} "
+                  f"{statistics.mean(r['packets'] for r in runs):>9.0f} "
+                  f"{statistics.mean(r['sender_packets'] for r in runs):>7.0f}")
+
+
+if __name__ == "__main__":
+    main()
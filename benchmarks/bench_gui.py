@@ -0,0 +1,167 @@
+"""
+Benchmark cập nhật danh sách thiết bị - gửi cả dict + dựng lại vs delta + sửa từng dòng
+
+- legacy: mỗi lần update discovery copy cả dict, giao diện tính hash str(sorted(...)),
+  copy lại rồi xóa và tạo lại mọi dòng
+- delta: discovery gom thay đổi vào DeltaTracker, giao diện áp delta và chỉ tạo/xóa/đổi
+  nhãn các dòng bị ảnh hưởng (ChatGUI.apply_devices_delta)
+Mỗi vòng có --churn peer thay đổi (1/3 vào mạng, 1/3 rời mạng, 1/3 đổi tên) trên --peers peer.
+Phần core đo ở mọi nơi; phần Tk (ChatGUI thật, cửa sổ ẩn) chỉ khi có display.
+
+Chạy: python -m benchmarks.bench_gui [--peers 500] [--churn 6] [--rounds 200]
+"""
+import argparse
+import time
+from core.addressing import DEFAULT_HOST
+from core.deltas import DeltaTracker
+from core.discovery import Device
+
+BASE_PORT = 20000
+
+
+def _device(index: int, name: str = None) -> Device:
+    return Device(device_id=f"peer{index}", name=name or f"Peer {index}",
+                  port=BASE_PORT + index, last_seen=time.time(), host=DEFAULT_HOST)
+
+
+def _rounds(peers: int, churn: int, rounds: int):
+    """Các vòng thay đổi giống nhau cho mọi chế độ: list (op, device)"""
+    alive = list(range(peers))
+    next_index = peers
+    plan = []
+    for r in range(rounds):
+        ops = []
+        for i in range(churn):
+            kind = i % 3
+            if kind == 0:
+                ops.append(('add', _device(next_index)))
+                alive.append(next_index)
+                next_index += 1
+            elif kind == 1:
+                index = alive.pop(0)
+                ops.append(('remove', _device(index)))
+            else:
+                index = alive[(r * churn + i) % len(alive)]
+                ops.append(('change', _device(index, f"Peer {index} #{r}")))
+        plan.append(ops)
+    return plan
+
+
+def _apply(devices: dict, op: str, device: Device):
+    if op == 'remove':
+        devices.pop(device.device_id, None)
+    else:
+        devices[device.device_id] = device
+
+
+def bench_core(peers: int, plan) -> dict:
+    """µs mỗi lần update (phía core + dữ liệu của giao diện) và số dòng phải dựng"""
+    results = {}
+
+    # legacy: copy -> hash -> copy -> dựng lại N dòng nếu hash đổi
+    devices = {d.device_id: d for d in map(_device, range(peers))}
+    gui_devices, last_hash, rows = {}, "", 0
+    start = time.perf_counter()
+    for ops in plan:
+        for op, device in ops:
+            _apply(devices, op, device)
+        devices_copy = dict(devices)
+        new_hash = str(sorted([(d.device_id, d.endpoint) for d in devices_copy.values()]))
+        if new_hash != last_hash:
+            last_hash = new_hash
+            gui_devices = dict(devices_copy)
+            rows += len(gui_devices)
+    results['legacy'] = ((time.perf_counter() - start) / len(plan) * 1e6, rows / len(plan))
+
+    # delta: tracker -> take -> apply, chỉ các dòng trong delta
+    devices = {d.device_id: d for d in map(_device, range(peers))}
+    gui_devices = dict(devices)
+    tracker, rows = DeltaTracker(), 0
+    start = time.perf_counter()
+    for ops in plan:
+        for op, device in ops:
+            _apply(devices, op, device)
+            getattr(tracker, op)(device.device_id, device)
+        delta = tracker.take()
+        if delta:
+            delta.apply(gui_devices)
+            rows += len(delta.added) + len(delta.changed) + len(delta.removed)
+    results['delta'] = ((time.perf_counter() - start) / len(plan) * 1e6, rows / len(plan))
+    assert gui_devices == devices
+    return results
+
+
+def bench_tk(peers: int, plan) -> dict:
+    """ms mỗi lần cập nhật widget của ChatGUI thật (None nếu không có display)"""
+    try:
+        from ui.gui import ChatGUI
+        gui = ChatGUI("bench", 0)
+    except Exception as e:
+        print(f"\nBỏ qua phần Tk: {e}")
+        return None
+    gui.root.withdraw()
+    results = {}
+    try:
+        # legacy: xóa và tạo lại mọi dòng (như _rebuild_devices cũ)
+        devices = {d.device_id: d for d in map(_device, range(peers))}
+        start = time.perf_counter()
+        for ops in plan:
+            for op, device in ops:
+                _apply(devices, op, device)
+            for w in gui.devices_frame.winfo_children():
+                w.destroy()
+            gui._device_widgets.clear()
+            with gui._data_lock:
+                gui._devices = dict(devices)
+            for did, device in devices.items():
+                gui._device_widgets[did] = gui._create_device_item(did, device)
+            gui.devices_count.config(text=f"({len(devices)})")
+            gui.root.update_idletasks()
+        results['legacy'] = (time.perf_counter() - start) / len(plan) * 1e3
+
+        # delta: bắt đầu từ cùng danh sách ban đầu
+        for w in gui.devices_frame.winfo_children():
+            w.destroy()
+        gui._device_widgets.clear()
+        with gui._data_lock:
+            gui._devices = {}
+        tracker = DeltaTracker()
+        for device in map(_device, range(peers)):
+            tracker.add(device.device_id, device)
+        gui.apply_devices_delta(tracker.take())
+        gui.root.update_idletasks()
+        start = time.perf_counter()
+        for ops in plan:
+            for op, device in ops:
+                getattr(tracker, op)(device.device_id, device)
+            gui.apply_devices_delta(tracker.take())
+            gui.root.update_idletasks()
+        results['delta'] = (time.perf_counter() - start) / len(plan) * 1e3
+    finally:
+        gui.root.destroy()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Device list update benchmark')
+    parser.add_argument('--peers', type=int, default=500)
+    parser.add_argument('--churn', type=int, default=6, help='Peer thay đổi mỗi vòng update')
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--tk-rounds', type=int, default=20, help='Số vòng cho phần Tk (chậm)')
+    args = parser.parse_args()
+
+    plan = _rounds(args.peers, args.churn, args.rounds)
+    print(f"{args.peers} peer, {args.churn} thay đổi mỗi update, {args.rounds} update")
+    print(f"{'mode':<8} {'µs/update (core)':>17} {'dòng dựng/update':>17}")
+    for name, (us, rows) in bench_core(args.peers, plan).items():
+        print(f"{name:<8} {us:>17.1f} {rows:>17.1f}")
+
+    tk_results = bench_tk(args.peers, plan[:args.tk_rounds])
+    if tk_results:
+        print(f"\nTk ({args.tk_rounds} update): {'ms/update':>10}")
+        for name, ms in tk_results.items():
+            print(f"{name:<8} {'':>14}{ms:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
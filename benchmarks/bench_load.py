@@ -0,0 +1,354 @@
+"""
+Benchmark tải - N node headless (run_demo.start_node + main.py --headless) trên localhost
+điều khiển qua lệnh JSON stdin, chạy hỗn hợp broadcast / tin riêng / tin nhóm K người
+(thông lượng, tỉ lệ giao, độ trễ đầu-cuối p50/p95/p99) và ghi báo cáo JSON để so sánh
+giữa các commit
+
+Độ trễ: thời điểm harness ghi lệnh -> thời điểm node nhận phát sự kiện "message"
+(cùng đồng hồ time.time() của máy).
+Chạy: python -m benchmarks.bench_load --nodes 8 --rate 100 --duration 10 -o load.json
+      python -m benchmarks.bench_load --compare load.json   (chạy lại và so với báo cáo cũ)
+      python -m benchmarks.bench_load --hosts 127.0.0.2,127.0.0.3   (chia node theo địa chỉ
+      loopback, các node cùng port trên host khác nhau; Linux không cần cấu hình thêm)
+Tham số thêm cho main.py: --node-arg=--tcp --node-arg=--no-rate-limit
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+from core.addressing import node_id
+from run_demo import SCRIPT_DIR, start_node
+
+KINDS = ("broadcast", "private", "group")
+MARKER = "LG"  # Tiền tố nội dung tin của harness: LG|token|thời điểm gửi|đệm
+
+
+class _Node:
+    """1 tiến trình main.py --headless và luồng đọc sự kiện của nó"""
+
+    def __init__(self, name: str, port: int, node_args: List[str], on_event,
+                 host: Optional[str] = None):
+        self.name = name
+        self.port = port
+        self.host = host
+        self.user_id = node_id(name, port, host)
+        if host:
+            node_args = ["--host", host, *node_args]
+        self.devices = set()
+        self.groups: Dict[str, str] = {}  # group_id -> name
+        self.ready = threading.Event()
+        self._on_event = on_event
+        self._write_lock = threading.Lock()
+        self.proc = start_node(
+            name, port, ["--headless", *node_args],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding="utf-8", bufsize=1
+        )
+        threading.Thread(target=self._read_events, daemon=True).start()
+
+    def command(self, **request):
+        line = json.dumps(request, ensure_ascii=False) + "\n"
+        with self._write_lock:
+            try:
+                self.proc.stdin.write(line)
+                self.proc.stdin.flush()
+            except (OSError, ValueError):
+                pass
+
+    def stop(self, timeout: float = 5.0):
+        self.command(cmd="quit")
+        try:
+            self.proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+    def _read_events(self):
+        for line in self.proc.stdout:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            kind = event.get('event')
+            if kind == 'status':
+                self.ready.set()
+            elif kind == 'devices' or (kind == 'ok' and event.get('cmd') == 'devices'):
+                self.devices = {d['id'] for d in event['devices']}
+            elif kind == 'groups':
+                self.groups = {g['id']: g['name'] for g in event['groups']}
+            elif kind == 'message':
+                self._on_event(self, event)
+
+
+class LoadRun:
+    """Khởi động node, tạo nhóm, phát tải và gom kết quả"""
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.nodes: List[_Node] = []
+        self.group_members: Dict[str, List[_Node]] = {}  # group_id -> thành viên
+
+        self._lock = threading.Lock()
+        self._sent: Dict[str, dict] = {}  # token -> kind, expected, sent_at
+        self._received: Dict[str, set] = {}  # token -> user_id đã nhận
+        self._latencies: Dict[str, List[float]] = {kind: [] for kind in KINDS}
+        self._duplicates = 0
+        self._last_delivery = 0.0
+
+    def run(self) -> dict:
+        try:
+            self._start_nodes()
+            self._discover()
+            self._create_groups()
+            started, finished = self._drive()
+            time.sleep(self.args.drain)
+            return self._results(started, finished)
+        finally:
+            for node in self.nodes:
+                node.stop()
+
+    def _start_nodes(self):
+        hosts = self.args.hosts.split(",") if self.args.hosts else [None]
+        for i in range(self.args.nodes):
+            # Chia lần lượt theo host; node trên host khác nhau dùng chung port
+            host = hosts[i % len(hosts)]
+            port = self.args.base_port + i // len(hosts)
+            node = _Node(f"N{i}", port, self.args.node_arg, self._on_message, host)
+            self.nodes.append(node)
+        deadline = time.monotonic() + self.args.settle
+        for node in self.nodes:
+            if not node.ready.wait(max(deadline - time.monotonic(), 0)):
+                raise RuntimeError(f"{node.user_id} did not start (exit code {node.proc.poll()})")
+
+    def _discover(self):
+        """Quét đến khi mọi node thấy đủ N-1 node còn lại"""
+        expected = len(self.nodes) - 1
+        deadline = time.monotonic() + self.args.settle
+        while time.monotonic() < deadline:
+            missing = [node for node in self.nodes if len(node.devices) < expected]
+            if not missing:
+                return
+            for node in missing:
+                node.command(cmd="scan")
+            time.sleep(1.0)
+            for node in missing:
+                node.command(cmd="devices")
+            time.sleep(0.2)
+        seen = min(len(node.devices) for node in self.nodes)
+        print(f"Cảnh báo: discovery chưa đủ sau {self.args.settle:.0f}s (ít nhất {seen}/{expected})")
+
+    def _create_groups(self):
+        """Nhóm i: node i tạo, thêm K-1 node kế tiếp (vòng tròn)"""
+        size = min(self.args.group_size, len(self.nodes))
+        if size < 2 or not self._weights().get('group'):
+            return
+        for i in range(self.args.groups):
+            creator = self.nodes[i % len(self.nodes)]
+            members = [self.nodes[(i + j) % len(self.nodes)] for j in range(size)]
+            name = f"load{i}"
+            creator.command(cmd="create_group", name=name,
+                            members=[node.user_id for node in members[1:]])
+            deadline = time.monotonic() + self.args.settle
+            group_id = None
+            while time.monotonic() < deadline:
+                group_id = next((gid for gid, n in creator.groups.items() if n == name), None)
+                if group_id and all(group_id in node.groups for node in members):
+                    break
+                time.sleep(0.1)
+            else:
+                print(f"Cảnh báo: nhóm {name} chưa đến đủ {size} thành viên")
+            if group_id:
+                self.group_members[group_id] = members
+
+    def _weights(self) -> Dict[str, float]:
+        weights = {}
+        for part in self.args.mix.split(","):
+            kind, _, weight = part.partition("=")
+            if kind.strip() not in KINDS:
+                raise ValueError(f"unknown message kind in --mix: {kind}")
+            weights[kind.strip()] = float(weight or 1)
+        return weights
+
+    def _drive(self):
+        """Gửi tin theo tốc độ cố định trong `duration` giây"""
+        weights = self._weights()
+        if not self.group_members:
+            weights.pop('group', None)
+        kinds = list(weights)
+        interval = 1.0 / self.args.rate
+        started = time.time()
+        next_at = time.monotonic()
+        end = next_at + self.args.duration
+        while next_at < end:
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._send_one(self.rng.choices(kinds, [weights[k] for k in kinds])[0])
+            next_at += interval
+        return started, time.time()
+
+    def _send_one(self, kind: str):
+        size = self.rng.choice(self.args.sizes)
+        token = uuid.uuid4().hex[:12]
+        sent_at = time.time()
+        content = f"{MARKER}|{token}|{sent_at:.6f}|"
+        content += "x" * max(size - len(content), 0)
+
+        if kind == "group":
+            group_id = self.rng.choice(list(self.group_members))
+            members = self.group_members[group_id]
+            sender = self.rng.choice(members)
+            expected = len(members) - 1
+            request = {'cmd': 'group', 'group_id': group_id}
+        elif kind == "private":
+            sender, target = self.rng.sample(self.nodes, 2)
+            expected = 1
+            request = {'cmd': 'private', 'target_id': target.user_id, 'target_port': target.port,
+                       'target_host': target.host}
+        else:
+            sender = self.rng.choice(self.nodes)
+            expected = len(self.nodes) - 1
+            request = {'cmd': 'broadcast'}
+
+        with self._lock:
+            self._sent[token] = {'kind': kind, 'expected': expected, 'sent_at': sent_at}
+            self._received[token] = set()
+        sender.command(content=content, **request)
+
+    def _on_message(self, node: _Node, event: dict):
+        parts = event.get('content', '').split("|", 3)
+        if len(parts) < 3 or parts[0] != MARKER:
+            return
+        token = parts[1]
+        with self._lock:
+            sent = self._sent.get(token)
+            if sent is None:
+                return
+            receivers = self._received[token]
+            if node.user_id in receivers:
+                self._duplicates += 1
+                return
+            receivers.add(node.user_id)
+            self._latencies[sent['kind']].append(event['time'] - sent['sent_at'])
+            self._last_delivery = max(self._last_delivery, event['time'])
+
+    def _results(self, started: float, finished: float) -> dict:
+        with self._lock:
+            results = {}
+            for kind in KINDS + ("overall",):
+                tokens = [t for t, s in self._sent.items() if kind in ("overall", s['kind'])]
+                if not tokens:
+                    continue
+                expected = sum(self._sent[t]['expected'] for t in tokens)
+                delivered = sum(len(self._received[t]) for t in tokens)
+                latencies = sorted(
+                    sum(self._latencies.values(), []) if kind == "overall" else self._latencies[kind]
+                )
+                results[kind] = _summary(len(tokens), expected, delivered, latencies)
+            span = max(self._last_delivery, finished) - started
+            results['overall'].update(
+                send_rate=len(self._sent) / (finished - started),
+                deliveries_per_sec=results['overall']['delivered'] / span,
+                duplicates=self._duplicates,
+            )
+        return results
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)] if ordered else 0.0
+
+
+def _summary(sent: int, expected: int, delivered: int, latencies: List[float]) -> dict:
+    return {
+        'sent': sent,
+        'expected': expected,
+        'delivered': delivered,
+        'delivery_ratio': delivered / expected if expected else 0.0,
+        'p50_ms': _percentile(latencies, 0.50) * 1000,
+        'p95_ms': _percentile(latencies, 0.95) * 1000,
+        'p99_ms': _percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+    }
+
+
+def _git(*args) -> Optional[str]:
+    try:
+        return subprocess.run(["git", *args], cwd=SCRIPT_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _print_results(results: dict, baseline: Optional[dict] = None):
+    print(f"{'kind':<10} {'sent':>6} {'delivered':>10} {'ratio':>8} {'p50 ms':>8} "
+          f"{'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for kind, r in results.items():
+        print(f"{kind:<10} {r['sent']:>6} {r['delivered']:>10} {r['delivery_ratio']:>8.2%} "
+              f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['max_ms']:>8.2f}")
+        old = (baseline or {}).get(kind)
+        if old:
+            print(f"{'  before':<10} {old['sent']:>6} {old['delivered']:>10} {old['delivery_ratio']:>8.2%} "
+                  f"{old['p50_ms']:>8.2f} {old['p95_ms']:>8.2f} {old['p99_ms']:>8.2f} {old['max_ms']:>8.2f}")
+    overall = results['overall']
+    print(f"\ngửi {overall['send_rate']:.0f} tin/s, giao {overall['deliveries_per_sec']:.0f} lượt/s, "
+          f"{overall['duplicates']} lượt trùng")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Localhost load-generation benchmark (headless nodes)')
+    parser.add_argument('--nodes', type=int, default=8, help='Số node headless')
+    parser.add_argument('--base-port', type=int, default=7600,
+                        help='Node i dùng port base+i (có --hosts: base+i/số host)')
+    parser.add_argument('--hosts', type=str, default=None, metavar='IP,IP,...',
+                        help='Chia node lần lượt cho các địa chỉ này (vd 127.0.0.2,127.0.0.3)')
+    parser.add_argument('--rate', type=float, default=100.0, help='Tổng số tin gửi mỗi giây')
+    parser.add_argument('--duration', type=float, default=10.0, help='Giây phát tải')
+    parser.add_argument('--mix', type=str, default="broadcast=1,private=3,group=2",
+                        help='Tỉ trọng loại tin, vd broadcast=1,private=3,group=2')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 512, 2048],
+                        help='Byte nội dung (chọn ngẫu nhiên mỗi tin)')
+    parser.add_argument('--groups', type=int, default=2, help='Số nhóm')
+    parser.add_argument('--group-size', type=int, default=4, help='Số thành viên mỗi nhóm (K)')
+    parser.add_argument('--settle', type=float, default=20.0,
+                        help='Giây tối đa chờ khởi động / discovery / tạo nhóm')
+    parser.add_argument('--drain', type=float, default=3.0, help='Giây chờ tin đến sau khi dừng gửi')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--node-arg', action='append', default=[],
+                        help='Tham số thêm cho main.py (lặp được), vd --node-arg=--tcp')
+    parser.add_argument('-o', '--output', type=str, default=None, help='Ghi báo cáo JSON')
+    parser.add_argument('--compare', type=str, default=None, help='Báo cáo JSON cũ để so sánh')
+    args = parser.parse_args()
+    if args.nodes < 2:
+        parser.error("--nodes must be >= 2")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"So với {args.compare} (commit {baseline.get('commit')})")
+
+    results = LoadRun(args).run()
+    report = {
+        'commit': _git("rev-parse", "--short", "HEAD"),
+        'dirty': bool(_git("status", "--porcelain", "--untracked-files=no")),
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        'results': results,
+    }
+    _print_results(results, baseline and baseline.get('results'))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Đã ghi {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark NetworkManager - Bản thread so với bản asyncio
+(packets/sec khi nhận dồn dập, CPU và số lần thức dậy khi rảnh)
+
+Chạy: python -m benchmarks.bench_network
+"""
+import argparse
+import resource
+import socket
+import threading
+import time
+from core import NetworkManager, AsyncNetworkManager
+from core.message import Message, MessageType
+from core.codec import CODEC_BINARY, encode_message
+from utils.logger import Logger
+
+
+def _packets(count: int):
+    return [
+        encode_message(Message(MessageType.TEXT, "Blaster_9999", "Blaster", 9999, f"msg {i}"),
+                       CODEC_BINARY)
+        for i in range(count)
+    ]
+
+
+def _measure_throughput(manager_cls, port: int, packets: list, burst: int) -> dict:
+    logger = Logger(f"bench_{manager_cls.__name__}")
+    manager = manager_cls(port, "Bench", logger)
+    received = 0
+    last = [time.perf_counter()]
+    lock = threading.Lock()
+
+    def on_message(message):
+        nonlocal received
+        with lock:
+            received += 1
+            last[0] = time.perf_counter()
+
+    manager.on_message_received = on_message
+    manager.start()
+    time.sleep(0.3)
+
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    start = time.perf_counter()
+    for i, data in enumerate(packets, 1):
+        sender.sendto(data, ("127.0.0.1", port))
+        # Gửi theo đợt để buffer kernel của bên nhận không tràn ngay
+        if i % burst == 0:
+            time.sleep(0.001)
+    # Chờ đến khi không còn gói nào đến trong 0.5s
+    while time.perf_counter() - max(last[0], start) < 0.5:
+        time.sleep(0.05)
+    elapsed = last[0] - start
+
+    manager.stop()
+    sender.close()
+    return {'received': received, 'pps': received / elapsed if elapsed > 0 else 0.0}
+
+
+def _measure_idle(manager_cls, port: int, duration: float) -> dict:
+    logger = Logger(f"bench_idle_{manager_cls.__name__}")
+    manager = manager_cls(port, "Idle", logger)
+    manager.start()
+    time.sleep(0.5)
+
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_before = time.process_time()
+    time.sleep(duration)
+    cpu = time.process_time() - cpu_before
+    after = resource.getrusage(resource.RUSAGE_SELF)
+
+    threads = threading.active_count()
+    manager.stop()
+    time.sleep(0.6)
+    return {
+        'cpu_ms': cpu * 1000,
+        'wakeups_per_sec': (after.ru_nvcsw - before.ru_nvcsw) / duration,
+        'threads': threads,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='NetworkManager benchmark')
+    parser.add_argument('--packets', type=int, default=20000)
+    parser.add_argument('--idle', type=float, default=3.0)
+    parser.add_argument('--burst', type=int, default=50)
+    parser.add_argument('--port', type=int, default=5600)
+    args = parser.parse_args()
+
+    packets = _packets(args.packets)
+    for cls in (NetworkManager, AsyncNetworkManager):
+        tp = _measure_throughput(cls, args.port, packets, args.burst)
+        idle = _measure_idle(cls, args.port + 1, args.idle)
+        print(f"{cls.__name__:<22} recv {tp['received']:>6}/{len(packets)}  "
+              f"{tp['pps']:>9,.0f} pkt/s | idle {args.idle:.0f}s: cpu {idle['cpu_ms']:.1f} ms, "
+              f"{idle['wakeups_per_sec']:.1f} wakeups/s, {idle['threads']} threads")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark đường nhận - recvfrom (cũ) so với recvfrom_into + selector (mới)
+(gói/giây, số gói mất khi gửi dồn dập, bộ nhớ cấp phát mỗi gói)
+
+Chạy: python -m benchmarks.bench_receive
+"""
+import argparse
+import socket
+import threading
+import time
+import tracemalloc
+from core import NetworkManager
+from core.codec import CODEC_BINARY, encode_message
+from core.message import Message, MessageType
+from utils.logger import Logger
+
+
+class _LegacyNetworkManager(NetworkManager):
+    """Đường nhận cũ: mỗi socket 1 thread, recvfrom(65535) từng gói với timeout"""
+
+    def _receive_loop(self, sockets: list):
+        for sock in sockets[1:]:
+            threading.Thread(target=self._receive_one, args=(sock,), daemon=True).start()
+        self._receive_one(sockets[0])
+
+    def _receive_one(self, sock: socket.socket):
+        sock.settimeout(0.5)
+        while self.running:
+            try:
+                data, addr = sock.recvfrom(self.BUFFER_SIZE)
+                self._on_packet(data, addr)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+
+
+def _packets(count: int) -> list:
+    return [
+        encode_message(Message(MessageType.TEXT, "Sender_5999", "Sender", 5999,
+                               f"tin nhắn số {i}"), CODEC_BINARY)
+        for i in range(count)
+    ]
+
+
+def _received(manager: NetworkManager) -> int:
+    # Tin đã qua giải mã: được xếp hàng hoặc bị hàng đợi bỏ
+    stats = manager.incoming_queue.stats().values()
+    return sum(s['enqueued'] + s['coalesced'] + s['dropped'] for s in stats)
+
+
+def _run(legacy: bool, recv_buffer, packets: list, port: int, burst: int, pause: float) -> dict:
+    cls = _LegacyNetworkManager if legacy else NetworkManager
+    manager = cls(port, "Receiver", Logger("bench_receive"), batching=False,
+                  broadcast_mode="sweep", recv_buffer=recv_buffer)
+    manager.on_message_received = lambda message: None
+    manager.start()
+    time.sleep(0.1)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    addr = ("127.0.0.1", port)
+    start = time.perf_counter()
+    for index, data in enumerate(packets, 1):
+        sock.sendto(data, addr)
+        if index % burst == 0:
+            time.sleep(pause)
+
+    # Chờ đến khi không còn gói mới
+    last, last_change = -1, time.perf_counter()
+    while time.perf_counter() - last_change < 0.3:
+        received = _received(manager)
+        if received != last:
+            last, last_change = received, time.perf_counter()
+        time.sleep(0.01)
+    elapsed = last_change - start
+
+    sock.close()
+    manager.stop()
+    return {
+        'received': last,
+        'lost': len(packets) - last,
+        'rate': last / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def _alloc_per_packet(legacy: bool, packets: list, port: int) -> float:
+    """Bộ nhớ cấp phát tạm (peak) trung bình mỗi lần nhận 1 gói, chỉ tầng socket"""
+    recv = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    recv.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, NetworkManager.RECV_BUFFER)
+    recv.bind(("127.0.0.1", port))
+    send = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for data in packets:
+        send.sendto(data, ("127.0.0.1", port))
+
+    buffer = bytearray(NetworkManager.BUFFER_SIZE)
+    view = memoryview(buffer)
+    total = 0
+    tracemalloc.start()
+    for _ in packets:
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        if legacy:
+            data, addr = recv.recvfrom(NetworkManager.BUFFER_SIZE)
+        else:
+            size, addr = recv.recvfrom_into(buffer)
+            data = view[:size]
+        total += tracemalloc.get_traced_memory()[1] - current
+        del data, addr
+    tracemalloc.stop()
+    recv.close()
+    send.close()
+    return total / len(packets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Receive path benchmark')
+    parser.add_argument('--count', type=int, default=20000)
+    parser.add_argument('--port', type=int, default=5400)
+    parser.add_argument('--burst', type=int, default=2000, help='Số gói gửi liền mỗi đợt')
+    parser.add_argument('--pause', type=float, default=0.05, help='Giây nghỉ giữa các đợt')
+    args = parser.parse_args()
+
+    packets = _packets(args.count)
+    print(f"{len(packets)} gói, {len(packets[0])} byte/gói\n")
+    print(f"{'path':<8} {'SO_RCVBUF':>10} {'received':>9} {'lost':>7} {'pkt/s':>9}")
+    # Mỗi lượt dùng port mới: socket cũ có thể còn nhận (SO_REUSEPORT) đến khi thread nhận thoát
+    port = args.port
+    for legacy, recv_buffer in ((True, None), (False, None), (False, NetworkManager.RECV_BUFFER)):
+        r = _run(legacy, recv_buffer, packets, port, args.burst, args.pause)
+        port += 1
+        print(f"{'old' if legacy else 'new':<8} {recv_buffer or 'default':>10} "
+              f"{r['received']:>9} {r['lost']:>7} {r['rate']:>9.0f}")
+
+    print(f"\n{'path':<8} {'alloc B/pkt':>12}")
+    sample = packets[:2000]
+    for legacy in (True, False):
+        per_packet = _alloc_per_packet(legacy, sample, port)
+        port += 1
+        print(f"{'old' if legacy else 'new':<8} {per_packet:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark relay - Client tự fan-out tin nhóm so với gửi 1 bản qua node relay
+(số gói client gửi, µs CPU của caller mỗi tin, lượt giao/giây, độ trễ p50/p99)
+
+Chạy: python -m benchmarks.bench_relay
+"""
+import argparse
+import statistics
+import threading
+import time
+from core import NetworkManager
+from utils.logger import Logger
+from benchmarks.bench_batching import _introduce
+
+
+def _run(use_relay: bool, members: int, count: int, size: int, port: int) -> dict:
+    logger = Logger("bench_relay")
+    client = NetworkManager(port, "Client", logger)
+    receivers = [NetworkManager(port + 2 + i, f"R{i}", logger) for i in range(members)]
+    nodes = [client] + receivers
+    if use_relay:
+        nodes.append(NetworkManager(port + 1, "Relay", logger, relay=True))
+
+    latencies = []
+    last = [0.0]
+    lock = threading.Lock()
+    done = threading.Event()
+    expected = count * members
+
+    def on_message(message):
+        now = time.perf_counter()
+        sent_at = float(message.content.split("|", 1)[0])
+        with lock:
+            latencies.append(now - sent_at)
+            last[0] = now
+            if len(latencies) >= expected:
+                done.set()
+
+    for node in nodes:
+        node.start()
+    for node in receivers:
+        node.on_message_received = on_message
+    for i, a in enumerate(nodes):
+        for b in nodes[i + 1:]:
+            _introduce(a, b)
+    time.sleep(0.3)
+
+    ports = [node.port for node in receivers]
+    padding = "x" * size
+    start = time.perf_counter()
+    cpu = time.thread_time()
+    results = [
+        client.send_group_message(f"{time.perf_counter():.9f}|{padding}", "bench", ports)
+        for _ in range(count)
+    ]
+    cpu = time.thread_time() - cpu
+    done.wait(30)
+    elapsed = last[0] - start
+    for result in results:
+        result.wait(5)
+    client_sent = client.reliability.stats()['sent']
+
+    for node in nodes:
+        node.stop()
+
+    with lock:
+        ordered = sorted(latencies)
+    return {
+        'client_sent': client_sent,
+        'cpu_us': cpu / count * 1e6,
+        'delivered': len(ordered),
+        'rate': len(ordered) / elapsed if elapsed > 0 else 0.0,
+        'p50': statistics.median(ordered) * 1000 if ordered else 0.0,
+        'p99': ordered[int(len(ordered) * 0.99) - 1] * 1000 if ordered else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Relay vs direct group fan-out benchmark')
+    parser.add_argument('--count', type=int, default=200, help='Số tin nhóm')
+    parser.add_argument('--size', type=int, default=200, help='Byte nội dung mỗi tin')
+    parser.add_argument('--members', type=int, nargs='+', default=[8, 32])
+    parser.add_argument('--port', type=int, default=6300)
+    args = parser.parse_args()
+
+    print(f"{'members':>7} {'path':<6} {'client pkts':>11} {'caller µs':>10} {'delivered':>9} "
+          f"{'deliv/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    # Mỗi lượt dùng dải port mới (socket cũ có thể còn nhận đến khi thread nhận thoát)
+    port = args.port
+    for members in args.members:
+        for use_relay in (False, True):
+            r = _run(use_relay, members, args.count, args.size, port)
+            port += members + 2
+            print(f"{members:>7} {'relay' if use_relay else 'direct':<6} {r['client_sent']:>11} "
+                  f"{r['cpu_us']:>10.0f} {r['delivered']:>9} {r['rate']:>9.0f} "
+                  f"{r['p50']:>8.2f} {r['p99']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
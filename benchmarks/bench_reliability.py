@@ -0,0 +1,93 @@
+"""
+Mô phỏng lớp tin cậy trên mạng cục bộ có mất gói (không dùng socket)
+So sánh với cách cũ: gửi mỗi tin 2 lần
+
+Chạy: python -m benchmarks.bench_reliability
+"""
+import argparse
+import random
+import threading
+import time
+from core.message import Message, MessageType
+from core.codec import CODEC_BINARY, decode_message
+from core.reliability import LossyTransport, ReliabilityLayer
+from utils.logger import Logger
+
+
+class _Node:
+    """Một endpoint gắn ReliabilityLayer vào LossyTransport"""
+
+    def __init__(self, name: str, port: int, transport: LossyTransport, logger: Logger):
+        self.port = port
+        self.received = set()
+        self._lock = threading.Lock()
+        self.layer = ReliabilityLayer(
+            f"{name}_{port}", name, port, transport.send,
+            lambda _port: CODEC_BINARY, logger
+        )
+        transport.register(port, self._receive)
+        self.layer.start()
+
+    def _receive(self, data: bytes):
+        message = decode_message(data)
+        if message.msg_type == MessageType.ACK:
+            self.layer.on_ack(message)
+        elif message.seq is not None:
+            if self.layer.on_data(message):
+                with self._lock:
+                    self.received.add(message.msg_id)
+        else:
+            with self._lock:
+                self.received.add(message.msg_id)
+
+
+def _run(loss: float, count: int, logger: Logger) -> dict:
+    transport = LossyTransport(loss_rate=loss, delay=0.002, jitter=0.001, seed=1)
+    alice = _Node("Alice", 7000, transport, logger)
+    bob = _Node("Bob", 7001, transport, logger)
+
+    start = time.perf_counter()
+    results = []
+    for i in range(count):
+        msg = Message(MessageType.PRIVATE_MESSAGE, "Alice_7000", "Alice", 7000, f"tin {i}",
+                      target_id="Bob_7001")
+        results.append(alice.layer.send(msg, [bob.port]))
+    for result in results:
+        result.wait(30)
+    elapsed = time.perf_counter() - start
+
+    stats = alice.layer.stats()
+    confirmed = sum(1 for r in results if bob.port in r.confirmed)
+    alice.layer.stop()
+    bob.layer.stop()
+    packets = transport.sent
+    transport.close()
+
+    # Cách cũ: gửi 2 lần, không ACK
+    rng = random.Random(2)
+    double = sum(1 for _ in range(count) if rng.random() >= loss or rng.random() >= loss)
+
+    return {
+        'delivered': len(bob.received), 'confirmed': confirmed, 'elapsed': elapsed,
+        'retransmits': stats['retransmits'], 'acks': bob.layer.stats()['acks_sent'],
+        'packets': packets, 'double_send': double, 'rto': alice.layer.rto_for(bob.port),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reliability simulation')
+    parser.add_argument('--count', type=int, default=2000)
+    args = parser.parse_args()
+    logger = Logger("bench_reliability")
+
+    print(f"{'loss':>5} {'delivered':>10} {'confirmed':>10} {'retx':>6} {'acks':>6} "
+          f"{'pkts/msg':>9} {'rto ms':>7} {'time s':>7} | {'double-send':>11} (2 pkts/msg)")
+    for loss in (0.0, 0.05, 0.2, 0.4):
+        r = _run(loss, args.count, logger)
+        print(f"{loss:>5.0%} {r['delivered']:>10} {r['confirmed']:>10} {r['retransmits']:>6} "
+              f"{r['acks']:>6} {r['packets'] / args.count:>9.2f} {r['rto'] * 1000:>7.0f} "
+              f"{r['elapsed']:>7.2f} | {r['double_send']:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark TCP pool - Tin nhóm qua UDP (reliability) so với kết nối TCP giữ sẵn
+(thông lượng lượt giao, độ trễ p50/p99, số lượt mất theo kích thước nhóm)
+
+Chạy: python -m benchmarks.bench_tcp_pool
+"""
+import argparse
+import statistics
+import threading
+import time
+from core import NetworkManager
+from utils.logger import Logger
+from benchmarks.bench_batching import _introduce
+
+
+def _run(tcp: bool, members: int, count: int, size: int, port: int) -> dict:
+    logger = Logger("bench_tcp_pool")
+    sender = NetworkManager(port, "Sender", logger, tcp=tcp)
+    receivers = [NetworkManager(port + 1 + i, f"R{i}", logger, tcp=tcp) for i in range(members)]
+
+    latencies = []
+    last = [0.0]
+    lock = threading.Lock()
+    done = threading.Event()
+    expected = count * members
+
+    def on_message(message):
+        now = time.perf_counter()
+        sent_at = float(message.content.split("|", 1)[0])
+        with lock:
+            latencies.append(now - sent_at)
+            last[0] = now
+            if len(latencies) >= expected:
+                done.set()
+
+    for node in [sender] + receivers:
+        node.start()
+    for node in receivers:
+        node.on_message_received = on_message
+        _introduce(sender, node)
+    time.sleep(0.3)
+
+    ports = [node.port for node in receivers]
+    padding = "x" * size
+    start = time.perf_counter()
+    results = [
+        sender.send_group_message(f"{time.perf_counter():.9f}|{padding}", "bench", ports)
+        for _ in range(count)
+    ]
+    done.wait(30)
+    elapsed = last[0] - start
+    for result in results:
+        result.wait(5)
+    retransmits = sender.reliability.stats()['retransmits'] if sender.reliability else 0
+
+    for node in [sender] + receivers:
+        node.stop()
+
+    with lock:
+        ordered = sorted(latencies)
+    return {
+        'delivered': len(ordered),
+        'lost': expected - len(ordered),
+        'rate': len(ordered) / elapsed if elapsed > 0 else 0.0,
+        'p50': statistics.median(ordered) * 1000 if ordered else 0.0,
+        'p99': ordered[int(len(ordered) * 0.99) - 1] * 1000 if ordered else 0.0,
+        'retransmits': retransmits,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TCP pool vs UDP benchmark')
+    parser.add_argument('--count', type=int, default=200, help='Số tin nhóm')
+    parser.add_argument('--size', type=int, default=1000, help='Byte nội dung mỗi tin')
+    parser.add_argument('--members', type=int, nargs='+', default=[8, 32])
+    parser.add_argument('--port', type=int, default=6100)
+    args = parser.parse_args()
+
+    print(f"{'members':>7} {'path':<5} {'delivered':>9} {'lost':>6} {'deliv/s':>9} "
+          f"{'p50 ms':>8} {'p99 ms':>8} {'retrans':>8}")
+    # Mỗi lượt dùng dải port mới (socket cũ có thể còn nhận đến khi thread nhận thoát)
+    port = args.port
+    for members in args.members:
+        for tcp in (False, True):
+            r = _run(tcp, members, args.count, args.size, port)
+            port += members + 1
+            print(f"{members:>7} {'tcp' if tcp else 'udp':<5} {r['delivered']:>9} {r['lost']:>6} "
+                  f"{r['rate']:>9.0f} {r['p50']:>8.2f} {r['p99']:>8.2f} {r['retransmits']:>8}")
+
+
+if __name__ == "__main__":
+    main()
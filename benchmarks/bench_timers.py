@@ -0,0 +1,339 @@
+"""
+Benchmark hẹn giờ - số thread và số lần thức dậy/giây trước và sau timer wheel dùng chung
+
+- legacy: các vòng lặp cũ của mỗi node (3 thread discovery, thread dọn cache của network,
+  thread heap timer của reliability và relay, threading.Timer trả lời DISCOVERY)
+- wheel: cùng các việc đó đăng ký với 1 TimerWheel mỗi node (như NetworkManager.scheduler)
+Mỗi chế độ đo lúc rảnh và lúc tải (đợt DISCOVERY + hẹn giờ ACK/truyền lại của tin riêng).
+Wakeups = tổng context switch của các thread trong process (/proc, chỉ Linux).
+Sau đó: node thật (NetworkManager + DeviceDiscovery) và chi phí đặt/hủy (heapq vs wheel).
+
+Chạy: python -m benchmarks.bench_timers [--nodes 4] [--window 3] [--rate 200]
+"""
+import argparse
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from core import DeviceDiscovery, NetworkManager, TimerWheel
+from core.message import Message, MessageType
+from utils.logger import Logger
+
+ACK_DELAY = 0.02    # Như ReliabilityLayer
+RTO = 0.5
+
+
+def _wakeups() -> int:
+    """Tổng context switch của mọi thread trong process"""
+    total = 0
+    try:
+        tasks = os.listdir("/proc/self/task")
+    except OSError:
+        return 0
+    for tid in tasks:
+        try:
+            with open(f"/proc/self/task/{tid}/status") as f:
+                for line in f:
+                    if line.startswith(("voluntary_ctxt_switches", "nonvoluntary_ctxt_switches")):
+                        total += int(line.split()[1])
+        except OSError:
+            pass  # Thread vừa kết thúc
+    return total
+
+
+class _HeapTimers:
+    """Thread heap timer như reliability/relay cũ: hẹn giờ cũ nằm lại đến hạn"""
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def arm(self, delay: float):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq)))
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self.running:
+                    if self._heap:
+                        wait = self._heap[0][0] - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if not self.running:
+                    return
+                heapq.heappop(self._heap)
+
+
+class _LegacyNode:
+    """Các thread hẹn giờ của 1 node trước khi có scheduler"""
+
+    def __init__(self):
+        self.running = True
+        self._pending_responses = False
+        self._lock = threading.Lock()
+        self.pending_update = False
+        self.ack_due = None
+        self.next_check = None
+        self.reliability = _HeapTimers()
+        self.relay = _HeapTimers()
+        for target in (self._discovery_loop, self._cleanup_loop, self._update_loop,
+                       self._network_cleanup_loop):
+            threading.Thread(target=target, daemon=True).start()
+
+    def on_discovery(self):
+        with self._lock:
+            first = not self._pending_responses
+            self._pending_responses = True
+        if first:
+            threading.Timer(DeviceDiscovery.RESPONSE_DELAY, self._flush_responses).start()
+        self.pending_update = True
+
+    def on_message(self):
+        # Như reliability cũ với 1 peer: 1 hẹn ACK trễ mỗi ACK_DELAY, 1 hẹn kiểm tra truyền lại;
+        # ACK đến không gỡ được entry khỏi heap -> thread vẫn thức dậy lúc hết RTO
+        now = time.monotonic()
+        if self.ack_due is None or self.ack_due <= now:
+            self.ack_due = now + ACK_DELAY
+            self.reliability.arm(ACK_DELAY)
+        if self.next_check is None or self.next_check <= now:
+            self.next_check = now + RTO
+            self.reliability.arm(RTO)
+
+    def stop(self):
+        self.running = False
+        self.reliability.stop()
+        self.relay.stop()
+
+    def _flush_responses(self):
+        with self._lock:
+            self._pending_responses = False
+
+    def _discovery_loop(self):
+        time.sleep(DeviceDiscovery.START_DELAY)
+        while self.running:
+            time.sleep(DeviceDiscovery.DISCOVERY_INTERVAL)
+
+    def _cleanup_loop(self):
+        while self.running:
+            time.sleep(DeviceDiscovery.CLEANUP_INTERVAL)
+
+    def _update_loop(self):
+        while self.running:
+            self.pending_update = False
+            time.sleep(0.5)
+
+    def _network_cleanup_loop(self):
+        while self.running:
+            time.sleep(NetworkManager.CLEANUP_INTERVAL)
+
+
+class _WheelNode:
+    """Cùng các việc đó trên 1 TimerWheel"""
+
+    def __init__(self):
+        self.wheel = TimerWheel()
+        self.wheel.start()
+        self._lock = threading.Lock()
+        self._response_timer = None
+        self._update_timer = None
+        self._ack_timer = None
+        self._check_timer = None
+        self._timers = [
+            self.wheel.call_every(DeviceDiscovery.DISCOVERY_INTERVAL, self._noop,
+                                  first=DeviceDiscovery.START_DELAY),
+            self.wheel.call_every(DeviceDiscovery.CLEANUP_INTERVAL, self._noop),
+            self.wheel.call_every(NetworkManager.CLEANUP_INTERVAL, self._noop),
+        ]
+
+    def on_discovery(self):
+        with self._lock:
+            if self._response_timer is None:
+                self._response_timer = self.wheel.call_later(DeviceDiscovery.RESPONSE_DELAY,
+                                                             self._flush_responses)
+            if self._update_timer is None:
+                self._update_timer = self.wheel.call_later(2.0, self._flush_update)
+
+    def on_message(self):
+        # ACK của tin trước đã đến, không còn gói chờ -> hủy hẹn truyền lại (O(1))
+        if self._check_timer:
+            self._check_timer.cancel()
+        if self._ack_timer is None or self._ack_timer.cancelled:  # Đã chạy
+            self._ack_timer = self.wheel.call_later(ACK_DELAY, self._noop)
+        self._check_timer = self.wheel.call_later(RTO, self._noop)
+
+    def stop(self):
+        self.wheel.stop()
+
+    def _noop(self):
+        pass
+
+    def _flush_responses(self):
+        with self._lock:
+            self._response_timer = None
+
+    def _flush_update(self):
+        with self._lock:
+            self._update_timer = None
+
+
+def _measure(factory, args) -> dict:
+    before_threads = threading.active_count()
+    nodes = [factory() for _ in range(args.nodes)]
+    time.sleep(0.3)
+    threads = threading.active_count() - before_threads
+
+    start = _wakeups()
+    time.sleep(args.window)
+    idle = (_wakeups() - start) / args.window
+
+    # Tải: DISCOVERY dồn dập + tin riêng có hẹn giờ ACK/truyền lại
+    peak = [threading.active_count()]
+    start = _wakeups()
+    deadline = time.monotonic() + args.window
+    interval = 1.0 / args.rate
+    rnd = random.Random(1)
+    while time.monotonic() < deadline:
+        node = nodes[rnd.randrange(len(nodes))]
+        for _ in range(args.discovery_burst):
+            node.on_discovery()
+        node.on_message()
+        peak[0] = max(peak[0], threading.active_count())
+        time.sleep(interval)
+    loaded = (_wakeups() - start) / args.window
+
+    for node in nodes:
+        node.stop()
+    time.sleep(0.2)
+    return {'threads': threads, 'peak': peak[0] - before_threads, 'idle': idle, 'loaded': loaded}
+
+
+def _real_nodes(args) -> dict:
+    """Node thật: số thread mỗi node, wakeups/giây lúc rảnh và đỉnh thread khi có đợt DISCOVERY"""
+    logger = Logger("bench_timers")
+    before_threads = threading.active_count()
+    nodes, discoveries = [], []
+    for i in range(args.nodes):
+        network = NetworkManager(args.port + i, f"N{i}", logger, batching=False)
+        discovery = DeviceDiscovery(network, logger)
+        network.on_message_received = lambda m, d=discovery: (
+            d.handle_discovery_message(m)
+            if m.msg_type in (MessageType.DISCOVERY, MessageType.DISCOVERY_RESPONSE) else None)
+        network.start()
+        discovery.start()
+        nodes.append(network)
+        discoveries.append(discovery)
+    time.sleep(1.5)  # Qua lượt discovery đầu
+    threads = threading.active_count() - before_threads
+
+    start = _wakeups()
+    time.sleep(args.window)
+    idle = (_wakeups() - start) / args.window
+
+    # Đợt DISCOVERY từ nhiều người gửi giả
+    peak = threading.active_count()
+    for n in range(args.window_burst):
+        target = discoveries[n % len(discoveries)]
+        target.handle_discovery_message(Message(
+            MessageType.DISCOVERY, f"Ghost_{n}", "Ghost", 20000 + n, "discover"))
+        if n % 50 == 0:
+            peak = max(peak, threading.active_count())
+    time.sleep(0.3)
+    peak = max(peak, threading.active_count())
+
+    timers = [n.scheduler.stats() for n in nodes]
+    for discovery, network in zip(discoveries, nodes):
+        discovery.stop()
+        network.stop()
+    time.sleep(0.3)
+    return {
+        'threads_per_node': threads / args.nodes,
+        'idle': idle,
+        'peak': peak - before_threads,
+        'pending': sum(t['pending'] for t in timers),
+        'fired': sum(t['fired'] for t in timers),
+    }
+
+
+def _micro(count: int) -> dict:
+    """µs mỗi lần đặt và hủy; heap hủy kiểu đánh dấu (entry nằm lại đến hạn)"""
+    rnd = random.Random(7)
+    delays = [rnd.uniform(0.01, 60.0) for _ in range(count)]
+    now = time.monotonic()
+
+    heap, cancelled, seq = [], set(), itertools.count()
+    t = time.perf_counter()
+    entries = []
+    for delay in delays:
+        entry = (now + delay, next(seq))
+        heapq.heappush(heap, entry)
+        entries.append(entry)
+    heap_schedule = time.perf_counter() - t
+    t = time.perf_counter()
+    for entry in entries:
+        cancelled.add(entry[1])
+    heap_cancel = time.perf_counter() - t
+
+    wheel = TimerWheel()  # Không start: chỉ đo cấu trúc dữ liệu
+    callback = _micro
+    t = time.perf_counter()
+    handles = [wheel.call_at(now + delay, callback) for delay in delays]
+    wheel_schedule = time.perf_counter() - t
+    t = time.perf_counter()
+    for handle in handles:
+        handle.cancel()
+    wheel_cancel = time.perf_counter() - t
+
+    return {
+        'heap': (heap_schedule / count * 1e6, heap_cancel / count * 1e6, len(heap)),
+        'wheel': (wheel_schedule / count * 1e6, wheel_cancel / count * 1e6, len(wheel)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Shared timer wheel benchmark')
+    parser.add_argument('--nodes', type=int, default=4)
+    parser.add_argument('--window', type=float, default=3.0, help='Giây mỗi lần đo')
+    parser.add_argument('--rate', type=float, default=200.0, help='Tin riêng mỗi giây (tải)')
+    parser.add_argument('--discovery-burst', type=int, default=5,
+                        help='DISCOVERY nhận được cho mỗi tin riêng (tải)')
+    parser.add_argument('--window-burst', type=int, default=2000,
+                        help='DISCOVERY giả gửi vào các node thật')
+    parser.add_argument('--timers', type=int, default=100000, help='Số hẹn giờ cho phép đo đặt/hủy')
+    parser.add_argument('--port', type=int, default=6600)
+    args = parser.parse_args()
+
+    print(f"{args.nodes} node; wakeups/s = context switch mỗi giây của cả process")
+    print(f"{'mode':<8} {'threads':>8} {'peak':>6} {'idle wakeups/s':>15} {'loaded wakeups/s':>17}")
+    for name, factory in (("legacy", _LegacyNode), ("wheel", _WheelNode)):
+        r = _measure(factory, args)
+        print(f"{name:<8} {r['threads']:>8} {r['peak']:>6} {r['idle']:>15.1f} {r['loaded']:>17.1f}")
+
+    r = _real_nodes(args)
+    print(f"\nNode thật: {r['threads_per_node']:.1f} thread/node, {r['idle']:.1f} wakeups/s lúc rảnh, "
+          f"đỉnh {r['peak']} thread khi nhận {args.window_burst} DISCOVERY, "
+          f"{r['fired']} hẹn giờ đã chạy, {r['pending']} đang chờ")
+
+    r = _micro(args.timers)
+    print(f"\n{args.timers} hẹn giờ trong 60s: {'µs đặt':>8} {'µs hủy':>8} {'còn lại':>8}")
+    for name in ('heap', 'wheel'):
+        schedule, cancel, left = r[name]
+        print(f"{name:<8} {'':>22}{schedule:>8.2f} {cancel:>8.2f} {left:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark nhận đa tiến trình - 0 (trong tiến trình chính) / 1 / 2 / 4 worker SO_REUSEPORT
+(tin/giây đến được hàng đợi nhận, số gói mất)
+
+Gói đến từ nhiều socket nguồn để kernel chia đều cho các worker.
+Chạy: python -m benchmarks.bench_workers
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import time
+from core import NetworkManager
+from core.codec import CODEC_BINARY, encode_message
+from core.message import Message, MessageType
+from utils.logger import Logger
+from benchmarks.bench_receive import _received
+
+
+def _sender(port: int, count: int, sources: int, size: int, burst: int, pause: float, ready):
+    """Tiến trình gửi: count tin qua `sources` socket nguồn (luân phiên)"""
+    content = ("tin nhắn nhóm " * (size // 14 + 1))[:size]
+    packets = [
+        encode_message(Message(MessageType.GROUP_MESSAGE, f"Sender{i % sources}_6000",
+                               "Sender", 6000, content, group_id="g1"), CODEC_BINARY)
+        for i in range(count)
+    ]
+    socks = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(sources)]
+    addr = ("127.0.0.1", port)
+    ready.wait()
+    for index, data in enumerate(packets, 1):
+        socks[index % sources].sendto(data, addr)
+        if index % burst == 0:
+            time.sleep(pause)
+    for sock in socks:
+        sock.close()
+
+
+def _run(workers: int, args, port: int) -> dict:
+    manager = NetworkManager(port, "Receiver", Logger("bench_workers"), batching=False,
+                             broadcast_mode="sweep", receive_workers=workers)
+    manager.on_message_received = lambda message: None
+    if not manager.start():
+        raise SystemExit("Network start failed")
+    time.sleep(0.2)
+
+    context = multiprocessing.get_context("spawn")
+    ready = context.Event()
+    sender = context.Process(target=_sender, args=(port, args.count, args.sources, args.size,
+                                                   args.burst, args.pause, ready))
+    sender.start()
+    time.sleep(1.0)  # Chờ tiến trình gửi mã hóa xong
+
+    start = time.perf_counter()
+    ready.set()
+    last, last_change = -1, time.perf_counter()
+    while time.perf_counter() - last_change < 0.5:
+        received = _received(manager)
+        if received != last:
+            last, last_change = received, time.perf_counter()
+        time.sleep(0.01)
+    elapsed = last_change - start
+
+    sender.join()
+    time.sleep(1.1)  # Worker gửi thống kê mỗi giây
+    per_worker = [s.get('forwarded', 0) for s in manager.worker_stats().values()]
+    manager.stop()
+    return {
+        'received': last,
+        'lost': args.count - last,
+        'rate': last / elapsed if elapsed > 0 else 0.0,
+        'per_worker': per_worker,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Receive worker scaling benchmark')
+    parser.add_argument('--count', type=int, default=40000)
+    parser.add_argument('--sources', type=int, default=16, help='Số socket nguồn')
+    parser.add_argument('--size', type=int, default=1000, help='Byte nội dung mỗi tin')
+    parser.add_argument('--burst', type=int, default=1000)
+    parser.add_argument('--pause', type=float, default=0.005)
+    parser.add_argument('--port', type=int, default=5700)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPU, {args.count} tin x {args.size} byte từ {args.sources} socket\n")
+    print(f"{'workers':>7} {'received':>9} {'lost':>7} {'msg/s':>9}  per worker")
+    port = args.port
+    for workers in (0, 1, 2, 4):
+        r = _run(workers, args, port)
+        port += 1
+        print(f"{workers:>7} {r['received']:>9} {r['lost']:>7} {r['rate']:>9.0f}  "
+              f"{r['per_worker'] or '-'}")
+
+
+if __name__ == "__main__":
+    main()
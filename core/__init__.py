@@ -1,4 +1,9 @@
 from .network import NetworkManager
+from .aio_network import AsyncNetworkManager
 from .discovery import DeviceDiscovery
 from .message import Message, MessageType
-from .group import GroupManager
\ No newline at end of file
+from .addressing import AddressBook, Endpoint
+from .scheduler import TimerWheel
+from .deltas import Delta, DeltaTracker
+from .group import GroupManager
+from .file_transfer import FileTransferManager
\ No newline at end of file
@@ -0,0 +1,147 @@
+"""
+Module địa chỉ - Endpoint (host, port) của peer và sổ địa chỉ theo user_id
+
+Host của peer lấy từ địa chỉ nguồn của gói nhận được (recvfrom / kết nối TCP),
+không gửi trên đường truyền. Tin chuyển tiếp (via) đến từ host của node chuyển tiếp ->
+host người gửi gốc tra trong AddressBook.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple, Union
+
+DEFAULT_HOST = "127.0.0.1"
+
+
+class Endpoint(NamedTuple):
+    """Địa chỉ UDP/TCP của một node - dùng thẳng làm addr cho sendto/connect"""
+    host: str
+    port: int
+
+    def __str__(self) -> str:
+        return f"{self.host}:{self.port}"
+
+
+def as_endpoint(target: Union[Endpoint, tuple, int], default_host: str = DEFAULT_HOST) -> Endpoint:
+    """Endpoint / (host, port) / port (cùng host default_host, cách gọi cũ) -> Endpoint"""
+    if isinstance(target, Endpoint):
+        return target
+    if isinstance(target, tuple):
+        return Endpoint(target[0], int(target[1]))
+    return Endpoint(default_host, int(target))
+
+
+def parse_endpoint(text: str, default_host: str = DEFAULT_HOST) -> Endpoint:
+    """'host:port' hoặc 'port' -> Endpoint"""
+    host, sep, port = str(text).rpartition(":")
+    return Endpoint(host if sep else default_host, int(port))
+
+
+def format_endpoint(endpoint: Endpoint, local_host: Optional[str] = None) -> str:
+    """Endpoint -> 'host:port'; chỉ 'port' khi cùng host local_host (peer cũ chỉ hiểu port)"""
+    if endpoint.host == local_host:
+        return str(endpoint.port)
+    return f"{endpoint.host}:{endpoint.port}"
+
+
+def node_id(user_name: str, port: int, host: Optional[str] = None) -> str:
+    """user_id của node; có host khi chạy nhiều node cùng port trên các địa chỉ khác nhau"""
+    if host:
+        return f"{user_name}_{host}_{port}"
+    return f"{user_name}_{port}"
+
+
+class AddressBook:
+    """
+    user_id -> Endpoint, học từ tin nhận trực tiếp (không qua via)
+
+    user_id chưa biết: ghi ngay. Đã biết mà đổi địa chỉ: chỉ chấp nhận khi tin báo hiện diện
+    (discovery/heartbeat) từ endpoint mới lặp lại MOVE_CONFIRMATIONS lần liên tiếp mà endpoint
+    cũ không lên tiếng - 1 gói giả sender_id không chuyển hướng được lưu lượng của peer.
+    Giữ tối đa capacity user_id, bỏ mục lâu không nghe thấy nhất (LRU).
+    """
+
+    CAPACITY = 4096         # Số user_id tối đa
+    MOVE_CONFIRMATIONS = 2  # Số tin hiện diện liên tiếp từ endpoint mới trước khi đổi
+
+    def __init__(self, capacity: int = CAPACITY):
+        self.capacity = capacity
+        self._entries: "OrderedDict[str, Endpoint]" = OrderedDict()
+        self._owners: Dict[Endpoint, str] = {}  # Endpoint -> user_id (tra ngược, vd. đích relay)
+        self._moves: Dict[str, Tuple[Endpoint, int]] = {}  # user_id -> (endpoint mới, số lần thấy)
+        self._lock = threading.Lock()
+        self.changes = 0   # Số lần peer đổi địa chỉ (khởi động lại trên máy khác...)
+        self.rejected = 0  # Gói đòi đổi địa chỉ chưa được xác nhận
+        self.evicted = 0   # Mục bị bỏ vì đầy
+
+    def learn(self, user_id: str, host: str, port: int, confirmed: bool = False):
+        """
+        Ghi nhận địa chỉ của user_id; không tạo Endpoint mới khi không đổi
+        confirmed: gói là tin hiện diện (discovery/heartbeat) - mới được tính để đổi địa chỉ
+        """
+        with self._lock:
+            known = self._entries.get(user_id)
+            if known is not None and known.port == port and known.host == host:
+                self._entries.move_to_end(user_id)
+                self._moves.pop(user_id, None)  # Endpoint cũ còn sống: hủy yêu cầu đổi
+                return
+            endpoint = Endpoint(host, port)
+            if known is None:
+                self._store(user_id, endpoint)
+                self._evict()
+                return
+            if not confirmed:
+                self.rejected += 1
+                return
+            pending, seen = self._moves.get(user_id, (None, 0))
+            seen = seen + 1 if pending == endpoint else 1
+            if seen < self.MOVE_CONFIRMATIONS:
+                self._moves[user_id] = (endpoint, seen)
+                return
+            del self._moves[user_id]
+            self.changes += 1
+            self._release(user_id, known)
+            self._store(user_id, endpoint)
+
+    def _store(self, user_id: str, endpoint: Endpoint):
+        self._entries[user_id] = endpoint
+        self._entries.move_to_end(user_id)
+        self._owners[endpoint] = user_id
+
+    def _release(self, user_id: str, endpoint: Endpoint):
+        if self._owners.get(endpoint) == user_id:
+            del self._owners[endpoint]
+
+    def _evict(self):
+        while len(self._entries) > self.capacity:
+            user_id, endpoint = self._entries.popitem(last=False)
+            self._moves.pop(user_id, None)
+            self._release(user_id, endpoint)
+            self.evicted += 1
+
+    def get(self, user_id: str) -> Optional[Endpoint]:
+        return self._entries.get(user_id)
+
+    def forget(self, user_id: str):
+        with self._lock:
+            self._moves.pop(user_id, None)
+            known = self._entries.pop(user_id, None)
+            if known is not None:
+                self._release(user_id, known)
+
+    def knows(self, endpoint: Endpoint) -> bool:
+        """Có peer nào đang dùng endpoint này không"""
+        return endpoint in self._owners
+
+    def snapshot(self) -> Dict[str, Endpoint]:
+        with self._lock:
+            return dict(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {'entries': len(self._entries), 'changes': self.changes,
+                'rejected': self.rejected, 'evicted': self.evicted}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._entries
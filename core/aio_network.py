@@ -0,0 +1,161 @@
+"""
+Module mạng dùng asyncio - Một event loop thay cho 4 thread polling
+
+Tin nhận được đi qua incoming_queue như bản dùng thread (ưu tiên, giới hạn, đếm tin bị
+bỏ và thời gian chờ); event loop lấy ra ngay trong lượt kế tiếp thay cho thread xử lý.
+"""
+import asyncio
+import queue
+import threading
+from typing import Optional
+from .message import Message
+from .network import NetworkManager
+from utils.logger import Logger
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    """Chuyển datagram nhận được cho manager"""
+
+    def __init__(self, manager: 'AsyncNetworkManager'):
+        self.manager = manager
+
+    def datagram_received(self, data: bytes, addr):
+        self.manager._on_datagram(data, addr)
+
+    def error_received(self, exc: Exception):
+        self.manager.logger.debug(f"UDP error: {exc}")
+
+
+class AsyncNetworkManager(NetworkManager):
+    """
+    NetworkManager chạy trên asyncio - cùng public API với bản dùng thread.
+    Event loop chạy trên thread riêng để Tk giữ main thread; mọi hàm public
+    đều an toàn khi gọi từ Tk thread.
+    """
+
+    def __init__(self, port: int, user_name: str, logger: Logger, **kwargs):
+        super().__init__(port, user_name, logger, **kwargs)
+        if self.receive_workers:
+            # Event loop đọc trực tiếp recv_socket
+            logger.warning("Receive workers are not supported with asyncio, ignoring")
+            self.receive_workers = 0
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._mcast_transport: Optional[asyncio.DatagramTransport] = None
+        # Giới hạn số broadcast đang chờ gửi (giống outgoing_queue maxsize)
+        self._send_slots = threading.BoundedSemaphore(self.outgoing_queue.maxsize)
+        # Đã hẹn _drain_incoming trên event loop (chỉ đọc/ghi trên thread của loop)
+        self._draining = False
+
+    def start(self) -> bool:
+        """Khởi động"""
+        try:
+            self._open_sockets()
+            self.recv_socket.setblocking(False)
+            if self.mcast_socket:
+                self.mcast_socket.setblocking(False)
+
+            self.loop = asyncio.new_event_loop()
+            self.running = True
+            self._loop_thread = threading.Thread(target=self._run_loop, daemon=True)
+            self._loop_thread.start()
+
+            asyncio.run_coroutine_threadsafe(self._setup(), self.loop).result(timeout=5)
+            self._start_services()
+
+            self.logger.info(f"Network (asyncio) started on port {self.port}")
+            return True
+        except Exception as e:
+            self.running = False
+            self.logger.error(f"Network start failed: {e}")
+            return False
+
+    def stop(self):
+        """Dừng"""
+        self.running = False
+        self._stop_services()
+        if self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._shutdown)
+            if self._loop_thread is not threading.current_thread():
+                self._loop_thread.join(timeout=2)
+        try:
+            if self.send_socket:
+                self.send_socket.close()
+        except:
+            pass
+
+    def send_message(self, message: Message) -> bool:
+        """Gửi tin nhắn (thread-safe)"""
+        if not self.running:
+            return False
+        if not self._send_slots.acquire(blocking=False):
+            self.outgoing_queue.record_drop(message)
+            return False
+        try:
+            self.loop.call_soon_threadsafe(self._send_broadcast, message)
+            return True
+        except RuntimeError:
+            # Loop đã đóng
+            self._send_slots.release()
+            return False
+
+    async def _setup(self):
+        self._transport, _ = await self.loop.create_datagram_endpoint(
+            lambda: _DatagramProtocol(self), sock=self.recv_socket
+        )
+        if self.mcast_socket:
+            self._mcast_transport, _ = await self.loop.create_datagram_endpoint(
+                lambda: _DatagramProtocol(self), sock=self.mcast_socket
+            )
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def _shutdown(self):
+        for transport in (self._transport, self._mcast_transport):
+            if transport:
+                transport.close()
+        self.loop.stop()
+
+    def _on_datagram(self, data: bytes, addr):
+        # Như bản thread (đếm + log tin hỏng), nhưng xếp hàng thẳng vì đang ở trên event loop
+        self._on_packet(data, addr, self._enqueue)
+
+    def _deliver(self, message: Message):
+        # Tin đến từ thread khác (TCP pool) -> xếp hàng trên event loop
+        self.loop.call_soon_threadsafe(self._enqueue, message)
+
+    def _enqueue(self, message: Message):
+        """Xếp tin vào incoming_queue (event loop) và hẹn 1 lượt lấy ra theo ưu tiên"""
+        self.incoming_queue.put(message)
+        if not self._draining:
+            self._draining = True
+            self.loop.call_soon(self._drain_incoming)
+
+    def _drain_incoming(self):
+        """Chuyển mọi tin đang chờ cho ứng dụng, lớp ưu tiên cao trước"""
+        self._draining = False
+        while True:
+            try:
+                message = self.incoming_queue.get_nowait()
+            except queue.Empty:
+                return
+            self._dispatch(message)
+
+    def _send_broadcast(self, message: Message):
+        try:
+            for data, addr in self._broadcast_datagrams(message):
+                if self.batcher:
+                    self._emit(data, addr)
+                else:
+                    self._transport.sendto(data, addr)
+        except Exception as e:
+            self.logger.debug(f"Broadcast failed: {e}")
+        finally:
+            self._send_slots.release()
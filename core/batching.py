@@ -0,0 +1,194 @@
+"""
+Module gộp datagram - Gom nhiều tin nhỏ cùng đích vào 1 gói UDP khi gửi dồn dập
+
+Định dạng gói gộp (network byte order):
+    magic(1) [length(2) datagram]...
+"""
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Tuple
+from .fragment import MAX_DATAGRAM
+from utils.logger import Logger
+
+CAP_BATCH = "batch1"
+
+BATCH_MAGIC = 0xB3  # Khác codec nhị phân (0xB1), mảnh (0xB2) và '{' của JSON
+
+_U16 = struct.Struct("!H")
+_OVERHEAD = 1 + _U16.size
+
+
+def unbatch(data: bytes) -> Iterator[bytes]:
+    """Tách gói gộp thành các datagram; gói thường trả nguyên"""
+    if not data or data[0] != BATCH_MAGIC:
+        yield data
+        return
+
+    offset, end = 1, len(data)
+    while offset + _U16.size <= end:
+        (length,) = _U16.unpack_from(data, offset)
+        offset += _U16.size
+        if offset + length > end:
+            raise ValueError("Truncated batch")
+        yield data[offset:offset + length]
+        offset += length
+
+
+@dataclass
+class _Batch:
+    deadline: float
+    parts: List[bytes] = field(default_factory=list)
+    size: int = 1  # magic
+
+
+class DatagramBatcher:
+    """
+    Gom datagram theo địa chỉ đích:
+    - Đích vừa nhận gói trong `linger` giây (đang dồn dập) -> gom, còn lại gửi ngay
+    - Gửi khi gói gộp đạt `max_size` hoặc tin đầu tiên đã chờ `linger` giây
+    - Datagram quá lớn gửi thẳng (sau khi xả gói đang gom cho đích đó)
+    - Gói chỉ có 1 tin thì gửi nguyên, không thêm header
+    - Lỗi gửi tin của caller raise về caller; lỗi gói gộp gửi sau (thread gom / xả gói của
+      tin trước) không còn caller để báo -> đếm vào `failed`
+    """
+
+    PRUNE_INTERVAL = 1.0  # Giây giữa 2 lần dọn _last_sent
+
+    def __init__(self, sendto: Callable[[bytes, Tuple], None], logger: Logger,
+                 max_size: int = MAX_DATAGRAM, linger: float = 0.002):
+        self._sendto = sendto
+        self.logger = logger
+        self.max_size = max_size
+        self.linger = linger
+
+        self._pending: Dict[Tuple, _Batch] = {}
+        self._last_sent: Dict[Tuple, float] = {}
+        self._next_prune = 0.0
+        self._cond = threading.Condition()
+        self.running = False
+
+        # Counters
+        self.datagrams = 0   # tin đi qua batcher
+        self.packets = 0     # gói UDP thực sự gửi
+        self.batched = 0     # gói chứa >= 2 tin
+        self.failed = 0      # tin nằm trong gói gửi lỗi
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+        self.flush()
+
+    def send(self, data: bytes, addr: Tuple, flush: bool = False):
+        """
+        Đưa datagram vào gói gộp của addr
+        flush=True: gửi ngay cùng các tin đang gom (vd. ACK - không chờ linger)
+        Raise lỗi của socket nếu datagram được gửi ngay mà gửi lỗi
+        """
+        ready = tail = None
+        with self._cond:
+            self.datagrams += 1
+            now = time.monotonic()
+            if now >= self._next_prune:
+                self._prune(now)
+            if len(data) + _OVERHEAD > self.max_size:
+                ready = self._pending.pop(addr, None)
+            elif addr not in self._pending and now - self._last_sent.get(addr, 0.0) >= self.linger:
+                # Không dồn dập -> không thêm độ trễ
+                pass
+            else:
+                batch = self._pending.get(addr)
+                if batch is not None and batch.size + _U16.size + len(data) > self.max_size:
+                    ready = self._pending.pop(addr)
+                    batch = None
+                if batch is None:
+                    batch = self._pending[addr] = _Batch(now + self.linger)
+                    self._cond.notify()
+                batch.parts.append(data)
+                batch.size += _U16.size + len(data)
+                data = None
+            self._last_sent[addr] = now
+            if flush:
+                tail = self._pending.pop(addr, None)
+
+        if ready is not None:
+            self._emit_quietly(ready, addr)
+        if data is not None:
+            self._emit(_Batch(now, [data]), addr)
+        if tail is not None:
+            self._emit(tail, addr)
+
+    def flush(self):
+        """Gửi ngay mọi gói đang gom"""
+        with self._cond:
+            pending, self._pending = self._pending, {}
+        for addr, batch in pending.items():
+            self._emit_quietly(batch, addr)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'datagrams': self.datagrams,
+            'packets': self.packets,
+            'batched': self.batched,
+            'failed': self.failed,
+            'ratio': self.datagrams / self.packets if self.packets else 0.0,
+        }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self.running:
+                    if self._pending:
+                        wait = min(b.deadline for b in self._pending.values()) - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if not self.running:
+                    return
+                now = time.monotonic()
+                due = [(addr, b) for addr, b in self._pending.items() if b.deadline <= now]
+                for addr, _ in due:
+                    del self._pending[addr]
+                    self._last_sent[addr] = now
+
+            for addr, batch in due:
+                self._emit_quietly(batch, addr)
+
+    def _prune(self, now: float):
+        """Bỏ đích không gửi gì quá linger - như chưa từng gửi (gọi khi giữ lock)"""
+        idle = now - self.linger
+        self._last_sent = {a: t for a, t in self._last_sent.items() if t > idle or a in self._pending}
+        self._next_prune = now + self.PRUNE_INTERVAL
+
+    def _emit(self, batch: _Batch, addr: Tuple):
+        """Gửi 1 gói; lỗi được đếm rồi raise"""
+        if len(batch.parts) == 1:
+            data = batch.parts[0]
+        else:
+            out = [bytes((BATCH_MAGIC,))]
+            for part in batch.parts:
+                out.append(_U16.pack(len(part)))
+                out.append(part)
+            data = b"".join(out)
+            self.batched += 1
+        self.packets += 1
+        try:
+            self._sendto(data, addr)
+        except Exception:
+            self.failed += len(batch.parts)
+            raise
+
+    def _emit_quietly(self, batch: _Batch, addr: Tuple):
+        """Gửi gói không còn caller chờ kết quả: lỗi chỉ đếm và ghi log"""
+        try:
+            self._emit(batch, addr)
+        except Exception as e:
+            self.logger.debug(f"Batch send to {addr} failed ({len(batch.parts)} datagrams): {e}")
@@ -0,0 +1,377 @@
+"""
+Module mã hóa nhị phân cho Message - Gọn và nhanh hơn JSON
+
+Định dạng (network byte order), phần định tuyến đứng trước phần nội dung:
+    magic(1) version(1) type(1) flags(1) sender_port(2) msg_id(8) timestamp(8)
+    header:
+        sender_id, sender_name, [target_id], [group_id]  (u16 + utf-8)
+        [epoch(4) seq(4) seq_base(4)]
+        [via(2)] [ttl(1)]
+    payload:
+        [group_members]  (u32 + utf-8, ngăn cách bằng NUL)
+        content (u32 + utf-8)
+    FLAG_COMPRESSED: payload được nén zlib (header luôn đọc được mà không giải nén)
+    FLAG_SEQ_TRAILER: epoch(4) seq(4) seq_base(4) nằm ở cuối gói thay vì trong header -
+        phần trước giống nhau cho mọi peer, chỉ mã hóa 1 lần (stamp_seq)
+"""
+import struct
+import threading
+import time
+import zlib
+from functools import partial
+from typing import Dict, Optional, Set
+from .message import LazyMessage, Message, MessageType
+
+CODEC_JSON = "json"
+CODEC_BINARY = "bin2"  # bin1 (nội dung trước định tuyến) không còn được hỗ trợ
+CODEC_BINARY_ZLIB = "bin2+zlib"  # Nhị phân, nén payload lớn (peer có CAP_COMPRESS)
+
+CAP_COMPRESS = "zlib1"
+COMPRESS_THRESHOLD = 512  # Byte - payload nhỏ hơn thì không đáng nén
+COMPRESS_LEVEL = 6
+MAX_DECOMPRESSED = 16 * 1024 * 1024  # Chặn "zip bomb"
+
+MAGIC = 0xB1  # Không phải ký tự mở đầu UTF-8 hợp lệ -> peer cũ bỏ qua
+VERSION = 2
+
+# Mã loại tin nhắn - cố định, chỉ được thêm mới ở cuối
+TYPE_CODES = {
+    MessageType.TEXT: 1,
+    MessageType.DISCOVERY: 2,
+    MessageType.DISCOVERY_RESPONSE: 3,
+    MessageType.GROUP_CREATE: 4,
+    MessageType.GROUP_INVITE: 5,
+    MessageType.GROUP_MESSAGE: 6,
+    MessageType.PRIVATE_MESSAGE: 7,
+    MessageType.HEARTBEAT: 8,
+    MessageType.EMOJI: 9,
+    MessageType.ACK: 10,
+    MessageType.FILE_OFFER: 11,
+    MessageType.FILE_ACCEPT: 12,
+    MessageType.RELAY: 13,
+}
+CODE_TYPES = {code: t for t, code in TYPE_CODES.items()}
+
+FLAG_TARGET = 0x01
+FLAG_GROUP = 0x02
+FLAG_MEMBERS = 0x04
+FLAG_SEQ = 0x08
+FLAG_COMPRESSED = 0x10
+FLAG_VIA = 0x20
+FLAG_TTL = 0x40
+FLAG_SEQ_TRAILER = 0x80
+
+# Tin nhắn discovery luôn gửi bằng JSON để peer cũ đọc được
+JSON_ONLY_TYPES = (MessageType.DISCOVERY, MessageType.DISCOVERY_RESPONSE)
+
+_HEADER = struct.Struct("!BBBBH8sd")
+_U8 = struct.Struct("!B")
+_U16 = struct.Struct("!H")
+_U32 = struct.Struct("!I")
+_SEQ = struct.Struct("!III")
+
+CAPS_SEPARATOR = ";caps="
+
+
+class CompressionStats:
+    """Thống kê nén theo loại tin: tỉ lệ và thời gian CPU"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._types: Dict[str, Dict[str, float]] = {}
+
+    def _entry(self, msg_type: MessageType) -> Dict[str, float]:
+        entry = self._types.get(msg_type.value)
+        if entry is None:
+            entry = self._types[msg_type.value] = {
+                'messages': 0, 'compressed': 0, 'raw_bytes': 0, 'wire_bytes': 0,
+                'compress_seconds': 0.0, 'decompressed': 0, 'decompress_seconds': 0.0,
+            }
+        return entry
+
+    def record_compress(self, msg_type: MessageType, raw: int, wire: int,
+                        seconds: float, used: bool):
+        with self._lock:
+            entry = self._entry(msg_type)
+            entry['messages'] += 1
+            entry['compressed'] += int(used)
+            entry['raw_bytes'] += raw
+            entry['wire_bytes'] += wire
+            entry['compress_seconds'] += seconds
+
+    def record_decompress(self, msg_type: MessageType, seconds: float):
+        with self._lock:
+            entry = self._entry(msg_type)
+            entry['decompressed'] += 1
+            entry['decompress_seconds'] += seconds
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Theo loại tin: số tin, tỉ lệ wire/raw, µs CPU trung bình mỗi tin"""
+        with self._lock:
+            result = {}
+            for name, e in self._types.items():
+                result[name] = {
+                    'messages': e['messages'],
+                    'compressed': e['compressed'],
+                    'raw_bytes': e['raw_bytes'],
+                    'wire_bytes': e['wire_bytes'],
+                    'ratio': e['wire_bytes'] / e['raw_bytes'] if e['raw_bytes'] else 1.0,
+                    'compress_us': e['compress_seconds'] * 1e6 / e['messages'] if e['messages'] else 0.0,
+                    'decompressed': e['decompressed'],
+                    'decompress_us': (e['decompress_seconds'] * 1e6 / e['decompressed']
+                                      if e['decompressed'] else 0.0),
+                }
+            return result
+
+
+def _pack_str(parts: list, value: str):
+    raw = value.encode('utf-8')
+    parts.append(_U16.pack(len(raw)))
+    parts.append(raw)
+
+
+def encode_binary(message: Message, compress_threshold: Optional[int] = None,
+                  stats: Optional[CompressionStats] = None) -> bytes:
+    """
+    Mã hóa Message sang dạng nhị phân
+    compress_threshold: nén payload từ ngưỡng này trở lên (None = không nén)
+    """
+    flags = 0
+    if message.target_id is not None:
+        flags |= FLAG_TARGET
+    if message.group_id is not None:
+        flags |= FLAG_GROUP
+    if message.group_members is not None:
+        flags |= FLAG_MEMBERS
+    if message.seq is not None:
+        flags |= FLAG_SEQ
+    if message.via is not None:
+        flags |= FLAG_VIA
+    if message.ttl is not None:
+        flags |= FLAG_TTL
+
+    msg_id = message.msg_id.encode('ascii')
+    if len(msg_id) > 8:
+        raise ValueError(f"msg_id too long for binary header: {message.msg_id}")
+    if message.ttl is not None and not 0 <= message.ttl <= 0xFF:
+        raise ValueError(f"ttl out of range for binary header: {message.ttl}")
+
+    parts = []
+    _pack_str(parts, message.sender_id)
+    _pack_str(parts, message.sender_name)
+    if flags & FLAG_TARGET:
+        _pack_str(parts, message.target_id)
+    if flags & FLAG_GROUP:
+        _pack_str(parts, message.group_id)
+    if flags & FLAG_SEQ:
+        parts.append(_SEQ.pack(message.epoch or 0, message.seq, message.seq_base or 0))
+    if flags & FLAG_VIA:
+        parts.append(_U16.pack(message.via))
+    if flags & FLAG_TTL:
+        parts.append(_U8.pack(message.ttl))
+
+    payload = []
+    if flags & FLAG_MEMBERS:
+        members = "\0".join(message.group_members).encode('utf-8')
+        payload.append(_U32.pack(len(members)))
+        payload.append(members)
+    content = message.content.encode('utf-8')
+    payload.append(_U32.pack(len(content)))
+    payload.append(content)
+    body = b"".join(payload)
+
+    if compress_threshold is not None and len(body) >= compress_threshold:
+        start = time.perf_counter()
+        packed = zlib.compress(body, COMPRESS_LEVEL)
+        used = len(packed) < len(body)
+        if used:
+            flags |= FLAG_COMPRESSED
+        if stats:
+            stats.record_compress(message.msg_type, len(body), min(len(packed), len(body)),
+                                  time.perf_counter() - start, used)
+        if used:
+            body = packed
+
+    return b"".join((
+        _HEADER.pack(MAGIC, VERSION, TYPE_CODES[message.msg_type], flags,
+                     message.sender_port, msg_id, message.timestamp),
+        *parts, body
+    ))
+
+
+def _read_str(data: bytes, offset: int):
+    end = offset + 2 + ((data[offset] << 8) | data[offset + 1])
+    if end > len(data):
+        raise ValueError("truncated string")
+    return str(data[offset + 2:end], 'utf-8'), end
+
+
+def _decompress(data: bytes) -> bytes:
+    decompressor = zlib.decompressobj()
+    body = decompressor.decompress(data, MAX_DECOMPRESSED)
+    if decompressor.unconsumed_tail:
+        raise ValueError("compressed body too large")
+    return body
+
+
+def _check_payload(data: bytes, flags: int):
+    """Kiểm tra độ dài các phần của payload (không giải mã utf-8)"""
+    offset = 0
+    if flags & FLAG_MEMBERS:
+        (length,) = _U32.unpack_from(data, offset)
+        offset += 4 + length
+    (length,) = _U32.unpack_from(data, offset)
+    if offset + 4 + length > len(data):
+        raise ValueError("truncated content")
+
+
+def _decode_payload(data: bytes, flags: int, msg_type: MessageType,
+                    stats: Optional[CompressionStats]):
+    """Giải mã payload -> (group_members, content)"""
+    try:
+        if flags & FLAG_COMPRESSED:
+            start = time.perf_counter()
+            data = _decompress(data)
+            if stats:
+                stats.record_decompress(msg_type, time.perf_counter() - start)
+            _check_payload(data, flags)
+
+        offset = 0
+        group_members = None
+        if flags & FLAG_MEMBERS:
+            (length,) = _U32.unpack_from(data, offset)
+            offset += 4
+            members = str(data[offset:offset + length], 'utf-8')
+            offset += length
+            group_members = members.split("\0") if members else []
+        (length,) = _U32.unpack_from(data, offset)
+        offset += 4
+        return group_members, str(data[offset:offset + length], 'utf-8')
+    except (struct.error, UnicodeDecodeError, zlib.error) as e:
+        raise ValueError(f"Invalid binary payload: {e}")
+
+
+def decode_binary(data: bytes, stats: Optional[CompressionStats] = None) -> LazyMessage:
+    """
+    Giải mã header nhị phân; content/group_members giải mã khi được truy cập
+    data có thể là view vào buffer dùng lại -> payload được copy ra
+    """
+    try:
+        magic, version, type_code, flags, port, msg_id, timestamp = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"unsupported header {magic:#x}/{version}")
+        msg_type = CODE_TYPES[type_code]
+        offset = _HEADER.size
+
+        sender_id, offset = _read_str(data, offset)
+        sender_name, offset = _read_str(data, offset)
+        target_id = group_id = None
+        if flags & FLAG_TARGET:
+            target_id, offset = _read_str(data, offset)
+        if flags & FLAG_GROUP:
+            group_id, offset = _read_str(data, offset)
+        epoch = seq = seq_base = None
+        if flags & FLAG_SEQ:
+            epoch, seq, seq_base = _SEQ.unpack_from(data, offset)
+            offset += _SEQ.size
+        via = None
+        if flags & FLAG_VIA:
+            (via,) = _U16.unpack_from(data, offset)
+            offset += _U16.size
+        ttl = None
+        if flags & FLAG_TTL:
+            ttl = data[offset]
+            offset += 1
+        end = len(data)
+        if flags & FLAG_SEQ_TRAILER:
+            end -= _SEQ.size
+            if end < offset:
+                raise ValueError("truncated seq trailer")
+            epoch, seq, seq_base = _SEQ.unpack_from(data, end)
+
+        payload = bytes(data[offset:end])
+        if not flags & FLAG_COMPRESSED:
+            _check_payload(payload, flags)
+
+        return LazyMessage.from_header(
+            partial(_decode_payload, payload, flags, msg_type, stats), len(payload), {
+                'msg_type': msg_type,
+                'sender_id': sender_id,
+                'sender_name': sender_name,
+                'sender_port': port,
+                'timestamp': timestamp,
+                'msg_id': str(msg_id.rstrip(b"\0"), 'ascii'),
+                'target_id': target_id,
+                'group_id': group_id,
+                'seq': seq,
+                'epoch': epoch,
+                'seq_base': seq_base,
+                'via': via,
+                'ttl': ttl,
+            }
+        )
+    except (struct.error, IndexError, KeyError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid binary message: {e}")
+
+
+def encode_message(message: Message, codec: str = CODEC_JSON,
+                   compress_threshold: Optional[int] = COMPRESS_THRESHOLD,
+                   stats: Optional[CompressionStats] = None) -> bytes:
+    """Mã hóa theo codec đã thỏa thuận"""
+    if codec in (CODEC_BINARY, CODEC_BINARY_ZLIB) and message.msg_type not in JSON_ONLY_TYPES:
+        try:
+            if codec == CODEC_BINARY_ZLIB:
+                return encode_binary(message, compress_threshold, stats)
+            return encode_binary(message)
+        except ValueError:
+            pass
+    return message.to_json().encode('utf-8')
+
+
+def stamp_seq(data: bytes, epoch: int, seq: int, seq_base: int) -> bytes:
+    """
+    Gắn epoch/seq/seq_base của 1 peer vào tin đã mã hóa chung (không mã hóa/nén lại)
+    Nhị phân: trailer 12 byte + FLAG_SEQ_TRAILER; JSON: thêm field trước dấu } cuối
+    """
+    if data and data[0] == MAGIC:
+        return b"".join((data[:3], _U8.pack(data[3] | FLAG_SEQ_TRAILER), data[4:],
+                         _SEQ.pack(epoch, seq, seq_base)))
+    return b"".join((data[:-1], f', "seq": {seq}, "epoch": {epoch}, "seq_base": {seq_base}}}'.encode('ascii')))
+
+
+def decode_message(data: bytes, stats: Optional[CompressionStats] = None) -> Message:
+    """Giải mã - tự nhận diện JSON hay nhị phân (nhận bytes hoặc memoryview)"""
+    if data and data[0] == MAGIC:
+        return decode_binary(data, stats)
+    return Message.from_json(str(data, 'utf-8'))
+
+
+_JSON_TYPE_PREFIX = b'{"msg_type": "'
+
+
+def peek_type(data: bytes) -> Optional[MessageType]:
+    """Loại tin của dữ liệu đã mã hóa, không giải mã (None nếu không nhận ra)"""
+    if data and data[0] == MAGIC:
+        return CODE_TYPES.get(data[2]) if len(data) > 2 else None
+    if data[:len(_JSON_TYPE_PREFIX)] == _JSON_TYPE_PREFIX:
+        end = data.find(b'"', len(_JSON_TYPE_PREFIX))
+        try:
+            return MessageType(str(data[len(_JSON_TYPE_PREFIX):end], 'utf-8'))
+        except ValueError:
+            return None
+    return None
+
+
+def with_capabilities(content: str, capabilities: Set[str]) -> str:
+    """Gắn danh sách tính năng vào nội dung discovery"""
+    if not capabilities:
+        return content
+    return f"{content}{CAPS_SEPARATOR}{','.join(sorted(capabilities))}"
+
+
+def parse_capabilities(content: str) -> Set[str]:
+    """Đọc danh sách tính năng từ nội dung discovery (peer cũ -> rỗng)"""
+    _, sep, caps = content.partition(CAPS_SEPARATOR)
+    if not sep:
+        return set()
+    return {c for c in caps.split(',') if c}
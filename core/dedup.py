@@ -0,0 +1,89 @@
+"""
+Module chống trùng tin nhắn - Bộ nhớ giới hạn, cửa sổ thời gian cố định
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+
+class DedupCache:
+    """
+    LRU theo (sender_id, msg_id), thêm/tra cứu O(1)
+    - Mục cũ hơn `window` giây bị hết hạn
+    - Vượt `capacity` mục thì loại mục cũ nhất (eviction)
+    """
+
+    def __init__(self, window: float = 120.0, capacity: int = 10000):
+        self.window = window
+        self.capacity = capacity
+
+        self._entries: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_bytes = 0
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def check_and_add(self, sender_id: str, msg_id: str) -> bool:
+        """True nếu đã thấy tin này trong cửa sổ thời gian (trùng)"""
+        key = (sender_id, msg_id)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if key in self._entries:
+                self.hits += 1
+                return True
+
+            self.misses += 1
+            self._entries[key] = now
+            self._key_bytes += self._key_size(key)
+            if len(self._entries) > self.capacity:
+                old_key, _ = self._entries.popitem(last=False)
+                self._key_bytes -= self._key_size(old_key)
+                self.evictions += 1
+            return False
+
+    def expire(self):
+        """Dọn các mục hết hạn (gọi định kỳ khi rảnh)"""
+        with self._lock:
+            self._expire(time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def memory_bytes(self) -> int:
+        """Ước lượng bộ nhớ đang dùng"""
+        return sys.getsizeof(self._entries) + self._key_bytes
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'memory_bytes': self.memory_bytes,
+        }
+
+    def _expire(self, now: float):
+        # Mục được thêm theo thứ tự thời gian -> chỉ cần xét từ đầu
+        deadline = now - self.window
+        entries = self._entries
+        while entries:
+            key, seen = next(iter(entries.items()))
+            if seen >= deadline:
+                break
+            del entries[key]
+            self._key_bytes -= self._key_size(key)
+            self.expirations += 1
+
+    @staticmethod
+    def _key_size(key: Tuple[str, str]) -> int:
+        # tuple + 2 chuỗi + float timestamp
+        return sys.getsizeof(key) + sys.getsizeof(key[0]) + sys.getsizeof(key[1]) + 24
@@ -0,0 +1,91 @@
+"""
+Module delta - Thay đổi theo phiên bản của một tập có key (thiết bị, nhóm) gửi cho giao diện
+
+Core gom thay đổi giữa 2 lần phát thành 1 Delta (added/changed/removed) thay vì gửi lại
+cả dict; giao diện chỉ sửa các dòng bị ảnh hưởng.
+"""
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+
+@dataclass
+class Delta:
+    """Thay đổi từ phiên bản version - 1 lên version"""
+    version: int
+    added: Dict[str, object] = field(default_factory=dict)
+    changed: Dict[str, object] = field(default_factory=dict)
+    removed: Dict[str, object] = field(default_factory=dict)  # Giá trị cuối cùng trước khi bị xóa
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+    def apply(self, items: Dict[str, object]):
+        """Áp delta vào bản sao của bên nhận"""
+        for key in self.removed:
+            items.pop(key, None)
+        items.update(self.added)
+        items.update(self.changed)
+
+
+def diff(old: Dict[str, object], new: Dict[str, object], version: int = 0) -> Delta:
+    """Delta giữa 2 dict (giá trị so bằng ==) - cho bên chỉ có bản đầy đủ"""
+    delta = Delta(version)
+    for key, value in new.items():
+        if key not in old:
+            delta.added[key] = value
+        elif old[key] != value:
+            delta.changed[key] = value
+    for key, value in old.items():
+        if key not in new:
+            delta.removed[key] = value
+    return delta
+
+
+class DeltaTracker:
+    """
+    Gom thay đổi theo key giữa 2 lần take(); mỗi delta lấy ra tăng version 1
+    Thêm rồi xóa trong cùng lượt -> không còn gì; xóa rồi thêm lại -> changed
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._added: Dict[str, object] = {}
+        self._changed: Dict[str, object] = {}
+        self._removed: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def add(self, key: str, value: object):
+        with self._lock:
+            if self._removed.pop(key, None) is not None:
+                self._changed[key] = value
+            else:
+                self._added[key] = value
+
+    def change(self, key: str, value: object):
+        with self._lock:
+            if key in self._added:
+                self._added[key] = value
+            else:
+                self._changed[key] = value
+
+    def remove(self, key: str, value: object):
+        with self._lock:
+            if self._added.pop(key, None) is not None:
+                return  # Bên nhận chưa từng thấy key này
+            self._changed.pop(key, None)
+            self._removed[key] = value
+
+    def pending(self) -> bool:
+        with self._lock:
+            return bool(self._added or self._changed or self._removed)
+
+    def take(self) -> Optional[Delta]:
+        """Delta của các thay đổi đang gom (None nếu không có gì)"""
+        with self._lock:
+            if not (self._added or self._changed or self._removed):
+                return None
+            self.version += 1
+            delta = Delta(self.version, self._added, self._changed, self._removed)
+            self._added, self._changed, self._removed = {}, {}, {}
+            return delta
@@ -3,9 +3,12 @@ Module dò tìm các máy trong mạng - Tối ưu để không gây lag
 """
 import threading
 import time
-from typing import Dict, Callable, Optional
+from typing import Dict, Callable, List, Optional, Set
 from dataclasses import dataclass
+from .addressing import DEFAULT_HOST, Endpoint
+from .deltas import Delta, DeltaTracker
 from .message import Message, MessageType
+from .scheduler import TimerHandle
 from utils.logger import Logger
 
 
@@ -16,16 +19,24 @@ class Device:
     name: str
     port: int
     last_seen: float
+    host: str = DEFAULT_HOST  # IP nguồn của gói discovery
+
+    @property
+    def endpoint(self) -> Endpoint:
+        return Endpoint(self.host, self.port)
 
     def is_online(self, timeout: float = 60.0) -> bool:
         return (time.time() - self.last_seen) < timeout
 
 
 class DeviceDiscovery:
-    """Quản lý việc dò tìm thiết bị"""
+    """Quản lý việc dò tìm thiết bị - mọi việc định kỳ chạy trên network.scheduler"""
 
+    START_DELAY = 1.0          # Đợi 1 giây trước lần discovery đầu
     DISCOVERY_INTERVAL = 15.0  # 15 giây
+    CLEANUP_INTERVAL = 15.0    # Kiểm tra thiết bị offline mỗi 15 giây
     DEVICE_TIMEOUT = 60.0      # 60 giây mới coi là offline
+    RESPONSE_DELAY = 0.1       # Gom các DISCOVERY đến trong khoảng này thành 1 lượt trả lời
 
     def __init__(self, network_manager, logger: Logger):
         self.network = network_manager
@@ -33,38 +44,49 @@ class DeviceDiscovery:
 
         self.devices: Dict[str, Device] = {}
         self._devices_lock = threading.Lock()
+        # Endpoint đang chờ DISCOVERY_RESPONSE - tối đa 1 timer chờ cho mọi endpoint
+        self._pending_responses: Set[Endpoint] = set()
+        self._responses_lock = threading.Lock()
         self.running = False
+        self._timers: List[TimerHandle] = []
+
+        # Thay đổi (thêm/đổi tên-địa chỉ/offline) gom lại, phát mỗi lần update
+        self._delta = DeltaTracker()
 
-        # Flags để throttle updates
-        self._pending_update = False
+        # Throttle updates: tối đa 1 lần update đang hẹn
+        self._update_timer: Optional[TimerHandle] = None
+        self._update_lock = threading.Lock()
         self._last_update_time = 0
         self._update_cooldown = 2.0  # Chỉ update GUI mỗi 2 giây
 
         self.on_device_found: Optional[Callable[[Device], None]] = None
         self.on_device_lost: Optional[Callable[[Device], None]] = None
+        # Delta có version tăng dần; on_devices_updated nhận cả dict (phải copy, chậm khi nhiều peer)
+        self.on_devices_delta: Optional[Callable[[Delta], None]] = None
         self.on_devices_updated: Optional[Callable[[Dict[str, Device]], None]] = None
 
     def start(self):
-        """Bắt đầu dò tìm"""
+        """Bắt đầu dò tìm (sau network.start(): cần scheduler đang chạy)"""
         self.running = True
-
-        # Discovery thread
-        discovery_thread = threading.Thread(target=self._discovery_loop, daemon=True)
-        discovery_thread.start()
-
-        # Cleanup thread
-        cleanup_thread = threading.Thread(target=self._cleanup_loop, daemon=True)
-        cleanup_thread.start()
-
-        # Update throttle thread
-        update_thread = threading.Thread(target=self._update_loop, daemon=True)
-        update_thread.start()
+        scheduler = self.network.scheduler
+        self._timers = [
+            scheduler.call_every(self.DISCOVERY_INTERVAL, self.send_discovery_now,
+                                 first=self.START_DELAY),
+            scheduler.call_every(self.CLEANUP_INTERVAL, self._cleanup_offline),
+        ]
 
         self.logger.info("Device discovery started")
 
     def stop(self):
         """Dừng dò tìm"""
         self.running = False
+        for timer in self._timers:
+            timer.cancel()
+        self._timers = []
+        with self._update_lock:
+            if self._update_timer:
+                self._update_timer.cancel()
+                self._update_timer = None
 
     def send_discovery_now(self):
         """Gửi discovery ngay lập tức"""
@@ -74,7 +96,7 @@ class DeviceDiscovery:
                 sender_id=self.network.user_id,
                 sender_name=self.network.user_name,
                 sender_port=self.network.port,
-                content="discover"
+                content=self.network.advertise("discover")
             )
             self.network.send_message(msg)
         except Exception as e:
@@ -83,14 +105,25 @@ class DeviceDiscovery:
     def handle_discovery_message(self, message: Message):
         """Xử lý tin nhắn discovery"""
         if message.msg_type == MessageType.DISCOVERY:
-            # Delay nhỏ để tránh flood
-            threading.Timer(0.1, self._send_discovery_response, args=[message.sender_port]).start()
+            # Delay nhỏ để tránh flood; DISCOVERY lặp lại trong lúc chờ không sinh thêm timer
+            with self._responses_lock:
+                first = not self._pending_responses
+                self._pending_responses.add(self.network.endpoint_of(message))
+            if first:
+                self.network.scheduler.call_later(self.RESPONSE_DELAY, self._flush_responses)
             self._add_device(message)
 
         elif message.msg_type == MessageType.DISCOVERY_RESPONSE:
             self._add_device(message)
 
-    def _send_discovery_response(self, target_port: int):
+    def _flush_responses(self):
+        """Trả lời mọi endpoint đã gửi DISCOVERY trong lúc chờ"""
+        with self._responses_lock:
+            targets, self._pending_responses = self._pending_responses, set()
+        for target in targets:
+            self._send_discovery_response(target)
+
+    def _send_discovery_response(self, target: Endpoint):
         """Gửi response sau delay"""
         try:
             response = Message(
@@ -98,109 +131,108 @@ class DeviceDiscovery:
                 sender_id=self.network.user_id,
                 sender_name=self.network.user_name,
                 sender_port=self.network.port,
-                content="online"
+                content=self.network.advertise("online")
             )
-            self.network._send_to_port(response, target_port)
+            self.network._send_to_port(response, target)
         except:
             pass
 
     def _add_device(self, message: Message):
         """Thêm hoặc cập nhật thiết bị"""
         device_id = message.sender_id
+        endpoint = self.network.endpoint_of(message)
+        now = time.time()
 
         with self._devices_lock:
-            is_new = device_id not in self.devices
-
-            self.devices[device_id] = Device(
+            device = self.devices.get(device_id)
+            is_new = device is None
+            if not is_new and device.name == message.sender_name and device.endpoint == endpoint:
+                # Chỉ làm mới last_seen: không có gì để báo giao diện
+                device.last_seen = now
+                return
+
+            # Đối tượng mới khi đổi tên/địa chỉ: bản giao diện đang giữ không bị sửa ngầm
+            device = self.devices[device_id] = Device(
                 device_id=device_id,
                 name=message.sender_name,
-                port=message.sender_port,
-                last_seen=time.time()
+                port=endpoint.port,
+                last_seen=now,
+                host=endpoint.host
             )
+            if is_new:
+                self._delta.add(device_id, device)
+            else:
+                self._delta.change(device_id, device)
 
         if is_new:
             self.logger.info(f"Device found: {message.sender_name}")
             if self.on_device_found:
                 try:
-                    self.on_device_found(self.devices[device_id])
+                    self.on_device_found(device)
                 except:
                     pass
 
-        # Đánh dấu cần update (sẽ được xử lý bởi update_loop)
-        self._pending_update = True
+        self._schedule_update()
 
     def _schedule_update(self):
-        """Lên lịch update GUI"""
-        current_time = time.time()
-        if current_time - self._last_update_time >= self._update_cooldown:
-            self._last_update_time = current_time
-            self._pending_update = False
+        """Lên lịch update GUI: ngay nếu đã qua cooldown, không thì khi hết cooldown"""
+        with self._update_lock:
+            if self._update_timer is not None:
+                return  # Đã hẹn - thay đổi này được gộp vào lần đó
+            delay = max(0.0, self._last_update_time + self._update_cooldown - time.time())
+            self._update_timer = self.network.scheduler.call_later(delay, self._flush_update)
+
+    def _flush_update(self):
+        """Gửi các thay đổi từ lần update trước cho GUI"""
+        with self._update_lock:
+            self._update_timer = None
+            self._last_update_time = time.time()
+
+        delta = self._delta.take()
+        if delta is None:
+            return
+
+        if self.on_devices_delta:
+            try:
+                self.on_devices_delta(delta)
+            except:
+                pass
 
+        if self.on_devices_updated:
             with self._devices_lock:
                 devices_copy = dict(self.devices)
-
-            if self.on_devices_updated:
-                try:
-                    self.on_devices_updated(devices_copy)
-                except:
-                    pass
-
-    def _update_loop(self):
-        """Thread xử lý update GUI với throttling"""
-        while self.running:
-            if self._pending_update:
-                self._schedule_update()
-            time.sleep(0.5)
-
-    def _discovery_loop(self):
-        """Gửi discovery định kỳ"""
-        # Đợi 1 giây trước khi bắt đầu
-        time.sleep(1.0)
-
-        while self.running:
             try:
-                msg = Message(
-                    msg_type=MessageType.DISCOVERY,
-                    sender_id=self.network.user_id,
-                    sender_name=self.network.user_name,
-                    sender_port=self.network.port,
-                    content="discover"
-                )
-                self.network.send_message(msg)
-            except Exception as e:
-                self.logger.error(f"Discovery error: {e}")
-
-            time.sleep(self.DISCOVERY_INTERVAL)
-
-    def _cleanup_loop(self):
-        """Xóa thiết bị offline"""
-        while self.running:
-            time.sleep(15.0)  # Check mỗi 15 giây
-
-            try:
-                offline_devices = []
-
-                with self._devices_lock:
-                    for device_id, device in list(self.devices.items()):
-                        if not device.is_online(self.DEVICE_TIMEOUT):
-                            offline_devices.append((device_id, device))
+                self.on_devices_updated(devices_copy)
+            except:
+                pass
 
-                    for device_id, _ in offline_devices:
-                        del self.devices[device_id]
-
-                for _, device in offline_devices:
-                    self.logger.info(f"Device lost: {device.name}")
-                    if self.on_device_lost:
-                        try:
-                            self.on_device_lost(device)
-                        except:
-                            pass
+    def _cleanup_offline(self):
+        """Xóa thiết bị offline"""
+        try:
+            offline_devices = []
 
-                if offline_devices:
-                    self._pending_update = True
+            with self._devices_lock:
+                for device_id, device in list(self.devices.items()):
+                    if not device.is_online(self.DEVICE_TIMEOUT):
+                        offline_devices.append((device_id, device))
+
+                for device_id, device in offline_devices:
+                    del self.devices[device_id]
+                    self._delta.remove(device_id, device)
+
+            for _, device in offline_devices:
+                self.logger.info(f"Device lost: {device.name}")
+                if self.on_device_lost:
+                    try:
+                        self.on_device_lost(device)
+                    except:
+                        pass
+
+            if offline_devices:
+                self._schedule_update()
 
-            except Exception as e:
-                self.logger.error(f"Cleanup error: {e}")
+        except Exception as e:
+            self.logger.error(f"Cleanup error: {e}")
 
     def get_online_devices(self) -> Dict[str, Device]:
         """Lấy danh sách thiết bị online"""
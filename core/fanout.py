@@ -0,0 +1,180 @@
+"""
+Module fan-out - Mã hóa một lần, gửi đến nhiều đích từ thread riêng
+"""
+import heapq
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable, Dict, List, Optional, Set
+from .message import Message
+from .codec import encode_message
+from utils.logger import Logger
+
+
+@dataclass
+class FanoutResult:
+    """Kết quả gửi theo từng đích (endpoint/port -> số lần gửi)"""
+    destinations: List[int]
+    succeeded: Dict[int, int] = field(default_factory=dict)
+    failed: Dict[int, int] = field(default_factory=dict)
+    confirmed: Set[int] = field(default_factory=set)  # đích đã ACK (reliability layer)
+    _done: threading.Event = field(default_factory=threading.Event, repr=False)
+    _parts: int = field(default=0, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _callbacks: List[Callable[['FanoutResult'], None]] = field(default_factory=list, repr=False)
+
+    def _add_part(self):
+        with self._lock:
+            self._parts += 1
+
+    def _finish_part(self):
+        """Một phần (fan-out / reliable) đã xong; done khi không còn phần nào"""
+        with self._lock:
+            self._parts -= 1
+            if self._parts > 0 or self._done.is_set():
+                return
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback: Callable[['FanoutResult'], None]):
+        """Gọi callback(result) khi gửi xong (ngay lập tức nếu đã xong) - từ thread gửi"""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _record(self, port: int, ok: bool):
+        with self._lock:
+            counts = self.succeeded if ok else self.failed
+            counts[port] = counts.get(port, 0) + 1
+
+    @property
+    def success_count(self) -> int:
+        return sum(self.succeeded.values())
+
+    @property
+    def failure_count(self) -> int:
+        return sum(self.failed.values())
+
+    def is_done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Chờ gửi xong (không gọi từ GUI thread)"""
+        return self._done.wait(timeout)
+
+
+@dataclass
+class _FanoutJob:
+    message: Message
+    ports: List[int]
+    result: FanoutResult
+    rounds_left: int
+    repeat_delay: float
+    # codec -> bytes, mã hóa một lần và dùng chung cho mọi đích
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+
+class FanoutSender:
+    """Thread gửi riêng: caller chỉ đưa job vào hàng đợi, không bị chặn"""
+
+    def __init__(self, send_raw: Callable[[bytes, int], None],
+                 codec_for: Callable[[int], str], logger: Logger,
+                 encode: Callable[[Message, str], bytes] = encode_message):
+        self._send_raw = send_raw
+        self._codec_for = codec_for
+        self._encode = encode
+        self.logger = logger
+
+        self._jobs = []  # heap (due_time, seq, job)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.running = False
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+
+    def submit(self, message: Message, ports: List[int], repeat: int = 1,
+               repeat_delay: float = 0.05,
+               result: Optional[FanoutResult] = None) -> FanoutResult:
+        """
+        Đưa tin nhắn vào hàng đợi gửi đến các port
+        repeat > 1: gửi lặp lại cả lượt sau repeat_delay (UDP không tin cậy)
+        result: ghi chung vào kết quả có sẵn (vd. cùng với reliability layer)
+        """
+        if result is None:
+            result = FanoutResult(destinations=list(ports))
+        result._add_part()
+        if not ports:
+            result._finish_part()
+            return result
+
+        job = _FanoutJob(message, list(ports), result, max(1, repeat), repeat_delay)
+        self._schedule(job, 0.0)
+        return result
+
+    def call_soon(self, callback: Callable, *args):
+        """Chạy callback(*args) trên thread gửi, theo thứ tự cùng các job khác"""
+        self._schedule(partial(callback, *args), 0.0)
+
+    def _schedule(self, job, delay: float):
+        with self._cond:
+            heapq.heappush(self._jobs, (time.monotonic() + delay, next(self._seq), job))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self.running:
+                    if self._jobs:
+                        wait = self._jobs[0][0] - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if not self.running:
+                    return
+                _, _, job = heapq.heappop(self._jobs)
+
+            if not isinstance(job, _FanoutJob):
+                try:
+                    job()
+                except Exception as e:
+                    self.logger.error(f"Deferred send failed: {e}")
+                continue
+
+            self._send_round(job)
+
+            job.rounds_left -= 1
+            if job.rounds_left > 0:
+                self._schedule(job, job.repeat_delay)
+            else:
+                job.encoded.clear()
+                job.result._finish_part()
+
+    def _send_round(self, job: _FanoutJob):
+        """Gửi một lượt đến tất cả đích"""
+        result = job.result
+        for port in job.ports:
+            try:
+                codec = self._codec_for(port)
+                data = job.encoded.get(codec)
+                if data is None:
+                    data = job.encoded[codec] = self._encode(job.message, codec)
+                self._send_raw(data, port)
+                result._record(port, True)
+            except Exception as e:
+                result._record(port, False)
+                self.logger.debug(f"Fan-out to port {port} failed: {e}")
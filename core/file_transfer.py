@@ -0,0 +1,560 @@
+"""
+Module truyền file - Thỏa thuận qua FILE_OFFER/FILE_ACCEPT, dữ liệu đi qua kênh TCP riêng
+
+Kênh TCP (bên gửi lắng nghe, bên nhận kết nối):
+    request:  1 dòng JSON {"transfer_id", "token", "receiver_name", "offset"}
+    response: các chunk offset(8) length(4) crc32(4) + data; length = 0 -> hết file
+Mỗi người được mời có token riêng (trong FILE_OFFER gửi cho riêng họ); token hết hạn sau
+OFFER_TTL và bị bỏ khi người đó tải xong hoặc từ chối. Hết token -> bỏ file khỏi danh sách.
+Lời mời nhận được cũng hết hạn sau OFFER_TTL; mỗi người gửi có tối đa
+MAX_OFFERS_PER_SENDER lời mời chờ trả lời.
+"""
+import hashlib
+import json
+import mmap
+import os
+import re
+import secrets
+import socket
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, List, Optional
+from .addressing import DEFAULT_HOST, Endpoint
+from .message import Message, MessageType
+from .scheduler import TimerHandle
+from utils.logger import Logger
+
+_CHUNK_HEADER = struct.Struct("!QII")
+_MAX_REQUEST = 4096
+# transfer_id = blake2b 8 byte dạng hex; đi vào tên file .part nên không nhận gì khác
+_TRANSFER_ID = re.compile(r"[0-9a-f]{16}")
+MAX_CHUNK_SIZE = 4 * 1024 * 1024  # Buffer nhận cấp theo chunk_size của peer: giới hạn lại
+
+
+@dataclass
+class FileOffer:
+    """Lời mời nhận file"""
+    transfer_id: str
+    name: str
+    size: int
+    chunk_size: int
+    tcp_port: int
+    sender_id: str = ""
+    sender_name: str = ""
+    sender_port: int = 0
+    group_id: Optional[str] = None
+    sender_host: str = DEFAULT_HOST  # IP nguồn của lời mời - cũng là nơi kết nối TCP tải file
+    token: str = ""                  # Riêng cho người nhận này, gửi lại khi tải/trả lời
+
+    @property
+    def sender_endpoint(self) -> Endpoint:
+        return Endpoint(self.sender_host, self.sender_port)
+
+    def to_content(self) -> str:
+        return json.dumps({
+            'transfer_id': self.transfer_id,
+            'name': self.name,
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'tcp_port': self.tcp_port,
+            'token': self.token,
+        }, ensure_ascii=False)
+
+    @classmethod
+    def from_message(cls, message: Message) -> 'FileOffer':
+        try:
+            data = json.loads(message.content)
+            transfer_id = str(data['transfer_id'])
+            if not _TRANSFER_ID.fullmatch(transfer_id):
+                raise ValueError(f"bad transfer id {transfer_id[:32]!r}")
+            size = int(data['size'])
+            if size < 0:
+                raise ValueError(f"bad size {size}")
+            return cls(
+                transfer_id=transfer_id,
+                # Chỉ lấy tên file, không cho peer chọn thư mục ghi
+                name=os.path.basename(str(data['name'])) or "file",
+                size=size,
+                # Chunk lớn hơn thì lượt tải báo lỗi "Unexpected chunk", không cấp bộ nhớ theo peer
+                chunk_size=min(max(int(data['chunk_size']), 1), MAX_CHUNK_SIZE),
+                tcp_port=int(data['tcp_port']),
+                sender_id=message.sender_id,
+                sender_name=message.sender_name,
+                sender_port=message.sender_port,
+                group_id=message.group_id,
+                sender_host=message.sender_host or DEFAULT_HOST,
+                token=str(data.get('token', '')),
+            )
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid file offer: {e}")
+
+
+@dataclass
+class TransferProgress:
+    """Tiến độ một lượt gửi/nhận"""
+    transfer_id: str
+    name: str
+    peer_name: str
+    direction: str          # "send" / "recv"
+    total: int
+    done: int = 0
+    state: str = "active"   # active / done / failed / declined
+    path: Optional[str] = None
+    error: Optional[str] = None
+    started: float = field(default_factory=time.monotonic, repr=False)
+    _start_done: int = field(default=0, repr=False)
+    _reported_at: float = field(default=0.0, repr=False)
+
+    @property
+    def percent(self) -> float:
+        return 100.0 if self.total == 0 else self.done * 100.0 / self.total
+
+    @property
+    def rate(self) -> float:
+        """Byte/giây kể từ lúc bắt đầu (hoặc tiếp tục)"""
+        elapsed = time.monotonic() - self.started
+        return (self.done - self._start_done) / elapsed if elapsed > 0 else 0.0
+
+
+class _OutgoingFile:
+    """File đang mời gửi - dùng chung cho mọi người nhận (mmap + cache checksum)"""
+
+    def __init__(self, path: str, size: int, chunk_size: int):
+        self.path = path
+        self.size = size
+        self.chunk_size = chunk_size
+        self.tokens: Dict[str, float] = {}  # token người nhận -> hạn (time.monotonic)
+        self.active = 0  # Số kết nối đang stream (không đóng mmap khi còn)
+        self._map: Optional[mmap.mmap] = None
+        self._checksums: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def checksum(self, index: int) -> int:
+        """crc32 của chunk - tính 1 lần, dùng lại cho mọi người nhận"""
+        with self._lock:
+            crc = self._checksums.get(index)
+            if crc is None:
+                if self._map is None:
+                    with open(self.path, 'rb') as f:
+                        self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                start = index * self.chunk_size
+                with memoryview(self._map) as view:
+                    crc = zlib.crc32(view[start:start + self.chunk_size])
+                self._checksums[index] = crc
+            return crc
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+
+
+class FileTransferManager:
+    """Gửi/nhận file qua TCP, tiếp tục từ offset khi đứt kết nối"""
+
+    CHUNK_SIZE = 256 * 1024
+    IO_TIMEOUT = 30.0
+    MAX_RETRIES = 3
+    RETRY_DELAY = 1.0
+    PROGRESS_INTERVAL = 0.2  # Giây giữa 2 lần báo tiến độ (không làm nghẽn GUI)
+    OFFER_TTL = 3600.0       # Giây - token mời dùng được (kể cả kết nối lại để tải tiếp)
+    MAX_OFFERS_PER_SENDER = 16  # Lời mời nhận được chờ trả lời tối đa của mỗi người gửi
+
+    def __init__(self, network_manager, logger: Logger, download_dir: str = "downloads"):
+        self.network = network_manager
+        self.logger = logger
+        self.download_dir = download_dir
+
+        self._server: Optional[socket.socket] = None
+        self.tcp_port = 0
+        self._outgoing: Dict[str, _OutgoingFile] = {}
+        self._offers: Dict[str, FileOffer] = {}  # Lời mời chờ trả lời
+        self._offer_timers: Dict[str, TimerHandle] = {}  # Hẹn giờ hết hạn của lời mời
+        self.offers_rejected = 0  # Lời mời bị bỏ vì người gửi đã có quá nhiều lời mời chờ
+        self._lock = threading.Lock()
+        self.running = False
+
+        self.on_offer: Optional[Callable[[FileOffer], None]] = None
+        self.on_progress: Optional[Callable[[TransferProgress], None]] = None
+
+    def start(self) -> bool:
+        """Mở cổng TCP cho người nhận kết nối"""
+        try:
+            self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._server.bind((self.network.bind_host, 0))
+            self._server.listen(16)
+            self.tcp_port = self._server.getsockname()[1]
+        except OSError as e:
+            self.logger.error(f"File transfer start failed: {e}")
+            return False
+
+        self.running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        self.logger.info(f"File transfer listening on TCP {self.tcp_port}")
+        return True
+
+    def stop(self):
+        self.running = False
+        try:
+            if self._server:
+                self._server.close()
+        except:
+            pass
+        with self._lock:
+            for outgoing in self._outgoing.values():
+                outgoing.close()
+            self._outgoing.clear()
+            for timer in self._offer_timers.values():
+                timer.cancel()
+            self._offer_timers.clear()
+            self._offers.clear()
+
+    def offer_file(self, path: str, ports: List[Endpoint], group_id: Optional[str] = None) -> FileOffer:
+        """Mời các endpoint nhận file (cả nhóm dùng chung 1 bản mmap/checksum)"""
+        stat = os.stat(path)
+        # Cùng file (đường dẫn, kích thước, mtime) -> cùng id -> người nhận tiếp tục được
+        key = f"{self.network.user_id}|{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        transfer_id = hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest()
+
+        deadline = time.monotonic() + self.OFFER_TTL
+        tokens = [secrets.token_hex(16) for _ in ports]
+        with self._lock:
+            outgoing = self._outgoing.get(transfer_id)
+            if outgoing is None:
+                outgoing = self._outgoing[transfer_id] = _OutgoingFile(path, stat.st_size, self.CHUNK_SIZE)
+            for token in tokens:
+                outgoing.tokens[token] = deadline
+        self.network.scheduler.call_later(self.OFFER_TTL, self._expire, transfer_id)
+
+        offer = FileOffer(
+            transfer_id=transfer_id,
+            name=os.path.basename(path),
+            size=stat.st_size,
+            chunk_size=self.CHUNK_SIZE,
+            tcp_port=self.tcp_port,
+            sender_id=self.network.user_id,
+            sender_name=self.network.user_name,
+            sender_port=self.network.port,
+            group_id=group_id,
+            sender_host=self.network.host,
+        )
+        # Mỗi người nhận 1 lời mời kèm token của họ
+        for port, token in zip(ports, tokens):
+            msg = Message(
+                msg_type=MessageType.FILE_OFFER,
+                sender_id=self.network.user_id,
+                sender_name=self.network.user_name,
+                sender_port=self.network.port,
+                content=replace(offer, token=token).to_content(),
+                group_id=group_id
+            )
+            self.network.send_to_ports(msg, [port])
+        self.logger.info(f"Offered {offer.name} ({offer.size} bytes) to {len(ports)} peers")
+        return offer
+
+    def handle_message(self, message: Message):
+        """Xử lý FILE_OFFER / FILE_ACCEPT"""
+        if message.msg_type == MessageType.FILE_OFFER:
+            try:
+                offer = FileOffer.from_message(message)
+            except ValueError as e:
+                self.logger.error(str(e))
+                return
+            if not self._store_offer(offer):
+                return
+            if self.on_offer:
+                self.on_offer(offer)
+
+        elif message.msg_type == MessageType.FILE_ACCEPT:
+            try:
+                data = json.loads(message.content)
+                transfer_id = str(data['transfer_id'])
+                token = str(data.get('token', ''))
+                accepted = bool(data.get('accepted'))
+            except (json.JSONDecodeError, KeyError, TypeError):
+                return
+            with self._lock:
+                outgoing = self._outgoing.get(transfer_id)
+                if outgoing is None or token not in outgoing.tokens:
+                    return
+            if accepted:
+                # Người nhận sẽ tự kết nối TCP; tiến độ báo từ _serve
+                self.logger.info(f"{message.sender_name} accepted {transfer_id}")
+            else:
+                self._release(transfer_id, token)
+                self._report(TransferProgress(
+                    transfer_id, os.path.basename(outgoing.path), message.sender_name,
+                    "send", outgoing.size, state="declined"
+                ), final=True)
+
+    def respond(self, transfer_id: str, accept: bool) -> bool:
+        """Trả lời lời mời (gọi được từ Tk thread - không chặn); False nếu đã hết hạn"""
+        with self._lock:
+            offer = self._pop_offer(transfer_id)
+        if offer is None:
+            return False
+
+        msg = Message(
+            msg_type=MessageType.FILE_ACCEPT,
+            sender_id=self.network.user_id,
+            sender_name=self.network.user_name,
+            sender_port=self.network.port,
+            content=json.dumps({
+                'transfer_id': transfer_id,
+                'token': offer.token,
+                'accepted': accept,
+                'offset': self._resume_offset(offer) if accept else 0,
+            }),
+            target_id=offer.sender_id
+        )
+        self.network.send_to_ports(msg, [offer.sender_endpoint])
+
+        if accept:
+            threading.Thread(target=self._download, args=(offer,), daemon=True).start()
+        return True
+
+    def pending_offers(self) -> Dict[str, FileOffer]:
+        with self._lock:
+            return dict(self._offers)
+
+    def _store_offer(self, offer: FileOffer) -> bool:
+        """Lưu lời mời nhận được và hẹn giờ hết hạn; False nếu người gửi đã đủ lời mời chờ"""
+        with self._lock:
+            # Mời lại cùng file thay lời mời cũ, không tính thêm
+            pending = sum(1 for o in self._offers.values()
+                          if o.sender_id == offer.sender_id and o.transfer_id != offer.transfer_id)
+            if pending >= self.MAX_OFFERS_PER_SENDER:
+                self.offers_rejected += 1
+                self.logger.warning(f"Too many pending file offers from {offer.sender_name}, "
+                                    f"ignoring {offer.name}")
+                return False
+            self._pop_offer(offer.transfer_id)
+            self._offers[offer.transfer_id] = offer
+            self._offer_timers[offer.transfer_id] = self.network.scheduler.call_later(
+                self.OFFER_TTL, self._expire_offer, offer)
+        return True
+
+    def _pop_offer(self, transfer_id: str) -> Optional[FileOffer]:
+        """Gọi khi giữ _lock: bỏ lời mời và hẹn giờ hết hạn của nó"""
+        timer = self._offer_timers.pop(transfer_id, None)
+        if timer:
+            timer.cancel()
+        return self._offers.pop(transfer_id, None)
+
+    def _expire_offer(self, offer: FileOffer):
+        """Lời mời không được trả lời trong OFFER_TTL (chạy trên scheduler)"""
+        with self._lock:
+            if self._offers.get(offer.transfer_id) is not offer:
+                return
+            self._pop_offer(offer.transfer_id)
+        self.logger.info(f"File offer {offer.name} from {offer.sender_name} expired")
+
+    # === Bên gửi ===
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: socket.socket):
+        """Stream file cho một người nhận bằng sendfile (không copy qua user space)"""
+        try:
+            with conn:
+                conn.settimeout(self.IO_TIMEOUT)
+                with conn.makefile('rb') as reader:
+                    request = json.loads(reader.readline(_MAX_REQUEST))
+
+                transfer_id, token = str(request.get('transfer_id')), str(request.get('token'))
+                with self._lock:
+                    outgoing = self._outgoing.get(transfer_id)
+                    deadline = outgoing.tokens.get(token) if outgoing else None
+                    if deadline is None or deadline < time.monotonic():
+                        self.logger.warning(f"Rejected file request for {str(transfer_id)[:32]}")
+                        return
+                    outgoing.active += 1
+
+                try:
+                    self._stream(conn, request, outgoing)
+                finally:
+                    with self._lock:
+                        outgoing.active -= 1
+                        self._drop_if_idle(transfer_id)
+                # Xong với người nhận này: token không dùng lại được nữa
+                self._release(transfer_id, token)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # Người nhận sẽ kết nối lại và tiếp tục từ offset cuối
+            self.logger.warning(f"File send interrupted: {e}")
+
+    def _stream(self, conn: socket.socket, request: dict, outgoing: _OutgoingFile):
+        size, chunk_size = outgoing.size, outgoing.chunk_size
+        offset = min(max(0, int(request.get('offset', 0))), size)
+        offset -= offset % chunk_size
+
+        progress = TransferProgress(
+            request['transfer_id'], os.path.basename(outgoing.path),
+            str(request.get('receiver_name', '')), "send", size, offset,
+            _start_done=offset
+        )
+
+        with open(outgoing.path, 'rb') as f:
+            while offset < size:
+                length = min(chunk_size, size - offset)
+                crc = outgoing.checksum(offset // chunk_size)
+                conn.sendall(_CHUNK_HEADER.pack(offset, length, crc))
+                if conn.sendfile(f, offset, length) != length:
+                    raise OSError("File changed while sending")
+                offset += length
+                progress.done = offset
+                self._report(progress)
+            conn.sendall(_CHUNK_HEADER.pack(size, 0, 0))
+
+        progress.state = "done"
+        self._report(progress, final=True)
+
+    def _release(self, transfer_id: str, token: str):
+        """Bỏ token của 1 người nhận (tải xong / từ chối)"""
+        with self._lock:
+            outgoing = self._outgoing.get(transfer_id)
+            if outgoing is not None:
+                outgoing.tokens.pop(token, None)
+                self._drop_if_idle(transfer_id)
+
+    def _expire(self, transfer_id: str):
+        """Bỏ các token đã hết hạn (chạy trên scheduler)"""
+        now = time.monotonic()
+        with self._lock:
+            outgoing = self._outgoing.get(transfer_id)
+            if outgoing is None:
+                return
+            for token, deadline in list(outgoing.tokens.items()):
+                if deadline <= now:
+                    del outgoing.tokens[token]
+            self._drop_if_idle(transfer_id)
+
+    def _drop_if_idle(self, transfer_id: str):
+        """Gọi khi giữ _lock: không còn ai được mời và không còn kết nối -> bỏ file"""
+        outgoing = self._outgoing.get(transfer_id)
+        if outgoing is not None and not outgoing.tokens and not outgoing.active:
+            del self._outgoing[transfer_id]
+            outgoing.close()
+
+    # === Bên nhận ===
+
+    def _download(self, offer: FileOffer):
+        """Tải file, kết nối lại từ offset cuối cùng hợp lệ khi lỗi"""
+        progress = TransferProgress(offer.transfer_id, offer.name, offer.sender_name,
+                                    "recv", offer.size)
+        retries = 0
+        try:
+            part = self._part_path(offer)
+            while True:
+                try:
+                    offset = self._resume_offset(offer)
+                    progress.done = progress._start_done = offset
+                    self._receive(offer, part, offset, progress)
+                    break
+                except (OSError, ValueError) as e:
+                    retries += 1
+                    if retries > self.MAX_RETRIES or not self.running:
+                        raise
+                    self.logger.warning(f"Download {offer.name} interrupted ({e}), resuming")
+                    time.sleep(self.RETRY_DELAY)
+
+            progress.path = self._final_path(offer.name)
+            os.replace(part, progress.path)
+        except Exception as e:
+            # Lỗi nào cũng phải báo: không thì giao diện giữ trạng thái "active" mãi
+            progress.state, progress.error = "failed", str(e) or type(e).__name__
+            self._report(progress, final=True)
+            self.logger.error(f"Download {offer.name} failed: {progress.error}")
+            return
+
+        progress.state = "done"
+        self._report(progress, final=True)
+        self.logger.info(f"Received {offer.name} -> {progress.path}")
+
+    def _receive(self, offer: FileOffer, part: str, offset: int, progress: TransferProgress):
+        address = (offer.sender_host, offer.tcp_port)
+        with socket.create_connection(address, timeout=self.IO_TIMEOUT) as conn, \
+                open(part, 'r+b' if os.path.exists(part) else 'w+b') as f:
+            request = {
+                'transfer_id': offer.transfer_id,
+                'token': offer.token,
+                'receiver_name': self.network.user_name,
+                'offset': offset,
+            }
+            conn.sendall(json.dumps(request).encode('utf-8') + b"\n")
+            f.truncate(offset)
+            f.seek(offset)
+
+            # Một buffer cho cả lượt tải: recv_into + ghi từ memoryview, không copy theo chunk
+            header = bytearray(_CHUNK_HEADER.size)
+            buffer = memoryview(bytearray(max(offer.chunk_size, 1)))
+            while True:
+                self._recv_exact(conn, memoryview(header))
+                chunk_offset, length, crc = _CHUNK_HEADER.unpack(header)
+                if length == 0:
+                    break
+                if chunk_offset != offset or length > len(buffer):
+                    raise ValueError(f"Unexpected chunk at {chunk_offset}")
+
+                data = buffer[:length]
+                self._recv_exact(conn, data)
+                if zlib.crc32(data) != crc:
+                    raise ValueError(f"Checksum mismatch at {chunk_offset}")
+                f.write(data)
+                offset += length
+                progress.done = offset
+                self._report(progress)
+
+            if offset != offer.size:
+                raise ValueError(f"Incomplete file: {offset}/{offer.size}")
+
+    @staticmethod
+    def _recv_exact(conn: socket.socket, view: memoryview):
+        while view:
+            received = conn.recv_into(view)
+            if received == 0:
+                raise ConnectionError("Connection closed")
+            view = view[received:]
+
+    def _part_path(self, offer: FileOffer) -> str:
+        os.makedirs(self.download_dir, exist_ok=True)
+        return os.path.join(self.download_dir, f".{offer.transfer_id}.part")
+
+    def _resume_offset(self, offer: FileOffer) -> int:
+        """Offset tiếp tục = phần đã ghi, làm tròn xuống theo chunk"""
+        try:
+            done = min(os.path.getsize(self._part_path(offer)), offer.size)
+        except OSError:
+            return 0
+        return done - done % offer.chunk_size if offer.chunk_size > 0 else 0
+
+    def _final_path(self, name: str) -> str:
+        path = os.path.join(self.download_dir, name)
+        stem, ext = os.path.splitext(path)
+        index = 1
+        while os.path.exists(path):
+            path = f"{stem} ({index}){ext}"
+            index += 1
+        return path
+
+    def _report(self, progress: TransferProgress, final: bool = False):
+        """Báo tiến độ, tối đa 1 lần mỗi PROGRESS_INTERVAL"""
+        now = time.monotonic()
+        if not final and now - progress._reported_at < self.PROGRESS_INTERVAL:
+            return
+        progress._reported_at = now
+        if self.on_progress:
+            try:
+                self.on_progress(progress)
+            except Exception as e:
+                self.logger.error(f"Progress callback error: {e}")
@@ -0,0 +1,201 @@
+"""
+Module phân mảnh - Chia tin lớn thành các datagram vừa MTU và ghép lại ở bên nhận
+
+Định dạng mảnh (network byte order):
+    magic(1) frag_id(8) index(2) count(2) payload
+"""
+import hashlib
+import struct
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List, Optional
+
+CAP_FRAGMENT = "frag1"
+
+FRAG_MAGIC = 0xB2  # Khác MAGIC của codec nhị phân và '{' của JSON
+
+# 1400 byte vừa MTU Ethernet (1500) trừ IP/UDP header và dư cho VPN/PPPoE
+MAX_DATAGRAM = 1400
+
+# Gửi tin nhiều mảnh theo đợt để không tràn buffer nhận của peer
+FRAGMENT_BURST = 32
+BURST_PAUSE = 0.001
+
+_FRAG_HEADER = struct.Struct("!B8sHH")
+FRAGMENT_PAYLOAD = MAX_DATAGRAM - _FRAG_HEADER.size
+MAX_FRAGMENTS = 0xFFFF
+
+
+def is_fragment(data: bytes) -> bool:
+    return len(data) >= _FRAG_HEADER.size and data[0] == FRAG_MAGIC
+
+
+def paced(datagrams: List[bytes]):
+    """Duyệt các mảnh, nghỉ BURST_PAUSE sau mỗi FRAGMENT_BURST mảnh"""
+    for index, datagram in enumerate(datagrams, 1):
+        yield datagram
+        if index % FRAGMENT_BURST == 0 and index < len(datagrams):
+            time.sleep(BURST_PAUSE)
+
+
+def fragment(data: bytes, max_datagram: int = MAX_DATAGRAM) -> List[bytes]:
+    """Chia data thành các mảnh; data nhỏ thì trả nguyên"""
+    if len(data) <= max_datagram:
+        return [data]
+
+    payload = max_datagram - _FRAG_HEADER.size
+    count = (len(data) + payload - 1) // payload
+    if count > MAX_FRAGMENTS:
+        raise ValueError(f"Message too large to fragment: {len(data)} bytes")
+
+    # frag_id theo nội dung: lần truyền lại ghép tiếp vào phần đã nhận, không bắt đầu lại
+    frag_id = hashlib.blake2b(data, digest_size=8).digest()
+    view = memoryview(data)
+    return [
+        _FRAG_HEADER.pack(FRAG_MAGIC, frag_id, index, count) + view[offset:offset + payload]
+        for index, offset in enumerate(range(0, len(data), payload))
+    ]
+
+
+@dataclass
+class _Partial:
+    count: int
+    created: float
+    source: Optional[Hashable]
+    chunks: Dict[int, bytes] = field(default_factory=dict)
+    size: int = 0
+
+
+class Reassembler:
+    """
+    Ghép mảnh theo frag_id, chấp nhận mảnh đến lệch thứ tự / trùng
+    - Tin chưa đủ mảnh sau `timeout` giây bị bỏ
+    - Tổng bộ nhớ đệm <= max_bytes (bỏ tin cũ nhất), mỗi tin <= max_message (tính theo
+      byte mảnh thực nhận, không theo count)
+    - Mỗi nguồn (địa chỉ gửi) đệm tối đa max_source_bytes: mảnh vượt mức bị bỏ, không mở
+      tin mới - một nguồn flood không đẩy tin của nguồn khác ra khỏi bộ đệm
+    """
+
+    def __init__(self, timeout: float = 10.0, max_bytes: int = 16 * 1024 * 1024,
+                 max_message: int = 4 * 1024 * 1024, max_source_bytes: int = 8 * 1024 * 1024):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_message = max_message
+        self.max_source_bytes = max_source_bytes
+
+        self._partials: "OrderedDict[bytes, _Partial]" = OrderedDict()
+        self._buffered = 0
+        self._by_source: Dict[Optional[Hashable], int] = {}  # nguồn -> byte đang đệm
+        self._lock = threading.Lock()
+
+        # Counters
+        self.completed = 0
+        self.expired = 0
+        self.evicted = 0
+        self.rejected = 0
+        self.source_limited = 0
+
+    def add(self, data: bytes, source: Optional[Hashable] = None) -> Optional[bytes]:
+        """
+        Thêm một mảnh; trả về tin hoàn chỉnh khi đủ mảnh
+        source: nguồn của mảnh (vd. IP gửi) để giới hạn bộ đệm theo nguồn
+        """
+        try:
+            _, frag_id, index, count = _FRAG_HEADER.unpack_from(data)
+        except struct.error:
+            self.rejected += 1
+            return None
+        if count == 0 or index >= count:
+            self.rejected += 1
+            return None
+
+        # Copy: data có thể là view vào buffer nhận được dùng lại
+        chunk = bytes(data[_FRAG_HEADER.size:])
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+
+            partial = self._partials.get(frag_id)
+            if partial is not None:
+                # frag_id theo nội dung: nguồn khác gửi cùng tin thì ghép chung, tính cho nguồn đầu
+                if partial.count != count:
+                    self.rejected += 1
+                    return None
+                if index in partial.chunks:
+                    return None  # Mảnh trùng
+                if partial.size + len(chunk) > self.max_message:
+                    self._drop(frag_id)
+                    self.rejected += 1
+                    return None
+            elif len(chunk) > self.max_message:
+                self.rejected += 1
+                return None
+            owner = source if partial is None else partial.source
+            if self._by_source.get(owner, 0) + len(chunk) > self.max_source_bytes:
+                self.source_limited += 1
+                return None
+            if partial is None:
+                partial = self._partials[frag_id] = _Partial(count, now, source)
+
+            partial.chunks[index] = chunk
+            partial.size += len(chunk)
+            self._buffered += len(chunk)
+            self._by_source[owner] = self._by_source.get(owner, 0) + len(chunk)
+
+            if len(partial.chunks) == count:
+                self._drop(frag_id)
+                self.completed += 1
+                return b"".join(partial.chunks[i] for i in range(count))
+
+            self._evict(frag_id)
+            return None
+
+    def expire(self):
+        """Bỏ các tin quá hạn (gọi định kỳ)"""
+        with self._lock:
+            self._expire(time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._partials)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'partial': len(self._partials),
+            'buffered_bytes': self._buffered,
+            'completed': self.completed,
+            'expired': self.expired,
+            'evicted': self.evicted,
+            'rejected': self.rejected,
+            'source_limited': self.source_limited,
+            'sources': len(self._by_source),
+        }
+
+    def _drop(self, frag_id: bytes):
+        partial = self._partials.pop(frag_id)
+        self._buffered -= partial.size
+        remaining = self._by_source[partial.source] - partial.size
+        if remaining:
+            self._by_source[partial.source] = remaining
+        else:
+            del self._by_source[partial.source]
+
+    def _expire(self, now: float):
+        # Tin được thêm theo thứ tự thời gian -> chỉ cần xét từ đầu
+        deadline = now - self.timeout
+        while self._partials:
+            frag_id, partial = next(iter(self._partials.items()))
+            if partial.created >= deadline:
+                break
+            self._drop(frag_id)
+            self.expired += 1
+
+    def _evict(self, keep: bytes):
+        # Vượt giới hạn bộ nhớ -> bỏ tin cũ nhất (không bỏ tin đang ghép)
+        for frag_id in list(self._partials):
+            if self._buffered <= self.max_bytes:
+                break
+            if frag_id != keep:
+                self._drop(frag_id)
+                self.evicted += 1
@@ -1,12 +1,83 @@
 """
 Module quản lý nhóm chat - Sửa lỗi đồng bộ thành viên
+
+Nhóm lớn (>= TREE_THRESHOLD thành viên) lan truyền tin theo cây: người gửi chỉ gửi cho
+`fanout` thành viên, mỗi thành viên chuyển tiếp cho `fanout` con của mình đến khi hết ttl.
+Cây dựng lại cho từng tin (xoay danh sách member_id theo msg_id) để việc chuyển tiếp chia đều.
+Cây dựng theo member_id (mọi node có cùng danh sách id), không theo endpoint: mỗi node thấy
+host của người khác theo cách riêng (IP nguồn quan sát được, 127.0.0.1 của chính mình...).
+Mỗi node gửi thêm cho các con của anh em kế tiếp (TREE_BACKUP): mỗi thành viên nhận
+thêm bản từ một node không nằm trên đường từ cha nó -> một node offline không làm mất
+cả cây con của nó. Lọc trùng theo msg_id -> mỗi node chuyển tiếp 1 lần.
 """
 import uuid
-from typing import Dict, List, Set, Optional
-from dataclasses import dataclass, field
+import zlib
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, Iterable, List, Set, Optional
+from .addressing import DEFAULT_HOST, Endpoint
+from .deltas import Delta, DeltaTracker
 from .message import Message, MessageType
+from .fanout import FanoutResult
 from utils.logger import Logger
 
+TREE_THRESHOLD = 128  # Từ số thành viên này trở lên thì lan truyền theo cây
+TREE_FANOUT = 4       # Số con của mỗi node (người gửi cũng chỉ gửi chừng này gói)
+TREE_BACKUP = 1       # Số anh em mà mỗi node gửi thay cho các con của họ (dự phòng node offline)
+TREE_TTL_SLACK = 1    # Lượt chuyển tiếp dự phòng ngoài độ sâu của cây
+MAX_TREE_TTL = 0xFF   # ttl là 1 byte trong header nhị phân
+
+
+def tree_ttl(members: int, fanout: int = TREE_FANOUT) -> int:
+    """
+    Số lượt chuyển tiếp (sau người gửi) đủ phủ cây `members` node
+    (bản dự phòng từ anh em của cha đến cùng lượt với bản từ cha)
+    """
+    if members <= 2:
+        return 0
+    if fanout <= 1:
+        return members - 2 + TREE_TTL_SLACK
+    # Độ sâu tầng cuối của cây chứa members - 1 node (các con của người gửi ở độ sâu 0)
+    depth, level, capacity = 0, fanout, fanout
+    while capacity < members - 1:
+        level *= fanout
+        capacity += level
+        depth += 1
+    return depth + TREE_TTL_SLACK
+
+
+def tree_targets(member_ids: Iterable[str], sender_id: str, msg_id: str, fanout: int,
+                 own_id: Optional[str] = None, backup: int = TREE_BACKUP) -> List[str]:
+    """
+    member_id của các thành viên mà `own_id` phải gửi/chuyển tiếp đến (None = mình là người gửi)
+    Thứ tự cây: id các thành viên trừ người gửi, sắp xếp rồi xoay theo crc32(msg_id);
+    node ở vị trí p có các con f*(p+1) .. f*(p+1)+f-1, người gửi là gốc (con 0 .. f-1).
+    Node chuyển tiếp gửi thêm cho các con của `backup` anh em kế tiếp (cùng cha, vòng tròn):
+    mỗi thành viên nhận thêm tối đa `backup` bản, cùng lượt với bản từ cha
+    """
+    order = sorted(member for member in set(member_ids) if member != sender_id)
+    if not order:
+        return []
+    shift = zlib.crc32(msg_id.encode('utf-8')) % len(order)
+    order = order[shift:] + order[:shift]
+    if own_id is None:
+        return order[:fanout]
+    try:
+        position = order.index(own_id)
+    except ValueError:
+        return []  # Mình không có trong danh sách thành viên
+    targets = _children(order, position, fanout)
+    base = position - position % fanout  # Vị trí đầu của nhóm anh em
+    siblings = min(fanout, len(order) - base)
+    for step in range(1, min(backup, siblings - 1) + 1):
+        sibling = base + (position - base + step) % siblings
+        targets += _children(order, sibling, fanout)
+    return targets
+
+
+def _children(order: List[str], position: int, fanout: int) -> List[str]:
+    first = fanout * (position + 1)
+    return order[first:first + fanout]
+
 
 @dataclass
 class Group:
@@ -15,13 +86,13 @@ class Group:
     name: str
     creator_id: str
     member_ids: Set[str] = field(default_factory=set)
-    member_ports: Dict[str, int] = field(default_factory=dict)  # member_id -> port
+    member_ports: Dict[str, Endpoint] = field(default_factory=dict)  # member_id -> (host, port)
     member_names: Dict[str, str] = field(default_factory=dict)  # member_id -> name
 
-    def add_member(self, member_id: str, port: int, name: str = ""):
+    def add_member(self, member_id: str, endpoint: Endpoint, name: str = ""):
         """Thêm thành viên"""
         self.member_ids.add(member_id)
-        self.member_ports[member_id] = port
+        self.member_ports[member_id] = endpoint
         if name:
             self.member_names[member_id] = name
 
@@ -35,35 +106,42 @@ class Group:
         """Kiểm tra có phải thành viên không"""
         return member_id in self.member_ids
 
-    def get_all_ports(self) -> List[int]:
-        """Lấy tất cả port của thành viên"""
+    def get_all_ports(self) -> List[Endpoint]:
+        """Lấy endpoint của tất cả thành viên"""
         return list(self.member_ports.values())
 
-    def get_other_ports(self, exclude_id: str) -> List[int]:
-        """Lấy port của các thành viên khác (trừ mình)"""
-        return [port for mid, port in self.member_ports.items() if mid != exclude_id]
+    def get_other_ports(self, exclude_id: str) -> List[Endpoint]:
+        """Lấy endpoint của các thành viên khác (trừ mình)"""
+        return [endpoint for mid, endpoint in self.member_ports.items() if mid != exclude_id]
+
+    def use_tree(self, threshold: int = TREE_THRESHOLD) -> bool:
+        """Nhóm đủ lớn để lan truyền theo cây thay cho gửi trực tiếp đến từng người"""
+        return len(self.member_ids) >= threshold
 
     def to_dict(self) -> dict:
-        """Chuyển thành dict để gửi qua mạng"""
+        """Chuyển thành dict để gửi qua mạng (host tách riêng: peer cũ chỉ đọc member_ports)"""
         return {
             'group_id': self.group_id,
             'name': self.name,
             'creator_id': self.creator_id,
             'member_ids': list(self.member_ids),
-            'member_ports': self.member_ports,
+            'member_ports': {mid: endpoint.port for mid, endpoint in self.member_ports.items()},
+            'member_hosts': {mid: endpoint.host for mid, endpoint in self.member_ports.items()},
             'member_names': self.member_names
         }
 
     @classmethod
-    def from_dict(cls, data: dict) -> 'Group':
-        """Tạo Group từ dict"""
+    def from_dict(cls, data: dict, default_host: str = DEFAULT_HOST) -> 'Group':
+        """Tạo Group từ dict (thành viên không có host - từ peer cũ - nằm trên default_host)"""
         group = cls(
             group_id=data['group_id'],
             name=data['name'],
             creator_id=data['creator_id']
         )
+        hosts = data.get('member_hosts', {})
         group.member_ids = set(data.get('member_ids', []))
-        group.member_ports = data.get('member_ports', {})
+        group.member_ports = {mid: Endpoint(hosts.get(mid, default_host), int(port))
+                              for mid, port in data.get('member_ports', {}).items()}
         group.member_names = data.get('member_names', {})
         return group
 
@@ -71,15 +149,28 @@ class Group:
 class GroupManager:
     """Quản lý các nhóm chat"""
 
-    def __init__(self, network_manager, logger: Logger):
+    def __init__(self, network_manager, logger: Logger,
+                 tree_threshold: int = TREE_THRESHOLD, tree_fanout: int = TREE_FANOUT,
+                 tree_ttl: Optional[int] = None, tree_backup: int = TREE_BACKUP):
         self.network = network_manager
         self.logger = logger
         self.groups: Dict[str, Group] = {}
 
+        # tree_ttl None = tự tính theo số thành viên
+        self.tree_threshold = tree_threshold
+        self.tree_fanout = tree_fanout
+        self.tree_ttl = tree_ttl
+        self.tree_backup = tree_backup
+        self.forwarded = 0
+
+        # Nhóm mới / đổi thành viên -> 1 delta có version cho giao diện (phát ngay, nhóm ít đổi)
+        self._delta = DeltaTracker()
+        self.on_groups_delta: Optional[Callable[[Delta], None]] = None
+
     def create_group(self, name: str, member_ids: List[str], member_info: Dict[str, dict]) -> Group:
         """
         Tạo nhóm mới
-        member_info: {member_id: {'port': int, 'name': str}}
+        member_info: {member_id: {'port': int, 'host': str, 'name': str}}
         """
         group_id = str(uuid.uuid4())[:8]
 
@@ -92,7 +183,7 @@ class GroupManager:
         # Thêm người tạo vào nhóm
         group.add_member(
             self.network.user_id,
-            self.network.port,
+            self.network.endpoint,
             self.network.user_name
         )
 
@@ -100,9 +191,12 @@ class GroupManager:
         for member_id in member_ids:
             if member_id in member_info:
                 info = member_info[member_id]
-                group.add_member(member_id, info['port'], info.get('name', ''))
+                endpoint = Endpoint(info.get('host', self.network.host), info['port'])
+                group.add_member(member_id, endpoint, info.get('name', ''))
 
         self.groups[group_id] = group
+        self._delta.add(group_id, group)
+        self._publish()
 
         # Gửi thông báo tạo nhóm đến TẤT CẢ thành viên
         self._broadcast_group_info(group)
@@ -127,43 +221,49 @@ class GroupManager:
             group_members=list(group.member_ids)
         )
 
-        # Gửi đến tất cả thành viên (trừ mình)
-        for member_id, port in group.member_ports.items():
-            if member_id != self.network.user_id:
-                self.network._send_to_port(msg, port)
-                self.logger.debug(f"Sent group info to {member_id} at port {port}")
+        # Gửi đến tất cả thành viên (trừ mình) - mã hóa 1 lần
+        ports = group.get_other_ports(self.network.user_id)
+        self.network.send_to_ports(msg, ports)
+        self.logger.debug(f"Queued group info for {len(ports)} members")
 
     def handle_group_create(self, message: Message) -> Optional[Group]:
         """Xử lý khi nhận thông báo tạo nhóm"""
         import json
 
         try:
-            # Parse thông tin nhóm từ content
-            group_data = json.loads(message.content)
+            # Parse thông tin nhóm từ content (người tạo bản cũ: mọi thành viên cùng host với họ)
+            sender = self.network.endpoint_of(message)
+            group = Group.from_dict(json.loads(message.content), sender.host)
+            # Người gửi có thể không biết IP của chính mình (bind mọi interface)
+            if message.sender_id in group.member_ports:
+                group.member_ports[message.sender_id] = sender
 
-            group_id = group_data['group_id']
+            group_id = group.group_id
 
             # Nếu đã có nhóm này, cập nhật thông tin
             if group_id in self.groups:
                 existing = self.groups[group_id]
+                before = (len(existing.member_ids), dict(existing.member_ports), dict(existing.member_names))
                 # Merge thông tin
-                existing.member_ids.update(group_data.get('member_ids', []))
-                existing.member_ports.update(group_data.get('member_ports', {}))
-                existing.member_names.update(group_data.get('member_names', {}))
+                existing.member_ids.update(group.member_ids)
+                existing.member_ports.update(group.member_ports)
+                existing.member_names.update(group.member_names)
+                if before != (len(existing.member_ids), existing.member_ports, existing.member_names):
+                    self._delta.change(group_id, existing)
+                    self._publish()
                 return existing
 
-            # Tạo nhóm mới từ dữ liệu nhận được
-            group = Group.from_dict(group_data)
-
             # Đảm bảo bản thân được thêm vào
             if self.network.user_id not in group.member_ids:
                 group.add_member(
                     self.network.user_id,
-                    self.network.port,
+                    self.network.endpoint,
                     self.network.user_name
                 )
 
             self.groups[group_id] = group
+            self._delta.add(group_id, group)
+            self._publish()
 
             self.logger.info(f"Joined group: {group.name} ({len(group.member_ids)} members)")
             self.logger.debug(f"Group members: {group.member_ports}")
@@ -174,11 +274,11 @@ class GroupManager:
             self.logger.error(f"Failed to parse group info: {e}")
             return None
 
-    def send_group_message(self, group_id: str, content: str):
+    def send_group_message(self, group_id: str, content: str) -> Optional[FanoutResult]:
         """Gửi tin nhắn đến nhóm"""
         if group_id not in self.groups:
             self.logger.error(f"Group {group_id} not found")
-            return
+            return None
 
         group = self.groups[group_id]
 
@@ -191,15 +291,64 @@ class GroupManager:
             group_id=group_id
         )
 
-        # Gửi đến tất cả thành viên KHÁC trong nhóm
-        sent_count = 0
-        for member_id, port in group.member_ports.items():
-            if member_id != self.network.user_id:
-                self.network._send_to_port(msg, port)
-                sent_count += 1
-                self.logger.debug(f"Sent group msg to {member_id} at port {port}")
+        ports = group.get_other_ports(self.network.user_id)
+        if group.use_tree(self.tree_threshold):
+            # Nhóm lớn: chỉ gửi cho các con trong cây, họ chuyển tiếp tiếp
+            msg.ttl = self._ttl_for(group)
+            children = tree_targets(group.member_ids, self.network.user_id, msg.msg_id,
+                                    self.tree_fanout)
+            targets = self._endpoints(group, children)
+            self.logger.debug(f"Group message sent to {len(targets)}/{len(ports)} tree children")
+            return self.network.send_to_ports(msg, targets)
+
+        # Gửi đến tất cả thành viên KHÁC trong nhóm - mã hóa 1 lần (hoặc 1 bản qua relay), không chặn
+        result = self.network.send_group(msg, ports)
+
+        self.logger.debug(f"Group message queued for {len(ports)} members")
+        return result
 
-        self.logger.debug(f"Group message sent to {sent_count} members")
+    def handle_group_message(self, message: Message) -> bool:
+        """
+        Xử lý tin nhóm nhận lần đầu (tin trùng đã bị network lọc):
+        chuyển tiếp nếu là tin lan truyền theo cây còn ttl; trả về True nếu tin dành cho mình
+        """
+        if not self.is_group_message_for_me(message):
+            return False
+        if message.ttl:
+            self._forward(message)
+        return True
+
+    def _ttl_for(self, group: Group) -> int:
+        ttl = self.tree_ttl
+        if ttl is None:
+            ttl = tree_ttl(len(group.member_ids), self.tree_fanout)
+        return min(max(ttl, 0), MAX_TREE_TTL)
+
+    @staticmethod
+    def _endpoints(group: Group, member_ids: List[str]) -> List[Endpoint]:
+        """member_id -> endpoint theo bảng thành viên của mình (bỏ id chưa biết địa chỉ)"""
+        return [group.member_ports[mid] for mid in member_ids if mid in group.member_ports]
+
+    def _forward(self, message: Message):
+        """
+        Chuyển tiếp cho các con trong cây và các con của anh em kế tiếp (dự phòng)
+        (giữ sender/msg_id; via = mình để bên nhận ACK về mình)
+        """
+        group = self.groups[message.group_id]
+        children = tree_targets(group.member_ids, message.sender_id, message.msg_id,
+                                self.tree_fanout, self.network.user_id, self.tree_backup)
+        targets = self._endpoints(group, children)
+        if not targets:
+            return
+        forward = replace(message, ttl=min(message.ttl - 1, MAX_TREE_TTL), via=self.network.port,
+                          seq=None, epoch=None, seq_base=None)
+        self.network.send_to_ports(forward, targets)
+        self.forwarded += 1
+
+    def accepts_group(self, group_id: str) -> bool:
+        """Bộ lọc header cho NetworkManager: mình có trong nhóm không"""
+        group = self.groups.get(group_id)
+        return group is not None and group.is_member(self.network.user_id)
 
     def is_group_message_for_me(self, message: Message) -> bool:
         """Kiểm tra tin nhắn nhóm có dành cho mình không"""
@@ -224,10 +373,26 @@ class GroupManager:
         """Lấy tất cả nhóm"""
         return self.groups
 
-    def update_member_port(self, member_id: str, port: int, name: str = ""):
-        """Cập nhật port của thành viên trong tất cả các nhóm"""
+    def update_member_port(self, member_id: str, endpoint: Endpoint, name: str = ""):
+        """Cập nhật endpoint của thành viên trong tất cả các nhóm"""
         for group in self.groups.values():
-            if member_id in group.member_ids:
-                group.member_ports[member_id] = port
-                if name:
-                    group.member_names[member_id] = name
\ No newline at end of file
+            if member_id not in group.member_ids:
+                continue
+            if group.member_ports.get(member_id) == endpoint and (
+                    not name or group.member_names.get(member_id) == name):
+                continue
+            group.member_ports[member_id] = endpoint
+            if name:
+                group.member_names[member_id] = name
+            self._delta.change(group.group_id, group)
+        self._publish()
+
+    def _publish(self):
+        """Phát các thay đổi đang gom (nếu có)"""
+        delta = self._delta.take()
+        if delta is None or not self.on_groups_delta:
+            return
+        try:
+            self.on_groups_delta(delta)
+        except Exception as e:
+            self.logger.error(f"Group update callback failed: {e}")
\ No newline at end of file
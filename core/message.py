@@ -5,8 +5,8 @@ import json
 import time
 import uuid
 from enum import Enum
-from dataclasses import dataclass, asdict
-from typing import Optional, List
+from dataclasses import dataclass, fields
+from typing import Callable, List, Optional, Tuple
 
 
 class MessageType(Enum):
@@ -20,6 +20,10 @@ class MessageType(Enum):
     PRIVATE_MESSAGE = "private_message"
     HEARTBEAT = "heartbeat"
     EMOJI = "emoji"
+    ACK = "ack"
+    FILE_OFFER = "file_offer"
+    FILE_ACCEPT = "file_accept"
+    RELAY = "relay"
 
 
 @dataclass
@@ -35,6 +39,14 @@ class Message:
     target_id: Optional[str] = None
     group_id: Optional[str] = None
     group_members: Optional[List[str]] = None
+    # Field mở rộng - chỉ gửi khi khác None (peer cũ không biết các field này)
+    seq: Optional[int] = None
+    epoch: Optional[int] = None
+    seq_base: Optional[int] = None
+    via: Optional[int] = None  # Port relay đã chuyển tiếp tin (bên nhận ACK về đây)
+    ttl: Optional[int] = None  # Tin nhóm lan truyền theo cây: số lượt chuyển tiếp còn lại
+    # Không gửi đi: IP nguồn của gói (recvfrom / kết nối TCP), điền lúc nhận
+    sender_host: Optional[str] = None
 
     def __post_init__(self):
         if self.timestamp is None:
@@ -44,8 +56,23 @@ class Message:
 
     def to_json(self) -> str:
         """Chuyển đổi thành JSON string"""
-        data = asdict(self)
-        data['msg_type'] = self.msg_type.value
+        # Dựng dict trực tiếp thay cho asdict() (asdict deep-copy từng field)
+        data = {
+            'msg_type': self.msg_type.value,
+            'sender_id': self.sender_id,
+            'sender_name': self.sender_name,
+            'sender_port': self.sender_port,
+            'content': self.content,
+            'timestamp': self.timestamp,
+            'msg_id': self.msg_id,
+            'target_id': self.target_id,
+            'group_id': self.group_id,
+            'group_members': self.group_members
+        }
+        for name in EXTENSION_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
         return json.dumps(data, ensure_ascii=False)
 
     @classmethod
@@ -54,8 +81,9 @@ class Message:
         try:
             data = json.loads(json_str)
             data['msg_type'] = MessageType(data['msg_type'])
-            return cls(**data)
-        except (json.JSONDecodeError, KeyError, ValueError) as e:
+            # Bỏ qua field lạ từ peer mới hơn
+            return cls(**{k: v for k, v in data.items() if k in _FIELD_NAMES})
+        except (json.JSONDecodeError, KeyError, ValueError, TypeError) as e:
             raise ValueError(f"Invalid message format: {e}")
 
     def get_time_str(self) -> str:
@@ -72,6 +100,76 @@ class Message:
             return "broadcast"
 
 
+EXTENSION_FIELDS = ('seq', 'epoch', 'seq_base', 'via', 'ttl')
+_FIELD_NAMES = frozenset(f.name for f in fields(Message))
+_FIELD_ORDER = tuple(f.name for f in fields(Message))
+
+
+class LazyMessage(Message):
+    """
+    Message đọc từ header - content và group_members chỉ giải mã khi truy cập lần đầu
+    Gói của chính mình / trùng / không dành cho mình bị bỏ mà không tốn công giải mã body
+    """
+
+    _load: Optional[Callable[[], Tuple[Optional[List[str]], str]]] = None
+    _payload_size: Optional[int] = None
+
+    @classmethod
+    def from_header(cls, load: Callable[[], Tuple[Optional[List[str]], str]],
+                    payload_size: int, header: dict) -> 'LazyMessage':
+        """
+        header: mọi field của Message trừ content/group_members
+        load() -> (group_members, content), gọi khi 1 trong 2 field được truy cập
+        """
+        message = cls.__new__(cls)
+        header['_load'] = load
+        header['_payload_size'] = payload_size
+        message.__dict__ = header
+        return message
+
+    def _materialize(self):
+        self._group_members, self._content = self._load()
+        self._load = None
+
+    @property
+    def content(self) -> str:
+        if self._load is not None:
+            self._materialize()
+        return self._content
+
+    @content.setter
+    def content(self, value: str):
+        if self._load is not None:
+            self._materialize()
+        self._content = value
+
+    @property
+    def group_members(self) -> Optional[List[str]]:
+        if self._load is not None:
+            self._materialize()
+        return self._group_members
+
+    @group_members.setter
+    def group_members(self, value: Optional[List[str]]):
+        if self._load is not None:
+            self._materialize()
+        self._group_members = value
+
+    @property
+    def payload_size(self) -> int:
+        """Số byte body trên đường truyền (không cần giải mã)"""
+        if self._payload_size is not None:
+            return self._payload_size
+        return len(self.content.encode('utf-8'))
+
+    def __eq__(self, other):
+        if not isinstance(other, Message):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in _FIELD_ORDER)
+
+    __hash__ = None
+
+
 # Danh sách emoji phổ biến
 EMOJI_LIST = [
     "😀", "😃", "😄", "😁", "😅", "😂", "🤣", "😊",
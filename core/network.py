@@ -1,63 +1,360 @@
 """
 Module xử lý mạng - Thêm retry cho tin nhắn quan trọng
 """
+import ipaddress
+import selectors
 import socket
 import threading
 import queue
-import time
-from typing import Callable, Optional, Set
+from typing import Callable, Dict, List, Optional, Sequence, Set
+from .addressing import AddressBook, Endpoint, as_endpoint, node_id
 from .message import Message, MessageType
+from .codec import (CAP_COMPRESS, CODEC_BINARY, CODEC_BINARY_ZLIB, CODEC_JSON,
+                    COMPRESS_THRESHOLD, CompressionStats, decode_message, encode_message,
+                    parse_capabilities, peek_type, with_capabilities)
+from .fanout import FanoutResult, FanoutSender
+from .dedup import DedupCache
+from .queues import PRIORITY_NAMES, PriorityMessageQueue
+from .ratelimit import RateLimiter
+from .reliability import CAP_RELIABLE, ReliabilityLayer
+from .fragment import CAP_FRAGMENT, Reassembler, fragment, is_fragment, paced
+from .batching import CAP_BATCH, DatagramBatcher, unbatch
+from .relay import (CAP_RELAY, CAP_RELAY_HUB, MAX_RELAY_TARGETS, RELAY_MIN_MEMBERS, RelayRouter,
+                    unwrap, wrap)
+from .scheduler import TimerHandle, TimerWheel
+from .sharding import ReceiveWorkerPool
+from .tcp_pool import CAP_TCP, TcpConnectionPool
+from .transport import (BROADCAST_MULTICAST, BROADCAST_SWEEP, CAP_MULTICAST, MulticastConfig,
+                        configure_multicast_sender, open_multicast_socket, open_unicast_socket,
+                        outgoing_address, set_recv_buffer)
 from utils.logger import Logger
+from utils.metrics import MetricsRegistry
+
+# Tin báo hiện diện - chỉ loại này mới được dùng để đổi địa chỉ đã biết của peer
+PRESENCE_TYPES = frozenset({MessageType.DISCOVERY, MessageType.DISCOVERY_RESPONSE,
+                            MessageType.HEARTBEAT})
 
 
 class NetworkManager:
     """Quản lý kết nối mạng"""
 
     BUFFER_SIZE = 65535
+    RECV_BUFFER = 1024 * 1024  # SO_RCVBUF mặc định - đủ cho một đợt tin dồn dập
+    RECV_BATCH = 64          # Số datagram tối đa đọc liền từ 1 socket mỗi lần thức dậy
+    BROADCAST_PORTS = range(5000, 5010)  # Dùng khi quét port (fallback)
+    DEDUP_WINDOW = 120.0     # Giây nhớ một msg_id
+    DEDUP_CAPACITY = 10000   # Số msg_id tối đa trong bộ nhớ
+    # Giới hạn hàng đợi theo lớp (control, chat, bulk) và tổng dùng chung: đầy thì tin lớp
+    # cao đẩy tin cũ nhất của lớp thấp ra (bulk trước)
+    INCOMING_BOUNDS = (100, 200, 50)
+    INCOMING_CAPACITY = 250
+    OUTGOING_BOUNDS = (50, 100, 25)
+    OUTGOING_CAPACITY = 125
+    BATCH_LINGER = 0.002     # Giây tối đa một tin chờ gộp với tin khác
+    TCP_MAX_CONNECTIONS = 64  # Kết nối TCP tối đa mỗi chiều (LRU)
+    TCP_IDLE_TIMEOUT = 60.0   # Giây không dùng thì đóng kết nối TCP
+    QUARANTINE_TIME = 30.0    # Giây cách ly người gửi flood (0 = chỉ bỏ tin vượt mức)
+    CLEANUP_INTERVAL = 60.0   # Giây giữa 2 lần dọn msg_id/mảnh/bucket/peer hết hạn
 
-    def __init__(self, port: int, user_name: str, logger: Logger):
+    def __init__(self, port: int, user_name: str, logger: Logger,
+                 wire_codec: str = CODEC_BINARY, reliable: bool = True,
+                 broadcast_mode: str = BROADCAST_MULTICAST,
+                 multicast_config: Optional[MulticastConfig] = None,
+                 batching: bool = True,
+                 compress_threshold: Optional[int] = COMPRESS_THRESHOLD,
+                 recv_buffer: Optional[int] = RECV_BUFFER,
+                 receive_workers: int = 0, tcp: bool = False, relay: bool = False,
+                 rate_limits: Optional[Dict[MessageType, tuple]] = None,
+                 quarantine_time: float = QUARANTINE_TIME,
+                 metrics: Optional[MetricsRegistry] = None,
+                 host: Optional[str] = None, sweep_hosts: Optional[Sequence[str]] = None):
         self.port = port
         self.user_name = user_name
-        self.user_id = f"{user_name}_{port}"
+        # host: IP bind và quảng bá (vd 127.0.0.2 để chạy nhiều node cùng port trên 1 máy);
+        # None = bind mọi interface, user_id như cũ
+        self.user_id = node_id(user_name, port, host)
         self.logger = logger
 
-        self.incoming_queue = queue.Queue(maxsize=100)
-        self.outgoing_queue = queue.Queue(maxsize=100)
+        # Tính năng được thỏa thuận qua DISCOVERY/DISCOVERY_RESPONSE
+        self.capabilities: Set[str] = {wire_codec} if wire_codec != CODEC_JSON else set()
+        self.capabilities.add(CAP_FRAGMENT)
+        self.capabilities.add(CAP_RELAY)
+        if batching:
+            self.capabilities.add(CAP_BATCH)
+        # Nén body từ compress_threshold byte trở lên (None = tắt)
+        self.compress_threshold = compress_threshold
+        if compress_threshold is not None and CODEC_BINARY in self.capabilities:
+            self.capabilities.add(CAP_COMPRESS)
+        self.compression = CompressionStats()
+        if reliable:
+            self.capabilities.add(CAP_RELIABLE)
+        self._peer_caps: Dict[Endpoint, Set[str]] = {}  # endpoint -> tính năng chung
+
+        # Broadcast: multicast nếu mở được, không thì quét dải port
+        self.broadcast_mode = broadcast_mode
+        self.multicast_config = multicast_config or MulticastConfig()
+        if broadcast_mode == BROADCAST_MULTICAST:
+            self.capabilities.add(CAP_MULTICAST)
+        # Peer không nghe multicast (bản cũ / chế độ quét) -> vẫn gửi unicast
+        self._unicast_peers: Set[Endpoint] = set()
+
+        # Địa chỉ của mình: bind vào host nếu có; không thì mọi interface và coi IP interface
+        # gửi ra ngoài là host của mình (đích chỉ có port cũng hiểu theo host này)
+        self.bind_host = host or ""
+        self.host = host or self._local_host(sweep_hosts)
+        self.endpoint = Endpoint(self.host, port)
+        # Chế độ quét port: quét BROADCAST_PORTS trên từng host này
+        self.sweep_hosts = tuple(sweep_hosts) if sweep_hosts else (self.host,)
+        # user_id -> Endpoint học từ địa chỉ nguồn của tin nhận được
+        self.addresses = AddressBook()
+
+        self.incoming_queue = PriorityMessageQueue(self.INCOMING_BOUNDS, self.INCOMING_CAPACITY)
+        self.outgoing_queue = PriorityMessageQueue(self.OUTGOING_BOUNDS, self.OUTGOING_CAPACITY)
 
-        self.processed_messages: Set[str] = set()
-        self._processed_lock = threading.Lock()
+        self.dedup = DedupCache(self.DEDUP_WINDOW, self.DEDUP_CAPACITY)
+        # Token bucket theo (người gửi, loại tin), kiểm tra ngay sau header (None = không giới hạn)
+        self.rate_limiter: Optional[RateLimiter] = None
+        if rate_limits is not None:
+            self.rate_limiter = RateLimiter(rate_limits, quarantine_time, logger=logger)
+        # Ghép tin lớn được chia thành nhiều datagram
+        self.reassembler = Reassembler()
 
         self.recv_socket: Optional[socket.socket] = None
         self.send_socket: Optional[socket.socket] = None
+        self.mcast_socket: Optional[socket.socket] = None
+        # SO_RCVBUF cho socket nhận (None = mặc định của hệ điều hành)
+        self.recv_buffer = recv_buffer
+        # > 0: nhận unicast bằng N tiến trình worker (SO_REUSEPORT) thay cho recv_socket
+        self.receive_workers = receive_workers
+        self.workers: Optional[ReceiveWorkerPool] = None
+
+        # Tin riêng/nhóm qua kết nối TCP giữ sẵn (peer có CAP_TCP), lỗi thì quay về UDP
+        self.tcp_pool: Optional[TcpConnectionPool] = None
+        if tcp:
+            self.tcp_pool = TcpConnectionPool(port, logger, self._on_frame,
+                                              self.TCP_MAX_CONNECTIONS, self.TCP_IDLE_TIMEOUT,
+                                              self.bind_host)
+            self.capabilities.add(CAP_TCP)
+
+        # Hẹn giờ dùng chung (reliability, relay, discovery, dọn cache): 1 thread cho cả node
+        self.scheduler = TimerWheel(logger)
+        self._cleanup_timer: Optional[TimerHandle] = None
+
+        # Vai trò relay: fan-out tin nhóm thay cho client gửi RELAY đến mình
+        self.relay = relay
+        if relay:
+            self.capabilities.add(CAP_RELAY_HUB)
+        # Phía client: gửi tin nhóm lớn qua relay đã biết (cần reliability để biết relay còn sống)
+        self.relay_router: Optional[RelayRouter] = None
+        if reliable and not relay:
+            self.relay_router = RelayRouter(logger, self.scheduler)
+
+        # Gộp tin nhỏ cùng đích vào 1 datagram khi gửi dồn dập
+        self.batcher: Optional[DatagramBatcher] = None
+        if batching:
+            self.batcher = DatagramBatcher(self._sendto, logger, linger=self.BATCH_LINGER)
+
+        # Gửi nhóm/riêng: mã hóa 1 lần, gửi từ thread riêng
+        self.fanout = FanoutSender(self._send_raw, self._codec_for, logger, encode=self._encode)
+
+        # Gửi tin cậy (ACK + truyền lại) cho peer hỗ trợ
+        self.reliability: Optional[ReliabilityLayer] = None
+        if reliable:
+            # Caller (Tk thread) chỉ cấp seq; mã hóa/gửi/truyền lại chạy trên thread fan-out
+            self.reliability = ReliabilityLayer(
+                self.user_id, user_name, port, self._send_raw, self._codec_for, logger,
+                encode=self._encode, send_control=self._send_control,
+                scheduler=self.scheduler, dispatch=self.fanout.call_soon
+            )
 
         self.running = False
+        # Đánh thức thread nhận khi dừng (select không cần timeout)
+        self._wakeup: Optional[socket.socket] = None
 
         self.on_message_received: Optional[Callable[[Message], None]] = None
         self.on_error: Optional[Callable[[str], None]] = None
+        # Lọc tin nhóm theo header: group_id -> mình có trong nhóm không (None = nhận hết)
+        self.accept_group: Optional[Callable[[str], bool]] = None
 
-    def start(self) -> bool:
-        """Khởi động"""
+        # Số tin bị bỏ chỉ sau khi đọc header (không giải mã nội dung)
+        self.filtered = {'own': 0, 'duplicate': 0, 'foreign': 0, 'rate_limited': 0}
+        # Số tin nhóm đã fan-out thay cho client (vai trò relay)
+        self.relayed = 0
+        # Vai trò relay: tin RELAY bị bỏ vì quá MAX_RELAY_TARGETS đích, số đích lạ bị bỏ qua
+        self.relay_rejected = 0
+        self.relay_unknown_targets = 0
+
+        # Số liệu (đếm theo loại tin, thời gian chờ trong hàng đợi...) - xuất qua utils.metrics
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self._setup_metrics()
+
+    def _setup_metrics(self):
+        """Tạo chỉ số; chỉ số con theo loại tin được tạo sẵn để đường nóng chỉ tra dict"""
+        m = self.metrics
+        types = list(MessageType)
+
+        def by_type(family):
+            return {t: family.labels(t.value) for t in types}
+
+        self._m_received = by_type(m.counter(
+            "lanchat_received_messages_total", "Messages decoded (before filtering)", ["type"]))
+        self._m_received_bytes = by_type(m.counter(
+            "lanchat_received_bytes_total", "Bytes of decoded messages (after reassembly)", ["type"]))
+        sent = by_type(m.counter(
+            "lanchat_sent_messages_total", "Messages sent, per destination (incl. retransmits)", ["type"]))
+        sent_bytes = by_type(m.counter("lanchat_sent_bytes_total", "Bytes sent", ["type"]))
+        self._m_sent = {t: (sent[t], sent_bytes[t]) for t in types}
+        self._m_receive_errors = m.counter(
+            "lanchat_receive_errors_total", "Packets that could not be decoded").labels()
+
+        wait = m.histogram("lanchat_queue_wait_seconds",
+                           "Time from enqueue to dispatch/send", ["queue", "class"])
+        for name, q in (("incoming", self.incoming_queue), ("outgoing", self.outgoing_queue)):
+            children = [wait.labels(name, cls) for cls in PRIORITY_NAMES]
+            q.on_wait = lambda priority, seconds, c=children: c[priority].observe(seconds)
+
+        m.collect("lanchat_filtered_total", "Messages dropped after header decode",
+                  "counter", ["reason"], lambda: [((k,), v) for k, v in self.filtered.items()])
+        m.collect("lanchat_queue_depth", "Messages waiting in queue", "gauge", ["queue", "class"],
+                  lambda: self._queue_metric('depth'))
+        m.collect("lanchat_queue_high_water", "Highest queue depth seen", "gauge", ["queue", "class"],
+                  lambda: self._queue_metric('high_water'))
+        m.collect("lanchat_queue_dropped_total", "Messages dropped because the queue was full",
+                  "counter", ["queue", "class"], lambda: self._queue_metric('dropped'))
+        m.collect("lanchat_queue_evicted_total", "Messages evicted for higher priority ones",
+                  "counter", ["queue", "class"], lambda: self._queue_metric('evicted'))
+        m.collect("lanchat_queue_promoted_total", "Messages dequeued early after being passed over",
+                  "counter", ["queue", "class"], lambda: self._queue_metric('promoted'))
+        if self.reliability:
+            m.collect("lanchat_reliability_total", "Reliable delivery events", "counter", ["event"],
+                      lambda: [((k,), v) for k, v in self.reliability.stats().items()
+                               if k not in ('in_flight', 'queued')])
+        m.collect("lanchat_timers_total", "Timer wheel events", "counter", ["event"],
+                  lambda: [((k,), v) for k, v in self.scheduler.stats().items() if k != 'pending'])
+        m.collect("lanchat_timers_pending", "Timers waiting in the timer wheel", "gauge", [],
+                  lambda: [((), len(self.scheduler))])
+
+    def _queue_metric(self, key: str) -> list:
+        return [((name, cls), values[key])
+                for name, stats in self.queue_stats().items()
+                for cls, values in stats.items()]
+
+    def _count_sent(self, data: bytes):
+        msg_type = peek_type(data)
+        if msg_type is not None:
+            sent, sent_bytes = self._m_sent[msg_type]
+            # Cộng thẳng thay cho inc(): mỗi lần gửi đều qua đây
+            sent.value += 1
+            sent_bytes.value += len(data)
+
+    def _open_sockets(self):
+        """Tạo socket nhận/gửi"""
+        if not self.receive_workers:
+            self.recv_socket = open_unicast_socket(self.port, self.bind_host)
+            self._set_recv_buffer(self.recv_socket)
+
+        self.send_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.send_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        if self.bind_host:
+            # Địa chỉ nguồn = host của mình -> bên nhận học đúng endpoint qua recvfrom
+            self.send_socket.bind((self.bind_host, 0))
+
+        if self.broadcast_mode == BROADCAST_MULTICAST:
+            self._open_multicast()
+
+    def _open_multicast(self):
+        """Tham gia nhóm multicast; lỗi thì quay về quét port"""
+        config = self.multicast_config
         try:
-            self.recv_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            self.recv_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.mcast_socket = open_multicast_socket(config)
+            self._set_recv_buffer(self.mcast_socket)
+            # recv_socket cũng gửi được (bản asyncio gửi qua transport của nó)
+            for sock in (self.send_socket, self.recv_socket):
+                if sock:
+                    configure_multicast_sender(sock, config)
+            self.logger.info(f"Multicast {config.group}:{config.port} via {config.interface}")
+        except OSError as e:
+            if self.mcast_socket:
+                self.mcast_socket.close()
+            self.mcast_socket = None
+            self.broadcast_mode = BROADCAST_SWEEP
+            self.capabilities.discard(CAP_MULTICAST)
+            self.logger.warning(f"Multicast unavailable ({e}), falling back to port sweep")
+
+    def _set_recv_buffer(self, sock: socket.socket):
+        """Tăng SO_RCVBUF để kernel không bỏ gói khi tin đến dồn dập"""
+        if not self.recv_buffer:
+            return
+        try:
+            actual = set_recv_buffer(sock, self.recv_buffer)
+            if actual < self.recv_buffer:
+                self.logger.warning(f"SO_RCVBUF capped at {actual} bytes "
+                                    f"(requested {self.recv_buffer}, see net.core.rmem_max)")
+        except OSError as e:
+            self.logger.warning(f"Cannot set SO_RCVBUF: {e}")
+
+    def _start_services(self):
+        """Khởi động các thành phần dùng chung (hẹn giờ, TCP, batching, fan-out, reliability)"""
+        self.scheduler.start()
+        self._cleanup_timer = self.scheduler.call_every(self.CLEANUP_INTERVAL, self._cleanup_processed)
+        if self.tcp_pool:
             try:
-                self.recv_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-            except:
-                pass
-            self.recv_socket.bind(("", self.port))
-            self.recv_socket.settimeout(0.5)
+                self.tcp_pool.start()
+            except OSError as e:
+                self.tcp_pool = None
+                self.capabilities.discard(CAP_TCP)
+                self.logger.warning(f"TCP port {self.port} unavailable ({e}), using UDP only")
+        if self.batcher:
+            self.batcher.start()
+        self.fanout.start()
+        if self.reliability:
+            self.reliability.start()
+        if self.relay_router:
+            self.relay_router.start()
+
+    def _stop_services(self):
+        if self.tcp_pool:
+            self.tcp_pool.stop()
+        self.fanout.stop()
+        if self.reliability:
+            self.reliability.stop()
+        if self.relay_router:
+            self.relay_router.stop()
+        if self.batcher:
+            self.batcher.stop()
+        if self._cleanup_timer:
+            self._cleanup_timer.cancel()
+        self.scheduler.stop()
 
-            self.send_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            self.send_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    def start(self) -> bool:
+        """Khởi động"""
+        try:
+            self._open_sockets()
+            if self.receive_workers:
+                self.workers = ReceiveWorkerPool(
+                    self.port, self.user_id, self.receive_workers, self.logger,
+                    self.recv_buffer, self.DEDUP_WINDOW, self.DEDUP_CAPACITY, self.BUFFER_SIZE,
+                    self.bind_host,
+                    self.rate_limiter.fragment_limit if self.rate_limiter else None,
+                    self._on_worker_stats
+                )
+                self.workers.start()
 
             self.running = True
 
-            threading.Thread(target=self._receive_loop, daemon=True).start()
+            # 1 thread nhận cho cả socket unicast và multicast
+            sockets = [s for s in (self.recv_socket, self.mcast_socket) if s]
+            if sockets:
+                waker, self._wakeup = socket.socketpair()
+                threading.Thread(target=self._receive_loop, args=(sockets, waker),
+                                 daemon=True).start()
+            if self.workers:
+                threading.Thread(target=self._worker_loop, daemon=True).start()
             threading.Thread(target=self._send_loop, daemon=True).start()
             threading.Thread(target=self._process_loop, daemon=True).start()
-            threading.Thread(target=self._cleanup_loop, daemon=True).start()
+            self._start_services()
 
-            self.logger.info(f"Network started on port {self.port}")
+            self.logger.info(f"Network started on {self.bind_host or '*'}:{self.port}")
             return True
         except Exception as e:
             self.logger.error(f"Network start failed: {e}")
@@ -66,20 +363,22 @@ class NetworkManager:
     def stop(self):
         """Dừng"""
         self.running = False
-        try:
-            if self.recv_socket:
-                self.recv_socket.close()
-            if self.send_socket:
-                self.send_socket.close()
-        except:
-            pass
-
-    def send_message(self, message: Message):
-        """Gửi tin nhắn"""
-        try:
-            self.outgoing_queue.put_nowait(message)
-        except queue.Full:
-            pass
+        # Các thread chờ không timeout: đánh thức để chúng thấy running = False
+        self.outgoing_queue.close()
+        self.incoming_queue.close()
+        self._stop_services()
+        if self.workers:
+            self.workers.stop()
+        for sock in (self._wakeup, self.recv_socket, self.mcast_socket, self.send_socket):
+            try:
+                if sock:
+                    sock.close()
+            except:
+                pass
+
+    def send_message(self, message: Message) -> bool:
+        """Gửi tin nhắn (broadcast); False nếu hàng đợi đầy và tin bị bỏ"""
+        return self.outgoing_queue.put(message)
 
     def broadcast_message(self, content: str, msg_type: MessageType = MessageType.TEXT):
         """Gửi broadcast"""
@@ -92,8 +391,85 @@ class NetworkManager:
         )
         self.send_message(msg)
 
-    def send_private_message(self, content: str, target_id: str, target_port: int):
-        """Gửi riêng"""
+    def _targets(self, ports: list) -> List[Endpoint]:
+        """Danh sách đích (Endpoint, hoặc port = cùng host với mình) trừ chính mình"""
+        targets = [as_endpoint(p, self.host) for p in ports]
+        return [t for t in targets if t != self.endpoint]
+
+    def send_to_ports(self, message: Message, ports: list, repeat: int = 1,
+                      reliable: bool = True) -> FanoutResult:
+        """
+        Gửi một tin đến nhiều đích (Endpoint hoặc port) - không chặn caller
+        Peer hỗ trợ reliability nhận qua lớp tin cậy (result.confirmed = đã ACK),
+        peer cũ nhận qua fan-out (lặp `repeat` lần)
+        """
+        ports = self._targets(ports)
+        result = FanoutResult(destinations=ports)
+        self._send_direct(message, ports, repeat, reliable, result)
+        return result
+
+    def _send_direct(self, message: Message, ports: list, repeat: int, reliable: bool,
+                     result: FanoutResult):
+        """Gửi đến từng đích (reliability / TCP / fan-out), ghi vào result"""
+        # Giữ result mở đến khi đã giao hết các phần
+        result._add_part()
+
+        legacy = ports
+        if reliable and self.reliability:
+            confirmed = [p for p in ports if self._peer_has(p, CAP_RELIABLE)]
+            if confirmed:
+                legacy = [p for p in ports if p not in confirmed]
+                self.reliability.send(message, confirmed, result)
+        if legacy and self.tcp_pool:
+            # Qua TCP không cần gửi lặp
+            streamed = [p for p in legacy if self._peer_has(p, CAP_TCP)]
+            if streamed:
+                legacy = [p for p in legacy if p not in streamed]
+                self.fanout.submit(message, streamed, result=result)
+        if legacy:
+            self.fanout.submit(message, legacy, repeat=repeat, result=result)
+
+        result._finish_part()
+
+    def send_group(self, message: Message, ports: list, repeat: int = 1) -> FanoutResult:
+        """
+        Gửi tin nhóm - qua relay nếu biết relay và nhóm đủ lớn (1 bản gửi thay cho N),
+        không thì như send_to_ports. Relay không ACK kịp -> tự gửi trực tiếp
+        """
+        relay = self.relay_router.choose() if self.relay_router else None
+        if relay is None:
+            return self.send_to_ports(message, ports, repeat)
+
+        ports = self._targets(ports)
+        # Chỉ chuyển qua relay cho peer hiểu field via
+        relayed = [p for p in ports if p != relay and self._peer_has(p, CAP_RELAY)]
+        if len(relayed) < RELAY_MIN_MEMBERS:
+            return self.send_to_ports(message, ports, repeat)
+        # Relay bỏ tin có quá MAX_RELAY_TARGETS đích: phần dư gửi trực tiếp
+        relayed = relayed[:MAX_RELAY_TARGETS]
+
+        result = FanoutResult(destinations=ports)
+        result._add_part()
+        chosen = set(relayed)
+        direct = [p for p in ports if p not in chosen]
+        if direct:
+            self._send_direct(message, direct, repeat, True, result)
+
+        def on_done(confirmed: bool):
+            if confirmed:
+                for port in relayed:
+                    result._record(port, True)
+            else:
+                self._send_direct(message, relayed, repeat, True, result)
+            result._finish_part()
+
+        relay_result = self.reliability.send(wrap(message, relayed, self.host), [relay])
+        self.relay_router.track(relay, relay_result, on_done)
+        return result
+
+    def send_private_message(self, content: str, target_id: str,
+                             target: Optional[Endpoint] = None) -> FanoutResult:
+        """Gửi riêng (target: Endpoint hoặc port; None = tra sổ địa chỉ theo target_id)"""
         msg = Message(
             msg_type=MessageType.PRIVATE_MESSAGE,
             sender_id=self.user_id,
@@ -102,9 +478,14 @@ class NetworkManager:
             content=content,
             target_id=target_id
         )
-        self._send_to_port(msg, target_port)
+        if target is None:
+            target = self.addresses.get(target_id)
+            if target is None:
+                self.logger.warning(f"No known address for {target_id}")
+                return self.send_to_ports(msg, [])
+        return self.send_to_ports(msg, [target])
 
-    def send_group_message(self, content: str, group_id: str, member_ports: list):
+    def send_group_message(self, content: str, group_id: str, member_ports: list) -> FanoutResult:
         """Gửi nhóm"""
         msg = Message(
             msg_type=MessageType.GROUP_MESSAGE,
@@ -115,65 +496,436 @@ class NetworkManager:
             group_id=group_id
         )
 
-        for port in member_ports:
-            if port != self.port:
-                # Gửi 2 lần để đảm bảo (UDP không tin cậy)
-                self._send_to_port(msg, port)
-                time.sleep(0.05)
-                self._send_to_port(msg, port)
+        # Peer có reliability: gửi 1 lần + ACK; peer cũ: gửi 2 lần (lượt 2 do fan-out lên lịch)
+        return self.send_group(msg, member_ports, repeat=2)
+
+    def queue_stats(self) -> Dict[str, dict]:
+        """Độ sâu và số tin bị bỏ của các hàng đợi theo lớp ưu tiên"""
+        return {
+            'incoming': self.incoming_queue.stats(),
+            'outgoing': self.outgoing_queue.stats(),
+        }
+
+    def advertise(self, content: str) -> str:
+        """Gắn capabilities của mình vào nội dung discovery"""
+        return with_capabilities(content, self.capabilities)
+
+    def _local_host(self, sweep_hosts: Optional[Sequence[str]]) -> str:
+        """
+        IP của mình khi bind mọi interface: interface multicast nếu đã chọn interface thật,
+        không thì IP hệ điều hành dùng để gửi đến host quét đầu tiên / ra mạng
+        Loopback chỉ khi máy không có đường ra nào
+        """
+        interface = self.multicast_config.interface
+        if not ipaddress.ip_address(interface).is_loopback:
+            return interface
+        probe = sweep_hosts[0] if sweep_hosts else self.multicast_config.group
+        return outgoing_address(probe) or interface
+
+    def endpoint_of(self, message: Message) -> Endpoint:
+        """
+        Endpoint của người gửi tin: địa chỉ nguồn của gói, hoặc sổ địa chỉ
+        khi tin được chuyển tiếp (via - gói đến từ node chuyển tiếp)
+        """
+        if message.via is not None:
+            known = self.addresses.get(message.sender_id)
+            if known is not None:
+                return known
+        return Endpoint(message.sender_host or self.host, message.sender_port)
+
+    def _reply_endpoint(self, message: Message) -> Endpoint:
+        """Node vừa gửi gói này (relay / node chuyển tiếp nếu có via) - đích của ACK"""
+        return Endpoint(message.sender_host or self.host, message.via or message.sender_port)
+
+    def _learn_capabilities(self, message: Message):
+        """Ghi nhận tính năng của peer từ DISCOVERY/DISCOVERY_RESPONSE"""
+        advertised = parse_capabilities(message.content)
+        peer = self.endpoint_of(message)
+        if CAP_MULTICAST in advertised:
+            self._unicast_peers.discard(peer)
+        else:
+            self._unicast_peers.add(peer)
+
+        if self.relay_router:
+            if CAP_RELAY_HUB in advertised and CAP_RELIABLE in advertised:
+                self.relay_router.seen(peer)
+            else:
+                self.relay_router.forget(peer)
+
+        caps = advertised & self.capabilities
+        if caps:
+            self._peer_caps[peer] = caps
+        else:
+            # Peer cũ (hoặc đã tắt) -> quay về JSON, không ACK
+            self._peer_caps.pop(peer, None)
+
+    def _peer_has(self, endpoint: Endpoint, capability: str) -> bool:
+        caps = self._peer_caps.get(endpoint)
+        return caps is not None and capability in caps
+
+    def _codec_for(self, endpoint: Endpoint) -> str:
+        if not self._peer_has(endpoint, CODEC_BINARY):
+            return CODEC_JSON
+        return CODEC_BINARY_ZLIB if self._peer_has(endpoint, CAP_COMPRESS) else CODEC_BINARY
+
+    def _multicast_codec(self) -> str:
+        """Codec cho multicast - theo tính năng chung của mọi peer multicast đã biết"""
+        peers = [caps for caps in self._peer_caps.values() if CAP_MULTICAST in caps]
+        # Peer bản cũ (bin1) không đọc được bin2 -> JSON
+        if CODEC_BINARY not in self.capabilities or not all(CODEC_BINARY in c for c in peers):
+            return CODEC_JSON
+        if CAP_COMPRESS in self.capabilities and all(CAP_COMPRESS in c for c in peers):
+            return CODEC_BINARY_ZLIB
+        return CODEC_BINARY
+
+    def _encode(self, message: Message, codec: str) -> bytes:
+        return encode_message(message, codec, self.compress_threshold, self.compression)
+
+    def _encode_for(self, message: Message, endpoint: Endpoint) -> bytes:
+        """Mã hóa theo codec của peer"""
+        return self._encode(message, self._codec_for(endpoint))
 
-    def _send_to_port(self, message: Message, target_port: int):
-        """Gửi đến port"""
+    def compression_stats(self) -> Dict[str, dict]:
+        """Tỉ lệ nén và µs CPU mỗi tin, theo loại tin"""
+        return self.compression.snapshot()
+
+    def _datagrams_for(self, data: bytes, endpoint: Endpoint) -> list:
+        """Chia tin lớn thành mảnh nếu peer ghép lại được (peer cũ nhận nguyên)"""
+        if self._peer_has(endpoint, CAP_FRAGMENT):
+            return fragment(data)
+        return [data]
+
+    def _sendto(self, datagram: bytes, addr):
+        self.send_socket.sendto(datagram, addr)
+
+    def _emit(self, datagram: bytes, addr, flush: bool = False):
+        """Gửi 1 datagram - qua batcher nếu đích tách được gói gộp"""
+        if self.batcher and (addr == self.multicast_config.address or
+                             self._peer_has(addr, CAP_BATCH)):
+            self.batcher.send(datagram, addr, flush)
+        else:
+            self._sendto(datagram, addr)
+
+    def _send_control(self, data: bytes, target: Endpoint):
+        """Gửi tin điều khiển nhỏ (ACK) ngay, kèm các tin đang gom cho cùng đích"""
+        self._count_sent(data)
+        self._emit(data, target, flush=True)
+
+    def _send_raw(self, data: bytes, target: Endpoint):
+        """Gửi tin đã mã hóa: qua TCP nếu được, không thì 1 hoặc nhiều datagram"""
+        self._count_sent(data)
+        # TCP không chặn: khung xếp vào pool, kết nối lỗi thì pool gửi lại qua UDP
+        if (self.tcp_pool and self._peer_has(target, CAP_TCP)
+                and self.tcp_pool.send(target, data, self._send_datagrams)):
+            return
+        self._send_datagrams(data, target)
+
+    def _send_datagrams(self, data: bytes, target: Endpoint):
+        """Gửi tin đã mã hóa qua UDP (1 hoặc nhiều datagram)"""
+        for datagram in paced(self._datagrams_for(data, target)):
+            self._emit(datagram, target)
+
+    def _send_to_port(self, message: Message, target: Endpoint):
+        """Gửi ngay đến 1 đích (không qua lớp tin cậy)"""
         try:
-            data = message.to_json().encode('utf-8')
-            self.send_socket.sendto(data, ("127.0.0.1", target_port))
+            self._send_raw(self._encode_for(message, target), target)
         except Exception as e:
-            self.logger.error(f"Send to port {target_port} failed: {e}")
+            self.logger.error(f"Send to {target} failed: {e}")
 
-    def _is_duplicate(self, msg_id: str) -> bool:
+    def _is_duplicate(self, sender_id: str, msg_id: str) -> bool:
         """Kiểm tra trùng"""
-        with self._processed_lock:
-            if msg_id in self.processed_messages:
-                return True
-            self.processed_messages.add(msg_id)
-            return False
+        return self.dedup.check_and_add(sender_id, msg_id)
 
-    def _receive_loop(self):
-        """Nhận tin"""
-        while self.running:
-            try:
-                data, addr = self.recv_socket.recvfrom(self.BUFFER_SIZE)
-                message = Message.from_json(data.decode('utf-8'))
+    def _is_foreign(self, message: Message) -> bool:
+        """Tin không dành cho mình (tin riêng gửi người khác, nhóm mình không tham gia)"""
+        if message.msg_type == MessageType.PRIVATE_MESSAGE:
+            return message.target_id is not None and message.target_id != self.user_id
+        if message.msg_type == MessageType.GROUP_MESSAGE and self.accept_group:
+            return not self.accept_group(message.group_id)
+        return False
+
+    def _handle_datagram(self, data: bytes, addr) -> Optional[Message]:
+        """
+        Giải mã header và lọc datagram; trả về Message nếu cần xử lý tiếp
+        Bản nhị phân chỉ giải mã content khi ứng dụng truy cập (LazyMessage)
+        """
+        if is_fragment(data):
+            # Tính mảnh vào bucket của IP nguồn trước khi ghép: flood mảnh không tốn bộ nhớ đệm
+            if self.rate_limiter and not self.rate_limiter.allow_fragment(addr[0]):
+                self.filtered['rate_limited'] += 1
+                return None
+            data = self.reassembler.add(data, addr[0])
+            if data is None:
+                return None
+
+        message = decode_message(data, self.compression)
+        message.sender_host = addr[0]
+        self._m_received_bytes[message.msg_type].inc(len(data))
+        return self._accept(message)
+
+    def _accept(self, message: Message) -> Optional[Message]:
+        """Lọc tin đã giải mã header (tin của mình, vượt mức, ACK, không dành cho mình, trùng)"""
+        self._m_received[message.msg_type].inc()
+        if message.sender_id == self.user_id:
+            self.filtered['own'] += 1
+            return None
+
+        # Gói tin cậy bị bỏ ở đây không được ACK -> bên gửi tự giảm tốc khi truyền lại
+        if self.rate_limiter and not self.rate_limiter.allow(message.sender_id, message.msg_type,
+                                                                  message.sender_host):
+            self.filtered['rate_limited'] += 1
+            return None
+
+        # Gói đến thẳng từ người gửi: địa chỉ nguồn là endpoint của họ (peer đã biết chỉ đổi
+        # địa chỉ khi tin hiện diện từ endpoint mới được xác nhận - xem AddressBook)
+        if message.via is None and message.sender_host is not None:
+            self.addresses.learn(message.sender_id, message.sender_host, message.sender_port,
+                                 message.msg_type in PRESENCE_TYPES)
+
+        if message.msg_type == MessageType.ACK:
+            if self.reliability:
+                self.reliability.on_ack(message, self._reply_endpoint(message))
+            return None
+
+        # Gói tin cậy luôn được ACK (kể cả khi trùng) trước khi lọc trùng
+        if message.seq is not None and self.reliability:
+            self.reliability.on_data(message, self._reply_endpoint(message))
+
+        if self._is_foreign(message):
+            self.filtered['foreign'] += 1
+            return None
+
+        if self._is_duplicate(message.sender_id, message.msg_id):
+            self.filtered['duplicate'] += 1
+            return None
+
+        if message.msg_type in (MessageType.DISCOVERY, MessageType.DISCOVERY_RESPONSE):
+            self._learn_capabilities(message)
+
+        if message.msg_type == MessageType.RELAY:
+            if self.relay:
+                # Fan-out N đích trên thread gửi: thread nhận không bị chặn
+                self.fanout.call_soon(self._relay, message)
+            return None
+
+        return message
+
+    def _relay(self, message: Message):
+        """
+        Fan-out tin nhóm thay cho client - thread gửi
+        Chỉ gửi đến peer đã biết (sổ địa chỉ / discovery), bỏ client khỏi danh sách
+        """
+        try:
+            client = self.endpoint_of(message)
+            inner, targets = unwrap(message, self.port, client.host)
+        except ValueError as e:
+            self.relay_rejected += 1
+            self.logger.debug(f"Relay from {message.sender_id} rejected: {e}")
+            return
+        known = [t for t in targets if self._is_known(t)]
+        self.relay_unknown_targets += len(targets) - len(known)
+        try:
+            self.send_to_ports(inner, [t for t in known if t != client])
+            self.relayed += 1
+        except Exception as e:
+            self.logger.debug(f"Relay from {message.sender_id} failed: {e}")
+
+    def _is_known(self, endpoint: Endpoint) -> bool:
+        """Endpoint của peer đã gửi tin trực tiếp cho mình / đã thấy trong discovery"""
+        return (self.addresses.knows(endpoint) or endpoint in self._peer_caps
+                or endpoint in self._unicast_peers)
+
+    def rate_limit_stats(self) -> Dict[str, object]:
+        """Số tin được nhận / bị bỏ theo loại, người gửi đang bị cách ly"""
+        if not self.rate_limiter:
+            return {}
+        stats = self.rate_limiter.stats()
+        stats['quarantined_senders'] = self.rate_limiter.quarantined()
+        return stats
+
+    def address_stats(self) -> Dict[str, int]:
+        """Sổ địa chỉ: số peer, số lần đổi địa chỉ, yêu cầu đổi chưa xác nhận, mục bị bỏ vì đầy"""
+        return self.addresses.stats()
+
+    def relay_stats(self) -> Dict[str, int]:
+        """
+        Vai trò relay: số tin đã fan-out / bị bỏ (quá nhiều đích), số đích lạ bị bỏ qua
+        Client: số tin gửi qua relay / phải gửi lại trực tiếp
+        """
+        if self.relay_router:
+            return self.relay_router.stats()
+        return {
+            'relayed': self.relayed,
+            'rejected': self.relay_rejected,
+            'unknown_targets': self.relay_unknown_targets,
+        }
+
+    def _broadcast_datagrams(self, message: Message):
+        """
+        Sinh (datagram, addr) cho một broadcast - mã hóa tối đa 1 lần mỗi codec
+        Multicast: 1 tin vào nhóm + unicast cho peer không nghe multicast
+        Quét port: unicast đến từng port trong BROADCAST_PORTS trên mỗi host của sweep_hosts
+        """
+        encoded: Dict[str, bytes] = {}
+        sent, sent_bytes = self._m_sent[message.msg_type]
+        sent.inc()
 
-                if message.sender_id == self.user_id:
-                    continue
+        def encode(codec: str) -> bytes:
+            data = encoded.get(codec)
+            if data is None:
+                data = encoded[codec] = self._encode(message, codec)
+            return data
 
-                if self._is_duplicate(message.msg_id):
-                    continue
+        if self.mcast_socket is not None:
+            # Node nghe multicast đều ghép được mảnh
+            for datagram in paced(fragment(encode(self._multicast_codec()))):
+                sent_bytes.inc(len(datagram))
+                yield datagram, self.multicast_config.address
+            targets = sorted(self._unicast_peers)
+        else:
+            targets = [Endpoint(host, port) for host in self.sweep_hosts
+                       for port in self.BROADCAST_PORTS]
 
-                self.incoming_queue.put_nowait(message)
-            except socket.timeout:
+        for target in targets:
+            if target != self.endpoint:
+                for datagram in paced(self._datagrams_for(encode(self._codec_for(target)), target)):
+                    sent_bytes.inc(len(datagram))
+                    yield datagram, target
+
+    def _dispatch(self, message: Message):
+        """Chuyển tin cho ứng dụng"""
+        try:
+            if self.on_message_received:
+                self.on_message_received(message)
+        except Exception as e:
+            self.logger.error(f"Process error: {e}")
+
+    def _cleanup_processed(self):
+        """Dọn các msg_id, mảnh, bucket và trạng thái peer tin cậy đã hết hạn"""
+        self.dedup.expire()
+        self.reassembler.expire()
+        if self.reliability:
+            self.reliability.expire()
+        if self.rate_limiter:
+            self.rate_limiter.expire()
+
+    def _receive_loop(self, sockets: list, waker: socket.socket):
+        """
+        Nhận tin từ các socket qua selector
+        - Chỉ thức dậy khi có gói hoặc khi dừng (waker đọc được), không polling
+        - Đọc vào 1 buffer dùng lại (recvfrom_into), không cấp phát bytes mới mỗi gói
+        - Mỗi lần thức dậy đọc hết các gói đang chờ (tối đa RECV_BATCH mỗi socket)
+        """
+        selector = selectors.DefaultSelector()
+        for sock in sockets:
+            sock.setblocking(False)
+            selector.register(sock, selectors.EVENT_READ)
+        selector.register(waker, selectors.EVENT_READ)
+        buffer = bytearray(self.BUFFER_SIZE)
+        view = memoryview(buffer)
+
+        try:
+            while self.running:
+                try:
+                    ready = selector.select()
+                except OSError:
+                    break  # Socket đã đóng khi dừng
+                for key, _ in ready:
+                    if key.fileobj is waker:
+                        return
+                    self._drain(key.fileobj, buffer, view)
+        finally:
+            selector.close()
+            waker.close()
+
+    def _drain(self, sock: socket.socket, buffer: bytearray, view: memoryview):
+        """Đọc liên tiếp các gói đang chờ trên sock"""
+        for _ in range(self.RECV_BATCH):
+            try:
+                size, addr = sock.recvfrom_into(buffer)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            self._on_packet(view[:size], addr)
+
+    def _on_packet(self, data: memoryview, addr,
+                   deliver: Optional[Callable[[Message], None]] = None):
+        """
+        Xử lý 1 gói UDP - data chỉ hợp lệ đến khi hàm trả về
+        Gói gộp chứa nhiều tin: tin hỏng bị bỏ riêng, các tin còn lại vẫn được xử lý
+        """
+        deliver = deliver or self._deliver
+        datagrams = unbatch(data)
+        while True:
+            try:
+                datagram = next(datagrams)
+            except StopIteration:
+                return
+            except Exception as e:
+                # Gói gộp bị cắt cụt: không tách được phần còn lại
+                self._receive_error(addr, e)
+                return
+            try:
+                message = self._handle_datagram(datagram, addr)
+            except Exception as e:
+                self._receive_error(addr, e)
                 continue
-            except queue.Full:
-                pass
-            except:
-                pass
+            if message is not None:
+                deliver(message)
+
+    def _receive_error(self, addr, error: Exception):
+        self._m_receive_errors.inc()
+        self.logger.debug(f"Bad datagram from {addr[0]}:{addr[1]}: {error!r}")
+
+    def _deliver(self, message: Message):
+        """Chuyển tin đã lọc cho thread xử lý"""
+        self.incoming_queue.put(message)
+
+    def _on_frame(self, data: bytes, addr):
+        """Khung nhận qua TCP (thread của pool)"""
+        message = self._handle_datagram(data, addr)
+        if message is not None:
+            self._deliver(message)
+
+    def tcp_stats(self) -> Dict[str, int]:
+        """Số kết nối / khung TCP (rỗng khi không dùng TCP)"""
+        return self.tcp_pool.stats() if self.tcp_pool else {}
+
+    def _worker_loop(self):
+        """Nhận tin đã giải mã từ các worker"""
+        while self.running:
+            try:
+                for message in self.workers.receive():
+                    message = self._accept(message)
+                    if message is not None:
+                        self._deliver(message)
+            except Exception as e:
+                self.logger.debug(f"Worker receive error: {e}")
+
+    def _on_worker_stats(self, counts: Dict[str, int], received_bytes: Dict[str, int]):
+        """Cộng phần tăng số liệu của worker vào chỉ số (tin worker đã lọc không về đến _accept)"""
+        for msg_type, size in received_bytes.items():
+            self._m_received_bytes[MessageType(msg_type)].inc(size)
+        self._m_receive_errors.inc(counts.get('errors', 0))
+        for reason in self.filtered:
+            self.filtered[reason] += counts.get(reason, 0)
+
+    def worker_stats(self) -> Dict[int, Dict[str, int]]:
+        """Số tin mỗi worker chuyển về / đã lọc (rỗng khi không dùng worker)"""
+        return self.workers.stats() if self.workers else {}
 
     def _send_loop(self):
         """Gửi tin"""
         while self.running:
             try:
-                message = self.outgoing_queue.get(timeout=0.5)
-                data = message.to_json().encode('utf-8')
-
-                for port in range(5000, 5010):
-                    if port != self.port:
-                        try:
-                            self.send_socket.sendto(data, ("127.0.0.1", port))
-                        except:
-                            pass
+                message = self.outgoing_queue.get()
 
-                time.sleep(0.01)
+                for data, addr in self._broadcast_datagrams(message):
+                    try:
+                        self._emit(data, addr)
+                    except:
+                        pass
             except queue.Empty:
                 continue
             except:
@@ -183,18 +935,7 @@ class NetworkManager:
         """Xử lý tin"""
         while self.running:
             try:
-                message = self.incoming_queue.get(timeout=0.5)
-                if self.on_message_received:
-                    self.on_message_received(message)
+                message = self.incoming_queue.get()
             except queue.Empty:
                 continue
-            except Exception as e:
-                self.logger.error(f"Process error: {e}")
-
-    def _cleanup_loop(self):
-        """Dọn cache"""
-        while self.running:
-            time.sleep(60)
-            with self._processed_lock:
-                if len(self.processed_messages) > 500:
-                    self.processed_messages.clear()
\ No newline at end of file
+            self._dispatch(message)
@@ -0,0 +1,209 @@
+"""
+Module hàng đợi ưu tiên - Tách control / chat / bulk, giới hạn riêng và đếm số tin bị bỏ
+"""
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+from .message import LazyMessage, Message, MessageType
+
+PRIORITY_CONTROL = 0   # Discovery, heartbeat, trả lời điều khiển
+PRIORITY_CHAT = 1      # Tin nhắn người dùng
+PRIORITY_BULK = 2      # Nội dung lớn (paste dài, trạng thái nhóm lớn)
+PRIORITY_NAMES = ("control", "chat", "bulk")
+
+CONTROL_TYPES = frozenset({
+    MessageType.DISCOVERY, MessageType.DISCOVERY_RESPONSE, MessageType.HEARTBEAT,
+    MessageType.ACK, MessageType.FILE_ACCEPT,
+})
+# Chỉ bản mới nhất của mỗi người gửi là có ý nghĩa -> gộp thay vì xếp thêm
+COALESCE_TYPES = frozenset({
+    MessageType.DISCOVERY, MessageType.DISCOVERY_RESPONSE, MessageType.HEARTBEAT,
+})
+BULK_SIZE = 4096  # Nội dung dài hơn -> bulk
+
+
+def classify(message: Message) -> int:
+    """Lớp ưu tiên của tin nhắn"""
+    if message.msg_type in CONTROL_TYPES:
+        return PRIORITY_CONTROL
+    # LazyMessage: theo số byte trên đường truyền, không giải mã content
+    size = message.payload_size if isinstance(message, LazyMessage) else len(message.content)
+    if size > BULK_SIZE:
+        return PRIORITY_BULK
+    return PRIORITY_CHAT
+
+
+@dataclass
+class _Entry:
+    message: Message
+    key: Optional[Tuple[MessageType, str]] = None
+    queued_at: float = 0.0
+
+
+class PriorityMessageQueue:
+    """
+    Hàng đợi nhiều lớp, lấy ra theo thứ tự ưu tiên (control > chat > bulk)
+    - Mỗi lớp có giới hạn riêng; lớp đầy thì bỏ tin mới
+    - Tổng vượt `capacity` (dùng chung, nhỏ hơn tổng các giới hạn): bỏ tin cũ nhất
+      của lớp thấp nhất còn tin (bulk trước) để nhường chỗ cho lớp cao hơn
+    - Lớp thấp bị bỏ qua `starve_limit` lần liên tiếp thì được lấy 1 tin (không đói mãi)
+    - Discovery/heartbeat của cùng người gửi được gộp (giữ bản mới nhất)
+    - on_wait(lớp, giây chờ) được gọi mỗi khi lấy tin ra (None = không đo)
+    """
+
+    STARVE_LIMIT = 32
+
+    def __init__(self, bounds: Tuple[int, int, int] = (50, 200, 50),
+                 capacity: Optional[int] = None,
+                 on_wait: Optional[Callable[[int, float], None]] = None,
+                 starve_limit: int = STARVE_LIMIT):
+        self.bounds = tuple(bounds)
+        self.maxsize = capacity if capacity is not None else sum(self.bounds)
+        self.on_wait = on_wait
+        self.starve_limit = starve_limit
+
+        self._queues = [deque() for _ in self.bounds]
+        self._coalesce: Dict[Tuple[MessageType, str], _Entry] = {}
+        self._size = 0
+        self._passed = [0] * len(self.bounds)  # Số lần liên tiếp lớp có tin bị bỏ qua
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # Counters theo lớp
+        self.enqueued = [0] * len(self.bounds)
+        self.dequeued = [0] * len(self.bounds)
+        self.dropped = [0] * len(self.bounds)
+        self.evicted = [0] * len(self.bounds)
+        self.coalesced = [0] * len(self.bounds)
+        self.promoted = [0] * len(self.bounds)  # Lấy ra sớm vì bị bỏ qua quá lâu
+        self.high_water = [0] * len(self.bounds)
+
+    def put(self, message: Message, priority: Optional[int] = None) -> bool:
+        """Thêm tin (không chặn); False nếu tin bị bỏ"""
+        if priority is None:
+            priority = classify(message)
+
+        with self._cond:
+            key = None
+            if message.msg_type in COALESCE_TYPES:
+                key = (message.msg_type, message.sender_id)
+                entry = self._coalesce.get(key)
+                if entry is not None:
+                    entry.message = message
+                    self.coalesced[priority] += 1
+                    return True
+
+            pending = self._queues[priority]
+            if len(pending) >= self.bounds[priority]:
+                self.dropped[priority] += 1
+                return False
+            if self._size >= self.maxsize and not self._evict_below(priority):
+                self.dropped[priority] += 1
+                return False
+
+            entry = _Entry(message, key, time.monotonic())
+            pending.append(entry)
+            if key is not None:
+                self._coalesce[key] = entry
+            self._size += 1
+            self.enqueued[priority] += 1
+            self.high_water[priority] = max(self.high_water[priority], len(pending))
+            self._cond.notify()
+            return True
+
+    def put_nowait(self, message: Message):
+        """Tương thích queue.Queue - raise queue.Full khi tin bị bỏ"""
+        if not self.put(message):
+            raise queue.Full
+
+    def get(self, timeout: Optional[float] = None) -> Message:
+        """Lấy tin ưu tiên cao nhất; raise queue.Empty khi hết thời gian chờ / đã close()"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._size > 0 or self._closed, timeout) \
+                    or self._closed:
+                raise queue.Empty
+            priority = self._pick()
+            entry = self._queues[priority].popleft()
+            self._forget(entry)
+            self._size -= 1
+            self.dequeued[priority] += 1
+            if self.on_wait:
+                self.on_wait(priority, time.monotonic() - entry.queued_at)
+            return entry.message
+
+    def get_nowait(self) -> Message:
+        return self.get(timeout=0)
+
+    def close(self):
+        """Đánh thức mọi thread đang chờ get() (khi dừng) - get() sau đó raise queue.Empty"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def record_drop(self, message: Message):
+        """Đếm tin bị bỏ ở nơi khác (vd. bản asyncio không xếp hàng)"""
+        with self._cond:
+            self.dropped[classify(message)] += 1
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return self._size == 0
+
+    def depths(self) -> Dict[str, int]:
+        return {name: len(q) for name, q in zip(PRIORITY_NAMES, self._queues)}
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._cond:
+            return {
+                name: {
+                    'depth': len(self._queues[p]),
+                    'bound': self.bounds[p],
+                    'high_water': self.high_water[p],
+                    'enqueued': self.enqueued[p],
+                    'dequeued': self.dequeued[p],
+                    'coalesced': self.coalesced[p],
+                    'dropped': self.dropped[p],
+                    'evicted': self.evicted[p],
+                    'promoted': self.promoted[p],
+                }
+                for p, name in enumerate(PRIORITY_NAMES)
+            }
+
+    def _pick(self) -> int:
+        """Lớp lấy tin tiếp theo: cao nhất còn tin, trừ khi lớp thấp hơn đã bị bỏ qua quá lâu"""
+        first = starved = None
+        for priority, pending in enumerate(self._queues):
+            if not pending:
+                self._passed[priority] = 0
+            elif first is None:
+                first = priority
+            elif starved is None and self._passed[priority] >= self.starve_limit:
+                starved = priority
+        chosen = first if starved is None else starved
+        if starved is not None:
+            self.promoted[starved] += 1
+        for priority in range(chosen + 1, len(self._queues)):
+            if self._queues[priority]:
+                self._passed[priority] += 1
+        self._passed[chosen] = 0
+        return chosen
+
+    def _evict_below(self, priority: int) -> bool:
+        # Bỏ tin cũ nhất ở lớp thấp nhất còn tin (thấp hơn lớp đang thêm)
+        for lower in range(len(self._queues) - 1, priority, -1):
+            pending = self._queues[lower]
+            if pending:
+                self._forget(pending.popleft())
+                self._size -= 1
+                self.evicted[lower] += 1
+                return True
+        return False
+
+    def _forget(self, entry: _Entry):
+        if entry.key is not None and self._coalesce.get(entry.key) is entry:
+            del self._coalesce[entry.key]
@@ -0,0 +1,211 @@
+"""
+Module giới hạn tốc độ nhận - Token bucket theo (người gửi, loại tin)
+
+Kiểm tra ngay sau khi đọc header: tin vượt mức bị bỏ và đếm, không vào hàng đợi.
+Người gửi bị bỏ quá nhiều tin trong thời gian ngắn thì bị cách ly tạm thời
+(bỏ mọi tin của họ đến hết hạn, trừ ACK).
+Người gửi = (IP nguồn, sender_id): sender_id tự khai nên gói giả mạo id của người khác
+từ máy khác không làm cạn bucket / cách ly người đó.
+Mảnh (fragment) chưa có header tin nên tính vào bucket theo IP nguồn, trước khi ghép:
+flood mảnh bị bỏ trước khi tốn bộ nhớ đệm.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from .message import MessageType
+from utils.logger import Logger
+
+# (IP nguồn, sender_id)
+SenderKey = Tuple[Optional[str], str]
+
+# Loại tin -> (tin/giây, burst); loại không có trong bảng thì không giới hạn
+DEFAULT_RATE_LIMITS: Dict[MessageType, Tuple[float, float]] = {
+    MessageType.DISCOVERY: (1.0, 5.0),
+    MessageType.DISCOVERY_RESPONSE: (1.0, 5.0),
+    MessageType.HEARTBEAT: (1.0, 5.0),
+    MessageType.TEXT: (20.0, 50.0),
+    MessageType.EMOJI: (20.0, 50.0),
+    MessageType.PRIVATE_MESSAGE: (100.0, 300.0),
+    MessageType.GROUP_MESSAGE: (100.0, 300.0),
+    MessageType.GROUP_CREATE: (5.0, 20.0),
+    MessageType.GROUP_INVITE: (5.0, 20.0),
+    MessageType.FILE_OFFER: (5.0, 20.0),
+    MessageType.FILE_ACCEPT: (5.0, 20.0),
+    MessageType.RELAY: (200.0, 500.0),
+}
+
+# Mảnh/giây và burst cho mỗi IP nguồn; burst đủ cho 1 tin lớn nhất Reassembler nhận (4MB)
+FRAGMENT_RATE_LIMIT: Tuple[float, float] = (2000.0, 4000.0)
+
+
+def parse_rate_limit(spec: str) -> Tuple[MessageType, Optional[Tuple[float, float]]]:
+    """
+    "text=20/50" -> (TEXT, (20.0, 50.0)); "text=off" -> (TEXT, None)
+    Raise ValueError nếu sai cú pháp
+    """
+    name, _, value = spec.partition("=")
+    msg_type = MessageType(name.strip().lower())
+    value = value.strip().lower()
+    if value == "off":
+        return msg_type, None
+    rate, _, burst = value.partition("/")
+    rate = float(rate)
+    burst = float(burst) if burst else rate
+    if rate <= 0 or burst < 1:
+        raise ValueError(f"invalid rate limit: {spec}")
+    return msg_type, (rate, burst)
+
+
+@dataclass
+class _Bucket:
+    tokens: float
+    updated: float
+
+
+@dataclass
+class _Offender:
+    drops: int
+    window_start: float
+    until: float = 0.0
+
+
+class RateLimiter:
+    """
+    Token bucket cho mỗi (IP nguồn, sender_id, loại tin) và cho mảnh của mỗi IP nguồn
+    - allow() / allow_fragment() O(1); tối đa `capacity` bucket (LRU) để sender_id giả mạo
+      không làm phình bộ nhớ
+    - fragment_limit None: không giới hạn mảnh
+    - quarantine_time > 0: sender bị bỏ >= QUARANTINE_DROPS tin trong QUARANTINE_WINDOW
+      giây bị cách ly quarantine_time giây (ACK vẫn được nhận để gửi tin cậy không bị kẹt)
+    """
+
+    QUARANTINE_DROPS = 100
+    QUARANTINE_WINDOW = 5.0
+
+    def __init__(self, limits: Optional[Dict[MessageType, Tuple[float, float]]] = None,
+                 quarantine_time: float = 30.0, capacity: int = 4096,
+                 logger: Optional[Logger] = None,
+                 fragment_limit: Optional[Tuple[float, float]] = FRAGMENT_RATE_LIMIT):
+        self.limits = dict(DEFAULT_RATE_LIMITS if limits is None else limits)
+        self.fragment_limit = fragment_limit
+        self.quarantine_time = quarantine_time
+        self.capacity = capacity
+        self.logger = logger
+
+        self._buckets: "OrderedDict[Tuple[SenderKey, MessageType], _Bucket]" = OrderedDict()
+        self._fragment_buckets: "OrderedDict[Optional[str], _Bucket]" = OrderedDict()  # IP -> bucket
+        self._offenders: Dict[SenderKey, _Offender] = {}
+        self._lock = threading.Lock()
+
+        # Counters
+        self.allowed = 0
+        self.dropped: Dict[str, int] = {}  # loại tin -> số tin bị bỏ
+        self.quarantine_dropped = 0
+        self.quarantines = 0
+
+    def allow(self, sender_id: str, msg_type: MessageType, source: Optional[str] = None) -> bool:
+        """
+        True nếu tin được nhận; False nếu vượt mức / người gửi đang bị cách ly
+        source: IP nguồn của gói
+        """
+        limit = self.limits.get(msg_type)
+        sender = (source, sender_id)
+        now = time.monotonic()
+        with self._lock:
+            offender = self._offenders.get(sender)
+            if offender is not None and offender.until > now and msg_type != MessageType.ACK:
+                self.quarantine_dropped += 1
+                return False
+            if limit is None:
+                self.allowed += 1
+                return True
+
+            if self._take(self._buckets, (sender, msg_type), limit, now):
+                self.allowed += 1
+                return True
+
+            self.dropped[msg_type.value] = self.dropped.get(msg_type.value, 0) + 1
+            if self.quarantine_time > 0:
+                self._record_drop(sender, now)
+            return False
+
+    def allow_fragment(self, source: Optional[str]) -> bool:
+        """
+        True nếu nhận mảnh từ IP nguồn source (gọi trước khi ghép mảnh)
+        Mảnh bị bỏ được đếm trong dropped['fragment'], không tính vào cách ly (chưa biết sender_id)
+        """
+        if self.fragment_limit is None:
+            return True
+        with self._lock:
+            if self._take(self._fragment_buckets, source, self.fragment_limit, time.monotonic()):
+                return True
+            self.dropped['fragment'] = self.dropped.get('fragment', 0) + 1
+            return False
+
+    def quarantined(self) -> Dict[str, float]:
+        """"sender_id@IP" -> số giây cách ly còn lại"""
+        now = time.monotonic()
+        with self._lock:
+            return {f"{sender_id}@{source}": o.until - now
+                    for (source, sender_id), o in self._offenders.items() if o.until > now}
+
+    def release(self, sender_id: str, source: Optional[str] = None):
+        """Bỏ cách ly một người gửi (source None: mọi IP nguồn của sender_id)"""
+        with self._lock:
+            for sender in [k for k in self._offenders
+                           if k[1] == sender_id and (source is None or k[0] == source)]:
+                del self._offenders[sender]
+
+    def expire(self):
+        """Dọn thông tin người gửi đã hết cách ly / hết cửa sổ đếm (gọi định kỳ)"""
+        now = time.monotonic()
+        with self._lock:
+            for sender in [s for s, o in self._offenders.items()
+                           if o.until <= now and now - o.window_start > self.QUARANTINE_WINDOW]:
+                del self._offenders[sender]
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                'allowed': self.allowed,
+                'dropped': dict(self.dropped),
+                'quarantine_dropped': self.quarantine_dropped,
+                'quarantines': self.quarantines,
+                'quarantined': sum(1 for o in self._offenders.values()
+                                   if o.until > time.monotonic()),
+                'buckets': len(self._buckets) + len(self._fragment_buckets),
+            }
+
+    def _take(self, buckets: OrderedDict, key, limit: Tuple[float, float], now: float) -> bool:
+        """Lấy 1 token từ bucket `key` (tạo đầy nếu chưa có, LRU theo capacity) - gọi khi giữ lock"""
+        rate, burst = limit
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = _Bucket(burst, now)
+            if len(buckets) > self.capacity:
+                buckets.popitem(last=False)
+        else:
+            buckets.move_to_end(key)
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+
+        if bucket.tokens >= 1.0:
+            bucket.tokens -= 1.0
+            return True
+        return False
+
+    def _record_drop(self, sender: SenderKey, now: float):
+        """Đếm tin bị bỏ của sender; đủ ngưỡng thì cách ly (gọi khi giữ lock)"""
+        offender = self._offenders.get(sender)
+        if offender is None or now - offender.window_start > self.QUARANTINE_WINDOW:
+            offender = self._offenders[sender] = _Offender(0, now)
+        offender.drops += 1
+        if offender.drops >= self.QUARANTINE_DROPS:
+            offender.until = now + self.quarantine_time
+            offender.drops = 0
+            offender.window_start = offender.until
+            self.quarantines += 1
+            if self.logger:
+                self.logger.warning(f"Quarantined {sender[1]}@{sender[0]} for {self.quarantine_time:.0f}s (flooding)")
@@ -0,0 +1,160 @@
+"""
+Module relay - Node trung gian fan-out tin nhóm thay cho người gửi
+
+Client gửi 1 bản RELAY (tin nhóm, endpoint đích nằm trong group_members) đến relay.
+Relay gửi lại tin gốc (giữ sender/msg_id) đến từng thành viên với via = port relay:
+bên nhận ACK về relay. Relay không ACK kịp -> client tự gửi trực tiếp (bên nhận lọc trùng).
+Relay chỉ gửi đến đích đã biết (sổ địa chỉ / discovery) và tối đa MAX_RELAY_TARGETS đích:
+danh sách do peer tự khai, không kiểm tra thì relay bị dùng để khuếch đại / phản xạ gói.
+"""
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Callable, Dict, List, Optional, Tuple
+from .addressing import Endpoint, format_endpoint, parse_endpoint
+from .fanout import FanoutResult
+from .message import Message, MessageType
+from .scheduler import TimerHandle, TimerWheel
+from utils.logger import Logger
+
+CAP_RELAY = "relay1"     # Hiểu tin chuyển tiếp (field via) - mọi node
+CAP_RELAY_HUB = "hub1"   # Node đang chạy vai trò relay
+
+RELAY_MIN_MEMBERS = 3    # Nhóm nhỏ hơn: gửi trực tiếp rẻ ngang gửi qua relay
+MAX_RELAY_TARGETS = 256  # Số đích tối đa trong 1 tin RELAY; nhiều hơn thì relay bỏ cả tin
+
+
+def wrap(message: Message, targets: List[Endpoint], local_host: Optional[str] = None) -> Message:
+    """Tin nhóm -> tin RELAY gửi cho relay (đích cùng host local_host ghi mỗi port như bản cũ)"""
+    return replace(message, msg_type=MessageType.RELAY,
+                   group_members=[format_endpoint(target, local_host) for target in targets])
+
+
+def unwrap(message: Message, via: int, default_host: str) -> Tuple[Message, List[Endpoint]]:
+    """
+    Tin RELAY -> (tin nhóm gốc đánh dấu via, các endpoint đích)
+    Đích chỉ có port nằm trên host của client (default_host)
+    Raise ValueError nếu có quá MAX_RELAY_TARGETS đích
+    """
+    members = message.group_members or []
+    if len(members) > MAX_RELAY_TARGETS:
+        raise ValueError(f"too many relay targets: {len(members)}")
+    targets = [parse_endpoint(target, default_host) for target in members]
+    inner = Message(
+        msg_type=MessageType.GROUP_MESSAGE,
+        sender_id=message.sender_id,
+        sender_name=message.sender_name,
+        sender_port=message.sender_port,
+        content=message.content,
+        timestamp=message.timestamp,
+        msg_id=message.msg_id,
+        target_id=message.target_id,
+        group_id=message.group_id,
+        via=via
+    )
+    return inner, targets
+
+
+@dataclass
+class _Relayed:
+    endpoint: Endpoint
+    result: FanoutResult
+    on_done: Callable[[bool], None]
+    settled: bool = False
+    timer: Optional[TimerHandle] = None  # Hạn chờ ACK của relay
+
+
+class RelayRouter:
+    """
+    Phía client: chọn relay còn sống, theo dõi bản gửi qua relay
+    - Relay được biết qua discovery (CAP_RELAY_HUB), hết hạn sau SEEN_TIMEOUT giây
+    - Relay không ACK trong ACK_TIMEOUT giây -> on_done(False), relay bị bỏ
+      đến khi xuất hiện lại trong discovery
+    """
+
+    SEEN_TIMEOUT = 60.0  # Như DeviceDiscovery.DEVICE_TIMEOUT
+    ACK_TIMEOUT = 2.0
+
+    def __init__(self, logger: Logger, scheduler: Optional[TimerWheel] = None):
+        self.logger = logger
+        self._relays: Dict[Endpoint, float] = {}  # endpoint -> lần cuối thấy
+        self._cond = threading.Condition()
+        # Không có scheduler dùng chung (vd. thử với LossyTransport): tự tạo và tự start/stop
+        self._own_scheduler = scheduler is None
+        if scheduler is None:
+            scheduler = TimerWheel(logger, name="relay-timers")
+        self._scheduler = scheduler
+        self.running = False
+
+        # Counters
+        self.relayed = 0
+        self.fallbacks = 0
+
+    def start(self):
+        self.running = True
+        if self._own_scheduler:
+            self._scheduler.start()
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+        if self._own_scheduler:
+            self._scheduler.stop()
+
+    def seen(self, endpoint: Endpoint):
+        with self._cond:
+            if endpoint not in self._relays:
+                self.logger.info(f"Relay found at {endpoint}")
+            self._relays[endpoint] = time.monotonic()
+
+    def forget(self, endpoint: Endpoint):
+        with self._cond:
+            if self._relays.pop(endpoint, None) is not None:
+                self.logger.warning(f"Relay at {endpoint} lost, sending directly")
+
+    def choose(self) -> Optional[Endpoint]:
+        """Relay thấy gần nhất (None = gửi trực tiếp)"""
+        deadline = time.monotonic() - self.SEEN_TIMEOUT
+        with self._cond:
+            for endpoint in [e for e, seen in self._relays.items() if seen < deadline]:
+                del self._relays[endpoint]
+            if not self._relays:
+                return None
+            return max(self._relays, key=self._relays.get)
+
+    def track(self, endpoint: Endpoint, result: FanoutResult, on_done: Callable[[bool], None]):
+        """Chờ relay ACK bản gửi `result`; on_done(confirmed) được gọi đúng 1 lần"""
+        entry = _Relayed(endpoint, result, on_done)
+        with self._cond:
+            self.relayed += 1
+            entry.timer = self._scheduler.call_later(self.ACK_TIMEOUT, self._on_timeout, entry)
+        result.add_done_callback(lambda _: self._settle(entry))
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                'relays': len(self._relays),
+                'relayed': self.relayed,
+                'fallbacks': self.fallbacks,
+            }
+
+    def _settle(self, entry: _Relayed):
+        with self._cond:
+            if entry.settled:
+                return
+            entry.settled = True
+            if entry.timer:
+                entry.timer.cancel()
+            confirmed = entry.endpoint in entry.result.confirmed
+            if not confirmed:
+                self.fallbacks += 1
+        if not confirmed:
+            self.forget(entry.endpoint)
+        try:
+            entry.on_done(confirmed)
+        except Exception as e:
+            self.logger.error(f"Relay fallback failed: {e}")
+
+    def _on_timeout(self, entry: _Relayed):
+        if self.running:
+            self._settle(entry)
@@ -0,0 +1,628 @@
+"""
+Module gửi tin cậy - Số thứ tự theo peer, ACK gộp (cumulative + selective),
+timeout truyền lại tính theo RTT (Jacobson/Karels)
+
+Tin gửi nhiều peer được mã hóa 1 lần mỗi codec; seq của từng peer gắn thành trailer
+(codec.stamp_seq). Caller chỉ cấp seq; mã hóa và gửi chạy trên thread của dispatch.
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from .message import Message, MessageType
+from .codec import encode_message, stamp_seq
+from .fanout import FanoutResult
+from .scheduler import TimerHandle, TimerWheel
+from utils.logger import Logger
+
+CAP_RELIABLE = "rel2"  # rel1 (seq trong header, mã hóa theo từng peer) không còn dùng
+
+
+def _ranges(seqs: List[int]) -> List[Tuple[int, int]]:
+    """[3,4,5,9] -> [(3,5), (9,9)] (seqs đã sắp xếp)"""
+    blocks = []
+    for seq in seqs:
+        if blocks and seq == blocks[-1][1] + 1:
+            blocks[-1] = (blocks[-1][0], seq)
+        else:
+            blocks.append((seq, seq))
+    return blocks
+
+
+def format_ack(epoch: int, cumulative: int, selective: List[int], max_blocks: int = 16) -> str:
+    """
+    Nội dung ACK: 'epoch:cum' hoặc 'epoch:cum:a-b,c,...'
+    Quá max_blocks khối thì giữ các khối mới nhất (seq cao nhất)
+    """
+    if not selective:
+        return f"{epoch}:{cumulative}"
+    blocks = _ranges(sorted(selective))[-max_blocks:]
+    sack = ','.join(f"{a}-{b}" if a != b else str(a) for a, b in blocks)
+    return f"{epoch}:{cumulative}:{sack}"
+
+
+def parse_ack(content: str) -> Tuple[int, int, List[Tuple[int, int]]]:
+    """Trả về (epoch, cumulative, [(đầu, cuối), ...])"""
+    parts = content.split(':')
+    blocks = []
+    if len(parts) > 2 and parts[2]:
+        for item in parts[2].split(','):
+            first, _, last = item.partition('-')
+            blocks.append((int(first), int(last or first)))
+    return int(parts[0]), int(parts[1]), blocks
+
+
+@dataclass
+class _Delivery:
+    """Một lần gửi tin cậy đến nhiều port"""
+    message: Message
+    result: FanoutResult
+    remaining: int
+    # codec -> thân tin mã hóa chung cho mọi peer (chưa có seq)
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+
+@dataclass
+class _Pending:
+    """Gói đang chờ ACK"""
+    seq: int
+    base: int  # seq_base lúc gửi
+    delivery: _Delivery
+    sent_at: Optional[float]  # None = đang chờ thread gửi (chưa lên mạng)
+    deadline: float
+    retries: int = 0
+    data: Optional[bytes] = None  # Tạo ở lần gửi đầu (thread gửi), dùng lại khi truyền lại
+
+
+@dataclass
+class _PeerState:
+    """Trạng thái gửi/nhận với một peer"""
+    rto: float
+    # Phía gửi
+    next_seq: int = 1
+    unacked: Dict[int, _Pending] = field(default_factory=dict)
+    backlog: deque = field(default_factory=deque)  # Chờ cửa sổ gửi trống
+    srtt: Optional[float] = None
+    rttvar: float = 0.0
+    next_check: Optional[float] = None  # Timer truyền lại đang đặt
+    check_timer: Optional[TimerHandle] = None
+    # Phía nhận
+    recv_epoch: Optional[int] = None
+    recv_cumulative: int = 0
+    recv_selective: Set[int] = field(default_factory=set)
+    ack_due: Optional[float] = None
+    ack_timer: Optional[TimerHandle] = None
+    ack_pending: int = 0
+    last_active: float = 0.0  # Lần cuối gửi/nhận với peer (dọn peer không hoạt động)
+
+
+class ReliabilityLayer:
+    """
+    Lớp tin cậy đặt trên transport datagram bất kỳ
+    send_raw(data, port), codec_for(port) và encode(message, codec) do NetworkManager
+    (hoặc transport giả lập như LossyTransport) cung cấp; "port" là địa chỉ peer của
+    transport đó (Endpoint với NetworkManager, số port với LossyTransport)
+    dispatch(callback, *args): chạy việc mã hóa/gửi trên thread gửi (None = gửi ngay)
+    Hẹn giờ truyền lại/ACK trễ đặt trên scheduler dùng chung (không có thì tự tạo)
+    """
+
+    ACK_DELAY = 0.02      # Gộp ACK trong 20ms
+    ACK_EVERY = 8         # ...hoặc ngay sau 8 gói
+    MAX_SACK_BLOCKS = 16  # Số khối selective tối đa trong một ACK
+    INITIAL_RTO = 0.5
+    MIN_RTO = 0.05
+    MAX_RTO = 5.0
+    MAX_RETRIES = 8
+    WINDOW = 64           # Số gói đang bay tối đa với mỗi peer
+    RECV_WINDOW = 256     # Seq nhận được tối đa vượt trước cumulative; xa hơn thì bỏ, không ACK
+    PEER_IDLE_TIMEOUT = 300.0  # Giây không gửi/nhận (và không còn gói chờ) thì bỏ trạng thái peer
+
+    def __init__(self, user_id: str, user_name: str, port: int,
+                 send_raw: Callable[[bytes, int], None],
+                 codec_for: Callable[[int], str],
+                 logger: Logger,
+                 encode: Callable[[Message, str], bytes] = encode_message,
+                 send_control: Optional[Callable[[bytes, int], None]] = None,
+                 scheduler: Optional[TimerWheel] = None,
+                 dispatch: Optional[Callable[..., None]] = None):
+        self.user_id = user_id
+        self.user_name = user_name
+        self.port = port
+        self._send_raw = send_raw
+        # ACK gửi ngay, không chờ gộp (mặc định như send_raw)
+        self._send_control = send_control or send_raw
+        self._codec_for = codec_for
+        self._encode = encode
+        self._dispatch = dispatch or (lambda callback, *args: callback(*args))
+        self.logger = logger
+
+        # Epoch ngẫu nhiên: peer nhận biết mình đã khởi động lại và reset seq
+        self.epoch = random.getrandbits(31)
+        self._peers: Dict[int, _PeerState] = {}
+        # seq đầu tiên cho peer mới tạo lại sau khi bị dọn: lớn hơn mọi seq đã cấp,
+        # bên nhận còn nhớ epoch này không coi tin mới là trùng
+        self._seq_floor = 1
+        self._cond = threading.Condition()
+        # Không có scheduler dùng chung (vd. thử với LossyTransport): tự tạo và tự start/stop
+        self._own_scheduler = scheduler is None
+        if scheduler is None:
+            scheduler = TimerWheel(logger, name="reliability-timers")
+        self._scheduler = scheduler
+        self.running = False
+
+        self.on_delivery_failed: Optional[Callable[[Message, int], None]] = None
+
+        # Counters
+        self.sent = 0
+        self.retransmits = 0
+        self.acks_sent = 0
+        self.acks_received = 0
+        self.delivered = 0
+        self.duplicates = 0
+        self.out_of_window = 0
+        self.gave_up = 0
+
+    def start(self):
+        self.running = True
+        if self._own_scheduler:
+            self._scheduler.start()
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            for peer in self._peers.values():
+                for timer in (peer.check_timer, peer.ack_timer):
+                    if timer:
+                        timer.cancel()
+        if self._own_scheduler:
+            self._scheduler.stop()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            in_flight = sum(len(p.unacked) for p in self._peers.values())
+            queued = sum(len(p.backlog) for p in self._peers.values())
+        return {
+            'sent': self.sent,
+            'retransmits': self.retransmits,
+            'acks_sent': self.acks_sent,
+            'acks_received': self.acks_received,
+            'delivered': self.delivered,
+            'duplicates': self.duplicates,
+            'out_of_window': self.out_of_window,
+            'gave_up': self.gave_up,
+            'in_flight': in_flight,
+            'queued': queued,
+        }
+
+    def rto_for(self, port: int) -> float:
+        with self._cond:
+            return self._peer(port).rto
+
+    # === GỬI ===
+
+    def send(self, message: Message, ports: List[int],
+             result: Optional[FanoutResult] = None) -> FanoutResult:
+        """
+        Gửi tin cậy đến các port; port đã ACK nằm trong result.confirmed
+        Không chặn: chỉ cấp seq, mã hóa và gửi qua dispatch
+        """
+        if result is None:
+            result = FanoutResult(destinations=list(ports))
+        result._add_part()
+        if not ports:
+            result._finish_part()
+            return result
+
+        delivery = _Delivery(message, result, len(ports))
+        outgoing = []
+        now = time.monotonic()
+        with self._cond:
+            for port in ports:
+                peer = self._peer(port)
+                seq = peer.next_seq
+                peer.next_seq += 1
+                # seq_base: seq nhỏ nhất chưa xong - bên nhận bỏ qua lỗ hổng phía dưới
+                if peer.unacked:
+                    base = next(iter(peer.unacked))
+                elif peer.backlog:
+                    base = peer.backlog[0].seq
+                else:
+                    base = seq
+                pending = _Pending(seq, base, delivery, None, 0.0)
+                if len(peer.unacked) < self.WINDOW and not peer.backlog:
+                    outgoing.append((self._launch(peer, pending, port, now), port))
+                else:
+                    peer.backlog.append(pending)
+
+        if outgoing:
+            self._dispatch(self._send_new, outgoing)
+        return result
+
+    def on_ack(self, message: Message, port=None):
+        """Xử lý ACK từ peer (port: địa chỉ gói đến, mặc định sender_port)"""
+        try:
+            epoch, cumulative, selective = parse_ack(message.content)
+        except (ValueError, IndexError):
+            return
+        if epoch != self.epoch:
+            return  # ACK cho phiên cũ
+
+        if port is None:
+            port = message.sender_port
+        now = time.monotonic()
+        completed = []
+        with self._cond:
+            self.acks_received += 1
+            peer = self._peers.get(port)
+            if peer is None:
+                return
+            peer.last_active = now
+            acked = [s for s in peer.unacked
+                     if s <= cumulative or any(a <= s <= b for a, b in selective)]
+            for seq in acked:
+                pending = peer.unacked.pop(seq)
+                # Karn: chỉ lấy mẫu RTT từ gói chưa truyền lại
+                if pending.retries == 0 and pending.sent_at is not None:
+                    self._update_rtt(peer, now - pending.sent_at)
+                completed.append(pending)
+            retransmit = self._detect_losses(peer, max(acked, default=0), port, now)
+            outgoing = []
+            while peer.backlog and len(peer.unacked) < self.WINDOW:
+                outgoing.append((self._launch(peer, peer.backlog.popleft(), port, now), port))
+            if not peer.unacked and peer.check_timer:
+                # Hết gói chờ ACK: bỏ hẹn kiểm tra truyền lại thay vì để nó chạy không
+                peer.check_timer.cancel()
+                peer.check_timer = None
+                peer.next_check = None
+
+        if retransmit:
+            self._dispatch(self._resend, retransmit, port)
+        if outgoing:
+            self._dispatch(self._send_new, outgoing)
+        for pending in completed:
+            pending.delivery.result.confirmed.add(port)
+            self._complete(pending.delivery)
+
+    # === NHẬN ===
+
+    def on_data(self, message: Message, port=None) -> bool:
+        """
+        Ghi nhận gói có seq và lên lịch ACK
+        Trả về True nếu là lần đầu nhận (cần chuyển cho ứng dụng)
+        Tin qua relay: seq thuộc về relay, ACK gửi về relay
+        port: địa chỉ node gửi gói này (mặc định via hoặc sender_port)
+        """
+        if port is None:
+            port = message.via or message.sender_port
+        seq = message.seq
+        send_now = False
+        with self._cond:
+            peer = self._peer(port)
+            if peer.recv_epoch != message.epoch:
+                # Peer mới hoặc vừa khởi động lại
+                peer.recv_epoch = message.epoch
+                peer.recv_cumulative = 0
+                peer.recv_selective.clear()
+
+            # Mọi seq < seq_base đã được bên gửi xử lý xong (ACK hoặc bỏ cuộc)
+            base = message.seq_base or 1
+            if base - 1 > peer.recv_cumulative:
+                peer.recv_cumulative = base - 1
+                peer.recv_selective = {s for s in peer.recv_selective if s > base - 1}
+
+            # Seq quá xa cumulative: không nhớ (tập selective giới hạn theo cửa sổ nhận), không
+            # ACK -> bên gửi truyền lại sau khi khoảng trống phía trước được lấp
+            if seq > peer.recv_cumulative + self.RECV_WINDOW:
+                self.out_of_window += 1
+                return False
+
+            fresh = seq > peer.recv_cumulative and seq not in peer.recv_selective
+            if fresh:
+                peer.recv_selective.add(seq)
+                self.delivered += 1
+            else:
+                self.duplicates += 1
+            while peer.recv_cumulative + 1 in peer.recv_selective:
+                peer.recv_cumulative += 1
+                peer.recv_selective.discard(peer.recv_cumulative)
+
+            # Gói trùng => ACK có thể đã mất, trả lời ngay; còn lại gộp ACK
+            peer.ack_pending += 1
+            if not fresh or peer.ack_pending >= self.ACK_EVERY:
+                send_now = True
+            elif peer.ack_due is None:
+                peer.ack_due = time.monotonic() + self.ACK_DELAY
+                peer.ack_timer = self._arm(peer.ack_due, port)
+
+            ack = self._build_ack(peer) if send_now else None
+
+        if ack is not None:
+            self._send_ack(ack, port)
+        return fresh
+
+    # === NỘI BỘ ===
+
+    def _peer(self, port: int) -> _PeerState:
+        peer = self._peers.get(port)
+        if peer is None:
+            peer = self._peers[port] = _PeerState(rto=self.INITIAL_RTO, next_seq=self._seq_floor)
+        peer.last_active = time.monotonic()
+        return peer
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """
+        Bỏ trạng thái của peer không hoạt động quá PEER_IDLE_TIMEOUT và không còn
+        gói chờ ACK / chờ gửi / ACK chưa gửi; trả về số peer đã bỏ
+        """
+        if now is None:
+            now = time.monotonic()
+        with self._cond:
+            idle = [port for port, peer in self._peers.items()
+                    if now - peer.last_active >= self.PEER_IDLE_TIMEOUT
+                    and not peer.unacked and not peer.backlog and peer.ack_due is None]
+            for port in idle:
+                peer = self._peers.pop(port)
+                self._seq_floor = max(self._seq_floor, peer.next_seq)
+                for timer in (peer.check_timer, peer.ack_timer):
+                    if timer:
+                        timer.cancel()
+        return len(idle)
+
+    def _arm(self, deadline: float, port: int) -> TimerHandle:
+        return self._scheduler.call_at(deadline, self._on_timer, port)
+
+    def _launch(self, peer: _PeerState, pending: _Pending, port: int, now: float) -> _Pending:
+        """Đưa gói vào cửa sổ đang bay (gọi khi giữ lock) - hạn thật tính lúc gửi (_stamp)"""
+        pending.deadline = now + peer.rto
+        peer.unacked[pending.seq] = pending
+        self._arm_retransmit(peer, pending.deadline, port)
+        return pending
+
+    def _send_new(self, outgoing):
+        """Gửi lần đầu và ghi kết quả"""
+        for pending, port in outgoing:
+            pending.delivery.result._record(port, self._transmit(pending, port))
+            self.sent += 1
+
+    def _resend(self, pendings: List[_Pending], port: int):
+        for pending in pendings:
+            self._transmit(pending, port)
+
+    def _stamp(self, pending: _Pending, port: int):
+        """
+        Gói sắp lên mạng: tính thời điểm gửi và hạn truyền lại từ bây giờ, không từ lúc
+        xếp hàng (hàng đợi của thread gửi không bị tính là RTT / không gây truyền lại giả)
+        """
+        with self._cond:
+            peer = self._peers.get(port)
+            if peer is None or peer.unacked.get(pending.seq) is not pending:
+                return  # Đã ACK / đã bỏ cuộc
+            now = time.monotonic()
+            pending.sent_at = now
+            # Hạn mới muộn hơn hạn đã đặt: timer cũ chạy sớm và tự đặt lại (_collect_due)
+            pending.deadline = now + min(self.MAX_RTO, peer.rto * (2 ** pending.retries))
+
+    def _arm_retransmit(self, peer: _PeerState, deadline: float, port: int):
+        # Một timer cho mỗi peer: chỉ đặt lại (hủy timer cũ) khi hạn mới sớm hơn
+        if peer.next_check is None or deadline < peer.next_check:
+            if peer.check_timer:
+                peer.check_timer.cancel()
+            peer.next_check = deadline
+            peer.check_timer = self._arm(deadline, port)
+
+    def _transmit(self, pending: _Pending, port: int) -> bool:
+        try:
+            data = self._data(pending, port)
+            self._stamp(pending, port)
+            self._send_raw(data, port)
+            return True
+        except Exception as e:
+            self.logger.debug(f"Reliable send to {port} failed: {e}")
+            return False
+
+    def _data(self, pending: _Pending, port: int) -> bytes:
+        """Bytes cho peer: thân tin mã hóa 1 lần mỗi codec + trailer seq của peer"""
+        if pending.data is None:
+            delivery = pending.delivery
+            codec = self._codec_for(port)
+            shared = delivery.encoded.get(codec)
+            if shared is None:
+                shared = delivery.encoded[codec] = self._encode(delivery.message, codec)
+            pending.data = stamp_seq(shared, self.epoch, pending.seq, pending.base)
+        return pending.data
+
+    def _update_rtt(self, peer: _PeerState, sample: float):
+        if peer.srtt is None:
+            peer.srtt = sample
+            peer.rttvar = sample / 2
+        else:
+            peer.rttvar = 0.75 * peer.rttvar + 0.25 * abs(peer.srtt - sample)
+            peer.srtt = 0.875 * peer.srtt + 0.125 * sample
+        peer.rto = min(self.MAX_RTO, max(self.MIN_RTO, peer.srtt + 4 * peer.rttvar))
+
+    def _build_ack(self, peer: _PeerState) -> Message:
+        if peer.ack_timer:
+            # ACK gửi sớm (đủ ACK_EVERY gói / gói trùng): bỏ hẹn giờ ACK trễ
+            peer.ack_timer.cancel()
+            peer.ack_timer = None
+        peer.ack_due = None
+        peer.ack_pending = 0
+        return Message(
+            msg_type=MessageType.ACK,
+            sender_id=self.user_id,
+            sender_name=self.user_name,
+            sender_port=self.port,
+            content=format_ack(peer.recv_epoch, peer.recv_cumulative,
+                               list(peer.recv_selective), self.MAX_SACK_BLOCKS)
+        )
+
+    def _send_ack(self, ack: Message, port: int):
+        try:
+            self._send_control(self._encode(ack, self._codec_for(port)), port)
+            self.acks_sent += 1
+        except Exception as e:
+            self.logger.debug(f"ACK to {port} failed: {e}")
+
+    def _complete(self, delivery: _Delivery):
+        with self._cond:
+            delivery.remaining -= 1
+            finished = delivery.remaining == 0
+        if finished:
+            delivery.encoded.clear()
+            delivery.result._finish_part()
+
+    def _on_timer(self, port: int):
+        """Hẹn giờ truyền lại / ACK trễ của một peer đến hạn (thread của scheduler)"""
+        with self._cond:
+            if not self.running:
+                return
+            retransmit, failed, ack = self._collect_due(port, time.monotonic())
+
+        if ack is not None:
+            self._send_ack(ack, port)
+        if retransmit:
+            self._dispatch(self._resend, retransmit, port)
+        for pending in failed:
+            self._give_up(pending, port)
+
+    def _detect_losses(self, peer: _PeerState, highest_acked: int, port: int,
+                       now: float) -> List[_Pending]:
+        """
+        Truyền lại nhanh: gói có seq nhỏ hơn gói vừa được ACK mà đã gửi quá
+        cửa sổ đảo thứ tự (SRTT + 4*RTTVAR) thì coi như mất, không chờ hết RTO;
+        gói chưa quá cửa sổ được hẹn kiểm tra lại sớm (gọi khi giữ lock)
+        """
+        if not highest_acked or peer.srtt is None:
+            return []
+        reorder_window = peer.srtt + 4 * peer.rttvar
+        retransmit = []
+        for pending in peer.unacked.values():
+            if pending.seq >= highest_acked:
+                break
+            if pending.retries >= self.MAX_RETRIES or pending.sent_at is None:
+                continue
+            if now - pending.sent_at >= reorder_window:
+                retransmit.append(self._retransmit(peer, pending, now))
+            elif pending.deadline > pending.sent_at + reorder_window:
+                pending.deadline = pending.sent_at + reorder_window
+                self._arm_retransmit(peer, pending.deadline, port)
+        return retransmit
+
+    def _retransmit(self, peer: _PeerState, pending: _Pending, now: float) -> _Pending:
+        """Đánh dấu truyền lại, backoff theo số lần của gói (gọi khi giữ lock)"""
+        pending.retries += 1
+        pending.sent_at = None
+        pending.deadline = now + min(self.MAX_RTO, peer.rto * (2 ** pending.retries))
+        self.retransmits += 1
+        return pending
+
+    def _collect_due(self, port: int, now: float):
+        """Gom các việc đến hạn của một peer (gọi khi giữ lock)"""
+        peer = self._peers.get(port)
+        if peer is None:
+            return [], [], None
+
+        ack = None
+        if peer.ack_due is not None and peer.ack_due <= now:
+            ack = self._build_ack(peer)
+
+        if peer.next_check is None or peer.next_check > now:
+            return [], [], ack
+        peer.next_check = None
+        peer.check_timer = None
+
+        retransmit, failed = [], []
+        for pending in list(peer.unacked.values()):
+            if pending.deadline > now:
+                continue
+            if pending.sent_at is None:
+                # Còn trong hàng đợi của thread gửi: chưa tính là mất
+                pending.deadline = now + peer.rto
+                continue
+            if pending.retries >= self.MAX_RETRIES:
+                del peer.unacked[pending.seq]
+                failed.append(pending)
+            else:
+                retransmit.append(self._retransmit(peer, pending, now))
+        if peer.unacked:
+            self._arm_retransmit(peer, min(p.deadline for p in peer.unacked.values()), port)
+        return retransmit, failed, ack
+
+    def _give_up(self, pending: _Pending, port: int):
+        self.gave_up += 1
+        pending.delivery.result._record(port, False)
+        self.logger.warning(f"Delivery of {pending.delivery.message.msg_id} to port {port} failed")
+        if self.on_delivery_failed:
+            try:
+                self.on_delivery_failed(pending.delivery.message, port)
+            except Exception:
+                pass
+        self._complete(pending.delivery)
+
+
+class LossyTransport:
+    """
+    Mạng cục bộ giả lập (không dùng socket) có mất gói và trễ ngẫu nhiên
+    Dùng để thử lớp tin cậy: endpoints[port] = hàm nhận datagram
+    """
+
+    def __init__(self, loss_rate: float = 0.0, delay: float = 0.0,
+                 jitter: float = 0.0, seed: Optional[int] = None):
+        self.loss_rate = loss_rate
+        self.delay = delay
+        self.jitter = jitter
+        self.endpoints: Dict[int, Callable[[bytes], None]] = {}
+        self._random = random.Random(seed)
+        self._queue = []  # heap (due, n, data, port)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.running = True
+
+        self.sent = 0
+        self.dropped = 0
+
+        threading.Thread(target=self._deliver_loop, daemon=True).start()
+
+    def register(self, port: int, receive: Callable[[bytes], None]):
+        self.endpoints[port] = receive
+
+    def send(self, data: bytes, port: int):
+        with self._cond:
+            self.sent += 1
+            if self._random.random() < self.loss_rate:
+                self.dropped += 1
+                return
+            due = time.monotonic() + self.delay + self._random.random() * self.jitter
+            heapq.heappush(self._queue, (due, next(self._seq), data, port))
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+
+    def _deliver_loop(self):
+        while True:
+            with self._cond:
+                while self.running:
+                    if self._queue:
+                        wait = self._queue[0][0] - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if not self.running:
+                    return
+                _, _, data, port = heapq.heappop(self._queue)
+
+            receive = self.endpoints.get(port)
+            if receive is not None:
+                try:
+                    receive(data)
+                except Exception:
+                    pass
@@ -0,0 +1,296 @@
+"""
+Module hẹn giờ - Timer wheel phân tầng dùng chung cho mọi thành phần của node
+
+Thay cho các vòng lặp sleep/poll và threading.Timer riêng lẻ: một thread duy nhất,
+đặt và hủy hẹn giờ O(1). Thread chỉ thức dậy khi có việc đến hạn (tìm ô kế tiếp
+bằng bitmap), không tick đều đặn.
+"""
+import itertools
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from utils.logger import Logger
+
+
+class TimerHandle:
+    """Hẹn giờ đã đặt; cancel() để hủy (gọi nhiều lần hoặc sau khi đã chạy đều được)"""
+
+    __slots__ = ('deadline', 'interval', 'callback', 'args', 'cancelled',
+                 '_tick', '_level', '_index', '_order', '_wheel')
+
+    def __init__(self, wheel: 'TimerWheel', deadline: float, interval: Optional[float],
+                 callback: Callable, args: tuple):
+        self.deadline = deadline
+        self.interval = interval  # None = chạy 1 lần
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self._tick = 0
+        self._level = -1  # -1 = không nằm trong wheel
+        self._index = 0
+        self._order = 0  # Thứ tự đặt: hẹn giờ cùng hạn chạy theo thứ tự đặt
+        self._wheel = wheel
+
+    def cancel(self):
+        self._wheel.cancel(self)
+
+
+class TimerWheel:
+    """
+    Timer wheel phân tầng (kiểu Linux): tầng 0 có LEVEL_BITS[0] bit ô, mỗi ô 1 tick;
+    ô tầng i dài bằng cả vòng tầng i-1. Hẹn giờ xa nằm ở tầng cao và được chuyển
+    xuống (cascade) khi thời điểm của ô đó đến. Hẹn giờ xa hơn cả wheel được đặt
+    ở ô cuối và đặt lại khi đến đó.
+    Callback chạy trên thread của wheel, ngoài lock: phải ngắn, không chặn.
+    """
+
+    TICK = 0.002              # Giây mỗi tick (độ trễ tối đa so với hạn đặt)
+    LEVEL_BITS = (9, 6, 6, 6)  # 512 ô x 2ms (~1s), 64 x ~1s, 64 x ~65s, 64 x ~70 phút
+
+    def __init__(self, logger: Optional[Logger] = None, tick: float = TICK,
+                 name: str = "timer-wheel"):
+        self.logger = logger
+        self.tick = tick
+        self.name = name
+
+        self._shifts: List[int] = []
+        shift = 0
+        for bits in self.LEVEL_BITS:
+            self._shifts.append(shift)
+            shift += bits
+        self._span = 1 << shift  # Số tick wheel chứa được
+        self._masks = [(1 << bits) - 1 for bits in self.LEVEL_BITS]
+        # Khoảng cách (tick) tối đa của mỗi tầng, trừ tầng cuối (nhận mọi thứ còn lại)
+        self._limits = [1 << s for s in self._shifts[1:]]
+        self._slots = [[set() for _ in range(1 << bits)] for bits in self.LEVEL_BITS]
+        self._occupied = [0] * len(self.LEVEL_BITS)  # Bitmap ô khác rỗng theo tầng
+
+        # Tick 0 coi như đã xử lý: tìm ô kế tiếp luôn tính từ một tick đã qua
+        self._origin = time.monotonic() - tick
+        self._tick = 1        # Tick kế tiếp chưa xử lý
+        self._wake_tick = None  # Tick thread định thức dậy (None = chờ vô hạn)
+        self._count = 0
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self.running = False
+
+        # Counters
+        self.scheduled = 0
+        self.fired = 0
+        self.cancelled = 0
+        self.cascaded = 0
+        self.wakeups = 0
+        self.errors = 0
+
+    def start(self):
+        with self._cond:
+            if self.running:
+                return
+            self.running = True
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+
+    def call_later(self, delay: float, callback: Callable, *args) -> TimerHandle:
+        """Gọi callback(*args) sau delay giây"""
+        return self.call_at(time.monotonic() + delay, callback, *args)
+
+    def call_at(self, deadline: float, callback: Callable, *args) -> TimerHandle:
+        """Gọi callback(*args) tại thời điểm time.monotonic() = deadline"""
+        handle = TimerHandle(self, deadline, None, callback, args)
+        self._schedule(handle)
+        return handle
+
+    def call_every(self, interval: float, callback: Callable, *args,
+                   first: Optional[float] = None) -> TimerHandle:
+        """Gọi callback(*args) mỗi interval giây (lần đầu sau first giây, mặc định interval)"""
+        delay = interval if first is None else first
+        handle = TimerHandle(self, time.monotonic() + delay, interval, callback, args)
+        self._schedule(handle)
+        return handle
+
+    def cancel(self, handle: TimerHandle):
+        """Hủy hẹn giờ - O(1): gỡ khỏi ô đang chứa nó"""
+        with self._cond:
+            if handle.cancelled:
+                return
+            handle.cancelled = True
+            if handle._level >= 0:
+                self._unlink(handle)
+                self.cancelled += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            pending = self._count
+        return {
+            'pending': pending,
+            'scheduled': self.scheduled,
+            'fired': self.fired,
+            'cancelled': self.cancelled,
+            'cascaded': self.cascaded,
+            'wakeups': self.wakeups,
+            'errors': self.errors,
+        }
+
+    def __len__(self) -> int:
+        return self._count
+
+    # === NỘI BỘ (gọi khi giữ lock, trừ _run/_fire) ===
+
+    def _tick_of(self, deadline: float) -> int:
+        """Tick đầu tiên không sớm hơn deadline (làm tròn lên: không chạy sớm)"""
+        ticks = (deadline - self._origin) / self.tick
+        whole = int(ticks)
+        return whole + 1 if ticks > whole else whole
+
+    def _schedule(self, handle: TimerHandle):
+        with self._cond:
+            if handle.cancelled:
+                return
+            handle._tick = self._tick_of(handle.deadline)
+            handle._order = next(self._order)
+            self._insert(handle)
+            self.scheduled += 1
+            # Sớm hơn lần thức dậy đã định -> đánh thức thread để tính lại
+            if self._wake_tick is None or handle._tick < self._wake_tick:
+                self._cond.notify()
+
+    def _insert(self, handle: TimerHandle):
+        delta = handle._tick - self._tick
+        if delta < 0:
+            delta = 0
+        elif delta >= self._span:
+            delta = self._span - 1  # Xa hơn cả wheel: đặt ở tick xa nhất, đến đó sẽ được đặt lại
+        level = 0
+        for limit in self._limits:
+            if delta < limit:
+                break
+            level += 1
+        index = ((self._tick + delta) >> self._shifts[level]) & self._masks[level]
+        self._slots[level][index].add(handle)
+        self._occupied[level] |= 1 << index
+        handle._level = level
+        handle._index = index
+        self._count += 1
+
+    def _unlink(self, handle: TimerHandle):
+        slot = self._slots[handle._level][handle._index]
+        slot.discard(handle)
+        if not slot:
+            self._occupied[handle._level] &= ~(1 << handle._index)
+        handle._level = -1
+        self._count -= 1
+
+    def _take(self, level: int, index: int) -> List[TimerHandle]:
+        """Lấy hết hẹn giờ trong một ô"""
+        slot = self._slots[level][index]
+        handles = list(slot)
+        slot.clear()
+        self._occupied[level] &= ~(1 << index)
+        self._count -= len(handles)
+        for handle in handles:
+            handle._level = -1
+        return handles
+
+    def _next_tick(self) -> Optional[int]:
+        """Tick sớm nhất sau self._tick - 1 có việc (hết hạn hoặc cascade); None = wheel rỗng"""
+        if not self._count:
+            return None
+        current = self._tick - 1  # Tick cuối đã xử lý
+        best = None
+        for level, bits in enumerate(self.LEVEL_BITS):
+            occupied = self._occupied[level]
+            if not occupied:
+                continue
+            size = 1 << bits
+            shift = self._shifts[level]
+            position = (current >> shift) & self._masks[level]
+            # Xoay bitmap để ô ngay sau position về bit 0, rồi lấy bit thấp nhất
+            rotated = (occupied >> (position + 1)) | (occupied << (size - position - 1))
+            rotated &= (1 << size) - 1
+            distance = (rotated & -rotated).bit_length()  # 1..size
+            tick = ((current >> shift) + distance) << shift
+            if best is None or tick < best:
+                best = tick
+        return best
+
+    def _advance(self, now_tick: int) -> List[TimerHandle]:
+        """Xử lý mọi tick đến now_tick, nhảy thẳng qua các tick không có việc"""
+        due = []
+        while self._tick <= now_tick:
+            next_tick = self._next_tick()
+            if next_tick is None or next_tick > now_tick:
+                self._tick = now_tick + 1
+                break
+            tick = next_tick
+            self._tick = tick
+            # Cascade từ tầng cao xuống trước khi chạy ô tầng 0 của tick này
+            for level in range(len(self._shifts) - 1, 0, -1):
+                shift = self._shifts[level]
+                if tick & ((1 << shift) - 1):
+                    continue
+                index = (tick >> shift) & self._masks[level]
+                if self._occupied[level] >> index & 1:
+                    for handle in self._take(level, index):
+                        self.cascaded += 1
+                        self._insert(handle)
+            index = tick & self._masks[0]
+            if self._occupied[0] >> index & 1:
+                for handle in self._take(0, index):
+                    if handle._tick > tick:
+                        self._insert(handle)  # Hẹn xa hơn wheel, chưa đến hạn
+                    else:
+                        due.append(handle)
+            self._tick = tick + 1
+        # Ô là set (hủy O(1)) và cascade đổi thứ tự: sắp lại theo hạn rồi thứ tự đặt
+        due.sort(key=lambda handle: (handle.deadline, handle._order))
+        return due
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self.running:
+                    return
+                due = self._advance(int((time.monotonic() - self._origin) / self.tick))
+                if not due:
+                    self._wake_tick = self._next_tick()
+                    if self._wake_tick is None:
+                        self._cond.wait()
+                    else:
+                        wait = self._origin + self._wake_tick * self.tick - time.monotonic()
+                        if wait > 0:
+                            self._cond.wait(wait)
+                    self._wake_tick = None
+                    self.wakeups += 1
+                    continue
+            for handle in due:
+                self._fire(handle)
+
+    def _fire(self, handle: TimerHandle):
+        if handle.cancelled:
+            return
+        self.fired += 1
+        try:
+            handle.callback(*handle.args)
+        except Exception as e:
+            self.errors += 1
+            if self.logger:
+                self.logger.error(f"Timer callback {getattr(handle.callback, '__name__', handle.callback)} failed: {e}")
+        if handle.interval is not None:
+            with self._cond:
+                if handle.cancelled:
+                    return
+                # Giữ nhịp theo hạn trước (không trôi); chậm quá một chu kỳ thì tính từ bây giờ
+                now = time.monotonic()
+                handle.deadline = max(handle.deadline + handle.interval, now)
+                handle._tick = self._tick_of(handle.deadline)
+                handle._order = next(self._order)
+                self._insert(handle)
+                self.scheduled += 1
+        else:
+            handle.cancelled = True
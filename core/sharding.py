@@ -0,0 +1,273 @@
+"""
+Module nhận đa tiến trình - N worker cùng bind port nhận (SO_REUSEPORT)
+
+Kernel chia gói theo địa chỉ nguồn -> mảnh của 1 tin luôn đến cùng worker.
+Worker: nhận, giới hạn mảnh theo IP nguồn, ghép mảnh, giải mã, bỏ tin của mình / tin riêng gửi người khác / tin trùng,
+rồi gửi bản ghi (tuple các field) theo lô về tiến trình chính qua pipe.
+Tiến trình chính vẫn xử lý ACK, lọc nhóm và chống trùng lần cuối (giữa các worker).
+Số liệu của worker (gói/byte nhận, tin bị lọc) gửi về mỗi giây và được cộng vào chỉ số
+của tiến trình chính.
+"""
+import multiprocessing
+import selectors
+import socket
+import time
+from multiprocessing.connection import wait
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from .message import Message, MessageType
+from .dedup import DedupCache
+from .fragment import Reassembler, is_fragment
+from .ratelimit import RateLimiter
+from .batching import unbatch
+from .codec import decode_message
+from .transport import open_unicast_socket, set_recv_buffer
+from utils.logger import Logger
+
+# Thứ tự field trong bản ghi (msg_type gửi dạng chuỗi)
+RECORD_FIELDS = (
+    'msg_type', 'sender_id', 'sender_name', 'sender_port', 'content', 'timestamp', 'msg_id',
+    'target_id', 'group_id', 'group_members', 'seq', 'epoch', 'seq_base', 'via',
+    'ttl', 'sender_host',
+)
+
+_READY = "ready"
+_ERROR = "error"
+_RECORDS = "records"
+_STATS = "stats"
+
+
+def to_record(message: Message) -> tuple:
+    """Message -> tuple gọn để pickle qua pipe (giải mã content ở worker)"""
+    return (message.msg_type.value,) + tuple(getattr(message, name) for name in RECORD_FIELDS[1:])
+
+
+def from_record(record: tuple) -> Message:
+    return Message(MessageType(record[0]), *record[1:])
+
+
+class _Shard:
+    """Phần xử lý chạy trong worker: giới hạn mảnh, ghép mảnh, giải mã, lọc"""
+
+    RECV_BATCH = 64
+    STATS_INTERVAL = 1.0
+
+    def __init__(self, user_id: str, dedup_window: float, dedup_capacity: int,
+                 fragment_limit: Optional[Tuple[float, float]] = None):
+        self.user_id = user_id
+        self.dedup = DedupCache(dedup_window, dedup_capacity)
+        self.reassembler = Reassembler()
+        # Kernel chia gói theo địa chỉ nguồn -> bucket mảnh của 1 IP chỉ nằm ở 1 worker;
+        # tin đã ghép vẫn qua RateLimiter đầy đủ ở tiến trình chính
+        self.rate_limiter: Optional[RateLimiter] = None
+        if fragment_limit is not None:
+            self.rate_limiter = RateLimiter({}, quarantine_time=0, fragment_limit=fragment_limit)
+        self.counts = {'datagrams': 0, 'bytes': 0, 'forwarded': 0, 'own': 0, 'duplicate': 0,
+                       'foreign': 0, 'rate_limited': 0, 'errors': 0}
+        # Byte tin đã giải mã (sau ghép mảnh) theo loại tin - như lanchat_received_bytes_total
+        self.received_bytes: Dict[str, int] = {}
+
+    def handle(self, data, records: List[tuple], host: Optional[str] = None):
+        self.counts['datagrams'] += 1
+        self.counts['bytes'] += len(data)
+        try:
+            for datagram in unbatch(data):
+                if is_fragment(datagram):
+                    if self.rate_limiter and not self.rate_limiter.allow_fragment(host):
+                        self.counts['rate_limited'] += 1
+                        continue
+                    datagram = self.reassembler.add(datagram, host)
+                    if datagram is None:
+                        continue
+                message = decode_message(datagram)
+                message.sender_host = host
+                msg_type = message.msg_type.value
+                self.received_bytes[msg_type] = self.received_bytes.get(msg_type, 0) + len(datagram)
+                if message.sender_id == self.user_id:
+                    self.counts['own'] += 1
+                    continue
+                # ACK và gói có seq luôn về tiến trình chính (reliability ACK trước khi lọc)
+                if message.msg_type != MessageType.ACK and message.seq is None:
+                    if (message.msg_type == MessageType.PRIVATE_MESSAGE
+                            and message.target_id not in (None, self.user_id)):
+                        self.counts['foreign'] += 1
+                        continue
+                    if self.dedup.check_and_add(message.sender_id, message.msg_id):
+                        self.counts['duplicate'] += 1
+                        continue
+                records.append(to_record(message))
+                self.counts['forwarded'] += 1
+        except Exception:
+            self.counts['errors'] += 1
+
+
+def _worker_main(port: int, user_id: str, recv_buffer: Optional[int], conn, stop,
+                 dedup_window: float, dedup_capacity: int, buffer_size: int, host: str = "",
+                 fragment_limit: Optional[Tuple[float, float]] = None):
+    """
+    Vòng lặp của 1 worker (tiến trình con)
+    stop: đầu đọc của pipe dừng - tiến trình chính đóng đầu ghi (hoặc thoát) thì pipe
+    đọc được (EOF) và select thức dậy; ngoài ra chỉ thức dậy khi có gói hoặc đến lúc gửi số liệu
+    """
+    try:
+        sock = open_unicast_socket(port, host)
+        if recv_buffer:
+            set_recv_buffer(sock, recv_buffer)
+        sock.setblocking(False)
+    except OSError as e:
+        conn.send((_ERROR, str(e)))
+        return
+    conn.send((_READY, multiprocessing.current_process().pid))
+
+    shard = _Shard(user_id, dedup_window, dedup_capacity, fragment_limit)
+    selector = selectors.DefaultSelector()
+    selector.register(sock, selectors.EVENT_READ)
+    selector.register(stop, selectors.EVENT_READ)
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    next_stats = time.monotonic() + shard.STATS_INTERVAL
+
+    try:
+        while True:
+            records: List[tuple] = []
+            timeout = max(0.0, next_stats - time.monotonic())
+            ready = [key.fileobj for key, _ in selector.select(timeout)]
+            if stop in ready:
+                break
+            if ready:
+                for _ in range(shard.RECV_BATCH):
+                    try:
+                        size, addr = sock.recvfrom_into(buffer)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    shard.handle(view[:size], records, addr[0])
+            if records:
+                conn.send((_RECORDS, records))
+            now = time.monotonic()
+            if now >= next_stats:
+                next_stats = now + shard.STATS_INTERVAL
+                shard.dedup.expire()
+                shard.reassembler.expire()
+                conn.send((_STATS, (dict(shard.counts), dict(shard.received_bytes))))
+    except (BrokenPipeError, EOFError, OSError):
+        pass  # Tiến trình chính đã thoát
+    finally:
+        selector.close()
+        sock.close()
+
+
+class ReceiveWorkerPool:
+    """
+    Quản lý các worker nhận trong tiến trình chính
+    - start(): khởi động worker (spawn - an toàn khi tiến trình chính đã có thread)
+    - receive(timeout): các Message đã giải mã từ mọi worker
+    - on_stats(counts, received_bytes): phần tăng số liệu của 1 worker từ lần báo trước
+      (gọi trên thread đang chạy receive)
+    """
+
+    START_TIMEOUT = 10.0
+
+    def __init__(self, port: int, user_id: str, workers: int, logger: Logger,
+                 recv_buffer: Optional[int] = None, dedup_window: float = 120.0,
+                 dedup_capacity: int = 10000, buffer_size: int = 65535, host: str = "",
+                 fragment_limit: Optional[Tuple[float, float]] = None,
+                 on_stats: Optional[Callable[[Dict[str, int], Dict[str, int]], None]] = None):
+        self.port = port
+        self.host = host  # Địa chỉ bind ("" = mọi interface)
+        self.user_id = user_id
+        self.workers = workers
+        self.logger = logger
+        self._args = (recv_buffer, dedup_window, dedup_capacity, buffer_size)
+        self.fragment_limit = fragment_limit  # Mảnh/giây, burst cho mỗi IP nguồn (None = không giới hạn)
+
+        self._context = multiprocessing.get_context("spawn")
+        self._stop = self._context.Event()
+        self._stop_writer = None  # Đóng để báo worker dừng (đầu đọc nằm ở worker)
+        self._processes: List[multiprocessing.Process] = []
+        self._readers = []
+        self._pids = {}  # reader -> pid worker
+        self._stats: Dict[int, Dict[str, int]] = {}
+        self._received_bytes: Dict[int, Dict[str, int]] = {}  # pid -> byte theo loại tin
+        self.on_stats = on_stats
+
+    def start(self):
+        """Khởi động worker; raise OSError nếu không bind được port"""
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise OSError("SO_REUSEPORT not supported on this platform")
+        recv_buffer, dedup_window, dedup_capacity, buffer_size = self._args
+        stop_reader, self._stop_writer = self._context.Pipe(duplex=False)
+        for _ in range(self.workers):
+            reader, writer = self._context.Pipe(duplex=False)
+            process = self._context.Process(
+                target=_worker_main, daemon=True,
+                args=(self.port, self.user_id, recv_buffer, writer, stop_reader,
+                      dedup_window, dedup_capacity, buffer_size, self.host, self.fragment_limit)
+            )
+            process.start()
+            writer.close()
+            self._processes.append(process)
+            self._readers.append(reader)
+        stop_reader.close()
+
+        for reader in self._readers:
+            if not reader.poll(self.START_TIMEOUT):
+                self.stop()
+                raise OSError("Receive worker did not start")
+            kind, value = reader.recv()
+            if kind == _ERROR:
+                self.stop()
+                raise OSError(f"Receive worker failed: {value}")
+            self._pids[reader] = value
+            self._stats[value] = {}
+        self.logger.info(f"{self.workers} receive workers on port {self.port}")
+
+    def stop(self):
+        self._stop.set()
+        if self._stop_writer is not None:
+            self._stop_writer.close()
+            self._stop_writer = None
+        for process in self._processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        for reader in self._readers:
+            reader.close()
+        self._processes.clear()
+        self._readers.clear()
+        self._pids.clear()
+
+    def receive(self, timeout: Optional[float] = None) -> Iterator[Message]:
+        """
+        Các Message worker gửi về (chờ tối đa timeout giây, None = đến khi có dữ liệu)
+        Worker gửi số liệu mỗi giây và đóng pipe khi dừng nên không chờ mãi
+        """
+        if not self._readers:
+            self._stop.wait(timeout)  # Mọi worker đã chết: chờ đến khi dừng
+            return
+        for reader in wait(self._readers, timeout):
+            try:
+                kind, value = reader.recv()
+            except (EOFError, OSError):
+                # Worker đã chết -> bỏ pipe của nó
+                self._readers.remove(reader)
+                if not self._stop.is_set():
+                    self.logger.error("Receive worker exited")
+                continue
+            if kind == _RECORDS:
+                for record in value:
+                    yield from_record(record)
+            elif kind == _STATS:
+                self._report(self._pids[reader], *value)
+
+    def _report(self, pid: int, counts: Dict[str, int], received_bytes: Dict[str, int]):
+        """Lưu số liệu (cộng dồn) của worker, báo phần tăng cho on_stats"""
+        previous = self._stats.get(pid, {})
+        previous_bytes = self._received_bytes.get(pid, {})
+        self._stats[pid] = counts
+        self._received_bytes[pid] = received_bytes
+        if self.on_stats:
+            self.on_stats({k: v - previous.get(k, 0) for k, v in counts.items()},
+                          {k: v - previous_bytes.get(k, 0) for k, v in received_bytes.items()})
+
+    def stats(self) -> Dict[int, Dict[str, int]]:
+        """Số gói/byte nhận, tin chuyển về / bị lọc theo pid worker (cập nhật mỗi giây)"""
+        return {pid: dict(counts) for pid, counts in self._stats.items()}
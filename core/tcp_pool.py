@@ -0,0 +1,457 @@
+"""
+Module TCP pool - Kết nối TCP giữ lâu dài đến từng peer cho tin riêng/nhóm
+
+Listener TCP dùng cùng số port với UDP của node. Mỗi chiều gửi dùng kết nối
+riêng của bên gửi (outbound); kết nối nhận (inbound) chỉ đọc.
+Khung tin (network byte order):
+    length(4) datagram    (datagram = tin đã mã hóa như khi gửi UDP, không phân mảnh)
+send() chỉ xếp khung vào hàng của kết nối; connect và ghi không chặn đều chạy trên
+thread selector của pool - một peer chậm/chết không giữ thread gửi của node.
+"""
+import errno
+import selectors
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Set, Tuple
+from .addressing import Endpoint
+from utils.logger import Logger
+
+CAP_TCP = "tcp1"
+
+MAX_FRAME = 16 * 1024 * 1024
+
+_LENGTH = struct.Struct("!I")
+
+
+@dataclass(eq=False)
+class _Outbound:
+    sock: socket.socket
+    endpoint: Endpoint
+    connected: bool = False
+    # (khung, datagram, fallback) chờ ghi; offset = số byte của khung đầu đã ghi
+    frames: deque = field(default_factory=deque)
+    offset: int = 0
+    queued: int = 0  # Số byte chờ ghi
+    last_used: float = field(default_factory=time.monotonic)
+    # Hạn connect / hạn ghi tiếp được (không tiến triển quá hạn -> bỏ kết nối)
+    deadline: Optional[float] = None
+    registered: bool = False
+    closed: bool = False
+
+
+@dataclass
+class _Inbound:
+    sock: socket.socket
+    addr: Tuple
+    buffer: bytearray = field(default_factory=bytearray)
+    last_active: float = field(default_factory=time.monotonic)
+
+
+class TcpConnectionPool:
+    """
+    Pool kết nối TCP theo endpoint (host, port) của peer
+    - Tối đa `max_connections` kết nối mỗi chiều; vượt thì đóng kết nối dùng lâu nhất (LRU)
+    - Kết nối không dùng `idle_timeout` giây bị đóng
+    - send() không chặn; trả False khi phải gửi qua UDP ngay (peer vừa lỗi, hàng đầy).
+      Khung đã nhận mà kết nối lỗi trước khi ghi xong -> fallback(datagram, endpoint)
+      trên thread của pool
+    - Peer vừa kết nối lỗi được bỏ qua trong RETRY_AFTER giây
+    """
+
+    CONNECT_TIMEOUT = 1.0
+    IO_TIMEOUT = 5.0
+    RETRY_AFTER = 10.0
+    RECV_SIZE = 256 * 1024
+    MAX_QUEUED = 4 * 1024 * 1024  # Byte chờ ghi tối đa mỗi kết nối (vượt -> UDP)
+
+    def __init__(self, port: int, logger: Logger,
+                 on_frame: Callable[[bytes, Tuple], None],
+                 max_connections: int = 64, idle_timeout: float = 60.0,
+                 host: str = ""):
+        self.port = port
+        self.logger = logger
+        self.on_frame = on_frame
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        # IP bind listener và kết nối đi ("" = mọi interface) - peer thấy đúng host của mình
+        self.host = host
+
+        self._outbound: "OrderedDict[Endpoint, _Outbound]" = OrderedDict()
+        self._changed: Set[_Outbound] = set()  # Kết nối mới / vừa có khung: thread pool theo dõi ghi
+        self._retry_at: Dict[Endpoint, float] = {}
+        self._lock = threading.Lock()
+        self._inbound: Dict[socket.socket, _Inbound] = {}
+        self._listener: Optional[socket.socket] = None
+        self._selector: Optional[selectors.BaseSelector] = None
+        # Đánh thức thread của pool khi dừng / có khung mới (select không cần polling)
+        self._waker: Optional[socket.socket] = None
+        self._wakeup: Optional[socket.socket] = None
+        self.running = False
+
+        # Counters
+        self.connects = 0
+        self.connect_failures = 0
+        self.send_failures = 0
+        self.evicted = 0
+        self.idle_closed = 0
+        self.frames_sent = 0
+        self.frames_received = 0
+
+    def start(self):
+        """Mở listener; raise OSError nếu port TCP đã bị dùng"""
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._listener.bind((self.host, self.port))
+            self._listener.listen(32)
+            self._listener.setblocking(False)
+        except OSError:
+            self._listener.close()
+            self._listener = None
+            raise
+        self._waker, self._wakeup = socket.socketpair()
+        self._waker.setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._listener, selectors.EVENT_READ)
+        self._selector.register(self._waker, selectors.EVENT_READ)
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        """Dừng; kết nối đóng trên thread của pool"""
+        self.running = False
+        self._wake()
+
+    def _wake(self):
+        try:
+            if self._wakeup:
+                self._wakeup.send(b"\0")
+        except OSError:
+            pass  # Thread đã dừng / buffer đầy (đã có tín hiệu chờ đọc)
+
+    def send(self, endpoint: Endpoint, data: bytes,
+             fallback: Optional[Callable[[bytes, Endpoint], None]] = None) -> bool:
+        """
+        Xếp 1 khung gửi đến peer (không chặn); False nếu phải dùng đường UDP ngay
+        Kết nối lỗi / quá hạn trước khi khung ghi xong -> fallback(data, endpoint)
+        """
+        if not self.running or len(data) > MAX_FRAME:
+            return False
+        frame = memoryview(_LENGTH.pack(len(data)) + data)
+        now = time.monotonic()
+        with self._lock:
+            conn = self._outbound.get(endpoint)
+            if conn is None:
+                if self._retry_at.get(endpoint, 0.0) > now:
+                    return False
+                conn = self._open(endpoint, now)
+                if conn is None:
+                    return False
+            else:
+                self._outbound.move_to_end(endpoint)
+                if conn.queued + len(frame) > self.MAX_QUEUED:
+                    self.send_failures += 1
+                    return False
+            wake = not conn.frames
+            if wake and conn.connected:
+                conn.deadline = now + self.IO_TIMEOUT
+            conn.frames.append((frame, data, fallback))
+            conn.queued += len(frame)
+            conn.last_used = now
+            if wake:
+                self._changed.add(conn)
+        if wake:
+            self._wake()  # Đang có khung chờ thì thread pool vẫn theo dõi ghi, không cần đánh thức
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            queued = sum(c.queued for c in self._outbound.values())
+        return {
+            'outbound': len(self._outbound),
+            'inbound': len(self._inbound),
+            'queued_bytes': queued,
+            'connects': self.connects,
+            'connect_failures': self.connect_failures,
+            'send_failures': self.send_failures,
+            'evicted': self.evicted,
+            'idle_closed': self.idle_closed,
+            'frames_sent': self.frames_sent,
+            'frames_received': self.frames_received,
+        }
+
+    # === OUTBOUND (thread của pool, trừ _open) ===
+
+    def _open(self, endpoint: Endpoint, now: float) -> Optional[_Outbound]:
+        """Bắt đầu connect không chặn (gọi khi giữ _lock); None nếu lỗi ngay"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            if self.host:
+                sock.bind((self.host, 0))
+            error = sock.connect_ex(endpoint)
+        except OSError as e:
+            error = e.errno or errno.EINVAL
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            self._close(sock)
+            self.connect_failures += 1
+            self._retry_at[endpoint] = now + self.RETRY_AFTER
+            self.logger.debug(f"TCP connect to {endpoint} failed: {errno.errorcode.get(error, error)}")
+            return None
+        conn = self._outbound[endpoint] = _Outbound(sock, endpoint,
+                                                    deadline=now + self.CONNECT_TIMEOUT)
+        self._changed.add(conn)
+        return conn
+
+    def _sync_outbound(self) -> bool:
+        """
+        Đóng kết nối vượt giới hạn (LRU), theo dõi ghi cho kết nối mới / vừa có khung
+        Trả về True nếu có thay đổi (hạn connect/ghi mới -> tính lại lần dọn kế tiếp)
+        """
+        with self._lock:
+            evicted = []
+            while len(self._outbound) > self.max_connections:
+                _, old = self._outbound.popitem(last=False)
+                evicted.append(old)
+                self.evicted += 1
+            changed = list(self._changed)
+            self._changed.clear()
+        for conn in evicted:
+            self._close_outbound(conn, "evicted")
+        for conn in changed:
+            if not conn.closed:
+                self._watch(conn)
+        return bool(evicted or changed)
+
+    def _watch(self, conn: _Outbound):
+        """
+        Đang connect / có khung chờ: chờ ghi được. Kết nối rảnh: chờ đọc -
+        outbound không bao giờ nhận dữ liệu, đọc được nghĩa là peer đã đóng (FIN/RST)
+        """
+        with self._lock:
+            writing = not conn.connected or bool(conn.frames)
+        events = selectors.EVENT_WRITE if writing else 0
+        if conn.connected:
+            events |= selectors.EVENT_READ
+        if conn.registered:
+            self._selector.modify(conn.sock, events, conn)
+        else:
+            self._selector.register(conn.sock, events, conn)
+            conn.registered = True
+
+    def _service(self, conn: _Outbound, events: int):
+        if conn.closed:
+            return
+        if conn.connected and events & selectors.EVENT_READ:
+            self._close_outbound(conn, "closed by peer")
+            return
+        if not events & selectors.EVENT_WRITE:
+            return
+        if not conn.connected:
+            error = conn.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error:
+                self._close_outbound(conn, errno.errorcode.get(error, str(error)), connect_failed=True)
+                return
+            conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.connects += 1
+            with self._lock:
+                conn.connected = True
+                self._retry_at.pop(conn.endpoint, None)
+        self._flush(conn)
+
+    def _flush(self, conn: _Outbound):
+        """Ghi các khung đang chờ đến khi hết hoặc socket đầy"""
+        while True:
+            with self._lock:
+                if not conn.frames:
+                    conn.deadline = None
+                    break
+                frame = conn.frames[0][0]
+            try:
+                sent = conn.sock.send(frame[conn.offset:])
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                self._close_outbound(conn, str(e))
+                return
+            conn.offset += sent
+            with self._lock:
+                conn.deadline = time.monotonic() + self.IO_TIMEOUT
+                if conn.offset == len(frame):
+                    conn.frames.popleft()
+                    conn.queued -= len(frame)
+                    conn.offset = 0
+                    self.frames_sent += 1
+        self._watch(conn)
+
+    def _close_outbound(self, conn: _Outbound, reason: str, connect_failed: bool = False):
+        """Đóng kết nối đi; khung chưa ghi xong chuyển sang fallback (UDP)"""
+        with self._lock:
+            if self._outbound.get(conn.endpoint) is conn:
+                del self._outbound[conn.endpoint]
+            conn.closed = True
+            frames = list(conn.frames)
+            conn.frames.clear()
+            conn.queued = 0
+            if connect_failed:
+                self.connect_failures += 1
+                self._retry_at[conn.endpoint] = time.monotonic() + self.RETRY_AFTER
+            self.send_failures += len(frames)
+        if conn.registered:
+            try:
+                self._selector.unregister(conn.sock)
+            except (KeyError, ValueError):
+                pass
+        self._close(conn.sock)
+        if frames:
+            self.logger.debug(f"TCP to {conn.endpoint} {reason}, {len(frames)} frames via UDP")
+        for _, data, fallback in frames:
+            if fallback:
+                try:
+                    fallback(data, conn.endpoint)
+                except Exception as e:
+                    self.logger.debug(f"Fallback send to {conn.endpoint} failed: {e}")
+
+    def _close(self, sock: socket.socket):
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+    def _run(self):
+        """
+        Nhận kết nối, đọc khung inbound, connect và ghi khung outbound (1 thread)
+        Chỉ thức dậy khi socket sẵn sàng, khi dừng / có khung mới (waker) hoặc khi
+        đến hạn sớm nhất (connect, ghi, đóng kết nối không dùng) - không polling
+        """
+        sweep_at = None
+        try:
+            while self.running:
+                timeout = None if sweep_at is None else max(0.0, sweep_at - time.monotonic())
+                changed = False
+                for key, events in self._selector.select(timeout):
+                    if key.fileobj is self._waker:
+                        self._drain_waker()
+                    elif key.fileobj is self._listener:
+                        self._accept()
+                        changed = True
+                    elif key.data is not None:
+                        self._service(key.data, events)
+                        changed = True  # Hạn connect/ghi của kết nối đi đã đổi
+                    else:
+                        self._read(self._inbound.get(key.fileobj))
+                changed |= self._sync_outbound()
+                now = time.monotonic()
+                if sweep_at is not None and now >= sweep_at:
+                    self._close_idle(now)
+                    changed = True
+                if changed:
+                    sweep_at = self._next_sweep()
+        finally:
+            with self._lock:
+                outbound = list(self._outbound.values())
+            for conn in outbound:
+                self._close_outbound(conn, "stopped")
+            for inbound in list(self._inbound.values()):
+                self._close_inbound(inbound)
+            self._selector.close()
+            for sock in (self._listener, self._waker, self._wakeup):
+                self._close(sock)
+
+    def _drain_waker(self):
+        try:
+            while self._waker.recv(64):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def _next_sweep(self) -> Optional[float]:
+        """Thời điểm sớm nhất có kết nối hết hạn: connect, ghi, không dùng (None = không có kết nối)"""
+        deadlines = [c.last_active + 2 * self.idle_timeout for c in self._inbound.values()]
+        with self._lock:
+            for c in self._outbound.values():
+                deadlines.append(c.deadline if c.deadline is not None
+                                 else c.last_used + self.idle_timeout)
+        return min(deadlines, default=None)
+
+    def _accept(self):
+        try:
+            sock, addr = self._listener.accept()
+        except OSError:
+            return
+        if len(self._inbound) >= self.max_connections:
+            oldest = min(self._inbound.values(), key=lambda c: c.last_active)
+            self._close_inbound(oldest)
+            self.evicted += 1
+        sock.setblocking(False)
+        self._inbound[sock] = _Inbound(sock, addr)
+        self._selector.register(sock, selectors.EVENT_READ)
+
+    def _read(self, inbound: Optional[_Inbound]):
+        if inbound is None:
+            return
+        try:
+            data = inbound.sock.recv(self.RECV_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._close_inbound(inbound)
+            return
+        inbound.last_active = time.monotonic()
+
+        buffer = inbound.buffer
+        buffer += data
+        offset, end = 0, len(buffer)
+        while end - offset >= _LENGTH.size:
+            (length,) = _LENGTH.unpack_from(buffer, offset)
+            if length > MAX_FRAME:
+                self.logger.warning(f"Oversized TCP frame from {inbound.addr}, closing")
+                self._close_inbound(inbound)
+                return
+            if end - offset - _LENGTH.size < length:
+                break
+            start = offset + _LENGTH.size
+            frame = bytes(buffer[start:start + length])
+            offset = start + length
+            self.frames_received += 1
+            try:
+                self.on_frame(frame, inbound.addr)
+            except Exception as e:
+                self.logger.debug(f"TCP frame from {inbound.addr} dropped: {e}")
+        del buffer[:offset]
+
+    def _close_inbound(self, inbound: _Inbound):
+        self._inbound.pop(inbound.sock, None)
+        try:
+            self._selector.unregister(inbound.sock)
+        except (KeyError, ValueError):
+            pass
+        self._close(inbound.sock)
+
+    def _close_idle(self, now: float):
+        # Bên gửi đóng trước; bên nhận chờ gấp đôi để không đóng giữa lúc peer đang gửi
+        inbound_deadline = now - 2 * self.idle_timeout
+        for inbound in [c for c in self._inbound.values() if c.last_active < inbound_deadline]:
+            self._close_inbound(inbound)
+            self.idle_closed += 1
+
+        deadline = now - self.idle_timeout
+        expired, idle = [], []
+        with self._lock:
+            for conn in self._outbound.values():
+                if conn.deadline is not None:
+                    if conn.deadline < now:
+                        expired.append(conn)  # Connect / ghi không tiến triển
+                elif conn.last_used < deadline:
+                    idle.append(conn)
+        for conn in expired:
+            self._close_outbound(conn, "timed out", connect_failed=not conn.connected)
+        for conn in idle:
+            self._close_outbound(conn, "idle")
+            self.idle_closed += 1
@@ -0,0 +1,94 @@
+"""
+Module truyền broadcast - IP multicast (1 lần gửi cho mọi node) hoặc quét dải port
+"""
+import socket
+from dataclasses import dataclass
+from typing import Optional
+
+BROADCAST_MULTICAST = "multicast"
+BROADCAST_SWEEP = "sweep"    # Cách cũ: unicast đến từng port 5000-5009
+
+# Peer nghe multicast -> không cần gửi unicast broadcast riêng cho nó
+CAP_MULTICAST = "mc1"
+
+
+@dataclass
+class MulticastConfig:
+    """Cấu hình nhóm multicast (mặc định chạy trên loopback)"""
+    group: str = "239.255.42.99"  # Dải administratively scoped
+    port: int = 5100              # Nằm ngoài dải port của node
+    ttl: int = 1                  # 1 = không ra khỏi mạng LAN
+    interface: str = "127.0.0.1"  # IP của interface gửi/nhận
+
+    @property
+    def address(self):
+        return (self.group, self.port)
+
+
+def open_unicast_socket(port: int, host: str = "") -> socket.socket:
+    """
+    Socket nhận unicast; SO_REUSEPORT cho phép nhiều socket (worker) cùng bind 1 port
+    host: IP bind ("" = mọi interface); nhiều node cùng port trên 127.0.0.2, 127.0.0.3...
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        except (AttributeError, OSError):
+            pass
+        sock.bind((host, port))
+        return sock
+    except Exception:
+        sock.close()
+        raise
+
+
+def outgoing_address(target: str) -> Optional[str]:
+    """IP nguồn hệ điều hành chọn khi gửi đến target (connect UDP không gửi gói nào); None = không có đường"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.connect((target, 9))
+        return sock.getsockname()[0]
+    except OSError:
+        return None
+    finally:
+        sock.close()
+
+
+def set_recv_buffer(sock: socket.socket, size: int) -> int:
+    """Đặt SO_RCVBUF, trả về giá trị thực (Linux nhân đôi và giới hạn theo net.core.rmem_max)"""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+    return sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
+
+def open_multicast_socket(config: MulticastConfig) -> socket.socket:
+    """Tạo socket nhận multicast (nhiều node cùng máy dùng chung port)"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        except (AttributeError, OSError):
+            pass
+        try:
+            # Linux: bind vào địa chỉ nhóm để không nhận unicast lạc vào port này
+            sock.bind(config.address)
+        except OSError:
+            # Windows không cho bind địa chỉ multicast
+            sock.bind(("", config.port))
+
+        membership = socket.inet_aton(config.group) + socket.inet_aton(config.interface)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        return sock
+    except Exception:
+        sock.close()
+        raise
+
+
+def configure_multicast_sender(sock: socket.socket, config: MulticastConfig):
+    """Cho phép socket gửi vào nhóm multicast qua interface đã chọn"""
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(config.interface))
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, config.ttl)
+    # Các node khác trên cùng máy cũng phải nhận được
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
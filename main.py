@@ -2,28 +2,59 @@
 Main application - Sửa lỗi tạo nhóm
 """
 import sys
+import time
 import argparse
-from core import NetworkManager, DeviceDiscovery, GroupManager
+from core import NetworkManager, AsyncNetworkManager, DeviceDiscovery, GroupManager, FileTransferManager
+from core.addressing import node_id
+from core.codec import COMPRESS_THRESHOLD
+from core.group import MAX_TREE_TTL, TREE_FANOUT, TREE_BACKUP, TREE_THRESHOLD
+from core.ratelimit import DEFAULT_RATE_LIMITS, parse_rate_limit
 from core.message import Message, MessageType
-from ui import ChatGUI
+from core.transport import BROADCAST_MULTICAST, BROADCAST_SWEEP, MulticastConfig
 from utils import Logger
+from utils.metrics import MetricsRegistry, MetricsServer
+from utils.profiling import Profiler, parse_modes
 
 
 class ChatApplication:
     """Ứng dụng chat chính"""
 
-    def __init__(self, user_name: str, port: int):
+    def __init__(self, user_name: str, port: int, use_asyncio: bool = False,
+                 network_options: dict = None, group_options: dict = None,
+                 headless: bool = False, control_path: str = None, profile_modes: tuple = None):
         self.user_name = user_name
         self.port = port
+        # --host: nhiều node cùng port trên các địa chỉ khác nhau -> tên log/profile cũng khác
+        host = (network_options or {}).get('host')
+        name = node_id(user_name, port, host)
 
-        self.logger = Logger(f"{user_name}_{port}")
+        self.logger = Logger(name)
         self.logger.on_error = self._on_error
+        # Bật từ đầu nếu có --profile; SIGUSR1 / lệnh profile bật/tắt khi đang chạy
+        self.profiler = Profiler(name, self.logger)
+        self.profile_modes = profile_modes
 
-        self.network = NetworkManager(port, user_name, self.logger)
+        network_cls = AsyncNetworkManager if use_asyncio else NetworkManager
+        self.network = network_cls(port, user_name, self.logger, **(network_options or {}))
         self.discovery = DeviceDiscovery(self.network, self.logger)
-        self.groups = GroupManager(self.network, self.logger)
-
-        self.gui = ChatGUI(user_name, port)
+        self.groups = GroupManager(self.network, self.logger, **(group_options or {}))
+        self.files = FileTransferManager(self.network, self.logger)
+
+        # Độ trễ từ timestamp của người gửi đến lúc tin được hiển thị
+        latency = self.network.metrics.histogram(
+            "lanchat_delivery_latency_seconds",
+            "Sender timestamp to message displayed (depends on both hosts' clocks)", ["type"])
+        self._m_latency = {t: latency.labels(t.value) for t in
+                           (MessageType.TEXT, MessageType.PRIVATE_MESSAGE, MessageType.GROUP_MESSAGE)}
+
+        # Import tại đây: relay/headless chạy không cần tkinter
+        if headless:
+            from ui.headless import HeadlessUI
+            self.gui = HeadlessUI(user_name, port, control_path, host=host)
+            self.gui.on_profile = self._profile
+        else:
+            from ui import ChatGUI
+            self.gui = ChatGUI(user_name, port, host=host, logger=self.logger)
 
         self._setup_callbacks()
 
@@ -35,13 +66,22 @@ class ChatApplication:
         self.gui.on_send_group = self._send_group
         self.gui.on_create_group = self._create_group
         self.gui.on_scan_devices = self._scan_devices
+        self.gui.on_send_file = self._send_file
+        self.gui.on_file_response = self.files.respond
         self.gui.on_close = self._on_close
 
         # Core -> GUI
         self.network.on_message_received = self._on_message_received
         self.network.on_error = self._on_error
+        # Tin nhóm mình không tham gia bị bỏ ngay sau khi đọc header
+        self.network.accept_group = self.groups.accepts_group
+
+        self.files.on_offer = lambda o: self.gui.schedule(self.gui.show_file_offer, o)
+        self.files.on_progress = lambda p: self.gui.schedule(self.gui.update_transfer, p)
 
-        self.discovery.on_devices_updated = lambda d: self.gui.schedule(self.gui.update_devices, d)
+        # Core chỉ gửi phần thay đổi; giao diện sửa đúng các dòng bị ảnh hưởng
+        self.discovery.on_devices_delta = lambda d: self.gui.schedule(self.gui.apply_devices_delta, d)
+        self.groups.on_groups_delta = lambda d: self.gui.schedule(self.gui.apply_groups_delta, d)
         self.discovery.on_device_found = lambda d: self._on_device_found(d)
         self.discovery.on_device_lost = lambda d: self.gui.schedule(
             self.gui.display_system_message, f"🔴 {d.name} đã offline", "broadcast"
@@ -55,18 +95,24 @@ class ChatApplication:
             "broadcast"
         )
 
-        # Cập nhật port của thiết bị trong các nhóm
-        self.groups.update_member_port(device.device_id, device.port, device.name)
+        # Cập nhật endpoint của thiết bị trong các nhóm
+        self.groups.update_member_port(device.device_id, device.endpoint, device.name)
 
     def start(self):
         """Khởi động ứng dụng"""
-        self.logger.info(f"Starting {self.user_name} on port {self.port}")
+        self.logger.info(f"Starting {self.user_name} on {self.network.endpoint}")
+
+        # Trước khi các thread mạng chạy để cProfile gắn được vào chúng
+        self.profiler.install_signal()
+        if self.profile_modes:
+            self.profiler.start(self.profile_modes)
 
         if not self.network.start():
             return False
 
         self.discovery.start()
-        self.gui.set_status(f"✅ Sẵn sàng - Port {self.port}")
+        self.files.start()
+        self.gui.set_status(f"✅ Sẵn sàng - {self.network.endpoint}")
         self.gui.run()
 
         return True
@@ -79,14 +125,38 @@ class ChatApplication:
         """Gửi broadcast"""
         self.network.broadcast_message(content, MessageType.TEXT)
 
-    def _send_private(self, content: str, target_id: str, target_port: int):
-        """Gửi tin nhắn riêng"""
-        self.network.send_private_message(content, target_id, target_port)
+    def _send_private(self, content: str, target_id: str, target=None):
+        """Gửi tin nhắn riêng (target: Endpoint; None = theo sổ địa chỉ)"""
+        self.network.send_private_message(content, target_id, target)
 
     def _send_group(self, content: str, group_id: str):
         """Gửi tin nhắn nhóm"""
         self.groups.send_group_message(group_id, content)
 
+    def _send_file(self, path: str, chat_id: str, chat_type: str, target=None):
+        """Mời nhận file trong chat hiện tại"""
+        group_id = None
+        if chat_type == "private":
+            target = target or self.network.addresses.get(chat_id)
+            ports = [target] if target else []
+        elif chat_type == "group":
+            group = self.groups.get_group(chat_id)
+            if not group:
+                self.gui.show_error("Không tìm thấy nhóm!")
+                return
+            group_id = chat_id
+            ports = group.get_other_ports(self.network.user_id)
+        else:
+            ports = [d.endpoint for d in self.discovery.get_online_devices().values()]
+
+        if not ports:
+            self.gui.show_error("Không có ai để gửi file!")
+            return
+
+        offer = self.files.offer_file(path, ports, group_id)
+        self.gui.track_transfer(offer.transfer_id, chat_id)
+        self.gui.display_system_message(f"📎 Đã mời gửi {offer.name} đến {len(ports)} người", chat_id)
+
     def _create_group(self, name: str, member_ids: list):
         """Tạo nhóm mới"""
         # Lấy thông tin đầy đủ của các thành viên
@@ -95,6 +165,7 @@ class ChatApplication:
             if device_id in member_ids:
                 member_info[device_id] = {
                     'port': device.port,
+                    'host': device.host,
                     'name': device.name
                 }
 
@@ -104,7 +175,6 @@ class ChatApplication:
 
         group = self.groups.create_group(name, member_ids, member_info)
 
-        self.gui.schedule(self.gui.update_groups, self.groups.get_all_groups())
         self.gui.schedule(
             self.gui.display_system_message,
             f"✅ Đã tạo nhóm '{name}' với {len(group.member_ids)} thành viên",
@@ -118,17 +188,20 @@ class ChatApplication:
         if msg_type in [MessageType.DISCOVERY, MessageType.DISCOVERY_RESPONSE]:
             self.discovery.handle_discovery_message(message)
 
+        elif msg_type in (MessageType.FILE_OFFER, MessageType.FILE_ACCEPT):
+            self.files.handle_message(message)
+
         elif msg_type == MessageType.TEXT:
-            self.gui.schedule(self.gui.display_received_message, message)
+            self.gui.schedule(self._display_message, message)
 
         elif msg_type == MessageType.PRIVATE_MESSAGE:
             if message.target_id == self.network.user_id:
-                self.gui.schedule(self.gui.display_received_message, message)
+                self.gui.schedule(self._display_message, message)
 
         elif msg_type == MessageType.GROUP_MESSAGE:
-            # Kiểm tra xem mình có trong nhóm không
-            if self.groups.is_group_message_for_me(message):
-                self.gui.schedule(self.gui.display_received_message, message)
+            # Kiểm tra xem mình có trong nhóm không (tin nhóm lớn được chuyển tiếp tại đây)
+            if self.groups.handle_group_message(message):
+                self.gui.schedule(self._display_message, message)
             else:
                 self.logger.debug(f"Ignored group message for {message.group_id}")
 
@@ -136,27 +209,144 @@ class ChatApplication:
             # Nhận thông báo được thêm vào nhóm
             group = self.groups.handle_group_create(message)
             if group:
-                self.gui.schedule(self.gui.update_groups, self.groups.get_all_groups())
                 self.gui.schedule(
                     self.gui.display_system_message,
                     f"👥 Bạn đã được thêm vào nhóm: {group.name}",
                     "broadcast"
                 )
 
+    def _display_message(self, message: Message):
+        """Hiển thị tin nhận (trên thread giao diện) và ghi độ trễ đầu-cuối"""
+        self.gui.display_received_message(message)
+        self._m_latency[message.msg_type].observe(max(time.time() - message.timestamp, 0.0))
+
     def _on_error(self, error: str):
         """Xử lý lỗi"""
         self.gui.schedule(self.gui.show_error, error)
 
+    def _profile(self, action: str, modes: list = None) -> dict:
+        """Lệnh profile từ chế độ headless: start / stop / dump / status"""
+        path = None
+        if action == "start":
+            self.profiler.start(parse_modes(",".join(modes)) if modes else None)
+        elif action == "stop":
+            path = self.profiler.stop()
+        elif action == "dump":
+            path = self.profiler.dump()
+        elif action != "status":
+            raise ValueError(f"unknown profile action: {action}")
+        return {'active': list(self.profiler.modes), 'path': path}
+
     def _on_close(self):
         """Đóng ứng dụng"""
+        self.profiler.stop()
         self.discovery.stop()
+        self.files.stop()
         self.network.stop()
 
 
+class RelayApplication:
+    """Node relay không giao diện: fan-out tin nhóm thay cho client, quảng bá qua discovery"""
+
+    STATS_INTERVAL = 60.0
+
+    def __init__(self, user_name: str, port: int, network_options: dict = None,
+                 profile_modes: tuple = None):
+        self.user_name = user_name
+        self.port = port
+
+        name = node_id(user_name, port, (network_options or {}).get('host'))
+        self.logger = Logger(name)
+        self.profiler = Profiler(name, self.logger)
+        self.profile_modes = profile_modes
+        self.network = NetworkManager(port, user_name, self.logger, relay=True,
+                                      **(network_options or {}))
+        self.discovery = DeviceDiscovery(self.network, self.logger)
+        self.network.on_message_received = self._on_message_received
+
+    def _on_message_received(self, message: Message):
+        if message.msg_type in [MessageType.DISCOVERY, MessageType.DISCOVERY_RESPONSE]:
+            self.discovery.handle_discovery_message(message)
+
+    def start(self):
+        """Chạy đến khi Ctrl+C"""
+        self.logger.info(f"Starting relay {self.user_name} on {self.network.endpoint}")
+
+        self.profiler.install_signal()
+        if self.profile_modes:
+            self.profiler.start(self.profile_modes)
+
+        if not self.network.start():
+            return False
+
+        self.discovery.start()
+        print(f"Relay đang chạy trên {self.network.endpoint} (Ctrl+C để dừng)")
+        try:
+            while True:
+                time.sleep(self.STATS_INTERVAL)
+                self.logger.info(f"Relay stats: {self.network.relay_stats()}, "
+                                 f"peers: {len(self.discovery.get_online_devices())}")
+        finally:
+            self.profiler.stop()
+            self.discovery.stop()
+            self.network.stop()
+
+        return True
+
+
 def main():
     parser = argparse.ArgumentParser(description='LAN Chat')
     parser.add_argument('-n', '--name', type=str, required=True)
     parser.add_argument('-p', '--port', type=int, default=5000)
+    parser.add_argument('--host', type=str, default=None,
+                        help='IP bind và quảng bá, vd 127.0.0.2 để chạy nhiều node cùng port '
+                             'trên 1 máy (mặc định: mọi interface)')
+    parser.add_argument('--asyncio', action='store_true', help='Dùng NetworkManager asyncio')
+    parser.add_argument('--sweep', action='store_true',
+                        help='Broadcast bằng cách quét port 5000-5009 thay cho multicast')
+    parser.add_argument('--sweep-hosts', type=str, default=None, metavar='IP,IP,...',
+                        help='Các host quét port khi --sweep (mặc định: host của mình)')
+    parser.add_argument('--no-batching', action='store_true',
+                        help='Không gộp nhiều tin vào 1 datagram khi gửi dồn dập')
+    parser.add_argument('--compress-threshold', type=int, default=COMPRESS_THRESHOLD,
+                        help='Nén zlib body từ số byte này trở lên (<= 0: tắt nén)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Số tiến trình nhận song song (SO_REUSEPORT, 0 = nhận trong tiến trình chính)')
+    parser.add_argument('--tcp', action='store_true',
+                        help='Gửi tin riêng/nhóm qua kết nối TCP giữ sẵn (peer hỗ trợ), lỗi thì dùng UDP')
+    parser.add_argument('--relay', action='store_true',
+                        help='Chạy node relay không giao diện (fan-out tin nhóm thay cho client)')
+    parser.add_argument('--headless', action='store_true',
+                        help='Chạy không giao diện, điều khiển bằng lệnh JSON (stdin hoặc --control)')
+    parser.add_argument('--control', type=str, default=None, metavar='PATH',
+                        help='Unix socket nhận lệnh/phát sự kiện khi --headless (mặc định stdin/stdout)')
+    parser.add_argument('--tree-threshold', type=int, default=TREE_THRESHOLD,
+                        help='Nhóm từ số thành viên này trở lên lan truyền tin theo cây')
+    parser.add_argument('--tree-fanout', type=int, default=TREE_FANOUT,
+                        help='Số thành viên mỗi node gửi/chuyển tiếp tin nhóm lớn (>= 2)')
+    parser.add_argument('--tree-ttl', type=int, default=None,
+                        help=f'Số lượt chuyển tiếp tối đa, 0-{MAX_TREE_TTL} '
+                             '(mặc định: theo kích thước nhóm)')
+    parser.add_argument('--tree-backup', type=int, default=TREE_BACKUP,
+                        help='Số anh em mà mỗi node gửi thay cho các con của họ (0 = chỉ theo cây)')
+    parser.add_argument('--no-rate-limit', action='store_true',
+                        help='Không giới hạn số tin nhận từ mỗi người gửi')
+    parser.add_argument('--rate-limit', action='append', default=[], metavar='TYPE=RATE/BURST',
+                        help='Giới hạn theo loại tin, vd text=20/50 hoặc discovery=off (lặp được)')
+    parser.add_argument('--quarantine', type=float, default=NetworkManager.QUARANTINE_TIME,
+                        help='Giây cách ly người gửi flood (0 = chỉ bỏ tin vượt mức)')
+    parser.add_argument('--rcvbuf', type=int, default=NetworkManager.RECV_BUFFER,
+                        help='SO_RCVBUF của socket nhận, byte (<= 0: mặc định hệ điều hành)')
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help='Xuất số liệu Prometheus tại http://127.0.0.1:PORT/metrics (0 = tắt)')
+    parser.add_argument('--profile', type=str, default=None, metavar='MODES',
+                        help='Profiling từ lúc khởi động: all hoặc cprofile,tracemalloc,sampler '
+                             '(SIGUSR1 bật/tắt khi đang chạy, kết quả trong logs/)')
+    parser.add_argument('--mcast-group', type=str, default=MulticastConfig.group)
+    parser.add_argument('--mcast-port', type=int, default=MulticastConfig.port)
+    parser.add_argument('--mcast-ttl', type=int, default=MulticastConfig.ttl)
+    parser.add_argument('--mcast-if', type=str, default=MulticastConfig.interface,
+                        help='IP của interface multicast')
 
     args = parser.parse_args()
 
@@ -164,7 +354,72 @@ def main():
         print("Port phải từ 1024-65535")
         sys.exit(1)
 
-    app = ChatApplication(args.name, args.port)
+    if args.tree_fanout < 2:
+        parser.error("--tree-fanout phải >= 2")
+    if args.tree_ttl is not None and not 0 <= args.tree_ttl <= MAX_TREE_TTL:
+        parser.error(f"--tree-ttl phải từ 0-{MAX_TREE_TTL}")
+    if args.tree_backup < 0:
+        parser.error("--tree-backup phải >= 0")
+
+    profile_modes = None
+    if args.profile:
+        try:
+            profile_modes = parse_modes(args.profile)
+        except ValueError as e:
+            parser.error(f"--profile: {e}")
+
+    rate_limits = None
+    if not args.no_rate_limit:
+        rate_limits = dict(DEFAULT_RATE_LIMITS)
+        for spec in args.rate_limit:
+            try:
+                msg_type, limit = parse_rate_limit(spec)
+            except ValueError as e:
+                parser.error(f"--rate-limit {spec}: {e}")
+            if limit is None:
+                rate_limits.pop(msg_type, None)
+            else:
+                rate_limits[msg_type] = limit
+
+    network_options = {
+        'broadcast_mode': BROADCAST_SWEEP if args.sweep else BROADCAST_MULTICAST,
+        'multicast_config': MulticastConfig(args.mcast_group, args.mcast_port,
+                                            args.mcast_ttl, args.mcast_if),
+        'batching': not args.no_batching,
+        'compress_threshold': args.compress_threshold if args.compress_threshold > 0 else None,
+        'recv_buffer': args.rcvbuf if args.rcvbuf > 0 else None,
+        'receive_workers': max(args.workers, 0),
+        'tcp': args.tcp,
+        'rate_limits': rate_limits,
+        'quarantine_time': max(args.quarantine, 0.0),
+        'metrics': MetricsRegistry(),
+        'host': args.host,
+        'sweep_hosts': args.sweep_hosts.split(",") if args.sweep_hosts else None,
+    }
+    if args.relay:
+        app = RelayApplication(args.name, args.port, network_options=network_options,
+                               profile_modes=profile_modes)
+    else:
+        group_options = {
+            'tree_threshold': args.tree_threshold,
+            'tree_fanout': args.tree_fanout,
+            'tree_ttl': args.tree_ttl,
+            'tree_backup': args.tree_backup,
+        }
+        app = ChatApplication(args.name, args.port, use_asyncio=args.asyncio,
+                              network_options=network_options, group_options=group_options,
+                              headless=args.headless or args.control is not None,
+                              control_path=args.control, profile_modes=profile_modes)
+
+    if args.metrics_port > 0:
+        server = MetricsServer(network_options['metrics'], args.metrics_port)
+        try:
+            server.start()
+        except OSError as e:
+            print(f"Không mở được cổng metrics {args.metrics_port}: {e}")
+            sys.exit(1)
+        # stderr: stdout của chế độ headless chỉ chứa sự kiện JSON
+        print(f"Metrics: http://127.0.0.1:{server.port}/metrics", file=sys.stderr)
 
     try:
         app.start()
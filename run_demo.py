@@ -6,6 +6,17 @@ import sys
 import time
 import os
 
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MAIN_SCRIPT = os.path.join(SCRIPT_DIR, "main.py")
+
+
+def start_node(name: str, port: int, args=(), **popen_kwargs) -> subprocess.Popen:
+    """Chạy 1 instance main.py (args: tham số thêm, vd ["--headless"])"""
+    cmd = [sys.executable, MAIN_SCRIPT, "-n", name, "-p", str(port), *args]
+    popen_kwargs.setdefault("cwd", SCRIPT_DIR)
+    return subprocess.Popen(cmd, **popen_kwargs)
+
+
 def main():
     instances = [
         {"name": "Alice", "port": 5000},
@@ -13,33 +24,30 @@ def main():
         {"name": "Charlie", "port": 5002},
         {"name": "Diana", "port": 5003},
     ]
-    
+
     processes = []
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    main_script = os.path.join(script_dir, "main.py")
-    
+
     print("=" * 50)
     print("🚀 LAN CHAT DEMO")
     print("=" * 50)
-    
+
     for i, inst in enumerate(instances):
-        cmd = [sys.executable, main_script, "-n", inst["name"], "-p", str(inst["port"])]
         print(f"  → Khởi động {inst['name']} (port {inst['port']})")
-        
-        proc = subprocess.Popen(cmd, cwd=script_dir)
+
+        proc = start_node(inst["name"], inst["port"])
         processes.append(proc)
-        
+
         # Delay 2 giây giữa các instance
         if i < len(instances) - 1:
             print("    Đợi 2 giây...")
             time.sleep(2)
-    
+
     print()
     print("=" * 50)
     print("✅ Đã khởi động tất cả!")
     print("💡 Ctrl+C để dừng")
     print("=" * 50)
-    
+
     try:
         for proc in processes:
             proc.wait()
@@ -49,4 +57,4 @@ def main():
             proc.terminate()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
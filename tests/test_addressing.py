@@ -0,0 +1,88 @@
+"""
+Kiểm tra sổ địa chỉ: gói giả sender_id không chuyển hướng được peer đã biết, giới hạn LRU,
+host của mình khi bind mọi interface
+"""
+import pytest
+from core.addressing import AddressBook, Endpoint
+from core.message import Message, MessageType
+from core.network import NetworkManager
+from core.transport import MulticastConfig
+from utils.logger import Logger
+
+BOB = Endpoint("10.0.0.2", 7001)
+MALLORY = Endpoint("10.6.6.6", 7001)
+
+
+def _move(book: AddressBook, endpoint: Endpoint, times: int = AddressBook.MOVE_CONFIRMATIONS):
+    for _ in range(times):
+        book.learn("bob_7001", endpoint.host, endpoint.port, confirmed=True)
+
+
+def test_unconfirmed_packet_cannot_move_known_peer():
+    book = AddressBook()
+    book.learn("bob_7001", BOB.host, BOB.port)
+    book.learn("bob_7001", MALLORY.host, MALLORY.port)
+    assert book.get("bob_7001") == BOB
+    assert book.stats()['rejected'] == 1 and book.changes == 0
+
+
+def test_move_needs_repeated_presence_from_new_endpoint():
+    book = AddressBook()
+    book.learn("bob_7001", BOB.host, BOB.port)
+    _move(book, MALLORY, AddressBook.MOVE_CONFIRMATIONS - 1)
+    assert book.get("bob_7001") == BOB
+    _move(book, MALLORY, 1)
+    assert book.get("bob_7001") == MALLORY
+    assert book.knows(MALLORY) and not book.knows(BOB)
+    assert book.changes == 1
+
+
+def test_old_endpoint_still_alive_cancels_move():
+    book = AddressBook()
+    book.learn("bob_7001", BOB.host, BOB.port)
+    for _ in range(5):
+        _move(book, MALLORY, AddressBook.MOVE_CONFIRMATIONS - 1)
+        book.learn("bob_7001", BOB.host, BOB.port)  # Bob thật vẫn đang gửi
+    assert book.get("bob_7001") == BOB and book.changes == 0
+
+
+def test_evicts_least_recently_heard():
+    book = AddressBook(capacity=3)
+    for i in range(3):
+        book.learn(f"peer_{i}", "10.0.0.1", 7000 + i)
+    book.learn("peer_0", "10.0.0.1", 7000)  # Vừa nghe lại -> không bị bỏ
+    book.learn("peer_3", "10.0.0.1", 7003)
+    assert len(book) == 3 and "peer_1" not in book and "peer_0" in book
+    assert not book.knows(Endpoint("10.0.0.1", 7001))
+    assert book.stats()['evicted'] == 1
+
+
+@pytest.fixture
+def network(tmp_path):
+    logger = Logger(f"test_{tmp_path.name}", log_file=str(tmp_path / "test.log"))
+    return NetworkManager(9000, "alice", logger, reliable=False, host="127.0.0.1")
+
+
+def _from(network: NetworkManager, msg_type: MessageType, source: Endpoint):
+    message = Message(msg_type, "bob_7001", "Bob", source.port, "")
+    message.sender_host = source.host
+    network._accept(message)
+
+
+def test_spoofed_datagram_does_not_redirect_peer(network):
+    _from(network, MessageType.TEXT, BOB)
+    _from(network, MessageType.TEXT, MALLORY)
+    _from(network, MessageType.HEARTBEAT, MALLORY)
+    assert network.addresses.get("bob_7001") == BOB
+    # Bob khởi động lại trên máy khác: heartbeat liên tiếp từ địa chỉ mới
+    _from(network, MessageType.HEARTBEAT, MALLORY)
+    assert network.addresses.get("bob_7001") == MALLORY
+    assert network.address_stats()['changes'] == 1
+
+
+def test_host_defaults_to_configured_interface(tmp_path):
+    logger = Logger(f"test_{tmp_path.name}", log_file=str(tmp_path / "test.log"))
+    network = NetworkManager(9000, "alice", logger, reliable=False,
+                             multicast_config=MulticastConfig(interface="10.1.2.3"))
+    assert network.host == "10.1.2.3" and network.bind_host == ""
+    assert network.endpoint == Endpoint("10.1.2.3", 9000)
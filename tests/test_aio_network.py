@@ -0,0 +1,90 @@
+"""
+Kiểm tra bản asyncio: tin nhận được đi qua incoming_queue (ưu tiên, đếm, giới hạn),
+tin hỏng trong gói gộp được đếm và không làm mất các tin còn lại
+"""
+import socket
+import struct
+import threading
+import pytest
+from core.aio_network import AsyncNetworkManager
+from core.batching import BATCH_MAGIC
+from core.codec import CODEC_BINARY, encode_message
+from core.message import Message, MessageType
+from core.transport import BROADCAST_SWEEP
+from utils.logger import Logger
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def network(tmp_path):
+    logger = Logger(f"test_{tmp_path.name}", log_file=str(tmp_path / "test.log"))
+    manager = AsyncNetworkManager(_free_port(), "Bob", logger, reliable=False,
+                                  broadcast_mode=BROADCAST_SWEEP, host="127.0.0.1")
+    assert manager.start()
+    yield manager
+    manager.stop()
+
+
+def _send(network: AsyncNetworkManager, messages):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for message in messages:
+            sock.sendto(encode_message(message, CODEC_BINARY), ("127.0.0.1", network.port))
+
+
+def test_received_messages_go_through_incoming_queue(network):
+    received = []
+    done = threading.Event()
+
+    def on_message(message):
+        received.append(message.msg_type)
+        if len(received) == 2:
+            done.set()
+
+    network.on_message_received = on_message
+    _send(network, [
+        Message(MessageType.TEXT, "alice_7000", "Alice", 7000, "xin chào"),
+        Message(MessageType.HEARTBEAT, "alice_7000", "Alice", 7000, ""),
+    ])
+    assert done.wait(5)
+    stats = network.queue_stats()['incoming']
+    assert stats['chat']['enqueued'] == stats['chat']['dequeued'] == 1
+    assert stats['control']['enqueued'] == stats['control']['dequeued'] == 1
+
+
+def test_full_incoming_queue_drops_and_counts(network):
+    # Bản thread dùng cùng hàng đợi: giới hạn lớp chat áp dụng cả trên event loop
+    network.incoming_queue.bounds = (1, 0, 1)
+    done = threading.Event()
+    network.on_message_received = lambda message: done.set()
+    _send(network, [Message(MessageType.TEXT, "alice_7000", "Alice", 7000, "bị bỏ"),
+                    Message(MessageType.HEARTBEAT, "alice_7000", "Alice", 7000, "")])
+    assert done.wait(5)
+    assert network.queue_stats()['incoming']['chat']['dropped'] == 1
+
+
+def test_bad_datagram_in_batch_counted_and_rest_delivered(network):
+    received = []
+    done = threading.Event()
+
+    def on_message(message):
+        received.append(message.content)
+        done.set()
+
+    network.on_message_received = on_message
+    good = encode_message(Message(MessageType.TEXT, "alice_7000", "Alice", 7000, "còn nguyên"),
+                          CODEC_BINARY)
+    bad = b"\xb1\xff\xff"  # Header codec nhị phân bị cắt cụt
+    batch = bytes([BATCH_MAGIC])
+    for part in (bad, good):
+        batch += struct.pack("!H", len(part)) + part
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.sendto(batch, ("127.0.0.1", network.port))
+
+    assert done.wait(5)
+    assert received == ["còn nguyên"]
+    assert network._m_receive_errors.value == 1
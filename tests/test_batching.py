@@ -0,0 +1,76 @@
+"""
+Kiểm tra gộp datagram
+"""
+import time
+import pytest
+from core.batching import DatagramBatcher, unbatch
+from utils.logger import Logger
+
+ADDR = ("127.0.0.1", 5001)
+
+
+class _Socket:
+    def __init__(self):
+        self.sent = []
+        self.error = None
+
+    def sendto(self, data: bytes, addr):
+        if self.error:
+            raise self.error
+        self.sent.append((data, addr))
+
+
+@pytest.fixture
+def sock():
+    return _Socket()
+
+
+@pytest.fixture
+def batcher(sock, tmp_path):
+    # Không start(): gói gộp chỉ gửi khi flush / đầy / flush=True
+    logger = Logger(f"test_{tmp_path.name}", log_file=str(tmp_path / "test.log"))
+    return DatagramBatcher(sock.sendto, logger, linger=10.0)
+
+
+def test_burst_is_batched(sock, batcher):
+    for i in range(5):
+        batcher.send(b"msg%d" % i, ADDR)
+    assert len(sock.sent) == 1  # Tin đầu gửi ngay, các tin sau đang gom
+    batcher.flush()
+    assert len(sock.sent) == 2
+    assert list(unbatch(sock.sent[1][0])) == [b"msg%d" % i for i in range(1, 5)]
+    assert batcher.stats()['batched'] == 1
+
+
+def test_flush_flag_sends_pending_with_control(sock, batcher):
+    batcher.send(b"a", ADDR)
+    batcher.send(b"b", ADDR)
+    batcher.send(b"ack", ADDR, flush=True)
+    assert list(unbatch(sock.sent[-1][0])) == [b"b", b"ack"]
+
+
+def test_immediate_send_failure_raises(sock, batcher):
+    sock.error = OSError("unreachable")
+    with pytest.raises(OSError):
+        batcher.send(b"a", ADDR)
+    assert batcher.stats()['failed'] == 1
+
+
+def test_deferred_batch_failure_is_counted(sock, batcher):
+    batcher.send(b"a", ADDR)
+    batcher.send(b"b", ADDR)
+    batcher.send(b"c", ADDR)
+    sock.error = OSError("unreachable")
+    batcher.flush()
+    assert batcher.stats()['failed'] == 2
+
+
+def test_idle_destinations_are_pruned(batcher):
+    batcher.linger = 0.001
+    batcher.PRUNE_INTERVAL = 0.0
+    for port in range(100):
+        batcher.send(b"x", ("127.0.0.1", port))
+    time.sleep(0.01)
+    batcher.send(b"x", ADDR)
+    assert list(batcher._last_sent) == [ADDR]
+
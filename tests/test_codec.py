@@ -0,0 +1,96 @@
+"""
+Kiểm tra codec: mã hóa rồi giải mã lại được đúng tin nhắn với mọi codec
+"""
+import pytest
+from core.codec import (CODEC_BINARY, CODEC_BINARY_ZLIB, CODEC_JSON, MAGIC,
+                        decode_message, encode_message, peek_type, stamp_seq)
+from core.message import Message, MessageType
+
+CODECS = (CODEC_JSON, CODEC_BINARY, CODEC_BINARY_ZLIB)
+
+
+def _messages():
+    return [
+        Message(MessageType.TEXT, "alice_5000", "Alice", 5000, "xin chào 👋"),
+        Message(MessageType.PRIVATE_MESSAGE, "alice_5000", "Alice", 5000, "riêng",
+                target_id="bob_5001"),
+        Message(MessageType.GROUP_MESSAGE, "alice_5000", "Alice", 5000, "nhóm " * 400,
+                group_id="g1", seq=7, epoch=123, seq_base=5, via=5009, ttl=3),
+        Message(MessageType.GROUP_CREATE, "alice_5000", "Alice", 5000, "{}",
+                group_id="g1", group_members=["alice_5000", "bob_5001", "chi_5002"]),
+        Message(MessageType.ACK, "bob_5001", "Bob", 5001, "123:7:9-11"),
+        Message(MessageType.TEXT, "alice_5000", "Alice", 5000, ""),
+    ]
+
+
+@pytest.mark.parametrize("codec", CODECS)
+@pytest.mark.parametrize("index", range(len(_messages())))
+def test_round_trip(codec, index):
+    message = _messages()[index]
+    decoded = decode_message(encode_message(message, codec))
+    assert decoded == message
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_decode_from_memoryview(codec):
+    message = _messages()[2]
+    buffer = bytearray(encode_message(message, codec))
+    decoded = decode_message(memoryview(buffer))
+    buffer[:] = b"\0" * len(buffer)  # Buffer nhận bị dùng lại: tin đã giải mã không đổi
+    assert decoded == message
+
+
+def test_discovery_always_json():
+    message = Message(MessageType.DISCOVERY, "a", "A", 1, "discover")
+    assert encode_message(message, CODEC_BINARY)[0] != MAGIC
+    assert decode_message(encode_message(message, CODEC_BINARY)) == message
+
+
+def test_large_payload_is_compressed():
+    message = Message(MessageType.TEXT, "a", "A", 1, "lặp lại " * 1000)
+    plain = encode_message(message, CODEC_BINARY)
+    packed = encode_message(message, CODEC_BINARY_ZLIB)
+    assert len(packed) < len(plain)
+    assert decode_message(packed) == message
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_stamp_seq(codec):
+    message = _messages()[2]
+    message.seq = message.epoch = message.seq_base = None
+    shared = encode_message(message, codec)
+    decoded = decode_message(stamp_seq(shared, 99, 42, 40))
+    assert (decoded.epoch, decoded.seq, decoded.seq_base) == (99, 42, 40)
+    assert decoded.content == message.content
+    assert decoded.ttl == message.ttl and decoded.via == message.via
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_peek_type(codec):
+    for message in _messages():
+        assert peek_type(encode_message(message, codec)) == message.msg_type
+
+
+@pytest.mark.parametrize("data", [
+    b"",
+    b"not json",
+    bytes([MAGIC, 2, 1, 0]),
+    bytes([MAGIC, 99]) + b"\0" * 30,
+])
+def test_invalid_data_raises_value_error(data):
+    with pytest.raises(ValueError):
+        decode_message(data)
+
+
+def test_truncated_binary_raises_value_error():
+    data = encode_message(_messages()[1], CODEC_BINARY)
+    for size in range(1, len(data)):
+        with pytest.raises(ValueError):
+            decode_message(data[:size]).content
+
+
+def test_out_of_range_ttl_falls_back_to_json():
+    message = Message(MessageType.GROUP_MESSAGE, "a", "A", 1, "x", group_id="g", ttl=300)
+    data = encode_message(message, CODEC_BINARY)
+    assert data[0] != MAGIC
+    assert decode_message(data).ttl == 300
@@ -0,0 +1,48 @@
+"""
+Kiểm tra bộ chống trùng
+"""
+import time
+from core.dedup import DedupCache
+
+
+def test_duplicate_detected():
+    cache = DedupCache()
+    assert not cache.check_and_add("alice", "m1")
+    assert cache.check_and_add("alice", "m1")
+    assert cache.stats()['hits'] == 1
+
+
+def test_key_includes_sender():
+    cache = DedupCache()
+    assert not cache.check_and_add("alice", "m1")
+    assert not cache.check_and_add("bob", "m1")
+
+
+def test_capacity_evicts_oldest():
+    cache = DedupCache(capacity=3)
+    for msg_id in ("m1", "m2", "m3", "m4"):
+        cache.check_and_add("alice", msg_id)
+    assert len(cache) == 3
+    assert cache.stats()['evictions'] == 1
+    assert not cache.check_and_add("alice", "m1")  # Đã bị loại -> coi như mới
+    assert cache.check_and_add("alice", "m4")
+
+
+def test_window_expires_entries():
+    cache = DedupCache(window=0.01)
+    cache.check_and_add("alice", "m1")
+    time.sleep(0.02)
+    cache.expire()
+    assert len(cache) == 0
+    assert cache.stats()['expirations'] == 1
+    assert not cache.check_and_add("alice", "m1")
+
+
+def test_memory_estimate_follows_evictions():
+    cache = DedupCache(capacity=2)
+    cache.check_and_add("alice", "m1")
+    one = cache._key_bytes
+    cache.check_and_add("alice", "m2")
+    cache.check_and_add("alice", "m3")
+    assert cache._key_bytes == 2 * one
+    assert cache.stats()['memory_bytes'] >= cache._key_bytes
@@ -0,0 +1,226 @@
+"""
+Kiểm tra truyền file: kiểm tra lời mời, token người nhận, giới hạn chunk và tải tiếp
+"""
+import json
+import os
+import socket
+import threading
+import time
+import pytest
+from core.addressing import DEFAULT_HOST, Endpoint
+from core.file_transfer import (_CHUNK_HEADER, MAX_CHUNK_SIZE, FileOffer, FileTransferManager)
+from core.message import Message, MessageType
+from core.scheduler import TimerWheel
+from utils.logger import Logger
+
+CHUNK = 1024
+
+
+@pytest.fixture
+def logger(tmp_path):
+    return Logger(f"test_{tmp_path.name}", log_file=str(tmp_path / "test.log"))
+
+
+class _Network:
+    """NetworkManager giả: ghi lại tin gửi đi, scheduler thật"""
+
+    def __init__(self, name: str, port: int, logger: Logger):
+        self.user_id = f"{name}_{port}"
+        self.user_name = name
+        self.port = port
+        self.host = self.bind_host = DEFAULT_HOST
+        self.scheduler = TimerWheel(logger)
+        self.sent = []
+
+    def send_to_ports(self, message: Message, ports: list):
+        message.sender_host = self.host
+        self.sent.append((message, ports))
+
+
+def _manager(tmp_path, name: str, port: int, logger: Logger) -> FileTransferManager:
+    manager = FileTransferManager(_Network(name, port, logger), logger,
+                                  download_dir=str(tmp_path / name))
+    manager.CHUNK_SIZE = CHUNK
+    manager.RETRY_DELAY = 0.01
+    assert manager.start()
+    return manager
+
+
+@pytest.fixture
+def pair(tmp_path, logger):
+    sender = _manager(tmp_path, "alice", 7000, logger)
+    receiver = _manager(tmp_path, "bob", 7001, logger)
+    yield sender, receiver
+    sender.stop()
+    receiver.stop()
+
+
+def _offer_message(content: dict, sender_id: str = "alice_7000") -> Message:
+    data = {'transfer_id': "0123456789abcdef", 'name': "a.txt", 'size': 10,
+            'chunk_size': CHUNK, 'tcp_port': 1, 'token': "t"}
+    data.update(content)
+    message = Message(MessageType.FILE_OFFER, sender_id, "Alice", 7000, json.dumps(data))
+    message.sender_host = DEFAULT_HOST
+    return message
+
+
+def _offer(sender: FileTransferManager, receiver: FileTransferManager, path: str) -> FileOffer:
+    """Mời file rồi chuyển FILE_OFFER cho bên nhận"""
+    offer = sender.offer_file(path, [Endpoint(DEFAULT_HOST, receiver.network.port)])
+    message, _ = sender.network.sent[-1]
+    receiver.handle_message(message)
+    return receiver.pending_offers()[offer.transfer_id]
+
+
+def _download(receiver: FileTransferManager, offer: FileOffer, timeout: float = 10):
+    """Chấp nhận lời mời, chờ đến khi có kết quả cuối"""
+    finished = threading.Event()
+    results = []
+
+    def on_progress(progress):
+        if progress.direction == "recv" and progress.state != "active":
+            results.append(progress)
+            finished.set()
+
+    receiver.on_progress = on_progress
+    assert receiver.respond(offer.transfer_id, True)
+    assert finished.wait(timeout)
+    return results[0]
+
+
+def _write(tmp_path, size: int) -> tuple:
+    data = os.urandom(size)
+    path = tmp_path / "source.bin"
+    path.write_bytes(data)
+    return str(path), data
+
+
+@pytest.mark.parametrize("transfer_id", ["../../etc/passwd", "0123456789ABCDEF",
+                                         "0123456789abcde", "0123456789abcdef/"])
+def test_offer_rejects_unsafe_transfer_id(transfer_id):
+    with pytest.raises(ValueError):
+        FileOffer.from_message(_offer_message({'transfer_id': transfer_id}))
+
+
+def test_offer_strips_directories_and_bounds_chunk():
+    offer = FileOffer.from_message(_offer_message({'name': "../../x.txt",
+                                                   'chunk_size': 1 << 40}))
+    assert offer.name == "x.txt"
+    assert offer.chunk_size == MAX_CHUNK_SIZE
+
+
+def test_download_and_resume(tmp_path, pair):
+    sender, receiver = pair
+    path, data = _write(tmp_path, 10 * CHUNK + 100)
+    offer = _offer(sender, receiver, path)
+
+    # Đã có 3 chunk và một phần chunk thứ 4: tải tiếp từ đầu chunk thứ 4
+    part = receiver._part_path(offer)
+    with open(part, 'wb') as f:
+        f.write(data[:3 * CHUNK + 10])
+    assert receiver._resume_offset(offer) == 3 * CHUNK
+
+    progress = _download(receiver, offer)
+    assert progress.state == "done", progress.error
+    assert progress._start_done == 3 * CHUNK
+    with open(progress.path, 'rb') as f:
+        assert f.read() == data
+    assert not os.path.exists(part)
+
+
+def _request(manager: FileTransferManager, transfer_id: str, token: str) -> bytes:
+    """Gửi request TCP thẳng đến bên gửi, trả về mọi byte nhận được"""
+    with socket.create_connection((DEFAULT_HOST, manager.tcp_port), timeout=5) as conn:
+        request = {'transfer_id': transfer_id, 'token': token, 'offset': 0}
+        conn.sendall(json.dumps(request).encode('utf-8') + b"\n")
+        received = b""
+        while True:
+            chunk = conn.recv(65536)
+            if not chunk:
+                return received
+            received += chunk
+
+
+def test_wrong_token_rejected(tmp_path, pair):
+    sender, receiver = pair
+    path, _ = _write(tmp_path, CHUNK)
+    offer = _offer(sender, receiver, path)
+    assert _request(sender, offer.transfer_id, "0" * 32) == b""
+    assert _request(sender, "../" + offer.transfer_id, offer.token) == b""
+    # Token đúng vẫn dùng được
+    assert len(_request(sender, offer.transfer_id, offer.token)) > CHUNK
+
+
+def test_expired_token_rejected(tmp_path, pair):
+    sender, receiver = pair
+    path, _ = _write(tmp_path, CHUNK)
+    offer = _offer(sender, receiver, path)
+    with sender._lock:
+        sender._outgoing[offer.transfer_id].tokens[offer.token] = time.monotonic() - 1
+    assert _request(sender, offer.transfer_id, offer.token) == b""
+
+    sender._expire(offer.transfer_id)
+    assert offer.transfer_id not in sender._outgoing
+
+
+def test_token_single_use(tmp_path, pair):
+    sender, receiver = pair
+    path, _ = _write(tmp_path, CHUNK)
+    offer = _offer(sender, receiver, path)
+    assert _download(receiver, offer).state == "done"
+    assert _request(sender, offer.transfer_id, offer.token) == b""
+
+
+def test_oversized_chunk_fails_download(tmp_path, logger):
+    receiver = _manager(tmp_path, "bob", 7001, logger)
+    server = socket.socket()
+    server.bind((DEFAULT_HOST, 0))
+    server.listen(1)
+
+    def serve():
+        conn, _ = server.accept()
+        with conn:
+            conn.makefile('rb').readline()
+            conn.sendall(_CHUNK_HEADER.pack(0, CHUNK + 1, 0) + b"x" * (CHUNK + 1))
+
+    threading.Thread(target=serve, daemon=True).start()
+    receiver.MAX_RETRIES = 0
+    message = _offer_message({'tcp_port': server.getsockname()[1], 'size': 2 * CHUNK})
+    try:
+        receiver.handle_message(message)
+        progress = _download(receiver, FileOffer.from_message(message))
+        assert progress.state == "failed"
+        assert "Unexpected chunk" in progress.error
+    finally:
+        server.close()
+        receiver.stop()
+
+
+def test_received_offers_capped_per_sender(tmp_path, logger):
+    receiver = _manager(tmp_path, "bob", 7001, logger)
+    receiver.MAX_OFFERS_PER_SENDER = 3
+    try:
+        for i in range(5):
+            receiver.handle_message(_offer_message({'transfer_id': f"{i:016x}"}))
+        # Mời lại cùng file thay lời mời cũ; người gửi khác không bị ảnh hưởng
+        receiver.handle_message(_offer_message({'transfer_id': f"{0:016x}"}))
+        receiver.handle_message(_offer_message({'transfer_id': f"{9:016x}"}, "carol_7002"))
+        assert len(receiver.pending_offers()) == 4
+        assert receiver.offers_rejected == 2
+    finally:
+        receiver.stop()
+
+
+def test_received_offer_expires(tmp_path, logger):
+    receiver = _manager(tmp_path, "bob", 7001, logger)
+    receiver.OFFER_TTL = 0.05
+    receiver.network.scheduler.start()
+    try:
+        receiver.handle_message(_offer_message({}))
+        assert len(receiver.pending_offers()) == 1
+        time.sleep(0.2)
+        assert not receiver.pending_offers()
+        assert not receiver.respond("0123456789abcdef", True)
+    finally:
+        receiver.network.scheduler.stop()
+        receiver.stop()
@@ -0,0 +1,127 @@
+"""
+Kiểm tra chia mảnh / ghép mảnh
+"""
+import os
+import random
+import time
+from core.fragment import (FRAG_MAGIC, FRAGMENT_PAYLOAD, MAX_DATAGRAM, Reassembler, fragment,
+                           is_fragment)
+
+
+def test_small_message_not_fragmented():
+    data = b"x" * MAX_DATAGRAM
+    assert fragment(data) == [data]
+    assert not is_fragment(data)
+
+
+def test_fragments_fit_datagram():
+    parts = fragment(os.urandom(50_000))
+    assert len(parts) > 1
+    assert all(len(p) <= MAX_DATAGRAM and is_fragment(p) for p in parts)
+
+
+def test_reassemble_out_of_order_with_duplicates():
+    data = os.urandom(20_000)
+    parts = fragment(data)
+    shuffled = parts[:-1] + parts[:5]
+    random.Random(1).shuffle(shuffled)
+    shuffled.append(parts[-1])
+
+    reassembler = Reassembler()
+    results = [r for r in map(reassembler.add, shuffled) if r is not None]
+    assert results == [data]
+    assert len(reassembler) == 0
+    assert reassembler.stats()['buffered_bytes'] == 0
+
+
+def test_interleaved_messages():
+    first, second = os.urandom(10_000), os.urandom(12_000)
+    reassembler = Reassembler()
+    results = []
+    for a, b in zip(fragment(first), fragment(second)):
+        results += [r for r in (reassembler.add(a), reassembler.add(b)) if r is not None]
+    results += [r for r in map(reassembler.add, fragment(second)[len(fragment(first)):])
+                if r is not None]
+    assert sorted(results) == sorted([first, second])
+
+
+def test_accepts_memoryview_into_reused_buffer():
+    data = os.urandom(5_000)
+    reassembler = Reassembler()
+    buffer = bytearray(MAX_DATAGRAM)
+    result = None
+    for part in fragment(data):
+        buffer[:len(part)] = part
+        result = reassembler.add(memoryview(buffer)[:len(part)])
+    assert result == data
+
+
+def test_rejects_bad_headers():
+    reassembler = Reassembler()
+    assert reassembler.add(bytes([FRAG_MAGIC]) + b"\0" * 3) is None
+    # index >= count
+    assert reassembler.add(bytes([FRAG_MAGIC]) + b"12345678" + b"\x00\x05\x00\x02" + b"x") is None
+    assert reassembler.stats()['rejected'] == 2
+
+
+def test_incomplete_message_expires():
+    reassembler = Reassembler(timeout=0.01)
+    reassembler.add(fragment(os.urandom(5_000))[0])
+    assert len(reassembler) == 1
+    time.sleep(0.02)
+    reassembler.expire()
+    assert len(reassembler) == 0
+    assert reassembler.stats()['expired'] == 1
+
+
+def test_memory_bound_evicts_oldest():
+    reassembler = Reassembler(max_bytes=3 * MAX_DATAGRAM)
+    old, new = fragment(os.urandom(10_000)), fragment(os.urandom(10_000))
+    reassembler.add(old[0])
+    for part in new[:-1]:
+        reassembler.add(part)
+    assert reassembler.stats()['evicted'] == 1
+    assert len(reassembler) == 1
+
+
+def test_message_bound_uses_received_bytes():
+    # Mảnh nhỏ (peer dùng MTU nhỏ): nhiều mảnh nhưng tổng byte vẫn trong giới hạn
+    data = os.urandom(10_000)
+    reassembler = Reassembler(max_message=len(data))
+    results = [r for r in map(reassembler.add, fragment(data, max_datagram=100)) if r is not None]
+    assert results == [data]
+
+    # Vượt giới hạn theo byte thực nhận -> bỏ cả tin đang ghép
+    reassembler = Reassembler(max_message=len(data) - 1)
+    assert all(reassembler.add(part) is None for part in fragment(data, max_datagram=100))
+    assert reassembler.stats()['rejected'] > 0
+    assert reassembler.stats()['completed'] == 0
+
+
+def test_per_source_limit_rejects_new_messages():
+    reassembler = Reassembler(max_source_bytes=3 * FRAGMENT_PAYLOAD)
+    flood = [fragment(os.urandom(20_000))[0] for _ in range(10)]
+    for part in flood:
+        reassembler.add(part, "10.0.0.66")
+    assert len(reassembler) == 3
+    assert reassembler.stats()['source_limited'] == 7
+    assert reassembler.stats()['evicted'] == 0
+
+    # Nguồn khác không bị ảnh hưởng
+    data = os.urandom(3_000)
+    results = [reassembler.add(part, "10.0.0.2") for part in fragment(data)]
+    assert results[-1] == data
+    assert reassembler.stats()['sources'] == 1
+
+
+def test_per_source_bytes_released():
+    reassembler = Reassembler(timeout=0.01, max_source_bytes=2 * FRAGMENT_PAYLOAD)
+    for _ in range(3):
+        reassembler.add(fragment(os.urandom(5_000))[0], "10.0.0.66")
+    assert reassembler.stats()['source_limited'] == 1
+    time.sleep(0.02)
+    reassembler.expire()
+    assert reassembler.stats()['sources'] == 0
+    # Hết hạn -> nguồn lại được đệm
+    data = os.urandom(2_000)
+    assert [reassembler.add(p, "10.0.0.66") for p in fragment(data)][-1] == data
@@ -0,0 +1,158 @@
+"""
+Kiểm tra tin nhóm lan truyền theo cây: ttl, thứ tự cây theo member_id, dự phòng node offline
+"""
+from collections import deque
+from dataclasses import replace
+import pytest
+from core.addressing import Endpoint
+from core.group import MAX_TREE_TTL, Group, GroupManager, tree_targets, tree_ttl
+from core.message import Message, MessageType
+from utils.logger import Logger
+
+
+def _group(members: int) -> Group:
+    return Group("g", "G", "m0", member_ids={f"m{i}" for i in range(members)})
+
+
+def test_tree_ttl_covers_tree():
+    assert tree_ttl(2, 4) == 0
+    assert tree_ttl(5, 4) == 1   # 4 con của người gửi
+    assert tree_ttl(21, 4) == 2  # + 16 cháu
+
+
+def test_ttl_clamped_to_header_byte():
+    assert GroupManager(None, None, tree_fanout=1)._ttl_for(_group(1000)) == MAX_TREE_TTL
+    assert GroupManager(None, None, tree_ttl=300)._ttl_for(_group(10)) == MAX_TREE_TTL
+    assert GroupManager(None, None, tree_ttl=3)._ttl_for(_group(1000)) == 3
+
+
+def test_tree_without_gossip_reaches_each_member_once():
+    members = [f"m{i:03d}" for i in range(200)]
+    received = []
+    pending = deque(tree_targets(members, "m000", "abc", 4, backup=0))
+    while pending:
+        member = pending.popleft()
+        received.append(member)
+        pending.extend(tree_targets(members, "m000", "abc", 4, member, backup=0))
+    assert sorted(received) == members[1:]
+
+
+def _propagate(members: list, msg_id: str, offline: str = None) -> dict:
+    """Lan truyền 1 tin (m000 gửi, mỗi node chuyển tiếp 1 lần): member -> (số bản, lượt đầu)"""
+    received = {}
+    pending = deque((child, 1) for child in tree_targets(members, "m000", msg_id, 4))
+    while pending:
+        member, hop = pending.popleft()
+        if member == offline:
+            continue
+        copies, first = received.get(member, (0, hop))
+        received[member] = (copies + 1, first)
+        if copies == 0:
+            pending.extend((child, hop + 1) for child in tree_targets(members, "m000", msg_id, 4, member))
+    return received
+
+
+def test_backup_copy_from_parents_sibling():
+    members = [f"m{i:03d}" for i in range(200)]
+    received = _propagate(members, "abc")
+    root_children = set(tree_targets(members, "m000", "abc", 4))
+    # Con trực tiếp của người gửi: 1 bản; còn lại: bản từ cha + bản từ anh em của cha
+    assert {received[m][0] for m in root_children} == {1}
+    assert {copies for m, (copies, _) in received.items() if m not in root_children} == {2}
+
+
+@pytest.mark.parametrize("msg_id", ["abc", "0123abcd"])
+def test_any_single_offline_member_loses_no_one_else(msg_id):
+    members = [f"m{i:03d}" for i in range(150)]
+    ttl = tree_ttl(len(members), 4)
+    for offline in members[1:]:
+        received = _propagate(members, msg_id, offline)
+        assert set(received) == set(members[1:]) - {offline}, offline
+        # Bản dự phòng đến cùng lượt với bản từ cha: ttl theo độ sâu vẫn đủ
+        assert max(hop for _, hop in received.values()) <= ttl
+
+
+class _Network:
+    """NetworkManager giả: giao tin nhóm qua hàng đợi chung của _Cluster"""
+
+    def __init__(self, cluster: "_Cluster", user_id: str, port: int):
+        self.cluster = cluster
+        self.user_id = user_id
+        self.user_name = user_id
+        self.port = port
+        self.host = "127.0.0.1"
+        self.endpoint = Endpoint(self.host, port)  # Không biết IP LAN của chính mình
+
+    def send_to_ports(self, message: Message, ports: list):
+        for endpoint in ports:
+            self.cluster.pending.append((endpoint, replace(message)))
+
+
+class _Cluster:
+    """
+    Mỗi node có bảng thành viên riêng: chính mình ở 127.0.0.1, người khác ở IP nguồn quan sát
+    được (10.0.x.y) - như sau khi nhận GROUP_CREATE trên LAN nhiều máy
+    """
+
+    def __init__(self, size: int, logger: Logger, **options):
+        self.ids = [f"node{i:03d}" for i in range(size)]
+        self.lan = {mid: Endpoint(f"10.0.{i // 250}.{i % 250 + 1}", 9000)
+                    for i, mid in enumerate(self.ids)}
+        self.managers = {}
+        self.offline = None
+        self.pending = deque()
+        self.received = {}
+        for mid in self.ids:
+            manager = GroupManager(_Network(self, mid, 9000), logger, tree_threshold=8, **options)
+            group = Group("g1", "G", self.ids[0])
+            for other in self.ids:
+                endpoint = manager.network.endpoint if other == mid else self.lan[other]
+                group.add_member(other, endpoint, other)
+            manager.groups["g1"] = group
+            self.managers[mid] = manager
+        self._by_lan = {endpoint: mid for mid, endpoint in self.lan.items()}
+
+    def send(self, sender_id: str, first_child_offline: bool = False) -> set:
+        """
+        Gửi 1 tin nhóm từ sender_id, trả về các node đã nhận
+        first_child_offline: con đầu tiên của người gửi trong cây offline (mất cả cây con của nó)
+        """
+        self.managers[sender_id].send_group_message("g1", "xin chào")
+        assert self.pending
+        offline = self.offline = self._by_lan[self.pending[0][0]] if first_child_offline else None
+        while self.pending:
+            endpoint, message = self.pending.popleft()
+            member = self._by_lan.get(endpoint)
+            assert member is not None, f"{endpoint} không phải địa chỉ LAN của thành viên nào"
+            if member == offline:
+                continue
+            self.received[member] = self.received.get(member, 0) + 1
+            if self.received[member] == 1:  # Tin trùng: network đã lọc theo msg_id
+                self.managers[member].handle_group_message(message)
+        return set(self.received)
+
+
+@pytest.fixture
+def logger(tmp_path):
+    return Logger(f"test_{tmp_path.name}", log_file=str(tmp_path / "test.log"))
+
+
+def test_tree_consistent_across_different_host_views(logger):
+    cluster = _Cluster(130, logger, tree_fanout=4, tree_backup=0)
+    received = cluster.send("node000")
+    assert received == set(cluster.ids[1:])
+    # Cây theo member_id: mọi node tính cùng một cây, không ai nhận 2 lần
+    assert set(cluster.received.values()) == {1}
+
+
+def test_gossip_covers_subtree_of_offline_member(logger):
+    cluster = _Cluster(130, logger, tree_fanout=4)
+    received = cluster.send("node000", first_child_offline=True)
+    assert received == set(cluster.ids[1:]) - {cluster.offline}
+
+
+def test_offline_member_loses_subtree_without_gossip(logger):
+    cluster = _Cluster(130, logger, tree_fanout=4, tree_backup=0)
+    received = cluster.send("node000", first_child_offline=True)
+    # Không dự phòng: mất cả cây con của node offline
+    assert len(set(cluster.ids[1:]) - {cluster.offline} - received) > 1
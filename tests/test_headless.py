@@ -0,0 +1,125 @@
+"""
+Kiểm tra socket điều khiển của chế độ headless: chỉ xóa socket cũ, không xóa file khác,
+chỉ chủ sở hữu nối được, client đọc chậm bị ngắt thay vì chặn các client khác
+"""
+import json
+import os
+import socket
+import stat
+import threading
+import time
+import pytest
+from ui.headless import HeadlessUI, _ClientSink
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="cần Unix socket")
+
+
+def test_refuses_to_unlink_regular_file(tmp_path):
+    path = tmp_path / "control"
+    path.write_text("dữ liệu quan trọng")
+    ui = HeadlessUI("bob", 9000, str(path))
+    with pytest.raises(FileExistsError):
+        ui._serve_socket()
+    assert path.read_text() == "dữ liệu quan trọng"
+
+
+def test_refuses_to_unlink_symlink(tmp_path):
+    target = tmp_path / "target"
+    target.write_text("x")
+    path = tmp_path / "control"
+    path.symlink_to(target)
+    with pytest.raises(FileExistsError):
+        HeadlessUI("bob", 9000, str(path))._serve_socket()
+    assert path.is_symlink() and target.exists()
+
+
+def test_replaces_stale_socket(tmp_path):
+    path = tmp_path / "control"
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(path))
+    stale.close()  # Tiến trình cũ thoát không dọn socket
+
+    ui = HeadlessUI("bob", 9000, str(path))
+    server = _start(ui)
+    try:
+        _connect(path).close()
+    finally:
+        ui._stop()
+        server.join(2)
+    assert not server.is_alive()
+    assert not path.exists()
+
+
+def _start(ui: HeadlessUI) -> threading.Thread:
+    server = threading.Thread(target=ui._serve_socket, daemon=True)
+    server.start()
+    return server
+
+
+def _connect(path) -> socket.socket:
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    for _ in range(200):
+        try:
+            client.connect(str(path))
+            return client
+        except (ConnectionRefusedError, FileNotFoundError):
+            time.sleep(0.01)
+    raise AssertionError("server không lắng nghe")
+
+
+def _wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_socket_only_accessible_by_owner(tmp_path):
+    path = tmp_path / "control"
+    ui = HeadlessUI("bob", 9000, str(path))
+    server = _start(ui)
+    try:
+        _connect(path).close()
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    finally:
+        ui._stop()
+        server.join(2)
+
+
+def test_slow_client_dropped_without_blocking_others(tmp_path, monkeypatch):
+    monkeypatch.setattr(_ClientSink, "MAX_PENDING", 8)
+    path = tmp_path / "control"
+    ui = HeadlessUI("bob", 9000, str(path))
+    server = _start(ui)
+    slow, fast = _connect(path), _connect(path)
+    received = []
+
+    def read_fast():
+        for line in fast.makefile('r', encoding='utf-8'):
+            received.append(json.loads(line))
+
+    reader = threading.Thread(target=read_fast, daemon=True)
+    reader.start()
+    try:
+        assert _wait_for(lambda: len(ui._sinks) == 2)
+        # Client chậm không đọc: bộ đệm socket đầy, hàng ghi vượt giới hạn -> bị ngắt
+        text = "x" * 65536
+        started = time.monotonic()
+        for i in range(64):
+            ui.display_system_message(text, chat_id=str(i))
+            assert _wait_for(lambda: len(received) > i)  # Client nhanh vẫn nhận đủ, theo thứ tự
+        assert time.monotonic() - started < _ClientSink.SEND_TIMEOUT
+        assert [event['chat_id'] for event in received] == [str(i) for i in range(64)]
+        assert _wait_for(lambda: len(ui._sinks) == 1)
+
+        # Client chậm đọc được phần đã gửi rồi gặp EOF
+        slow.settimeout(5)
+        while slow.recv(65536):
+            pass
+    finally:
+        ui._stop()
+        server.join(2)
+        slow.close()
+        fast.close()
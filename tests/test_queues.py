@@ -0,0 +1,188 @@
+"""
+Kiểm tra hàng đợi ưu tiên: giới hạn theo lớp, nhường chỗ cho lớp cao, gộp tin, chống đói
+"""
+import queue
+import threading
+import pytest
+from core.message import Message, MessageType
+from core.queues import (BULK_SIZE, PRIORITY_BULK, PRIORITY_CHAT, PRIORITY_CONTROL,
+                         PriorityMessageQueue, classify)
+
+
+def _message(msg_type: MessageType = MessageType.TEXT, sender: str = "alice_7000",
+             content: str = "xin chào") -> Message:
+    return Message(msg_type, sender, sender.split("_")[0], 7000, content)
+
+
+def _control(sender: str = "alice_7000") -> Message:
+    return _message(MessageType.ACK, sender, "")
+
+
+def _bulk(label: str = "") -> Message:
+    return _message(content=label + "x" * (BULK_SIZE + 1))
+
+
+def _drain(q: PriorityMessageQueue) -> list:
+    messages = []
+    while not q.empty():
+        messages.append(q.get_nowait())
+    return messages
+
+
+def test_classify():
+    assert classify(_message(MessageType.HEARTBEAT)) == PRIORITY_CONTROL
+    assert classify(_control()) == PRIORITY_CONTROL
+    assert classify(_message()) == PRIORITY_CHAT
+    assert classify(_message(content="x" * BULK_SIZE)) == PRIORITY_CHAT
+    assert classify(_bulk()) == PRIORITY_BULK
+
+
+def test_control_served_before_chat_and_bulk():
+    q = PriorityMessageQueue()
+    q.put(_bulk())
+    q.put(_message())
+    q.put(_control())
+    assert [classify(m) for m in _drain(q)] == [PRIORITY_CONTROL, PRIORITY_CHAT, PRIORITY_BULK]
+
+
+def test_full_class_drops_new_messages_and_counts():
+    q = PriorityMessageQueue(bounds=(2, 2, 2))
+    first = [_message(content=f"m{i}") for i in range(2)]
+    assert all(q.put(m) for m in first)
+    assert not q.put(_message(content="late"))
+    with pytest.raises(queue.Full):
+        q.put_nowait(_message(content="later"))
+    # Lớp khác vẫn còn chỗ
+    assert q.put(_control())
+
+    stats = q.stats()
+    assert stats['chat']['dropped'] == 2
+    assert stats['chat']['enqueued'] == 2
+    assert stats['control']['dropped'] == 0
+    assert [m.content for m in _drain(q)][1:] == ["m0", "m1"]
+
+
+def test_full_capacity_evicts_oldest_of_lowest_class():
+    q = PriorityMessageQueue(bounds=(5, 5, 5), capacity=4)
+    q.put(_message(content="c0"))
+    q.put(_bulk("b0"))
+    q.put(_bulk("b1"))
+    q.put(_message(content="c1"))
+
+    # Chat mới đẩy bulk cũ nhất ra; hết bulk thì control đẩy chat cũ nhất ra
+    assert q.put(_message(content="c2"))
+    assert q.put(_control("bob_7001"))
+    assert q.put(_control("carol_7002"))
+    assert q.qsize() == 4
+
+    stats = q.stats()
+    assert stats['bulk']['evicted'] == 2
+    assert stats['chat']['evicted'] == 1
+    assert [m.content[:2] for m in _drain(q)] == ["", "", "c1", "c2"]
+
+
+def test_full_capacity_never_evicts_same_or_higher_class():
+    q = PriorityMessageQueue(bounds=(5, 5, 5), capacity=2)
+    q.put(_control("bob_7001"))
+    q.put(_message(content="c0"))
+    assert not q.put(_message(content="c1"))  # Không đẩy tin cùng lớp
+    assert not q.put(_bulk())                 # Lớp thấp hơn không đẩy lớp cao
+    stats = q.stats()
+    assert stats['chat']['dropped'] == 1 and stats['bulk']['dropped'] == 1
+    assert stats['chat']['evicted'] == stats['control']['evicted'] == 0
+
+
+@pytest.mark.parametrize("msg_type", [MessageType.DISCOVERY, MessageType.DISCOVERY_RESPONSE,
+                                      MessageType.HEARTBEAT])
+def test_coalesces_latest_per_sender(msg_type):
+    q = PriorityMessageQueue(bounds=(2, 5, 5))
+    q.put(_message(msg_type, "alice_7000", "v1"))
+    q.put(_message(msg_type, "bob_7001", "bob"))
+    # Lớp control đã đầy nhưng tin gộp không cần chỗ mới
+    assert q.put(_message(msg_type, "alice_7000", "v2"))
+    assert q.put(_message(msg_type, "alice_7000", "v3"))
+
+    stats = q.stats()['control']
+    assert stats['coalesced'] == 2 and stats['dropped'] == 0
+    # Giữ vị trí cũ, nội dung mới nhất
+    assert [m.content for m in _drain(q)] == ["v3", "bob"]
+
+    # Đã lấy ra: tin sau được xếp hàng lại bình thường
+    assert q.put(_message(msg_type, "alice_7000", "v4"))
+    assert q.qsize() == 1
+
+
+def test_coalesce_keyed_by_type_and_not_for_chat():
+    q = PriorityMessageQueue()
+    q.put(_message(MessageType.DISCOVERY, "alice_7000", "d"))
+    q.put(_message(MessageType.HEARTBEAT, "alice_7000", "h"))
+    q.put(_message(MessageType.TEXT, "alice_7000", "t1"))
+    q.put(_message(MessageType.TEXT, "alice_7000", "t2"))
+    assert q.qsize() == 4
+    assert sum(stats['coalesced'] for stats in q.stats().values()) == 0
+
+
+def test_evicted_coalesced_entry_is_forgotten():
+    q = PriorityMessageQueue(bounds=(5, 5, 5), capacity=1)
+    q.put(_message(MessageType.HEARTBEAT, "alice_7000", "h1"), priority=PRIORITY_BULK)
+    assert q.put(_message(content="c0"))  # Đẩy heartbeat (xếp ở lớp bulk) ra
+    assert q.stats()['bulk']['evicted'] == 1
+    # Heartbeat sau không gộp vào tin đã bị bỏ
+    q.put(_message(MessageType.HEARTBEAT, "alice_7000", "h2"))
+    assert q.stats()['control']['coalesced'] == 0
+
+
+def test_low_priority_served_after_starve_limit():
+    q = PriorityMessageQueue(bounds=(100, 10, 10), starve_limit=4)
+    for i in range(20):
+        q.put(_control(f"peer_{i}"))
+    q.put(_message(content="chat"))
+    q.put(_bulk("bulk"))
+
+    order = [classify(m) for m in _drain(q)]
+    # Sau 4 lần bị bỏ qua lớp chat được lấy 1 tin; bulk đợi thêm đến lượt mình
+    assert order.index(PRIORITY_CHAT) == 4
+    assert order.index(PRIORITY_BULK) == 5
+    stats = q.stats()
+    assert stats['chat']['promoted'] == 1 and stats['bulk']['promoted'] == 1
+    assert stats['control']['promoted'] == 0
+
+
+def test_starvation_counter_resets_when_class_served():
+    q = PriorityMessageQueue(bounds=(100, 10, 10), starve_limit=3)
+    for i in range(10):
+        q.put(_control(f"peer_{i}"))
+    for i in range(3):
+        q.put(_message(content=f"c{i}"))
+    order = [classify(m) for m in _drain(q)]
+    # Mỗi tin chat chờ lại đủ 3 lần trước khi được lấy sớm
+    assert order == [0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0]
+    assert q.stats()['chat']['promoted'] == 3
+
+
+def test_on_wait_reports_class():
+    waits = []
+    q = PriorityMessageQueue(on_wait=lambda priority, seconds: waits.append((priority, seconds)))
+    q.put(_bulk())
+    q.get_nowait()
+    assert waits[0][0] == PRIORITY_BULK and waits[0][1] >= 0
+
+
+def test_get_timeout_and_close():
+    q = PriorityMessageQueue()
+    with pytest.raises(queue.Empty):
+        q.get(timeout=0.01)
+
+    errors = []
+
+    def waiter():
+        try:
+            q.get()
+        except queue.Empty:
+            errors.append("closed")
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    q.close()
+    thread.join(2)
+    assert errors == ["closed"]
@@ -0,0 +1,99 @@
+"""
+Kiểm tra giới hạn tốc độ nhận và cách ly người gửi flood
+"""
+import os
+from core.fragment import FRAGMENT_PAYLOAD, fragment
+from core.message import MessageType
+from core.network import NetworkManager
+from core.ratelimit import RateLimiter, parse_rate_limit
+from core.sharding import _Shard
+from utils.logger import Logger
+
+VICTIM, ATTACKER = "10.0.0.2", "10.0.0.66"
+
+
+def _limiter(**kwargs) -> RateLimiter:
+    limiter = RateLimiter({MessageType.DISCOVERY: (1.0, 5.0)}, **kwargs)
+    limiter.QUARANTINE_DROPS = 10
+    return limiter
+
+
+def _flood(limiter: RateLimiter, source: str, count: int = 50):
+    for _ in range(count):
+        limiter.allow("victim_5000", MessageType.DISCOVERY, source)
+
+
+def test_burst_then_drop():
+    limiter = _limiter(quarantine_time=0)
+    results = [limiter.allow("a", MessageType.DISCOVERY, VICTIM) for _ in range(7)]
+    assert results == [True] * 5 + [False] * 2
+    assert limiter.allow("a", MessageType.TEXT, VICTIM)  # Không giới hạn
+
+
+def test_flooder_is_quarantined():
+    limiter = _limiter()
+    _flood(limiter, VICTIM)
+    assert limiter.stats()['quarantines'] == 1
+    assert not limiter.allow("victim_5000", MessageType.PRIVATE_MESSAGE, VICTIM)
+    assert list(limiter.quarantined()) == [f"victim_5000@{VICTIM}"]
+
+
+def test_spoofed_sender_id_does_not_quarantine_victim():
+    limiter = _limiter()
+    _flood(limiter, ATTACKER)
+    assert limiter.stats()['quarantines'] == 1
+    assert limiter.allow("victim_5000", MessageType.DISCOVERY, VICTIM)
+    assert limiter.allow("victim_5000", MessageType.PRIVATE_MESSAGE, VICTIM)
+
+
+def test_ack_passes_quarantine():
+    limiter = _limiter()
+    _flood(limiter, VICTIM)
+    assert limiter.allow("victim_5000", MessageType.ACK, VICTIM)
+
+
+def test_release():
+    limiter = _limiter()
+    _flood(limiter, VICTIM)
+    limiter.release("victim_5000")
+    assert not limiter.quarantined()
+    assert limiter.allow("victim_5000", MessageType.PRIVATE_MESSAGE, VICTIM)
+
+
+def test_parse_rate_limit():
+    assert parse_rate_limit("text=20/50") == (MessageType.TEXT, (20.0, 50.0))
+    assert parse_rate_limit("discovery=off") == (MessageType.DISCOVERY, None)
+
+
+def test_fragments_limited_per_source_ip():
+    limiter = _limiter(fragment_limit=(1.0, 3.0))
+    assert [limiter.allow_fragment(ATTACKER) for _ in range(5)] == [True] * 3 + [False] * 2
+    assert limiter.allow_fragment(VICTIM)
+    assert limiter.stats()['dropped'] == {'fragment': 2}
+    # Chưa biết sender_id: không cách ly ai
+    assert not limiter.quarantined()
+    assert RateLimiter(fragment_limit=None).allow_fragment(ATTACKER)
+
+
+def test_fragment_flood_dropped_before_reassembly(tmp_path):
+    logger = Logger(f"test_{tmp_path.name}", log_file=str(tmp_path / "test.log"))
+    network = NetworkManager(9000, "bob", logger, reliable=False, host="127.0.0.1", rate_limits={})
+    network.rate_limiter.fragment_limit = (1.0, 3.0)
+    parts = fragment(os.urandom(100_000))
+    for part in parts:
+        assert network._handle_datagram(part, (ATTACKER, 7000)) is None
+    assert network.filtered['rate_limited'] == len(parts) - 3
+    assert network.reassembler.stats()['buffered_bytes'] == 3 * FRAGMENT_PAYLOAD
+    # IP khác vẫn gửi được
+    assert network._handle_datagram(parts[0], (VICTIM, 7000)) is None
+    assert network.filtered['rate_limited'] == len(parts) - 3
+
+
+def test_shard_limits_fragments():
+    shard = _Shard("bob_9000", 60.0, 100, fragment_limit=(1.0, 3.0))
+    records = []
+    for part in fragment(os.urandom(100_000)):
+        shard.handle(part, records, ATTACKER)
+    assert records == []
+    assert shard.counts['rate_limited'] > 0
+    assert len(shard.reassembler) == 1
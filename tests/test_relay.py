@@ -0,0 +1,74 @@
+"""
+Kiểm tra relay: chỉ fan-out đến peer đã biết, giới hạn số đích trong 1 tin RELAY
+"""
+import pytest
+from core.addressing import AddressBook, Endpoint
+from core.message import Message, MessageType
+from core.network import NetworkManager
+from core.relay import MAX_RELAY_TARGETS, unwrap, wrap
+from utils.logger import Logger
+
+HOST = "127.0.0.1"
+CLIENT = Endpoint(HOST, 7000)
+
+
+@pytest.fixture
+def relay(tmp_path):
+    logger = Logger(f"test_{tmp_path.name}", log_file=str(tmp_path / "test.log"))
+    network = NetworkManager(9000, "hub", logger, reliable=False, relay=True, host=HOST)
+    network.sent = []
+    network.send_to_ports = lambda message, ports: network.sent.append((message, ports))
+    network.addresses.learn("alice_7000", CLIENT.host, CLIENT.port)
+    return network
+
+
+def _relay_message(targets: list) -> Message:
+    message = Message(MessageType.GROUP_MESSAGE, "alice_7000", "Alice", CLIENT.port, "xin chào",
+                      group_id="g1")
+    relayed = wrap(message, targets, HOST)
+    relayed.sender_host = CLIENT.host
+    return relayed
+
+
+def test_unwrap_rejects_too_many_targets():
+    targets = [Endpoint(HOST, 10000 + i) for i in range(MAX_RELAY_TARGETS + 1)]
+    with pytest.raises(ValueError):
+        unwrap(_relay_message(targets), 9000, HOST)
+    inner, parsed = unwrap(_relay_message(targets[:MAX_RELAY_TARGETS]), 9000, HOST)
+    assert parsed == targets[:MAX_RELAY_TARGETS]
+    assert inner.msg_type == MessageType.GROUP_MESSAGE and inner.via == 9000
+
+
+def test_relay_sends_only_to_known_peers(relay):
+    bob, carol = Endpoint(HOST, 7001), Endpoint("10.0.0.3", 7002)
+    relay.addresses.learn("bob_7001", bob.host, bob.port)
+    relay._peer_caps[carol] = {"relay1"}  # Chỉ thấy qua discovery
+    victim = Endpoint("10.9.9.9", 53)
+    relay._relay(_relay_message([bob, victim, carol, CLIENT]))
+
+    [(inner, ports)] = relay.sent
+    assert ports == [bob, carol]
+    assert inner.msg_id and inner.via == relay.port
+    assert relay.relay_stats() == {'relayed': 1, 'rejected': 0, 'unknown_targets': 1}
+
+
+def test_relay_drops_oversized_target_list(relay):
+    targets = [Endpoint(HOST, 10000 + i) for i in range(MAX_RELAY_TARGETS + 1)]
+    for i, target in enumerate(targets):
+        relay.addresses.learn(f"peer_{i}", target.host, target.port)
+    relay._relay(_relay_message(targets))
+    assert relay.sent == []
+    assert relay.relay_stats()['rejected'] == 1
+
+
+def test_address_book_reverse_lookup():
+    book = AddressBook()
+    book.learn("bob_7001", HOST, 7001)
+    assert book.knows(Endpoint(HOST, 7001))
+    # Đổi địa chỉ (đã xác nhận): endpoint cũ không còn được coi là đã biết
+    for _ in range(AddressBook.MOVE_CONFIRMATIONS):
+        book.learn("bob_7001", "10.0.0.2", 7001, confirmed=True)
+    assert not book.knows(Endpoint(HOST, 7001))
+    assert book.knows(Endpoint("10.0.0.2", 7001))
+    book.forget("bob_7001")
+    assert not book.knows(Endpoint("10.0.0.2", 7001))
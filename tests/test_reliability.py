@@ -0,0 +1,241 @@
+"""
+Kiểm tra lớp tin cậy: mất gói, truyền lại, Karn và backoff RTO
+"""
+import threading
+import time
+import pytest
+from core.codec import CODEC_BINARY, decode_message
+from core.message import Message, MessageType
+from core.reliability import LossyTransport, ReliabilityLayer, format_ack, parse_ack
+from utils.logger import Logger
+
+ALICE, BOB = 7000, 7001
+
+
+@pytest.fixture
+def logger(tmp_path):
+    return Logger(f"test_{tmp_path.name}", log_file=str(tmp_path / "test.log"))
+
+
+class _Node:
+    """Endpoint gắn ReliabilityLayer vào LossyTransport, ghi lại tin nhận được"""
+
+    def __init__(self, port: int, transport: LossyTransport, logger: Logger):
+        self.received = []
+        self._lock = threading.Lock()
+        self.layer = ReliabilityLayer(f"user_{port}", f"User {port}", port,
+                                      transport.send, lambda _port: CODEC_BINARY, logger)
+        transport.register(port, self._receive)
+
+    def _receive(self, data: bytes):
+        message = decode_message(data)
+        if message.msg_type == MessageType.ACK:
+            self.layer.on_ack(message)
+        elif self.layer.on_data(message):
+            with self._lock:
+                self.received.append(message.content)
+
+
+def _message(i: int) -> Message:
+    return Message(MessageType.PRIVATE_MESSAGE, "user_7000", "User 7000", ALICE, f"tin {i}",
+                   target_id="user_7001")
+
+
+def _layer(logger, sent):
+    """Layer gửi vào list (không có mạng), dispatch chạy ngay trên thread gọi"""
+    return ReliabilityLayer("user_7000", "User 7000", ALICE,
+                            lambda data, port: sent.append((data, port)),
+                            lambda _port: CODEC_BINARY, logger)
+
+
+def _ack(layer: ReliabilityLayer, cumulative: int) -> Message:
+    return Message(MessageType.ACK, "user_7001", "User 7001", BOB,
+                   format_ack(layer.epoch, cumulative, []))
+
+
+def _expire(layer: ReliabilityLayer, port: int):
+    """Làm mọi gói đang chờ đến hạn rồi chạy hẹn giờ của peer"""
+    peer = layer._peers[port]
+    for pending in peer.unacked.values():
+        pending.deadline = 0.0
+    peer.next_check = 0.0
+    layer._on_timer(port)
+
+
+def test_ack_round_trip():
+    assert parse_ack(format_ack(5, 10, [12, 13, 14, 20])) == (5, 10, [(12, 14), (20, 20)])
+
+
+def test_lossy_link_delivers_everything_once(logger):
+    count = 200
+    transport = LossyTransport(loss_rate=0.2, delay=0.001, jitter=0.002, seed=7)
+    alice = _Node(ALICE, transport, logger)
+    bob = _Node(BOB, transport, logger)
+    alice.layer.MAX_RETRIES = 30
+    alice.layer.MAX_RTO = 0.2
+    alice.layer.start()
+    bob.layer.start()
+    try:
+        results = [alice.layer.send(_message(i), [BOB]) for i in range(count)]
+        for result in results:
+            assert result.wait(30)
+        assert all(BOB in r.confirmed for r in results)
+        assert alice.layer.retransmits > 0 and transport.dropped > 0
+
+        # Mỗi tin đúng một lần, bên nhận đã có liền mạch seq 1..count
+        assert sorted(bob.received) == sorted(f"tin {i}" for i in range(count))
+        peer = bob.layer._peers[ALICE]
+        assert peer.recv_cumulative == count
+        assert not peer.recv_selective
+        assert alice.layer.stats()['in_flight'] == 0
+    finally:
+        alice.layer.stop()
+        bob.layer.stop()
+        transport.close()
+
+
+def test_duplicate_data_not_delivered_twice(logger):
+    sent = []
+    receiver = _layer(logger, sent)
+    message = _message(1)
+    message.epoch, message.seq, message.seq_base = 42, 1, 1
+    assert receiver.on_data(message, BOB)
+    assert not receiver.on_data(message, BOB)
+    assert receiver.duplicates == 1
+    assert sent  # Gói trùng được ACK ngay
+
+
+def test_rtt_sample_from_fresh_packet(logger):
+    sent = []
+    layer = _layer(logger, sent)
+    layer.running = True
+    result = layer.send(_message(1), [BOB])
+    layer.on_ack(_ack(layer, 1))
+    peer = layer._peers[BOB]
+    assert result.is_done() and BOB in result.confirmed
+    assert peer.srtt is not None
+    assert layer.MIN_RTO <= peer.rto < layer.INITIAL_RTO
+
+
+def test_karn_ignores_retransmitted_packet(logger):
+    sent = []
+    layer = _layer(logger, sent)
+    layer.running = True
+    layer.send(_message(1), [BOB])
+    _expire(layer, BOB)
+    assert layer.retransmits == 1
+    assert len(sent) == 2 and sent[0][0] == sent[1][0]  # Truyền lại đúng bytes đã gửi
+
+    layer.on_ack(_ack(layer, 1))
+    peer = layer._peers[BOB]
+    assert not peer.unacked
+    assert peer.srtt is None
+    assert peer.rto == layer.INITIAL_RTO
+
+
+def test_rto_backoff_doubles_until_max(logger):
+    sent = []
+    layer = _layer(logger, sent)
+    layer.running = True
+    layer.MAX_RTO = 3.0
+    layer.send(_message(1), [BOB])
+    pending = layer._peers[BOB].unacked[1]
+    assert pending.deadline - pending.sent_at == pytest.approx(layer.INITIAL_RTO)
+
+    for retries in range(1, 6):
+        _expire(layer, BOB)
+        assert pending.retries == retries
+        expected = min(layer.MAX_RTO, layer.INITIAL_RTO * 2 ** retries)
+        assert pending.deadline - pending.sent_at == pytest.approx(expected)
+
+
+def test_gives_up_after_max_retries(logger):
+    sent, failed = [], []
+    layer = _layer(logger, sent)
+    layer.running = True
+    layer.MAX_RETRIES = 3
+    layer.on_delivery_failed = lambda message, port: failed.append(port)
+    result = layer.send(_message(1), [BOB])
+    for _ in range(layer.MAX_RETRIES + 1):
+        _expire(layer, BOB)
+
+    assert len(sent) == layer.MAX_RETRIES + 1
+    assert result.is_done()
+    assert BOB not in result.confirmed and result.failed == {BOB: 1}
+    assert failed == [BOB]
+    assert layer.gave_up == 1 and not layer._peers[BOB].unacked
+
+
+def test_window_limits_packets_in_flight(logger):
+    sent = []
+    layer = _layer(logger, sent)
+    layer.running = True
+    layer.WINDOW = 4
+    for i in range(10):
+        layer.send(_message(i), [BOB])
+    assert len(sent) == 4
+    assert layer.stats()['queued'] == 6
+
+    layer.on_ack(_ack(layer, 4))
+    assert len(sent) == 8
+    seqs = [decode_message(data).seq for data, _ in sent]
+    assert seqs == list(range(1, 9))
+
+
+def test_idle_peer_pruned_and_seq_continues(logger):
+    sent = []
+    layer = _layer(logger, sent)
+    layer.running = True
+    for i in range(3):
+        layer.send(_message(i), [BOB])
+    # Còn gói chờ ACK: không dọn dù đã quá hạn
+    assert layer.expire(now=time.monotonic() + layer.PEER_IDLE_TIMEOUT + 1) == 0
+
+    layer.on_ack(_ack(layer, 3))
+    assert layer.expire() == 0  # Vừa hoạt động
+    assert layer.expire(now=time.monotonic() + layer.PEER_IDLE_TIMEOUT + 1) == 1
+    assert BOB not in layer._peers
+
+    # Peer tạo lại tiếp tục seq cũ: bên nhận còn nhớ epoch không coi là trùng
+    layer.send(_message(3), [BOB])
+    assert decode_message(sent[-1][0]).seq == 4
+
+
+def test_receiver_state_pruned_after_ack(logger):
+    sent = []
+    receiver = _layer(logger, sent)
+    message = _message(1)
+    message.epoch, message.seq, message.seq_base = 42, 1, 1
+    receiver.on_data(message, BOB)
+    # ACK trễ chưa gửi: chưa dọn
+    assert receiver.expire(now=time.monotonic() + receiver.PEER_IDLE_TIMEOUT + 1) == 0
+    receiver.running = True
+    receiver._peers[BOB].ack_due = 0.0
+    receiver._on_timer(BOB)
+    assert receiver.expire(now=time.monotonic() + receiver.PEER_IDLE_TIMEOUT + 1) == 1
+
+
+def test_out_of_window_seq_not_tracked(logger):
+    sent = []
+    receiver = _layer(logger, sent)
+    window = receiver.RECV_WINDOW
+
+    def deliver(seq: int) -> bool:
+        message = _message(seq)
+        message.epoch, message.seq, message.seq_base = 42, seq, 1
+        return receiver.on_data(message, BOB)
+
+    # Seq 1 mất: giữ tối đa cửa sổ nhận gói đến sớm, gói xa hơn bị bỏ và không được ACK
+    for seq in range(2, window + 100):
+        deliver(seq)
+    peer = receiver._peers[BOB]
+    assert max(peer.recv_selective) == window
+    assert len(peer.recv_selective) == window - 1
+    assert receiver.out_of_window == 99
+    assert not deliver(10 ** 9)
+
+    # Lấp khoảng trống: cửa sổ trượt, gói truyền lại được nhận
+    assert deliver(1)
+    assert peer.recv_cumulative == window and not peer.recv_selective
+    assert deliver(window + 1)
+    assert receiver.stats()['out_of_window'] == 100
@@ -0,0 +1,154 @@
+"""
+Kiểm tra timer wheel: cascade giữa các tầng, hủy, lặp lại, call_later(0), thứ tự chạy
+Phần lớn chạy wheel bằng tay (_advance) với tick 1 giây: không phụ thuộc thời gian thật
+"""
+import threading
+import pytest
+from core.scheduler import TimerWheel
+
+
+@pytest.fixture
+def wheel():
+    return TimerWheel(tick=1.0)
+
+
+def _at(wheel: TimerWheel, tick: int) -> float:
+    """Hạn rơi đúng vào tick"""
+    return wheel._origin + (tick - 0.5) * wheel.tick
+
+
+def _run(wheel: TimerWheel, until: int) -> list:
+    """Chạy wheel đến tick `until`, trả về nhãn của các hẹn giờ đến hạn"""
+    labels = []
+    for handle in wheel._advance(until):
+        labels.append(handle.args[0])
+        wheel._fire(handle)
+    return labels
+
+
+def test_level_boundaries():
+    wheel = TimerWheel()
+    assert wheel._limits == [512, 512 * 64, 512 * 64 * 64]
+    assert wheel._span == 1 << 27
+
+
+@pytest.mark.parametrize("tick", [2, 511, 512, 513, 1023, 1024, 5000, 32767, 32768,
+                                  40000, 2_097_152, 3_000_000, (1 << 27) + 1000])
+def test_fires_exactly_on_its_tick(wheel, tick):
+    wheel.call_at(_at(wheel, tick), lambda label: None, tick)
+    assert _run(wheel, tick - 1) == []
+    assert _run(wheel, tick) == [tick]
+    assert len(wheel) == 0
+    if tick > 512:  # Quá một vòng tầng 0 tính từ tick 1
+        assert wheel.cascaded > 0
+
+
+def test_many_deadlines_across_levels_fire_in_order(wheel):
+    ticks = [700, 3, 40000, 512, 100_000, 33000, 511, 2_500_000, 1024, 64]
+    for tick in ticks:
+        wheel.call_at(_at(wheel, tick), lambda label: None, tick)
+    fired = []
+    for tick in sorted(ticks):
+        fired += _run(wheel, tick)
+        assert fired[-1] == tick
+    assert fired == sorted(ticks)
+
+
+def test_cancel_before_cascade(wheel):
+    handle = wheel.call_at(_at(wheel, 1000), lambda label: None, "x")
+    assert handle._level == 1
+    handle.cancel()
+    assert len(wheel) == 0
+    assert _run(wheel, 2000) == []
+    assert wheel.cancelled == 1
+
+
+def test_cancel_after_cascade(wheel):
+    handle = wheel.call_at(_at(wheel, 1000), lambda label: None, "x")
+    other = wheel.call_at(_at(wheel, 1001), lambda label: None, "y")
+    assert _run(wheel, 700) == []
+    assert handle._level == 0  # Đã chuyển xuống tầng 0 ở tick 512
+    handle.cancel()
+    handle.cancel()  # Hủy lần 2 không ảnh hưởng gì
+    assert _run(wheel, 2000) == ["y"]
+    assert wheel.cancelled == 1
+    assert len(wheel) == 0 and other.cancelled
+
+
+def test_periodic_rearms_without_drift(wheel):
+    handle = wheel.call_every(5.0, lambda label: None, "tick")
+    first = handle._tick
+    fired_at = [t for t in range(1, 3000) if _run(wheel, t)]
+    assert fired_at[0] == first
+    assert all(b - a == 5 for a, b in zip(fired_at, fired_at[1:]))
+    assert len(fired_at) == (2999 - first) // 5 + 1
+    assert len(wheel) == 1  # Đã đặt lại cho lần sau
+
+    handle.cancel()
+    assert _run(wheel, 4000) == []
+    assert len(wheel) == 0
+
+
+def test_periodic_cancelled_from_callback(wheel):
+    calls = []
+
+    def callback(label):
+        calls.append(label)
+        if len(calls) == 3:
+            handle.cancel()
+
+    handle = wheel.call_every(2.0, callback, "p")
+    for t in range(1, 100):
+        for due in wheel._advance(t):
+            wheel._fire(due)
+    assert calls == ["p"] * 3
+    assert len(wheel) == 0
+
+
+def test_equal_deadlines_fire_in_scheduling_order(wheel):
+    deadline = _at(wheel, 1000)
+    # Đặt sớm: nằm ở tầng 1, xuống tầng 0 khi cascade ở tick 512
+    for i in range(10):
+        wheel.call_at(deadline, lambda label: None, i)
+    assert _run(wheel, 490) == []
+    # Đặt muộn: vào thẳng ô tầng 0 - vẫn chạy sau các hẹn giờ đã đặt trước
+    for i in range(10, 20):
+        wheel.call_at(deadline, lambda label: None, i)
+    assert _run(wheel, 1000) == list(range(20))
+
+
+def test_earlier_deadline_in_same_tick_fires_first(wheel):
+    base = wheel._origin + 99 * wheel.tick
+    wheel.call_at(base + 0.9, lambda label: None, "late")
+    wheel.call_at(base + 0.1, lambda label: None, "early")
+    assert _run(wheel, 100) == ["early", "late"]
+
+
+def test_call_later_zero_fires_on_next_tick(wheel):
+    wheel.call_later(0, lambda label: None, "now")
+    assert _run(wheel, wheel._tick_of(wheel._origin) + 2) == ["now"]
+
+
+def test_call_later_zero_wakes_running_wheel():
+    wheel = TimerWheel()
+    fired = threading.Event()
+    wheel.start()
+    try:
+        wheel.call_later(3600, fired.set)  # Thread đang chờ hẹn giờ xa
+        wheel.call_later(0, fired.set)
+        assert fired.wait(1)
+    finally:
+        wheel.stop()
+
+
+def test_callback_error_does_not_stop_wheel():
+    wheel = TimerWheel()
+    fired = threading.Event()
+    wheel.start()
+    try:
+        wheel.call_later(0, lambda: 1 / 0)
+        wheel.call_later(0.01, fired.set)
+        assert fired.wait(1)
+        assert wheel.errors == 1
+    finally:
+        wheel.stop()
@@ -0,0 +1,81 @@
+"""
+Kiểm tra số liệu của worker nhận: gói/byte nhận và tin bị lọc được cộng vào chỉ số
+của tiến trình chính
+"""
+import socket
+import time
+import pytest
+from core.codec import CODEC_BINARY, encode_message
+from core.message import Message, MessageType
+from core.network import NetworkManager
+from core.sharding import ReceiveWorkerPool, _Shard
+from utils.logger import Logger
+
+HOST = "127.0.0.1"
+
+
+@pytest.fixture
+def logger(tmp_path):
+    return Logger(f"test_{tmp_path.name}", log_file=str(tmp_path / "test.log"))
+
+
+def _text(sender_id: str = "alice_7000", content: str = "xin chào") -> bytes:
+    return encode_message(Message(MessageType.TEXT, sender_id, "Alice", 7000, content), CODEC_BINARY)
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def test_shard_counts_datagrams_and_bytes():
+    shard = _Shard("bob_9000", 60.0, 100)
+    records = []
+    text, own = _text(), _text("bob_9000")
+    for data in (text, own, b"\xb1"):
+        shard.handle(data, records, HOST)
+    assert len(records) == 1
+    counts = shard.counts
+    assert counts['datagrams'] == 3 and counts['bytes'] == len(text) + len(own) + 1
+    assert counts['own'] == 1 and counts['errors'] == 1
+    assert shard.received_bytes == {MessageType.TEXT.value: len(text) + len(own)}
+
+
+def test_pool_reports_increments(logger):
+    reports = []
+    pool = ReceiveWorkerPool(9000, "bob_9000", 2, logger,
+                             on_stats=lambda counts, sizes: reports.append((counts, sizes)))
+    pool._report(11, {'datagrams': 3, 'own': 1}, {'text': 300})
+    pool._report(12, {'datagrams': 5, 'own': 0}, {'text': 50})
+    pool._report(11, {'datagrams': 4, 'own': 2}, {'text': 350, 'ack': 20})
+    assert reports[2] == ({'datagrams': 1, 'own': 1}, {'text': 50, 'ack': 20})
+    assert pool.stats()[11] == {'datagrams': 4, 'own': 2}
+
+
+def test_worker_stats_feed_metrics(logger):
+    network = NetworkManager(9000, "bob", logger, reliable=False, host=HOST)
+    network._on_worker_stats({'datagrams': 3, 'own': 1, 'errors': 2}, {'text': 300})
+    network._on_worker_stats({'datagrams': 1, 'own': 0, 'errors': 0}, {'text': 50})
+    assert network._m_received_bytes[MessageType.TEXT].value == 350
+    assert network._m_receive_errors.value == 2
+    assert network.filtered['own'] == 1
+
+
+@pytest.mark.skipif(not hasattr(socket, "SO_REUSEPORT"), reason="cần SO_REUSEPORT")
+def test_received_bytes_metric_with_workers(logger):
+    network = NetworkManager(_free_port(), "bob", logger, reliable=False, host=HOST,
+                             receive_workers=1)
+    assert network.start()
+    try:
+        data = _text()
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(data, (HOST, network.port))
+        received = network._m_received_bytes[MessageType.TEXT]
+        deadline = time.monotonic() + 10
+        while received.value == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert received.value == len(data)
+        assert 'lanchat_received_bytes_total{type="text"}' in network.metrics.render()
+    finally:
+        network.stop()
@@ -0,0 +1,154 @@
+"""
+Kiểm tra TCP pool: send không chặn, peer chậm/chết không giữ thread gửi, fallback UDP
+"""
+import socket
+import threading
+import time
+import pytest
+from core.addressing import Endpoint
+from core.tcp_pool import TcpConnectionPool
+from utils.logger import Logger
+
+HOST = "127.0.0.1"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def logger(tmp_path):
+    return Logger(f"test_{tmp_path.name}", log_file=str(tmp_path / "test.log"))
+
+
+@pytest.fixture
+def pools(logger):
+    started = []
+
+    def make(on_frame=lambda data, addr: None, **kwargs) -> TcpConnectionPool:
+        pool = TcpConnectionPool(_free_port(), logger, on_frame, host=HOST, **kwargs)
+        pool.start()
+        started.append(pool)
+        return pool
+
+    yield make
+    for pool in started:
+        pool.stop()
+
+
+class _Fallback:
+    """Ghi lại khung pool trả về đường UDP"""
+
+    def __init__(self):
+        self.frames = []
+        self.event = threading.Event()
+
+    def __call__(self, data: bytes, endpoint: Endpoint):
+        self.frames.append((data, endpoint))
+        self.event.set()
+
+
+def test_frames_delivered_in_order(pools):
+    received, done = [], threading.Event()
+
+    def on_frame(data, addr):
+        received.append(data)
+        if len(received) == 500:
+            done.set()
+
+    receiver = pools(on_frame)
+    sender = pools()
+    target = Endpoint(HOST, receiver.port)
+    assert all(sender.send(target, b"m%d" % i) for i in range(500))
+    assert done.wait(5)
+    assert received == [b"m%d" % i for i in range(500)]
+    assert sender.stats()['connects'] == 1
+
+
+def test_refused_connect_falls_back_and_backs_off(pools):
+    sender = pools()
+    fallback = _Fallback()
+    target = Endpoint(HOST, _free_port())  # Không ai nghe
+    assert sender.send(target, b"x", fallback)
+    assert fallback.event.wait(5)
+    assert fallback.frames == [(b"x", target)]
+    # Trong RETRY_AFTER: caller gửi UDP ngay, không thử connect lại
+    assert not sender.send(target, b"y", fallback)
+    assert sender.stats()['connect_failures'] == 1
+
+
+def test_stalled_peer_does_not_block_sender(pools):
+    # Peer nhận kết nối nhưng không bao giờ đọc
+    server = socket.socket()
+    server.bind((HOST, 0))
+    server.listen()
+    held = []
+    threading.Thread(target=lambda: held.append(server.accept()), daemon=True).start()
+
+    received = threading.Event()
+    other = pools(lambda data, addr: received.set())
+    sender = pools()
+    sender.MAX_QUEUED = 256 * 1024
+    sender.IO_TIMEOUT = 0.3
+    stalled = Endpoint(HOST, server.getsockname()[1])
+    fallback = _Fallback()
+    try:
+        # Gửi đến khi buffer kernel và hàng của kết nối đầy; không lần gửi nào được chặn
+        chunk = b"z" * 64 * 1024
+        refused, slowest = 0, 0.0
+        deadline = time.monotonic() + 10
+        while not fallback.event.is_set() and time.monotonic() < deadline:
+            started = time.monotonic()
+            if not sender.send(stalled, chunk, fallback):
+                refused += 1  # Hàng đầy -> caller dùng UDP
+                time.sleep(0.01)
+            slowest = max(slowest, time.monotonic() - started)
+        assert refused and slowest < 0.1
+
+        # Peer khác vẫn nhận ngay
+        assert sender.send(Endpoint(HOST, other.port), b"hello")
+        assert received.wait(2)
+
+        # Không ghi tiếp được quá IO_TIMEOUT: bỏ kết nối, khung còn lại qua fallback
+        assert fallback.event.is_set()
+        assert all(endpoint == stalled for _, endpoint in fallback.frames)
+        assert stalled not in sender._outbound
+    finally:
+        server.close()
+        for conn, _ in held:
+            conn.close()
+
+
+def test_peer_close_detected_and_reconnected(pools):
+    received = []
+    receiver = pools(lambda data, addr: received.append(data))
+    sender = pools()
+    target = Endpoint(HOST, receiver.port)
+    assert sender.send(target, b"first")
+    deadline = time.monotonic() + 5
+    while not received and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    # Bên nhận đóng kết nối (vd. hết idle): bên gửi thấy FIN và mở kết nối mới
+    for inbound in list(receiver._inbound.values()):
+        inbound.sock.shutdown(socket.SHUT_RDWR)
+    while sender.stats()['outbound'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sender.send(target, b"second")
+    while len(received) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert received == [b"first", b"second"]
+    assert sender.stats()['connects'] == 2
+
+
+def test_idle_connections_closed(pools):
+    receiver = pools(idle_timeout=0.1)
+    sender = pools(idle_timeout=0.1)
+    assert sender.send(Endpoint(HOST, receiver.port), b"x")
+    deadline = time.monotonic() + 5
+    while (sender.stats()['outbound'] or receiver.stats()['inbound']) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert sender.stats()['idle_closed'] == 1
+    assert receiver.stats()['inbound'] == 0
@@ -1 +1,9 @@
-from .gui import ChatGUI
\ No newline at end of file
+from .headless import HeadlessUI
+
+
+def __getattr__(name):
+    # ChatGUI import tkinter - chỉ nạp khi cần (chế độ headless/relay không có Tk)
+    if name == "ChatGUI":
+        from .gui import ChatGUI
+        return ChatGUI
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,53 +2,66 @@
 Module giao diện người dùng - Tối ưu để không lag
 """
 import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox
+from tkinter import ttk, scrolledtext, messagebox, filedialog
 import threading
+import queue
 import time as time_module
 from typing import Dict, Optional, Callable, List
 from collections import defaultdict
+from core.addressing import Endpoint, node_id
+from core.deltas import Delta
 from core.message import Message, MessageType, EMOJI_LIST
 from core.discovery import Device
+from utils.logger import Logger
 
 
 class ChatGUI:
     """Giao diện chat chính"""
 
-    def __init__(self, user_name: str, port: int):
+    def __init__(self, user_name: str, port: int, host: Optional[str] = None,
+                 logger: Optional[Logger] = None):
         self.user_name = user_name
+        self.logger = logger
         self.port = port
-        self.user_id = f"{user_name}_{port}"
+        self.host = host
+        self.user_id = node_id(user_name, port, host)
+        self.address = f"{host}:{port}" if host else f"Port: {port}"
 
         # Callbacks
         self.on_send_broadcast: Optional[Callable[[str], None]] = None
-        self.on_send_private: Optional[Callable[[str, str, int], None]] = None
+        self.on_send_private: Optional[Callable[[str, str, Optional[Endpoint]], None]] = None
         self.on_send_group: Optional[Callable[[str, str], None]] = None
         self.on_create_group: Optional[Callable[[str, list], None]] = None
         self.on_scan_devices: Optional[Callable[[], None]] = None
+        self.on_send_file: Optional[Callable[[str, str, str, Optional[Endpoint]], None]] = None
+        self.on_file_response: Optional[Callable[[str, bool], None]] = None
         self.on_close: Optional[Callable[[], None]] = None
 
         # Chat state
         self.current_chat_id = "broadcast"
         self.current_chat_type = "broadcast"
         self.current_chat_name = "Broadcast"
-        self.current_target_port = None
+        self.current_target: Optional[Endpoint] = None
 
         # Data
         self.chat_histories: Dict[str, List[dict]] = defaultdict(list)
         self.unread_counts: Dict[str, int] = defaultdict(int)
+        self._transfer_chats: Dict[str, str] = {}  # transfer_id -> chat hiển thị tiến độ
 
         self._devices: Dict[str, Device] = {}
         self._groups: Dict[str, any] = {}
         self._data_lock = threading.Lock()
 
-        # Throttling
-        self._last_devices_hash = ""
-        self._last_groups_hash = ""
-        self._update_scheduled = False
+        # Hàng đợi lời gọi từ thread khác (network/asyncio) sang Tk thread
+        # schedule() chỉ đặt 1 after_idle khi hàng đợi vừa có việc (không polling định kỳ)
+        self._calls = queue.SimpleQueue()
+        self._wake_lock = threading.Lock()
+        self._wake_pending = False  # Đã đặt after_idle chưa chạy
+        self._running = False       # mainloop đã chạy: trước đó Tk chưa nhận lời gọi từ thread khác
 
         # Create window
         self.root = tk.Tk()
-        self.root.title(f"LAN Chat - {user_name} (Port: {port})")
+        self.root.title(f"LAN Chat - {user_name} ({self.address})")
         self.root.geometry("950x650")
         self.root.minsize(850, 550)
 
@@ -85,7 +98,7 @@ class ChatGUI:
         ).pack(fill=tk.X)
 
         tk.Label(
-            sidebar, text=f"Port: {self.port}",
+            sidebar, text=self.address,
             bg=self.colors['sidebar'], fg='#95a5a6', font=('Arial', 9)
         ).pack()
 
@@ -227,6 +240,12 @@ class ChatGUI:
             command=self._show_emoji_picker
         ).pack(side=tk.LEFT, padx=(0, 5))
 
+        tk.Button(
+            inner, text="📎", font=('Arial', 16),
+            bg='#ecf0f1', relief=tk.FLAT,
+            command=self._choose_file
+        ).pack(side=tk.LEFT, padx=(0, 5))
+
         self.message_entry = tk.Entry(inner, font=('Arial', 12), relief=tk.FLAT, bg='white')
         self.message_entry.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 10))
 
@@ -270,7 +289,7 @@ class ChatGUI:
         inner.pack(fill=tk.X, padx=10, pady=6)
 
         label = tk.Label(
-            inner, text=f"🟢 {device.name}",
+            inner, text=self._device_text(device),
             bg=self.colors['sidebar_item'], fg='white',
             font=('Arial', 10), anchor='w'
         )
@@ -284,13 +303,15 @@ class ChatGUI:
         unread_lbl.pack(side=tk.RIGHT)
 
         def on_click(e):
-            self.current_target_port = device.port
-            self._select_chat(device_id, "private", device.name)
+            # Tên hiện tại: dòng được giữ lại khi thiết bị đổi tên
+            with self._data_lock:
+                current = self._devices.get(device_id, device)
+            self._select_chat(device_id, "private", current.name)
 
         for w in [frame, inner, label, unread_lbl]:
             w.bind('<Button-1>', on_click)
 
-        return {'frame': frame, 'unread': unread_lbl}
+        return {'frame': frame, 'label': label, 'unread': unread_lbl}
 
     def _create_group_item(self, group_id: str, group):
         """Tạo item cho group"""
@@ -303,7 +324,7 @@ class ChatGUI:
         inner.pack(fill=tk.X, padx=10, pady=6)
 
         label = tk.Label(
-            inner, text=f"👥 {group.name}",
+            inner, text=self._group_text(group),
             bg=self.colors['sidebar_item'], fg='white',
             font=('Arial', 10), anchor='w'
         )
@@ -317,58 +338,58 @@ class ChatGUI:
         unread_lbl.pack(side=tk.RIGHT)
 
         def on_click(e):
-            self._select_chat(group_id, "group", group.name)
+            with self._data_lock:
+                current = self._groups.get(group_id, group)
+            self._select_chat(group_id, "group", current.name)
 
         for w in [frame, inner, label, unread_lbl]:
             w.bind('<Button-1>', on_click)
 
-        return {'frame': frame, 'unread': unread_lbl}
-
-    def _rebuild_devices(self):
-        """Rebuild devices list"""
-        for w in self.devices_frame.winfo_children():
-            w.destroy()
-        self._device_widgets.clear()
-
-        with self._data_lock:
-            devices = dict(self._devices)
-
-        for did, device in devices.items():
-            self._device_widgets[did] = self._create_device_item(did, device)
-
-        self.devices_count.config(text=f"({len(devices)})")
-
-    def _rebuild_groups(self):
-        """Rebuild groups list"""
-        for w in self.groups_frame.winfo_children():
-            w.destroy()
-        self._group_widgets.clear()
-
-        with self._data_lock:
-            groups = dict(self._groups)
-
-        for gid, group in groups.items():
-            self._group_widgets[gid] = self._create_group_item(gid, group)
-
-        self.groups_count.config(text=f"({len(groups)})")
-
-    def _update_unread(self):
-        """Update unread badges only"""
-        count = self.unread_counts.get("broadcast", 0)
-        self.broadcast_unread.config(text=f"({count})" if count else "")
-
-        for did, widgets in self._device_widgets.items():
-            u = self.unread_counts.get(did, 0)
-            widgets['unread'].config(text=f"({u})" if u else "")
-
-        for gid, widgets in self._group_widgets.items():
-            u = self.unread_counts.get(gid, 0)
-            widgets['unread'].config(text=f"({u})" if u else "")
+        return {'frame': frame, 'label': label, 'unread': unread_lbl}
+
+    @staticmethod
+    def _device_text(device: Device) -> str:
+        return f"🟢 {device.name}"
+
+    @staticmethod
+    def _group_text(group) -> str:
+        return f"👥 {group.name}"
+
+    def _patch_items(self, delta: Delta, widgets: Dict[str, dict], create: Callable, text: Callable):
+        """Sửa danh sách theo delta: chỉ tạo/xóa/đổi nhãn các dòng bị ảnh hưởng"""
+        for key in delta.removed:
+            item = widgets.pop(key, None)
+            if item:
+                item['frame'].destroy()
+
+        for changes in (delta.changed, delta.added):
+            for key, value in changes.items():
+                item = widgets.get(key)
+                if item:
+                    item['label'].config(text=text(value))
+                else:
+                    widgets[key] = create(key, value)
+
+    def _update_unread(self, chat_id: str):
+        """Cập nhật badge chưa đọc của 1 chat"""
+        count = self.unread_counts.get(chat_id, 0)
+        text = f"({count})" if count else ""
+
+        if chat_id == "broadcast":
+            self.broadcast_unread.config(text=text)
+            return
+        item = self._device_widgets.get(chat_id) or self._group_widgets.get(chat_id)
+        if item:
+            item['unread'].config(text=text)
 
     def _select_chat(self, chat_id: str, chat_type: str, name: str):
         self.current_chat_id = chat_id
         self.current_chat_type = chat_type
         self.current_chat_name = name
+        # Chat riêng mở từ thông báo cũng phải lấy đúng địa chỉ (None = sổ địa chỉ của network)
+        with self._data_lock:
+            device = self._devices.get(chat_id) if chat_type == "private" else None
+        self.current_target = device.endpoint if device else None
 
         if chat_type == "broadcast":
             self.chat_header.config(text="📢 Broadcast - Gửi đến tất cả")
@@ -378,7 +399,7 @@ class ChatGUI:
             self.chat_header.config(text=f"👥 Nhóm: {name}")
 
         self.unread_counts[chat_id] = 0
-        self._update_unread()
+        self._update_unread(chat_id)
         self._display_history(chat_id)
 
     def _display_history(self, chat_id: str):
@@ -422,7 +443,7 @@ class ChatGUI:
             if self.current_chat_type == "broadcast" and self.on_send_broadcast:
                 self.on_send_broadcast(content)
             elif self.current_chat_type == "private" and self.on_send_private:
-                self.on_send_private(content, self.current_chat_id, self.current_target_port)
+                self.on_send_private(content, self.current_chat_id, self.current_target)
             elif self.current_chat_type == "group" and self.on_send_group:
                 self.on_send_group(content, self.current_chat_id)
 
@@ -438,6 +459,16 @@ class ChatGUI:
         except Exception as e:
             self.show_error(str(e))
 
+    def _choose_file(self):
+        path = filedialog.askopenfilename(parent=self.root, title="Chọn file để gửi")
+        if not path or not self.on_send_file:
+            return
+        try:
+            self.on_send_file(path, self.current_chat_id, self.current_chat_type,
+                              self.current_target)
+        except Exception as e:
+            self.show_error(str(e))
+
     def _show_emoji_picker(self):
         win = tk.Toplevel(self.root)
         win.title("Emoji")
@@ -487,7 +518,7 @@ class ChatGUI:
             var = tk.BooleanVar()
             checks[did] = var
             tk.Checkbutton(
-                dialog, text=f"{device.name} ({device.port})",
+                dialog, text=f"{device.name} ({device.endpoint})",
                 variable=var, font=('Arial', 10)
             ).pack(anchor=tk.W, padx=20)
 
@@ -507,6 +538,8 @@ class ChatGUI:
         if messagebox.askokcancel("Thoát", "Bạn có muốn thoát?"):
             if self.on_close:
                 self.on_close()
+            with self._wake_lock:
+                self._running = False
             self.root.destroy()
 
     def _show_popup(self, title: str, msg: str, chat_id: str, chat_type: str, chat_name: str):
@@ -535,35 +568,21 @@ class ChatGUI:
 
     # === PUBLIC METHODS ===
 
-    def update_devices(self, devices: Dict[str, Device]):
-        """Cập nhật devices - có throttling"""
-        new_hash = str(sorted([(d.device_id, d.port) for d in devices.values()]))
-
-        if new_hash != self._last_devices_hash:
-            self._last_devices_hash = new_hash
-            with self._data_lock:
-                self._devices = dict(devices)
-
-            # Schedule rebuild (debounce)
-            if not self._update_scheduled:
-                self._update_scheduled = True
-                self.root.after(500, self._do_rebuild)
-
-    def _do_rebuild(self):
-        """Thực hiện rebuild"""
-        self._update_scheduled = False
-        self._rebuild_devices()
-        self._rebuild_groups()
-
-    def update_groups(self, groups: dict):
-        """Cập nhật groups"""
-        new_hash = str(sorted([(g.group_id, g.name) for g in groups.values()]))
+    def apply_devices_delta(self, delta: Delta):
+        """Áp thay đổi thiết bị từ discovery (đã được gom theo cooldown ở core)"""
+        with self._data_lock:
+            delta.apply(self._devices)
+            count = len(self._devices)
+        self._patch_items(delta, self._device_widgets, self._create_device_item, self._device_text)
+        self.devices_count.config(text=f"({count})")
 
-        if new_hash != self._last_groups_hash:
-            self._last_groups_hash = new_hash
-            with self._data_lock:
-                self._groups = dict(groups)
-            self._rebuild_groups()
+    def apply_groups_delta(self, delta: Delta):
+        """Áp thay đổi nhóm từ GroupManager"""
+        with self._data_lock:
+            delta.apply(self._groups)
+            count = len(self._groups)
+        self._patch_items(delta, self._group_widgets, self._create_group_item, self._group_text)
+        self.groups_count.config(text=f"({count})")
 
     def display_received_message(self, message: Message):
         """Hiển thị tin nhắn nhận"""
@@ -601,7 +620,7 @@ class ChatGUI:
             self.chat_display.config(state=tk.DISABLED)
         else:
             self.unread_counts[chat_id] += 1
-            self._update_unread()
+            self._update_unread(chat_id)
             self._show_popup(f"💬 {message.sender_name}", message.content, chat_id, chat_type, chat_name)
 
     def display_system_message(self, text: str, chat_id: str = None):
@@ -617,6 +636,52 @@ class ChatGUI:
             self.chat_display.see(tk.END)
             self.chat_display.config(state=tk.DISABLED)
 
+    def show_file_offer(self, offer):
+        """Hỏi có nhận file không (kết quả gửi qua on_file_response)"""
+        chat_id = offer.group_id or offer.sender_id
+        self._transfer_chats[offer.transfer_id] = chat_id
+        self.display_system_message(
+            f"📎 {offer.sender_name} gửi file {offer.name} ({_format_size(offer.size)})", chat_id
+        )
+
+        # Hộp thoại modal chạy vòng sự kiện lồng nhau: mở sau lượt lấy lời gọi hiện tại
+        self.root.after_idle(self._ask_file_offer, offer, chat_id)
+
+    def _ask_file_offer(self, offer, chat_id: str):
+        accepted = messagebox.askyesno(
+            "📎 Nhận file",
+            f"{offer.sender_name} muốn gửi file:\n{offer.name} ({_format_size(offer.size)})\n\nNhận file?",
+            parent=self.root
+        )
+        if self.on_file_response:
+            self.on_file_response(offer.transfer_id, accepted)
+        if not accepted:
+            self.display_system_message(f"Đã từ chối {offer.name}", chat_id)
+
+    def track_transfer(self, transfer_id: str, chat_id: str):
+        """Gắn lượt gửi file với một chat để báo kết quả"""
+        self._transfer_chats[transfer_id] = chat_id
+
+    def update_transfer(self, progress):
+        """Cập nhật tiến độ gửi/nhận file (đã được throttle ở core)"""
+        arrow = "📤" if progress.direction == "send" else "📥"
+        chat_id = self._transfer_chats.get(progress.transfer_id)
+
+        if progress.state == "active":
+            self.status_var.set(
+                f"{arrow} {progress.name} - {progress.peer_name}: {progress.percent:.0f}% "
+                f"({_format_size(progress.rate)}/s)"
+            )
+        elif progress.state == "done":
+            where = f" -> {progress.path}" if progress.path else ""
+            self.status_var.set(f"✅ {progress.name} - {progress.peer_name}")
+            self.display_system_message(f"{arrow} {progress.name} ({progress.peer_name}) xong{where}", chat_id)
+        elif progress.state == "declined":
+            self.display_system_message(f"{progress.peer_name} từ chối {progress.name}", chat_id)
+        else:
+            self.status_var.set(f"❌ {progress.name}: {progress.error}")
+            self.display_system_message(f"❌ Lỗi truyền {progress.name}: {progress.error}", chat_id)
+
     def show_error(self, error: str):
         self.status_var.set(f"❌ {error}")
 
@@ -624,7 +689,52 @@ class ChatGUI:
         self.status_var.set(status)
 
     def run(self):
-        self.root.mainloop()
+        with self._wake_lock:
+            self._running = True
+            self._wake_pending = True
+        # Lời gọi đã xếp trước khi mainloop chạy
+        self.root.after_idle(self._drain_calls)
+        try:
+            self.root.mainloop()
+        finally:
+            with self._wake_lock:
+                self._running = False
 
     def schedule(self, func, *args):
-        self.root.after(0, lambda: func(*args))
\ No newline at end of file
+        """Gọi func trên Tk thread - an toàn khi gọi từ thread khác"""
+        self._calls.put((func, args))
+        with self._wake_lock:
+            if not self._running or self._wake_pending:
+                return
+            self._wake_pending = True
+        try:
+            self.root.after_idle(self._drain_calls)
+        except (RuntimeError, tk.TclError):
+            pass  # Cửa sổ đã đóng
+
+    def _drain_calls(self):
+        """
+        Chạy các lời gọi đang chờ trên Tk thread
+        An toàn khi chạy lồng nhau (hộp thoại modal trong một lời gọi chạy vòng sự kiện riêng)
+        """
+        with self._wake_lock:
+            self._wake_pending = False
+        while True:
+            try:
+                func, args = self._calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except Exception as e:
+                if self.logger:
+                    # Không notify: on_error lại schedule lên GUI
+                    name = getattr(func, '__name__', func)
+                    self.logger.error(f"Scheduled GUI call {name} failed: {e}", notify=False)
+
+
+def _format_size(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
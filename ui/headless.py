@@ -0,0 +1,497 @@
+"""
+Module chạy không giao diện - Điều khiển node bằng JSON lines
+
+Cùng giao diện public với ChatGUI (schedule, display_*, apply_*_delta, on_send_*...) nên
+ChatApplication dùng được nguyên vẹn. Không import tkinter.
+
+Lệnh (mỗi dòng 1 object JSON, "id" tùy chọn được trả lại trong phản hồi):
+    {"cmd": "broadcast", "content": "..."}
+    {"cmd": "private", "content": "...", "target_id": "...", "target_port": 5001,
+     "target_host": "127.0.0.2"}   (không có target_*: theo danh sách thiết bị / sổ địa chỉ)
+    {"cmd": "group", "content": "...", "group_id": "..."}
+    {"cmd": "create_group", "name": "...", "members": ["id", ...]}
+    {"cmd": "send_file", "path": "...", "chat_type": "private|group|broadcast", "chat_id": "..."}
+    {"cmd": "file_response", "transfer_id": "...", "accept": true}
+    {"cmd": "profile", "action": "start|stop|dump|status", "modes": ["sampler", ...]}
+    {"cmd": "scan"} / {"cmd": "devices"} / {"cmd": "groups"} / {"cmd": "quit"}
+Sự kiện ghi ra (mỗi dòng 1 object JSON có "event"): message, system, devices, groups,
+file_offer, transfer, status, error; phản hồi lệnh là "ok" / "error" kèm "cmd".
+devices/groups luôn chứa cả danh sách, kèm "version" của delta vừa áp.
+"""
+import collections
+import json
+import os
+import queue
+import selectors
+import socket
+import stat
+import sys
+import threading
+import time as time_module
+from typing import Callable, Dict, List, Optional
+from core.addressing import DEFAULT_HOST, Endpoint, node_id
+from core.deltas import Delta
+from core.message import Message, MessageType
+
+
+class _StreamSink:
+    """Nơi nhận ghi thẳng ra 1 stream (stdout khi điều khiển qua stdin)"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def send(self, line: str) -> bool:
+        try:
+            with self._lock:
+                self.stream.write(line)
+                self.stream.flush()
+            return True
+        except (OSError, ValueError):
+            return False
+
+
+class _ClientSink:
+    """Nơi nhận của 1 client socket: hàng ghi có giới hạn, thread ghi riêng, gửi không chặn"""
+
+    MAX_PENDING = 1024   # Số dòng chờ ghi tối đa; vượt thì ngắt client (đọc không kịp)
+    SEND_TIMEOUT = 5.0   # Giây chờ socket ghi được; quá thì ngắt client
+
+    def __init__(self, conn: socket.socket):
+        self.conn = conn
+        self._pending = collections.deque()
+        self._cond = threading.Condition()
+        self._closing = False  # Ghi nốt hàng rồi dừng
+        self._dropped = False  # Bỏ hàng, dừng ngay
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def send(self, line: str) -> bool:
+        """Xếp dòng vào hàng ghi, không I/O; False nếu client đã bị ngắt"""
+        with self._cond:
+            if self._closing or self._dropped:
+                return False
+            if len(self._pending) < self.MAX_PENDING:
+                self._pending.append(line.encode('utf-8'))
+                self._cond.notify()
+                return True
+            self._dropped = True
+            self._pending.clear()
+            self._cond.notify()
+        self._shutdown()
+        return False
+
+    def close(self, timeout: Optional[float] = None):
+        """Ghi nốt các dòng đang chờ (tối đa SEND_TIMEOUT mỗi lần gửi) rồi dừng thread ghi"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            while True:
+                with self._cond:
+                    while not (self._pending or self._closing or self._dropped):
+                        self._cond.wait()
+                    if self._dropped or not self._pending:
+                        return
+                    data = b"".join(self._pending)
+                    self._pending.clear()
+                self._send_all(data)
+        except OSError:
+            with self._cond:
+                self._dropped = True
+                self._pending.clear()
+            self._shutdown()
+
+    def _send_all(self, data: bytes):
+        # Gửi không chặn, chờ ghi được bằng selector: client không đọc thì hết hạn thay vì treo
+        view = memoryview(data)
+        deadline = time_module.monotonic() + self.SEND_TIMEOUT
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.conn, selectors.EVENT_WRITE)
+            while view:
+                try:
+                    view = view[self.conn.send(view, socket.MSG_DONTWAIT):]
+                except BlockingIOError:
+                    remaining = deadline - time_module.monotonic()
+                    if remaining <= 0 or not selector.select(remaining):
+                        raise TimeoutError("client không đọc sự kiện")
+
+    def stop_reading(self):
+        """Đánh thức thread đọc khi dừng - vẫn ghi nốt được hàng đang chờ"""
+        try:
+            self.conn.shutdown(socket.SHUT_RD)
+        except OSError:
+            pass
+
+    def _shutdown(self):
+        # Đánh thức thread đọc của client để nó dọn dẹp
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class HeadlessUI:
+    """Thay ChatGUI khi chạy --headless: lệnh từ stdin hoặc Unix socket, sự kiện ra JSON lines"""
+
+    def __init__(self, user_name: str, port: int, control_path: Optional[str] = None,
+                 host: Optional[str] = None):
+        self.user_name = user_name
+        self.port = port
+        self.host = host
+        self.user_id = node_id(user_name, port, host)
+        self.control_path = control_path
+
+        # Callbacks (như ChatGUI)
+        self.on_send_broadcast: Optional[Callable[[str], None]] = None
+        self.on_send_private: Optional[Callable[[str, str, Optional[Endpoint]], None]] = None
+        self.on_send_group: Optional[Callable[[str, str], None]] = None
+        self.on_create_group: Optional[Callable[[str, list], None]] = None
+        self.on_scan_devices: Optional[Callable[[], None]] = None
+        self.on_send_file: Optional[Callable[[str, str, str, Optional[Endpoint]], None]] = None
+        self.on_file_response: Optional[Callable[[str, bool], None]] = None
+        self.on_close: Optional[Callable[[], None]] = None
+        self.on_profile: Optional[Callable[[str, Optional[list]], dict]] = None
+
+        self._devices: Dict[str, object] = {}
+        self._groups: Dict[str, object] = {}
+        self._transfer_chats: Dict[str, str] = {}
+        self._data_lock = threading.Lock()
+
+        # Nơi nhận sự kiện: stdout hoặc các client đang nối vào socket
+        self._sinks: List = [] if control_path else [_StreamSink(sys.stdout)]
+        self._sinks_lock = threading.Lock()
+
+        # Lời gọi từ thread khác chạy tuần tự trên 1 thread (như Tk thread của ChatGUI)
+        self._calls = queue.SimpleQueue()
+        self._stopped = threading.Event()
+        # Đánh thức vòng accept khi dừng (select không cần timeout)
+        self._wakeup: Optional[socket.socket] = None
+
+        self._commands = {
+            'broadcast': self._cmd_broadcast,
+            'private': self._cmd_private,
+            'group': self._cmd_group,
+            'create_group': self._cmd_create_group,
+            'send_file': self._cmd_send_file,
+            'file_response': self._cmd_file_response,
+            'scan': self._cmd_scan,
+            'profile': self._cmd_profile,
+            'devices': self._cmd_devices,
+            'groups': self._cmd_groups,
+            'quit': self._cmd_quit,
+        }
+
+    # === PUBLIC METHODS (như ChatGUI) ===
+
+    def apply_devices_delta(self, delta: Delta):
+        with self._data_lock:
+            delta.apply(self._devices)
+        self._emit({'event': 'devices', 'version': delta.version, 'devices': self._device_list()})
+
+    def apply_groups_delta(self, delta: Delta):
+        with self._data_lock:
+            delta.apply(self._groups)
+        self._emit({'event': 'groups', 'version': delta.version, 'groups': self._group_list()})
+
+    def display_received_message(self, message: Message):
+        if message.msg_type == MessageType.TEXT:
+            chat_type, chat_id = "broadcast", "broadcast"
+        elif message.msg_type == MessageType.PRIVATE_MESSAGE:
+            chat_type, chat_id = "private", message.sender_id
+        elif message.msg_type == MessageType.GROUP_MESSAGE:
+            chat_type, chat_id = "group", message.group_id
+        else:
+            return
+
+        self._emit({
+            'event': 'message',
+            'chat_type': chat_type,
+            'chat_id': chat_id,
+            'msg_id': message.msg_id,
+            'sender_id': message.sender_id,
+            'sender_name': message.sender_name,
+            'sender_port': message.sender_port,
+            'sender_host': message.sender_host,
+            'content': message.content,
+            'timestamp': message.timestamp,
+        })
+
+    def display_system_message(self, text: str, chat_id: str = None):
+        self._emit({'event': 'system', 'chat_id': chat_id, 'text': text})
+
+    def show_file_offer(self, offer):
+        """Báo lời mời nhận file - trả lời bằng lệnh file_response"""
+        self._transfer_chats[offer.transfer_id] = offer.group_id or offer.sender_id
+        self._emit({
+            'event': 'file_offer',
+            'transfer_id': offer.transfer_id,
+            'name': offer.name,
+            'size': offer.size,
+            'sender_id': offer.sender_id,
+            'sender_name': offer.sender_name,
+            'group_id': offer.group_id,
+        })
+
+    def track_transfer(self, transfer_id: str, chat_id: str):
+        self._transfer_chats[transfer_id] = chat_id
+
+    def update_transfer(self, progress):
+        self._emit({
+            'event': 'transfer',
+            'transfer_id': progress.transfer_id,
+            'chat_id': self._transfer_chats.get(progress.transfer_id),
+            'name': progress.name,
+            'peer_name': progress.peer_name,
+            'direction': progress.direction,
+            'state': progress.state,
+            'done': progress.done,
+            'total': progress.total,
+            'path': progress.path,
+            'error': progress.error,
+        })
+
+    def show_error(self, error: str):
+        self._emit({'event': 'error', 'error': error})
+
+    def set_status(self, status: str):
+        self._emit({'event': 'status', 'status': status})
+
+    def schedule(self, func, *args):
+        """Gọi func trên thread xử lý sự kiện - an toàn khi gọi từ thread khác"""
+        self._calls.put((func, args))
+
+    def run(self):
+        """Chặn đến khi hết stdin / lệnh quit / Ctrl+C"""
+        threading.Thread(target=self._drain_calls, daemon=True).start()
+        try:
+            if self.control_path:
+                self._serve_socket()
+            else:
+                self._serve_stream(sys.stdin, self._sinks[0])
+        finally:
+            self._stopped.set()
+            self._calls.put(None)
+            if self.on_close:
+                self.on_close()
+
+    # === CONTROL ===
+
+    def _serve_stream(self, reader, sink):
+        """Đọc lệnh từng dòng từ reader, phản hồi gửi cho sink"""
+        for line in reader:
+            line = line.strip()
+            if line:
+                sink.send(self._line(self.execute(line)))
+            if self._stopped.is_set():
+                break
+
+    def _serve_socket(self):
+        """Unix socket: mỗi client là 1 luồng lệnh, mọi client nhận sự kiện"""
+        if not hasattr(socket, "AF_UNIX"):
+            raise RuntimeError("Unix socket không được hỗ trợ trên hệ điều hành này")
+        try:
+            mode = os.lstat(self.control_path).st_mode
+        except FileNotFoundError:
+            pass
+        else:
+            # Chỉ xóa socket cũ còn sót lại; file thường / thư mục / symlink thì báo lỗi, không xóa
+            if not stat.S_ISSOCK(mode):
+                raise FileExistsError(f"{self.control_path} đã tồn tại và không phải Unix socket")
+            os.unlink(self.control_path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.control_path)
+        # Chỉ chủ sở hữu được nối vào (lệnh gửi tin/file); đặt trước listen nên không có khe hở
+        os.chmod(self.control_path, 0o600)
+        server.listen()
+        server.setblocking(False)
+        waker, self._wakeup = socket.socketpair()
+        selector = selectors.DefaultSelector()
+        selector.register(server, selectors.EVENT_READ)
+        selector.register(waker, selectors.EVENT_READ)
+        clients: List[threading.Thread] = []
+        try:
+            # Chỉ thức dậy khi có client kết nối hoặc khi dừng (waker đọc được), không polling
+            while not self._stopped.is_set():
+                ready = [key.fileobj for key, _ in selector.select()]
+                if waker in ready:
+                    break
+                try:
+                    conn, _ = server.accept()
+                except (BlockingIOError, InterruptedError):
+                    continue
+                conn.settimeout(None)
+                client = threading.Thread(target=self._serve_client, args=(conn,), daemon=True)
+                client.start()
+                clients = [thread for thread in clients if thread.is_alive()] + [client]
+        finally:
+            selector.close()
+            for sock in (server, waker, self._wakeup):
+                sock.close()
+            # Đánh thức thread đọc của các client; mỗi thread gửi nốt hàng ghi (vd. phản hồi quit)
+            with self._sinks_lock:
+                sinks = list(self._sinks)
+            for sink in sinks:
+                sink.stop_reading()
+            for client in clients:
+                client.join(_ClientSink.SEND_TIMEOUT)
+            try:
+                os.unlink(self.control_path)
+            except OSError:
+                pass
+
+    def _serve_client(self, conn: socket.socket):
+        # Thread này chỉ đọc lệnh; ghi do thread riêng của sink nên client chậm không chặn ai
+        reader = conn.makefile('r', encoding='utf-8', newline='\n')
+        sink = _ClientSink(conn)
+        with self._sinks_lock:
+            self._sinks.append(sink)
+        try:
+            self._serve_stream(reader, sink)
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self._sinks_lock:
+                if sink in self._sinks:
+                    self._sinks.remove(sink)
+            sink.close(_ClientSink.SEND_TIMEOUT)
+            for stream in (reader, conn):
+                try:
+                    stream.close()
+                except OSError:
+                    pass
+
+    def execute(self, line: str) -> dict:
+        """Chạy 1 lệnh JSON, trả về phản hồi"""
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+        except ValueError as e:
+            return {'event': 'error', 'cmd': None, 'error': f"invalid JSON: {e}"}
+
+        cmd = request.get('cmd')
+        reply = {'event': 'ok', 'cmd': cmd}
+        if 'id' in request:
+            reply['id'] = request['id']
+
+        handler = self._commands.get(cmd)
+        if handler is None:
+            reply.update(event='error', error=f"unknown command: {cmd}")
+            return reply
+        try:
+            result = handler(request)
+        except KeyError as e:
+            reply.update(event='error', error=f"missing field: {e.args[0]}")
+        except Exception as e:
+            reply.update(event='error', error=str(e))
+        else:
+            if result:
+                reply.update(result)
+        return reply
+
+    def _cmd_broadcast(self, request: dict):
+        self._call(self.on_send_broadcast, str(request['content']))
+
+    def _target(self, request: dict, device_id: str) -> Optional[Endpoint]:
+        """target_host/target_port trong lệnh, không thì thiết bị đã biết (None = sổ địa chỉ)"""
+        target_port = request.get('target_port')
+        if target_port is not None:
+            return Endpoint(request.get('target_host') or self.host or DEFAULT_HOST, int(target_port))
+        with self._data_lock:
+            device = self._devices.get(device_id)
+        return device.endpoint if device else None
+
+    def _cmd_private(self, request: dict):
+        target_id = request['target_id']
+        self._call(self.on_send_private, str(request['content']), target_id,
+                   self._target(request, target_id))
+
+    def _cmd_group(self, request: dict):
+        self._call(self.on_send_group, str(request['content']), request['group_id'])
+
+    def _cmd_create_group(self, request: dict):
+        self._call(self.on_create_group, str(request['name']), list(request['members']))
+
+    def _cmd_send_file(self, request: dict):
+        chat_type = request.get('chat_type', 'broadcast')
+        chat_id = request.get('chat_id', 'broadcast')
+        target = self._target(request, chat_id) if chat_type == 'private' else None
+        self._call(self.on_send_file, request['path'], chat_id, chat_type, target)
+
+    def _cmd_file_response(self, request: dict):
+        self._call(self.on_file_response, request['transfer_id'], bool(request['accept']))
+
+    def _cmd_scan(self, request: dict):
+        self._call(self.on_scan_devices)
+
+    def _cmd_profile(self, request: dict) -> dict:
+        if self.on_profile is None:
+            raise RuntimeError("not connected")
+        return self.on_profile(request.get('action', 'status'), request.get('modes'))
+
+    def _cmd_devices(self, request: dict) -> dict:
+        return {'devices': self._device_list()}
+
+    def _cmd_groups(self, request: dict) -> dict:
+        return {'groups': self._group_list()}
+
+    def _cmd_quit(self, request: dict):
+        self._stop()
+
+    def _stop(self):
+        """Dừng vòng lệnh - gọi được từ thread của client"""
+        self._stopped.set()
+        wakeup = self._wakeup
+        if wakeup is not None:
+            try:
+                wakeup.send(b"\0")
+            except OSError:
+                pass  # Vòng accept đã thoát
+
+    @staticmethod
+    def _call(callback, *args):
+        if callback is None:
+            raise RuntimeError("not connected")
+        callback(*args)
+
+    # === OUTPUT ===
+
+    def _device_list(self) -> list:
+        with self._data_lock:
+            return [{'id': d.device_id, 'name': d.name, 'host': d.host, 'port': d.port}
+                    for d in self._devices.values()]
+
+    def _group_list(self) -> list:
+        with self._data_lock:
+            return [{'id': g.group_id, 'name': g.name, 'members': sorted(g.member_ids)}
+                    for g in self._groups.values()]
+
+    def _emit(self, event: dict):
+        """Gửi sự kiện cho mọi nơi nhận - client chậm bị ngắt, thread của nó tự gỡ sink"""
+        event.setdefault('time', time_module.time())
+        line = self._line(event)
+        with self._sinks_lock:
+            sinks = list(self._sinks)
+        for sink in sinks:
+            sink.send(line)
+
+    @staticmethod
+    def _line(event: dict) -> str:
+        return json.dumps(event, ensure_ascii=False, default=str) + "\n"
+
+    def _drain_calls(self):
+        """Chạy các lời gọi đang chờ theo thứ tự"""
+        while True:
+            call = self._calls.get()
+            if call is None:
+                return
+            func, args = call
+            try:
+                func(*args)
+            except Exception as e:
+                self._emit({'event': 'error', 'error': f"{func.__name__}: {e}"})
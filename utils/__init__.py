@@ -1 +1,2 @@
-from .logger import Logger
\ No newline at end of file
+from .logger import Logger
+from .metrics import MetricsRegistry, MetricsServer
@@ -0,0 +1,229 @@
+"""
+Module số liệu - Counter / gauge / histogram trong tiến trình, xuất dạng text Prometheus
+
+Ghi số liệu không khóa (chỉ cộng 1 thuộc tính) để gần như không tốn gì trên đường nóng;
+nhiều thread cùng ghi một chỉ số có thể lệch rất ít. Số liệu đã có sẵn ở nơi khác
+(hàng đợi, bộ lọc...) được đọc lúc scrape qua collector thay vì ghi thêm.
+"""
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+# Giây - từ dưới 1ms (loopback) đến vài giây (truyền lại)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Giá trị chỉ tăng"""
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Gauge:
+    """Giá trị tăng/giảm tùy ý"""
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+
+class Histogram:
+    """Đếm theo bucket cố định (le = cận trên, bao gồm)"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Phần tử cuối: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricFamily:
+    """Một chỉ số và các bộ nhãn của nó"""
+
+    def __init__(self, name: str, help_text: str, kind: str, labelnames: Sequence[str],
+                 factory: Callable[[], object]):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> object:
+        """Chỉ số con theo giá trị nhãn - nên giữ lại kết quả thay vì gọi trên đường nóng"""
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._factory())
+        return child
+
+    def render(self) -> Iterable[str]:
+        with self._lock:
+            children = sorted(self._children.items())
+        for key, child in children:
+            if self.kind == "histogram":
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                    cumulative += count
+                    le = f'le="{_number(bound)}"'
+                    yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}"
+                yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(child.sum)}"
+                yield f"{self.name}_count{_labels(self.labelnames, key)} {child.count}"
+            else:
+                yield f"{self.name}{_labels(self.labelnames, key)} {_number(child.value)}"
+
+
+class _Collected:
+    """Chỉ số đọc lúc scrape: fn() -> [(giá trị nhãn, giá trị)]"""
+
+    def __init__(self, name: str, help_text: str, kind: str, labelnames: Sequence[str],
+                 fn: Callable[[], Iterable[Tuple[Sequence[str], float]]]):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+
+    def render(self) -> Iterable[str]:
+        for values, value in self.fn():
+            yield f"{self.name}{_labels(self.labelnames, values)} {_number(value)}"
+
+
+class MetricsRegistry:
+    """Tập chỉ số của một tiến trình; đăng ký lại cùng tên trả về chỉ số đã có"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> MetricFamily:
+        return self._family(name, help_text, "counter", labelnames, Counter)
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> MetricFamily:
+        return self._family(name, help_text, "gauge", labelnames, Gauge)
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> MetricFamily:
+        buckets = tuple(sorted(buckets))
+        family = self._family(name, help_text, "histogram", labelnames,
+                              lambda: Histogram(buckets))
+        family.buckets = buckets
+        return family
+
+    def collect(self, name: str, help_text: str, kind: str, labelnames: Sequence[str],
+                fn: Callable[[], Iterable[Tuple[Sequence[str], float]]]):
+        """Chỉ số lấy từ số liệu sẵn có lúc scrape (kind: counter/gauge); đăng ký lại thì thay fn"""
+        with self._lock:
+            self._metrics[name] = _Collected(name, help_text, kind, labelnames, fn)
+
+    def render(self) -> str:
+        """Text exposition format của Prometheus"""
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        for name, metric in metrics:
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# error collecting {name}: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+    def _family(self, name: str, help_text: str, kind: str, labelnames: Sequence[str],
+                factory: Callable[[], object]) -> MetricFamily:
+        with self._lock:
+            existing = self._metrics.get(name)
+            if existing is not None:
+                if existing.kind != kind or existing.labelnames != tuple(labelnames):
+                    raise ValueError(f"metric {name} already registered as {existing.kind}")
+                return existing
+            family = self._metrics[name] = MetricFamily(name, help_text, kind, labelnames, factory)
+            return family
+
+
+class MetricsServer:
+    """HTTP GET /metrics chỉ trên localhost (thread riêng)"""
+
+    def __init__(self, registry: MetricsRegistry, port: int, host: str = "127.0.0.1"):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Không ghi mỗi lần scrape ra console
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
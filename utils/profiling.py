@@ -0,0 +1,342 @@
+"""
+Module profiling - Bật/tắt khi đang chạy: cProfile theo thread, tracemalloc, lấy mẫu stack
+
+Kết quả ghi vào logs/profile_<tên>_<thời điểm>/ (cạnh file log):
+    cprofile_<thread>.prof   pstats từng thread (mở bằng pstats / snakeviz)
+    cprofile.txt             top hàm theo thời gian tích lũy, từng thread
+    sampler.folded           stack gộp "thread;hàm;hàm số_mẫu" (flamegraph.pl / speedscope)
+    sampler.txt              top dòng code theo số mẫu (tự thân / bao gồm), từng thread
+    tracemalloc.txt          top chỗ cấp phát và phần tăng thêm từ lúc bật
+"""
+import cProfile
+import io
+import os
+import pstats
+import re
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from .logger import Logger
+
+MODE_CPROFILE = "cprofile"
+MODE_TRACEMALLOC = "tracemalloc"
+MODE_SAMPLER = "sampler"
+PROFILE_MODES = (MODE_CPROFILE, MODE_TRACEMALLOC, MODE_SAMPLER)
+
+# Python < 3.12 không gắn/gỡ profiler cho thread đang chạy từ thread khác được
+CAN_PROFILE_RUNNING_THREADS = hasattr(threading, "setprofile_all_threads")
+
+
+def parse_modes(spec: str) -> Tuple[str, ...]:
+    """"all" / "cprofile,sampler" -> tuple mode; raise ValueError nếu sai"""
+    if spec.strip().lower() == "all":
+        return PROFILE_MODES
+    modes = tuple(m.strip().lower() for m in spec.split(",") if m.strip())
+    unknown = [m for m in modes if m not in PROFILE_MODES]
+    if unknown or not modes:
+        raise ValueError(f"unknown profile mode: {', '.join(unknown) or spec!r}")
+    return modes
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", name)
+
+
+class _Snapshot:
+    """Bọc stats đã chụp để pstats.Stats đọc mà không gọi disable() trên thread hiện tại"""
+
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class ThreadProfiles:
+    """
+    Một cProfile.Profile cho mỗi thread
+    - Python >= 3.12: gắn vào mọi thread đang chạy và gỡ ra khi dừng
+    - Python cũ hơn: chỉ thread gọi start() và thread tạo sau đó; profiler ở các thread
+      đó chạy đến khi thread kết thúc (nên bật từ lúc khởi động: --profile cprofile)
+    """
+
+    def __init__(self):
+        self._profiles: Dict[int, Tuple[str, cProfile.Profile]] = {}
+        self._lock = threading.Lock()
+        self.running = False
+
+    def start(self):
+        self.running = True
+        if CAN_PROFILE_RUNNING_THREADS:
+            threading.setprofile_all_threads(self._hook)
+        else:
+            threading.setprofile(self._hook)
+        self._attach()
+
+    def stop(self) -> bool:
+        """True nếu đã gỡ khỏi mọi thread"""
+        self.running = False
+        if CAN_PROFILE_RUNNING_THREADS:
+            threading.setprofile_all_threads(None)
+            return True
+        threading.setprofile(None)
+        with self._lock:
+            own = self._profiles.get(threading.get_ident())
+        if own:
+            own[1].disable()
+        return False
+
+    def snapshot(self) -> List[Tuple[str, int, pstats.Stats]]:
+        """(tên thread, ident, stats) - đọc được khi các thread vẫn đang chạy"""
+        with self._lock:
+            profiles = list(self._profiles.items())
+        result = []
+        for ident, (name, profile) in profiles:
+            profile.snapshot_stats()
+            if profile.stats:
+                result.append((name, ident, pstats.Stats(_Snapshot(profile.stats))))
+        return result
+
+    def _hook(self, frame, event, arg):
+        # Sự kiện đầu tiên trong thread: thay hook này bằng cProfile của riêng thread
+        self._attach()
+
+    def _attach(self):
+        ident = threading.get_ident()
+        with self._lock:
+            if ident in self._profiles:
+                name, profile = self._profiles[ident]
+            else:
+                profile = cProfile.Profile()
+                self._profiles[ident] = (threading.current_thread().name, profile)
+        profile.enable()
+
+
+class StackSampler:
+    """Lấy mẫu stack của mọi thread mỗi `interval` giây (sys._current_frames)"""
+
+    MAX_DEPTH = 64
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: Counter = Counter()  # (tên thread, stack từ ngoài vào) -> số mẫu
+        self.ticks = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.MAX_DEPTH:
+                    code = frame.f_code
+                    stack.append((code.co_filename, frame.f_lineno, code.co_name))
+                    frame = frame.f_back
+                stack.reverse()
+                self.samples[(names.get(ident, str(ident)), tuple(stack))] += 1
+            self.ticks += 1
+
+    def folded(self) -> Iterable[str]:
+        """Dạng collapsed stack: thread;hàm (file:dòng);... số_mẫu"""
+        for (thread, stack), count in self.samples.most_common():
+            frames = ";".join(f"{name} ({os.path.basename(filename)}:{line})"
+                              for filename, line, name in stack)
+            yield f"{_safe_name(thread)};{frames} {count}"
+
+    def summary(self, top: int) -> str:
+        by_thread: Dict[str, Tuple[Counter, Counter, int]] = {}
+        for (thread, stack), count in self.samples.items():
+            own, inclusive, total = by_thread.get(thread, (Counter(), Counter(), 0))
+            if stack:
+                own[stack[-1]] += count
+            for frame in set(stack):
+                inclusive[frame] += count
+            by_thread[thread] = (own, inclusive, total + count)
+
+        out = io.StringIO()
+        out.write(f"{self.ticks} lượt lấy mẫu, mỗi {self.interval * 1000:.0f} ms\n")
+        for thread, (own, inclusive, total) in sorted(by_thread.items()):
+            out.write(f"\n=== {thread}: {total} mẫu ===\n")
+            for title, counter in (("tự thân", own), ("bao gồm", inclusive)):
+                out.write(f"  -- {title}\n")
+                for (filename, line, name), count in counter.most_common(top):
+                    out.write(f"  {count / total:6.1%} {count:>7}  {name} "
+                              f"({filename}:{line})\n")
+        return out.getvalue()
+
+
+class Profiler:
+    """
+    Điều khiển các chế độ profiling của một tiến trình
+    start(modes) / stop() (ghi kết quả) / dump() (ghi, không dừng) / toggle()
+    """
+
+    SAMPLE_INTERVAL = 0.01  # Giây giữa 2 lần lấy mẫu stack
+    TRACEMALLOC_FRAMES = 10
+    TOP_N = 30
+
+    def __init__(self, name: str, logger: Optional[Logger] = None, out_dir: str = "logs",
+                 sample_interval: float = SAMPLE_INTERVAL, top: int = TOP_N):
+        self.name = name
+        self.logger = logger
+        self.out_dir = out_dir
+        self.sample_interval = sample_interval
+        self.top = top
+
+        self.modes: Tuple[str, ...] = ()
+        # Chế độ khi bật bằng tín hiệu / lệnh không nêu rõ chế độ
+        self.default_modes: Tuple[str, ...] = (
+            PROFILE_MODES if CAN_PROFILE_RUNNING_THREADS else (MODE_TRACEMALLOC, MODE_SAMPLER)
+        )
+        self._threads: Optional[ThreadProfiles] = None
+        self._sampler: Optional[StackSampler] = None
+        self._tracemalloc_base: Optional[tracemalloc.Snapshot] = None
+        self._started = 0.0
+        self._lock = threading.RLock()
+
+    @property
+    def active(self) -> bool:
+        return bool(self.modes)
+
+    def start(self, modes: Optional[Iterable[str]] = None) -> Tuple[str, ...]:
+        """Bật các chế độ (mặc định: default_modes); trả về các chế độ đang bật"""
+        modes = tuple(modes) if modes is not None else self.default_modes
+        with self._lock:
+            started = [m for m in modes if m not in self.modes]
+            if MODE_CPROFILE in started:
+                if self._threads is None:
+                    self._threads = ThreadProfiles()
+                self._threads.start()
+                if not CAN_PROFILE_RUNNING_THREADS:
+                    self._log("cProfile chỉ đo thread hiện tại và thread tạo sau "
+                              "(Python < 3.12) - bật từ đầu bằng --profile cprofile", warn=True)
+            if MODE_TRACEMALLOC in started:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(self.TRACEMALLOC_FRAMES)
+                self._tracemalloc_base = tracemalloc.take_snapshot()
+            if MODE_SAMPLER in started:
+                self._sampler = StackSampler(self.sample_interval)
+                self._sampler.start()
+            if started:
+                if not self.modes:
+                    self._started = time.monotonic()
+                self.modes = self.modes + tuple(started)
+                self._log(f"Profiling started: {', '.join(started)}")
+            return self.modes
+
+    def stop(self) -> Optional[str]:
+        """Dừng mọi chế độ; trả về thư mục kết quả (None nếu không bật gì)"""
+        with self._lock:
+            if not self.modes:
+                return None
+            path = self.dump()
+            if MODE_CPROFILE in self.modes and not self._threads.stop():
+                self._log("cProfile vẫn chạy trong các thread đã gắn đến khi chúng kết thúc "
+                          "(Python < 3.12); lần dump sau cộng dồn", warn=True)
+            if MODE_SAMPLER in self.modes:
+                self._sampler.stop()
+                self._sampler = None
+            if MODE_TRACEMALLOC in self.modes:
+                tracemalloc.stop()
+                self._tracemalloc_base = None
+            self.modes = ()
+            self._log(f"Profiling stopped, results in {path}")
+            return path
+
+    def toggle(self, modes: Optional[Iterable[str]] = None) -> Optional[str]:
+        """Đang bật -> dừng (trả về thư mục kết quả); đang tắt -> bật"""
+        if self.active:
+            return self.stop()
+        self.start(modes)
+        return None
+
+    def dump(self) -> Optional[str]:
+        """Ghi kết quả hiện tại mà không dừng; trả về thư mục kết quả"""
+        with self._lock:
+            if not self.modes:
+                return None
+            stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            path = os.path.join(self.out_dir, f"profile_{_safe_name(self.name)}_{stamp}")
+            os.makedirs(path, exist_ok=True)
+            if MODE_CPROFILE in self.modes:
+                self._dump_cprofile(path)
+            if MODE_SAMPLER in self.modes:
+                self._dump_sampler(path)
+            if MODE_TRACEMALLOC in self.modes:
+                self._dump_tracemalloc(path)
+            return path
+
+    def install_signal(self, signum: Optional[int] = None) -> bool:
+        """Tín hiệu (mặc định SIGUSR1) bật/tắt profiling; False nếu hệ điều hành không có"""
+        signum = signum if signum is not None else getattr(signal, "SIGUSR1", None)
+        if signum is None:
+            return False
+
+        def handler(signo, frame):
+            # Ghi file ngoài handler (handler chạy xen vào main thread)
+            threading.Thread(target=self.toggle, name="profiler-toggle", daemon=True).start()
+
+        signal.signal(signum, handler)
+        return True
+
+    def _dump_cprofile(self, path: str):
+        with open(os.path.join(path, "cprofile.txt"), "w", encoding="utf-8") as summary:
+            for name, ident, stats in sorted(self._threads.snapshot()):
+                stats.dump_stats(os.path.join(path, f"cprofile_{_safe_name(name)}_{ident}.prof"))
+                summary.write(f"\n=== {name} ({ident}) ===\n")
+                stats.stream = summary
+                stats.sort_stats("cumulative").print_stats(self.top)
+
+    def _dump_sampler(self, path: str):
+        with open(os.path.join(path, "sampler.folded"), "w", encoding="utf-8") as f:
+            for line in self._sampler.folded():
+                f.write(line + "\n")
+        with open(os.path.join(path, "sampler.txt"), "w", encoding="utf-8") as f:
+            f.write(self._sampler.summary(self.top))
+
+    def _dump_tracemalloc(self, path: str):
+        # Bỏ cấp phát của chính các công cụ profiling
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, filename)
+            for filename in (tracemalloc.__file__, cProfile.__file__, pstats.__file__, __file__,
+                             "<frozen importlib._bootstrap>")
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        with open(os.path.join(path, "tracemalloc.txt"), "w", encoding="utf-8") as f:
+            f.write(f"Đang dùng {current / 1024:.1f} KiB, đỉnh {peak / 1024:.1f} KiB "
+                    f"(từ lúc bật, {time.monotonic() - self._started:.0f}s)\n")
+            f.write(f"\n=== Top {self.top} theo dòng code ===\n")
+            for stat in snapshot.statistics("lineno")[:self.top]:
+                f.write(f"{stat}\n")
+            if self._tracemalloc_base is not None:
+                f.write("\n=== Tăng thêm từ lúc bật ===\n")
+                for stat in snapshot.compare_to(self._tracemalloc_base, "lineno")[:self.top]:
+                    f.write(f"{stat}\n")
+            f.write(f"\n=== Top {self.top} theo traceback ===\n")
+            for stat in snapshot.statistics("traceback")[:min(self.top, 10)]:
+                f.write(f"\n{stat}\n")
+                for line in stat.traceback.format():
+                    f.write(f"{line}\n")
+
+    def _log(self, message: str, warn: bool = False):
+        if self.logger:
+            (self.logger.warning if warn else self.logger.info)(message)